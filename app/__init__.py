@@ -34,8 +34,33 @@ def create_app(config_name=None):
     jwt.init_app(app)
     bcrypt.init_app(app)
     ma.init_app(app)
+    # Handlers Socket.IO (salas de eventos): importados ANTES do
+    # init_app para ficarem em socketio.handlers e serem registados
+    # em cada servidor criado (várias apps no mesmo processo, testes)
+    from app.controllers import socket_controller  # noqa: F401
     socketio.init_app(app)
 
+    from app.services.notificacao_dispatcher import get_notificacao_dispatcher
+    get_notificacao_dispatcher().init_app(app)
+
+    from app.services.relatorios_service import get_gestor_relatorios
+    get_gestor_relatorios().init_app(app)
+
+    from app.services.cache_service import get_cache
+    get_cache().init_app(app)
+
+    from app.services.eventos_service import EventosService
+    from app.services.versao_estado import get_versao_estado
+    from app.services.metricas_diarias_service import MetricasDiariasService
+    from app.services.estimador_espera import get_estimador_espera
+    EventosService.registar_ouvinte(get_versao_estado().ouvinte)
+    EventosService.registar_ouvinte(MetricasDiariasService.ouvinte)
+    EventosService.registar_ouvinte(get_estimador_espera().ouvinte)
+    EventosService.registar_ouvinte(get_cache().ouvinte)
+
+    from app.services.rollup_service import RollupService
+    RollupService.ligar()
+
     setup_logging(app)
     log_request(app)
 
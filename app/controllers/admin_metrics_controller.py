@@ -13,6 +13,18 @@ Rotas:
   GET  /api/admin/atendentes/top
        Top 3 do período (trabalhador do dia/semana/mês).
 
+  POST /api/admin/relatorios
+       Cria um relatório em background (csv | ndjson | resumo).
+
+  GET  /api/admin/relatorios/<job_id>
+       Progresso do relatório; download_url quando concluído.
+
+  GET  /api/admin/relatorios/<job_id>/download
+       Ficheiro gerado.
+
+  GET  /api/admin/cache/stats
+       Backend, entradas, bytes, hits/misses/evicções do cache.
+
 Autenticação:
   Todas as rotas requerem JWT + tipo 'admin'.
 
@@ -27,7 +39,7 @@ Query params suportados:
 import logging
 from datetime import date, timedelta
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app.models.atendente import Atendente
@@ -37,6 +49,8 @@ from app.services.metrics_service import (
     calcular_score,
     parse_date,
 )
+from app.services.cache_service import get_cache
+from app.services.relatorios_service import get_gestor_relatorios
 
 logger = logging.getLogger(__name__)
 
@@ -318,3 +332,109 @@ def top_atendentes():
         "data_fim":    data_fim.isoformat()    if data_fim    else None,
         "top":         top,
     }), 200
+
+
+# ─────────────────────────────────────────────────────────────
+# RELATÓRIOS EM BACKGROUND — /api/admin/relatorios
+# ─────────────────────────────────────────────────────────────
+
+def _job_com_links(job: dict) -> dict:
+    job = dict(job)
+    job["status_url"] = url_for("admin_metrics.estado_relatorio", job_id=job["id"])
+    job["download_url"] = (
+        url_for("admin_metrics.descarregar_relatorio", job_id=job["id"])
+        if job["estado"] == "concluido" else None
+    )
+    return job
+
+
+@admin_metrics_bp.route("/relatorios", methods=["POST"])
+@jwt_required()
+def criar_relatorio():
+    """
+    POST /api/admin/relatorios
+
+    Body (JSON):
+      {
+        "tipo": "csv" | "ndjson" | "resumo",
+        "periodo": "hoje" | "semana" | "mes",         (opcional)
+        "data_inicio": "YYYY-MM-DD",                  (default: hoje)
+        "data_fim":    "YYYY-MM-DD"                   (default: hoje)
+      }
+
+    Resposta (202): job com estado, progresso e status_url.
+    Um pedido igual a um relatório ainda em curso devolve esse mesmo
+    job com "duplicado": true.
+    """
+    admin, erro = _verificar_admin()
+    if erro:
+        return erro
+
+    dados   = request.get_json(silent=True) or {}
+    tipo    = str(dados.get("tipo", "csv")).strip().lower()
+    periodo = str(dados.get("periodo", "")).strip().lower()
+
+    try:
+        data_inicio, data_fim = _resolver_periodo(
+            periodo,
+            str(dados.get("data_inicio", "")).strip(),
+            str(dados.get("data_fim", "")).strip(),
+        )
+        hoje = date.today()
+        job, novo = get_gestor_relatorios().submeter(
+            tipo, data_inicio or hoje, data_fim or hoje, pedido_por=admin.id
+        )
+    except ValueError as err:
+        return jsonify({"erro": str(err)}), 400
+
+    return jsonify({**_job_com_links(job), "duplicado": not novo}), 202
+
+
+@admin_metrics_bp.route("/relatorios/<job_id>", methods=["GET"])
+@jwt_required()
+def estado_relatorio(job_id: str):
+    """
+    GET /api/admin/relatorios/<job_id>
+
+    Resposta (200):
+      { "id", "tipo", "estado": "pendente|a_gerar|concluido|erro",
+        "progresso": 0-100, "linhas", "erro", "download_url", ... }
+    """
+    _, erro = _verificar_admin()
+    if erro:
+        return erro
+
+    job = get_gestor_relatorios().estado(job_id)
+    if not job:
+        return jsonify({"erro": "Relatório não encontrado ou expirado."}), 404
+    return jsonify(_job_com_links(job)), 200
+
+
+@admin_metrics_bp.route("/relatorios/<job_id>/download", methods=["GET"])
+@jwt_required()
+def descarregar_relatorio(job_id: str):
+    """GET /api/admin/relatorios/<job_id>/download — ficheiro do relatório concluído."""
+    _, erro = _verificar_admin()
+    if erro:
+        return erro
+
+    ficheiro = get_gestor_relatorios().ficheiro(job_id)
+    if not ficheiro:
+        return jsonify({"erro": "Relatório não encontrado ou ainda não concluído."}), 404
+
+    caminho, nome, mimetype = ficheiro
+    return send_file(caminho, mimetype=mimetype, as_attachment=True, download_name=nome)
+
+
+# ─────────────────────────────────────────────────────────────
+# GET /api/admin/cache/stats
+# ─────────────────────────────────────────────────────────────
+
+@admin_metrics_bp.route("/cache/stats", methods=["GET"])
+@jwt_required()
+def estatisticas_cache():
+    """GET /api/admin/cache/stats — backend + contadores (hits/misses deste processo)."""
+    _, erro = _verificar_admin()
+    if erro:
+        return erro
+    return jsonify(get_cache().get_stats()), 200
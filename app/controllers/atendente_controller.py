@@ -41,6 +41,7 @@ from app.models.atendente import Atendente
 from app.models.senha import Senha
 from app.models.log_actividade import LogActividade
 from app.extensions import db
+from app.utils.periodos import entre_dias
 
 from datetime import date, timedelta
 from sqlalchemy import func, case
@@ -159,15 +160,9 @@ def _calcular_metricas(atendente_id, data_inicio, data_fim):
     redir_q = db.session.query(func.count(LogActividade.id)).filter(
         LogActividade.atendente_id == atendente_id,
         LogActividade.acao == 'redirecionada'
+    ).filter(
+        entre_dias(LogActividade.created_at, data_inicio, data_fim)
     )
-    if data_inicio:
-        redir_q = redir_q.filter(
-            func.date(LogActividade.created_at) >= data_inicio
-        )
-    if data_fim:
-        redir_q = redir_q.filter(
-            func.date(LogActividade.created_at) <= data_fim
-        )
     redirecionamentos = redir_q.scalar() or 0
 
     # ── Score composto ────────────────────────────────────────
@@ -40,6 +40,9 @@ from sqlalchemy.exc import IntegrityError
 from app.extensions import db
 from app.models.avaliacao import Avaliacao
 from app.models.senha import Senha
+from app.services.cache_service import get_cache
+from app.services.metricas_diarias_service import MetricasDiariasService
+from app.services.versao_estado import get_versao_estado
 
 logger = logging.getLogger(__name__)
 
@@ -166,6 +169,10 @@ def avaliar_atendimento():
         senha.avaliacao_em         = datetime.utcnow()
 
         db.session.commit()
+        get_versao_estado().tocar(senha.id)   # rating aparece no delta do snapshot
+        get_cache().invalidar_senha(senha)
+        # Avaliação tardia de um dia fechado → recalcular esse dia
+        MetricasDiariasService.invalidar_se_fechado(senha.data_emissao)
 
         logger.info(
             "Avaliação criada: senha=%s score=%s atendente=%s",
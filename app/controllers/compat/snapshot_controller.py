@@ -4,102 +4,104 @@ import logging
 import json
 from datetime import date, datetime
 
+from sqlalchemy import and_, case, func, select
+
+from app.extensions import db
 from app.models.atendente import Atendente
 from app.models.log_actividade import LogActividade
 from app.models.senha import Senha
 from app.models.servico import Servico
-from datetime import date
-from sqlalchemy import func
+from app.services.cache_service import cached
+from app.services.versao_estado import get_versao_estado
+from app.utils.periodos import no_dia
 
 logger = logging.getLogger(__name__)
 
 
-def obter_snapshot(servico_id=None, data_str=None):
+ESTADOS_FILA      = ["aguardando", "chamada", "chamando"]
+ESTADOS_HISTORICO = ["concluida", "cancelada"]
+ACOES_EVENTOS     = ["senha_chamada", "senha_redirecionada", "senha_concluida", "senha_negada"]
+
+
+def _chave_snapshot(servico_id=None, data_str=None, since=None):
+    # A versão faz parte da chave: qualquer transição gera uma chave nova
+    return (f"snapshot:{servico_id}:{data_str or date.today().isoformat()}:"
+            f"{since}:{get_versao_estado().versao}")
+
+
+def _tags_snapshot(servico_id=None, data_str=None, since=None):
+    # Notas / recebidas não mudam a versão: a tag apanha-as também
+    return [f"servico:{servico_id}"] if servico_id else ["fila"]
+
+
+@cached(key=_chave_snapshot, tags=_tags_snapshot, ttl=60, stale_ttl=10,
+        guardar_se=lambda r: r[1] == 200)
+def obter_snapshot(servico_id=None, data_str=None, since=None):
+    """
+    Snapshot completo ou, com `since` (versão devolvida antes), só o
+    que mudou desde essa versão:
+
+      { unchanged: true, version }                 → nada mudou (sem BD)
+      { delta: true, version, since,
+        queue:   { upsert: [...], remove: [ids] },
+        history: { upsert: [...] },
+        stats:   { só campos alterados },
+        events:  [ novos ], lastCalled? }           → alterações
+      { version, queue, history, ... }             → completo (since
+                                                     desconhecido / antigo,
+                                                     ou cache por processo)
+    """
     try:
         data_ref = _parse_data(data_str)
-
-        fila_q = Senha.query.filter(
-            Senha.status.in_(["aguardando", "chamada", "chamando"]),
+        estado   = get_versao_estado()
+        versao   = estado.versao    # ler ANTES das queries: nunca saltar alterações
+
+        # Sem backend partilhado a versão é do worker: só snapshot completo
+        if since is not None and data_ref == date.today() and estado.delta_disponivel:
+            if since == versao:
+                return {
+                    "ok": True,
+                    "unchanged": True,
+                    "version": versao,
+                    "updatedAt": datetime.utcnow().isoformat() + "Z",
+                }, 200
+
+            alteracoes = estado.alteracoes_desde(since)
+            if alteracoes is not None:
+                return _snapshot_delta(data_ref, servico_id, since, versao, alteracoes), 200
+
+        fila_q = Senha.query.options(*Senha.opcoes_serializacao()).filter(
+            Senha.status.in_(ESTADOS_FILA),
             Senha.data_emissao == data_ref,
         )
         if servico_id:
             fila_q = fila_q.filter_by(servico_id=servico_id)
         fila = fila_q.order_by(Senha.emitida_em.asc()).all()
 
-        historico = Senha.query.filter(
-            Senha.status.in_(["concluida", "cancelada"]),
+        historico = Senha.query.options(*Senha.opcoes_serializacao()).filter(
+            Senha.status.in_(ESTADOS_HISTORICO),
             Senha.data_emissao == data_ref,
         ).order_by(Senha.atendimento_concluido_em.desc()).limit(50).all()
 
         hoje = data_ref  # manter consistência da data em todo o snapshot
- 
-        # FIX-BACKEND-01: filtrar lastCalled por hoje
-        # Sem este filtro, devolve a última chamada de QUALQUER dia anterior
-        ultimo_log = LogActividade.query.filter(
-            LogActividade.acao == "chamada",
-            func.date(LogActividade.created_at) == hoje
-        ).order_by(LogActividade.created_at.desc()).first()
- 
-        last_called = None
-        if ultimo_log:
-            senha_l = Senha.query.get(ultimo_log.senha_id) if ultimo_log.senha_id else None
-            if senha_l and senha_l.data_emissao == hoje:   # dupla verificação
-                last_called = {
-                    "code":        senha_l.numero,
-                    "service":     senha_l.servico.nome if senha_l.servico else "",
-                    "counterName": f"Balcão {senha_l.numero_balcao}" if senha_l.numero_balcao else "Balcão",
-                    "at":          ultimo_log.created_at.isoformat() if ultimo_log.created_at else None,
-                }
-
-        # Fallback: alguns fluxos não registam LogActividade.acao=="chamada".
-        # Neste caso, usar a senha mais recente chamada/atendendo do dia.
-        if not last_called:
-            ultima_senha = Senha.query.filter(
-                Senha.data_emissao == hoje,
-                Senha.status.in_(["chamada", "chamando", "atendendo"]),
-                Senha.chamada_em.isnot(None)
-            ).order_by(Senha.chamada_em.desc()).first()
-
-            if ultima_senha:
-                last_called = {
-                    "code":        ultima_senha.numero,
-                    "service":     ultima_senha.servico.nome if ultima_senha.servico else "",
-                    "counterName": f"Balcão {ultima_senha.numero_balcao}" if ultima_senha.numero_balcao else "Balcão",
-                    "at":          ultima_senha.chamada_em.isoformat() if ultima_senha.chamada_em else None,
-                }
 
         atendentes = Atendente.query.filter(
             Atendente.ativo.is_(True),
             Atendente.tipo.in_(["atendente", "admin"]),
         ).all()
 
-        eventos_logs = LogActividade.query.filter(
-            func.date(LogActividade.created_at) == hoje,
-            LogActividade.acao.in_(["senha_chamada", "senha_redirecionada", "senha_concluida", "senha_negada"])
-        ).order_by(LogActividade.created_at.desc()).limit(20).all()
-
-        if not last_called:
-            ultimo_evento_chamada = next(
-                (e for e in eventos_logs if e.acao == "senha_chamada"),
-                None
-            )
-            if ultimo_evento_chamada:
-                dados_evento = _evento_dict(ultimo_evento_chamada).get("dados", {})
-                numero_balcao = dados_evento.get("numero_balcao")
-                last_called = {
-                    "code": dados_evento.get("numero"),
-                    "service": dados_evento.get("servico_nome", ""),
-                    "counterName": f"Balcão {numero_balcao}" if numero_balcao else "Balcão",
-                    "at": ultimo_evento_chamada.created_at.isoformat() if ultimo_evento_chamada.created_at else None,
-                }
+        eventos_logs = _eventos_do_dia(hoje)
+        stats        = _calcular_stats(data_ref)
+        estado.guardar_stats(data_ref.isoformat(), versao, stats)
 
         return {
             "ok": True,
+            "version": versao,
             "updatedAt": datetime.utcnow().isoformat() + "Z",
             "queue": [_senha_para_ticket(s) for s in fila],
             "history": [_senha_para_ticket(s) for s in historico],
-            "lastCalled": last_called,
-            "stats": _calcular_stats(data_ref),
+            "lastCalled": _ultima_chamada(hoje, eventos_logs),
+            "stats": stats,
             "users": [_atendente_dict(a) for a in atendentes],
             "events": [_evento_dict(e) for e in eventos_logs],
         }, 200
@@ -118,10 +120,125 @@ def obter_snapshot(servico_id=None, data_str=None):
         }, 500
 
 
+def _snapshot_delta(data_ref, servico_id, since, versao, alteracoes):
+    """Só as senhas, eventos e campos de stats alterados desde `since`."""
+    ids = alteracoes["senha_ids"]
+
+    senhas = []
+    if ids:
+        senhas = Senha.query.options(*Senha.opcoes_serializacao()).filter(
+            Senha.id.in_(ids),
+            Senha.data_emissao == data_ref,
+        ).all()
+
+    na_fila = [
+        s for s in senhas
+        if s.status in ESTADOS_FILA and (not servico_id or s.servico_id == servico_id)
+    ]
+    no_historico = [s for s in senhas if s.status in ESTADOS_HISTORICO]
+    ids_fila     = {s.id for s in na_fila}
+
+    chave = data_ref.isoformat()
+    stats = _calcular_stats(data_ref)
+    estado = get_versao_estado()
+    anteriores = estado.stats_em(chave, since)
+    estado.guardar_stats(chave, versao, stats)
+    if anteriores is not None:
+        stats = {k: v for k, v in stats.items() if anteriores.get(k) != v}
+
+    eventos_logs = _eventos_do_dia(data_ref, desde=alteracoes["desde_em"])
+
+    resposta = {
+        "ok": True,
+        "delta": True,
+        "version": versao,
+        "since": since,
+        "updatedAt": datetime.utcnow().isoformat() + "Z",
+        "queue": {
+            "upsert": [_senha_para_ticket(s) for s in sorted(
+                na_fila, key=lambda s: s.emitida_em or datetime.min)],
+            "remove": sorted(i for i in ids if i not in ids_fila),
+        },
+        "history": {
+            "upsert": [_senha_para_ticket(s) for s in sorted(
+                no_historico,
+                key=lambda s: s.atendimento_concluido_em or datetime.min,
+                reverse=True)],
+        },
+        "stats": stats,
+        "events": [_evento_dict(e) for e in eventos_logs],
+    }
+
+    if any(s.chamada_em for s in senhas):
+        resposta["lastCalled"] = _ultima_chamada(data_ref, eventos_logs)
+    return resposta
+
+
+def _eventos_do_dia(hoje, desde=None):
+    query = LogActividade.query.filter(
+        no_dia(LogActividade.created_at, hoje),
+        LogActividade.acao.in_(ACOES_EVENTOS)
+    )
+    if desde is not None:
+        query = query.filter(LogActividade.created_at > desde)
+    return query.order_by(LogActividade.created_at.desc()).limit(20).all()
+
+
+def _ultima_chamada(hoje, eventos_logs):
+    """lastCalled: LogActividade 'chamada' → senha mais recente chamada → eventos."""
+    # FIX-BACKEND-01: filtrar lastCalled por hoje
+    # Sem este filtro, devolve a última chamada de QUALQUER dia anterior
+    ultimo_log = LogActividade.query.filter(
+        LogActividade.acao == "chamada",
+        no_dia(LogActividade.created_at, hoje)
+    ).order_by(LogActividade.created_at.desc()).first()
+
+    if ultimo_log:
+        senha_l = Senha.query.get(ultimo_log.senha_id) if ultimo_log.senha_id else None
+        if senha_l and senha_l.data_emissao == hoje:   # dupla verificação
+            return {
+                "code":        senha_l.numero,
+                "service":     senha_l.servico.nome if senha_l.servico else "",
+                "counterName": f"Balcão {senha_l.numero_balcao}" if senha_l.numero_balcao else "Balcão",
+                "at":          ultimo_log.created_at.isoformat() if ultimo_log.created_at else None,
+            }
+
+    # Fallback: alguns fluxos não registam LogActividade.acao=="chamada".
+    # Neste caso, usar a senha mais recente chamada/atendendo do dia.
+    ultima_senha = Senha.query.filter(
+        Senha.data_emissao == hoje,
+        Senha.status.in_(["chamada", "chamando", "atendendo"]),
+        Senha.chamada_em.isnot(None)
+    ).order_by(Senha.chamada_em.desc()).first()
+
+    if ultima_senha:
+        return {
+            "code":        ultima_senha.numero,
+            "service":     ultima_senha.servico.nome if ultima_senha.servico else "",
+            "counterName": f"Balcão {ultima_senha.numero_balcao}" if ultima_senha.numero_balcao else "Balcão",
+            "at":          ultima_senha.chamada_em.isoformat() if ultima_senha.chamada_em else None,
+        }
+
+    ultimo_evento_chamada = next(
+        (e for e in eventos_logs if e.acao == "senha_chamada"),
+        None
+    )
+    if ultimo_evento_chamada:
+        dados_evento = _evento_dict(ultimo_evento_chamada).get("dados", {})
+        numero_balcao = dados_evento.get("numero_balcao")
+        return {
+            "code": dados_evento.get("numero"),
+            "service": dados_evento.get("servico_nome", ""),
+            "counterName": f"Balcão {numero_balcao}" if numero_balcao else "Balcão",
+            "at": ultimo_evento_chamada.created_at.isoformat() if ultimo_evento_chamada.created_at else None,
+        }
+    return None
+
+
 def obter_fila_activa(servico_id=None, balcao=None):
     try:
-        query = Senha.query.filter(
-            Senha.status.in_(["aguardando", "chamada", "chamando"]),
+        query = Senha.query.options(*Senha.opcoes_serializacao()).filter(
+            Senha.status.in_(ESTADOS_FILA),
             Senha.data_emissao == date.today(),
         )
         if servico_id:
@@ -240,35 +357,81 @@ def _atendente_dict(a):
 
 
 def _calcular_stats(data_ref):
+    """
+    Estatísticas do dia em 2 queries fixas (antes: ~7 + 2 por serviço
+    + 1 por atendente):
+      1. GROUP BY servico_id com somas condicionais → totais por estado,
+         médias de espera/atendimento e totais por serviço
+      2. GROUP BY atendente → atendidos e tempo médio por atendente
+    """
     try:
-        base = Senha.query.filter_by(data_emissao=data_ref)
-        total = base.count()
-        aguardando = base.filter(Senha.status == "aguardando").count()
-        em_atend = base.filter(Senha.status.in_(["chamada", "chamando", "atendendo"])).count()
-        concluidas = base.filter(Senha.status == "concluida").count()
-        canceladas = base.filter(Senha.status == "cancelada").count()
-
-        def media(vals):
-            return round(sum(vals) / len(vals), 1) if vals else 0
-
-        te = [s.tempo_espera_minutos for s in base.filter(
-            Senha.status == "concluida", Senha.tempo_espera_minutos.isnot(None)).all()]
-        ta = [s.tempo_atendimento_minutos for s in base.filter(
-            Senha.status == "concluida", Senha.tempo_atendimento_minutos.isnot(None)).all()]
+        def conta(condicao):
+            return func.sum(case((condicao, 1), else_=0))
+
+        def soma(condicao, coluna):
+            return func.sum(case((condicao, coluna), else_=0))
+
+        concluida = Senha.status == "concluida"
+        com_te    = and_(concluida, Senha.tempo_espera_minutos.isnot(None))
+        com_ta    = and_(concluida, Senha.tempo_atendimento_minutos.isnot(None))
+
+        linhas = db.session.execute(
+            select(
+                Senha.servico_id,
+                Servico.nome,
+                Servico.ativo,
+                func.count(Senha.id),
+                conta(Senha.status == "aguardando"),
+                conta(Senha.status.in_(["chamada", "chamando", "atendendo"])),
+                conta(concluida),
+                conta(Senha.status == "cancelada"),
+                soma(com_te, Senha.tempo_espera_minutos),
+                conta(com_te),
+                soma(com_ta, Senha.tempo_atendimento_minutos),
+                conta(com_ta),
+            )
+            .select_from(Senha)
+            .outerjoin(Servico, Servico.id == Senha.servico_id)
+            .where(Senha.data_emissao == data_ref)
+            .group_by(Senha.servico_id, Servico.nome, Servico.ativo)
+            .order_by(Senha.servico_id)
+        ).all()
 
+        tot = [0] * 9
         por_servico = []
-        for sv in Servico.query.filter_by(ativo=True).all():
-            t = base.filter_by(servico_id=sv.id).count()
-            c = base.filter(Senha.servico_id == sv.id, Senha.status == "concluida").count()
-            if t > 0:
-                por_servico.append({"servico": sv.nome, "total": t, "concluidas": c})
-
-        por_atendente = []
-        for at in Atendente.query.filter(Atendente.ativo.is_(True), Atendente.tipo == "atendente").all():
-            senhas_at = base.filter(Senha.atendente_id == at.id, Senha.status == "concluida").all()
-            if senhas_at:
-                tms = [s.tempo_atendimento_minutos for s in senhas_at if s.tempo_atendimento_minutos]
-                por_atendente.append({"nome": at.nome, "atendidos": len(senhas_at), "tempo_medio_min": media(tms)})
+        for servico_id, nome, ativo, *valores in linhas:
+            valores = [int(v or 0) for v in valores]
+            tot = [a + b for a, b in zip(tot, valores)]
+            if ativo and valores[0] > 0:
+                por_servico.append({"servico": nome, "total": valores[0], "concluidas": valores[3]})
+
+        total, aguardando, em_atend, concluidas, canceladas, soma_te, n_te, soma_ta, n_ta = tot
+
+        # tempo médio só com valores > 0 (como antes: `if s.tempo_atendimento_minutos`)
+        com_tempo = and_(Senha.tempo_atendimento_minutos.isnot(None),
+                         Senha.tempo_atendimento_minutos != 0)
+        por_atendente = [
+            {"nome": nome, "atendidos": int(atendidos),
+             "tempo_medio_min": _media(soma_t, n_t)}
+            for _, nome, atendidos, soma_t, n_t in db.session.execute(
+                select(
+                    Atendente.id,
+                    Atendente.nome,
+                    func.count(Senha.id),
+                    soma(com_tempo, Senha.tempo_atendimento_minutos),
+                    conta(com_tempo),
+                )
+                .join(Senha, Senha.atendente_id == Atendente.id)
+                .where(
+                    Atendente.ativo.is_(True),
+                    Atendente.tipo == "atendente",
+                    Senha.data_emissao == data_ref,
+                    concluida,
+                )
+                .group_by(Atendente.id, Atendente.nome)
+                .order_by(Atendente.id)
+            ).all()
+        ]
 
         return {
             "total_emitidas": total,
@@ -276,8 +439,8 @@ def _calcular_stats(data_ref):
             "em_atendimento": em_atend,
             "concluidas": concluidas,
             "canceladas": canceladas,
-            "tempo_medio_espera_min": media(te),
-            "tempo_medio_atendimento_min": media(ta),
+            "tempo_medio_espera_min": _media(soma_te, n_te),
+            "tempo_medio_atendimento_min": _media(soma_ta, n_ta),
             "por_servico": por_servico,
             "por_atendente": por_atendente,
         }
@@ -296,6 +459,10 @@ def _calcular_stats(data_ref):
         }
 
 
+def _media(soma, n):
+    return round(float(soma or 0) / int(n), 1) if n else 0
+
+
 def _evento_dict(e):
     dados = {}
     if e.descricao:
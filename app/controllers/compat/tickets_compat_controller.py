@@ -8,6 +8,10 @@ from app.models.log_actividade import LogActividade
 from app.models.senha import Senha
 from app.models.servico import Servico
 from app.services.fila_service import FilaService, AtendimentoAtivoError
+from app.services.senha_service import SenhaService
+from app.services.eventos_service import EventosService
+from app.services.cache_service import get_cache
+from app.services.versao_estado import get_versao_estado
 
 logger = logging.getLogger(__name__)
 
@@ -31,11 +35,7 @@ def _emitir_directo(dados):
 
         prefixo = "P" if _e_prior(nome_servico) else "N"
         hoje = date.today()
-        contagem = Senha.query.filter(
-            Senha.data_emissao == hoje,
-            Senha.numero.like(f"{prefixo}%"),
-        ).count()
-        numero = f"{prefixo}{contagem + 1:03d}"
+        numero = SenhaService.gerar_numero(prefixo, hoje)
 
         senha = Senha(
             numero=numero,
@@ -52,6 +52,7 @@ def _emitir_directo(dados):
             descricao=f"Senha {numero} emitida para {servico.nome}",
         ))
         db.session.commit()
+        EventosService.publicar('emitida', senha)
         return {"ok": True, "ticket": _ticket(senha, servico.nome, dados)}, 201
     except Exception as exc:
         db.session.rollback()
@@ -67,7 +68,8 @@ def chamar_proximo(dados):
         if not numero_balcao:
             return {"ok": False, "message": "numero_balcao é obrigatório."}, 400
 
-        senha = FilaService.chamar_proxima(servico_id=servico_id, atendente_id=atendente_id or 0, numero_balcao=numero_balcao)
+        senha = FilaService.chamar_proxima(servico_id=servico_id, atendente_id=atendente_id or 0,
+                                           numero_balcao=numero_balcao, publicar=False)
         if not senha:
             return {"ok": False, "message": "Não há senhas na fila."}, 404
 
@@ -77,7 +79,13 @@ def chamar_proximo(dados):
             acao="chamada",
             descricao=f"Senha {senha.numero} chamada no balcão {numero_balcao}",
         ))
-        db.session.commit()
+        try:
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()   # a chamada já está gravada; só o log se perde
+            logger.error("Erro log chamada: %s", exc)
+        # Só agora: quem reage ao evento (snapshot, lastCalled) já vê o log
+        EventosService.publicar("chamada", senha)
         return {"ok": True, "ticket": _ticket(senha, senha.servico.nome if senha.servico else "")}, 200
     except AtendimentoAtivoError as exc:
         return {"ok": False, "message": str(exc)}, 409
@@ -101,6 +109,7 @@ def iniciar_atendimento(dados):
             s.atendente_id = dados["attendant_id"]
         db.session.add(LogActividade(senha_id=s.id, atendente_id=dados.get("attendant_id"), acao="iniciada", descricao=f"Atendimento {s.numero} iniciado"))
         db.session.commit()
+        EventosService.publicar('iniciada', s)
         return {"ok": True, "ticket": _ticket(s, s.servico.nome if s.servico else "")}, 200
     except Exception as exc:
         db.session.rollback()
@@ -129,6 +138,7 @@ def _concluir_directo(dados):
             s.tempo_espera_minutos = max(0, int((s.chamada_em - s.emitida_em).total_seconds() / 60))
         db.session.add(LogActividade(senha_id=s.id, atendente_id=dados.get("attendant_id"), acao="concluida", descricao=f"Atendimento {s.numero} concluído"))
         db.session.commit()
+        EventosService.publicar('concluida', s)
         nome = s.servico.nome if s.servico else ""
         return {
             "ok": True,
@@ -155,6 +165,7 @@ def reencaminhar_ticket(dados):
         if not s:
             return {"ok": False, "message": "Senha não encontrada."}, 404
         sv = Servico.query.filter(Servico.nome.ilike(f"%{destino}%"), Servico.ativo.is_(True)).first()
+        servico_origem_id = s.servico_id
         s.status = "aguardando"
         s.chamada_em = None
         s.atendente_id = None
@@ -163,6 +174,7 @@ def reencaminhar_ticket(dados):
             s.servico_id = sv.id
         db.session.add(LogActividade(senha_id=s.id, atendente_id=dados.get("attendant_id"), acao="reencaminhada", descricao=f"Senha {s.numero} → {destino}"))
         db.session.commit()
+        EventosService.publicar('redirecionada', s, servico_origem_id=servico_origem_id)
         return {"ok": True, "ticket": _ticket(s, destino)}, 200
     except Exception as exc:
         db.session.rollback()
@@ -170,6 +182,16 @@ def reencaminhar_ticket(dados):
         return {"ok": False, "message": "Erro interno."}, 500
 
 
+def _senha_alterada(senha):
+    """
+    Alteração gravada fora das transições (nota, recepção, avaliação):
+    nova versão do estado, para a senha entrar no delta do snapshot, e
+    invalidação das entradas de cache que a incluem. Chamar depois do commit.
+    """
+    get_versao_estado().tocar(senha.id)
+    get_cache().invalidar_senha(senha)
+
+
 def adicionar_nota(dados):
     ticket_id = dados.get("ticket_id")
     nota = str(dados.get("note", "")).strip()
@@ -182,6 +204,7 @@ def adicionar_nota(dados):
         s.observacoes = nota
         db.session.add(LogActividade(senha_id=s.id, atendente_id=dados.get("attendant_id"), acao="nota_adicionada", descricao=f"Nota adicionada à senha {s.numero}"))
         db.session.commit()
+        _senha_alterada(s)
         return {"ok": True, "ticket": {"id": s.id, "code": s.numero, "observacoes": nota}}, 200
     except Exception as exc:
         db.session.rollback()
@@ -201,6 +224,7 @@ def marcar_recebido(dados):
             s.recebida_em = datetime.utcnow()
         db.session.add(LogActividade(senha_id=s.id, acao="recebida", descricao=f"Utente confirmou chamada da senha {s.numero}"))
         db.session.commit()
+        _senha_alterada(s)
         return {"ok": True, "ticket": {"id": s.id, "code": s.numero, "recebida_em": datetime.utcnow().isoformat()}}, 200
     except Exception as exc:
         db.session.rollback()
@@ -235,6 +259,7 @@ def avaliar_atendimento(dados):
 
         db.session.add(LogActividade(senha_id=s.id, acao="avaliada", descricao=f"Senha {s.numero} avaliada com nota {score}"))
         db.session.commit()
+        _senha_alterada(s)
         return {
             "ok": True,
             "ticket": {
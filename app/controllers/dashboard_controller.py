@@ -16,9 +16,16 @@ from datetime import datetime, date, timedelta
 
 from app.models import Senha, Servico, Atendente, LogActividade
 from app.services import SenhaService, FilaService
+from app.services.cache_service import cached
+from app.services.estatisticas_service import EstatisticasService
+from app.services.estimador_espera import get_estimador_espera
+from app.services.exportacao_service import ExportacaoService
+from app.services.rollup_service import RollupService
 from app.schemas.senha_schema import AtendenteSchema
 from app.extensions import db
-from sqlalchemy import func
+from app.utils.periodos import no_dia
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
@@ -32,23 +39,14 @@ dashboard_bp = Blueprint('dashboard', __name__)
 def estatisticas():
     """GET /api/dashboard/estatisticas — Estatísticas gerais do dia."""
     try:
-        hoje = date.today()
-
+        # As três leituras do dia partilham uma só query (memo do pedido)
         stats_senhas  = SenhaService.obter_estatisticas_hoje()
         stats_filas   = FilaService.obter_estatisticas_fila()
+        tempo_medio   = EstatisticasService.dia()['atendimento_media_no_dia']
 
         atendentes_ativos = Atendente.query.filter_by(ativo=True).count()
         servicos_ativos   = Servico.query.filter_by(ativo=True).count()
 
-        senhas_concluidas = Senha.query.filter(
-            Senha.status == 'concluida',
-            func.date(Senha.atendimento_concluido_em) == hoje
-        ).all()
-
-        tempos      = [s.tempo_atendimento_minutos for s in senhas_concluidas
-                       if s.tempo_atendimento_minutos]
-        tempo_medio = round(sum(tempos) / len(tempos), 1) if tempos else 0
-
         return jsonify({
             "senhas":                 stats_senhas,
             "filas":                  stats_filas,
@@ -67,27 +65,16 @@ def estatisticas():
 def listar_atendentes():
     """GET /api/dashboard/atendentes — Lista atendentes com stats do dia."""
     try:
-        hoje       = date.today()
-        atendentes = Atendente.query.order_by(Atendente.nome).all()
+        atendentes = Atendente.query.options(
+            joinedload(Atendente.servico)
+        ).order_by(Atendente.nome).all()
+        do_dia     = EstatisticasService.por_atendente()   # 1 query agrupada
 
         resultado = []
         for a in atendentes:
-            # Contar atendimentos do dia para este atendente
-            atendidos = Senha.query.filter(
-                Senha.atendente_id == a.id,
-                Senha.status == 'concluida',
-                func.date(Senha.atendimento_concluido_em) == hoje
-            ).count()
-
-            # Tempo médio do atendente hoje
-            senhas_c = Senha.query.filter(
-                Senha.atendente_id == a.id,
-                Senha.status == 'concluida',
-                func.date(Senha.atendimento_concluido_em) == hoje,
-                Senha.tempo_atendimento_minutos.isnot(None)
-            ).all()
-            tempos    = [s.tempo_atendimento_minutos for s in senhas_c]
-            tempo_med = round(sum(tempos) / len(tempos)) if tempos else 0
+            stats     = do_dia.get(a.id, {})
+            atendidos = stats.get('atendidos', 0)
+            tempo_med = round(stats['tempo_medio']) if stats.get('tempo_medio') is not None else 0
 
             resultado.append({
                 "id":               a.id,
@@ -139,7 +126,7 @@ def estatisticas_trabalhador():
     """GET /api/dashboard/trabalhador/estatisticas — KPIs do trabalhador."""
     try:
         atendente_id = int(get_jwt_identity())
-        stats        = SenhaService.obter_estatisticas_trabalhador(atendente_id)
+        stats        = dict(SenhaService.obter_estatisticas_trabalhador(atendente_id))
         stats_gerais = SenhaService.obter_estatisticas_hoje()
         stats['aguardando'] = stats_gerais.get('aguardando', 0)
         return jsonify(stats), 200
@@ -176,14 +163,9 @@ def trend_admin():
         hoje  = date.today()
         ontem = hoje - timedelta(days=1)
 
-        total_hoje  = Senha.query.filter(
-            Senha.status == 'concluida',
-            func.date(Senha.atendimento_concluido_em) == hoje
-        ).count()
-        total_ontem = Senha.query.filter(
-            Senha.status == 'concluida',
-            func.date(Senha.atendimento_concluido_em) == ontem
-        ).count()
+        dias        = RollupService.por_dia(ontem, hoje)
+        total_hoje  = dias.get(hoje,  {}).get('concluidas', 0)
+        total_ontem = dias.get(ontem, {}).get('concluidas', 0)
 
         variacao_absoluta = total_hoje - total_ontem
 
@@ -232,6 +214,8 @@ def fluxo_admin():
     - dia   → agrupado por hora (00h–23h), apenas hoje
     - semana → agrupado por dia (seg–dom), últimos 7 dias
     - mes   → agrupado por dia (1–31), mês actual
+
+    Lê só o rollup horário (senhas_rollup_hora), não as senhas.
     """
     try:
         periodo = request.args.get('periodo', 'dia')
@@ -239,18 +223,11 @@ def fluxo_admin():
 
         if periodo == 'dia':
             # Agrupar por hora do dia actual
-            resultados = db.session.query(
-                func.hour(Senha.atendimento_concluido_em).label('hora'),
-                func.count(Senha.id).label('total')
-            ).filter(
-                Senha.status == 'concluida',
-                func.date(Senha.atendimento_concluido_em) == hoje
-            ).group_by(
-                func.hour(Senha.atendimento_concluido_em)
-            ).all()
+            mapa = {}
+            for hora, somas in RollupService.por_hora(hoje, hoje).items():
+                mapa[hora.hour] = mapa.get(hora.hour, 0) + somas['concluidas']
 
             # Construir array de 24h com zeros onde não há dados
-            mapa   = {r.hora: r.total for r in resultados}
             labels = [f"{h:02d}h" for h in range(24)]
             dados  = [mapa.get(h, 0) for h in range(24)]
 
@@ -258,20 +235,10 @@ def fluxo_admin():
             # Últimos 7 dias
             inicio = hoje - timedelta(days=6)
 
-            resultados = db.session.query(
-                func.date(Senha.atendimento_concluido_em).label('dia'),
-                func.count(Senha.id).label('total')
-            ).filter(
-                Senha.status == 'concluida',
-                func.date(Senha.atendimento_concluido_em) >= inicio,
-                func.date(Senha.atendimento_concluido_em) <= hoje
-            ).group_by(
-                func.date(Senha.atendimento_concluido_em)
-            ).all()
-
             # Nomes dos dias em pt-PT
             DIAS_PT = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
-            mapa    = {str(r.dia): r.total for r in resultados}
+            mapa    = {str(dia): somas['concluidas']
+                       for dia, somas in RollupService.por_dia(inicio, hoje).items()}
             labels  = []
             dados   = []
             for i in range(7):
@@ -283,22 +250,12 @@ def fluxo_admin():
             # Dias do mês actual
             primeiro_dia = hoje.replace(day=1)
 
-            resultados = db.session.query(
-                func.day(Senha.atendimento_concluido_em).label('dia'),
-                func.count(Senha.id).label('total')
-            ).filter(
-                Senha.status == 'concluida',
-                func.year(Senha.atendimento_concluido_em)  == hoje.year,
-                func.month(Senha.atendimento_concluido_em) == hoje.month
-            ).group_by(
-                func.day(Senha.atendimento_concluido_em)
-            ).all()
-
             dias_no_mes = (
                 hoje.replace(month=hoje.month % 12 + 1, day=1)
                 - timedelta(days=1)
             ).day
-            mapa   = {r.dia: r.total for r in resultados}
+            mapa   = {dia.day: somas['concluidas']
+                      for dia, somas in RollupService.por_dia(primeiro_dia, hoje).items()}
             labels = [str(d) for d in range(1, dias_no_mes + 1)]
             dados  = [mapa.get(d, 0) for d in range(1, dias_no_mes + 1)]
 
@@ -344,21 +301,15 @@ def tempo_por_servico():
     try:
         hoje     = date.today()
         servicos = Servico.query.filter_by(ativo=True).all()
+        rollup   = RollupService.por_servico(hoje, hoje)
 
         resultado = []
         for srv in servicos:
-            senhas_c = Senha.query.filter(
-                Senha.servico_id == srv.id,
-                Senha.status     == 'concluida',
-                func.date(Senha.atendimento_concluido_em) == hoje,
-                Senha.tempo_atendimento_minutos.isnot(None)
-            ).all()
-
-            tempos     = [s.tempo_atendimento_minutos for s in senhas_c]
-            total_hoje = len(senhas_c)
-            tempo_med  = round(sum(tempos) / len(tempos)) if tempos else 0
-            tempo_max  = max(tempos) if tempos else 0
-            tempo_min  = min(tempos) if tempos else 0
+            somas      = rollup.get(srv.id, {})
+            total_hoje = somas.get('n_atendimento', 0)
+            tempo_med  = round(somas['soma_atendimento'] / total_hoje) if total_hoje else 0
+            tempo_max  = somas.get('max_atendimento') or 0
+            tempo_min  = somas.get('min_atendimento') or 0
 
             resultado.append({
                 "id":          srv.id,
@@ -384,6 +335,58 @@ def tempo_por_servico():
 # ROTA PÚBLICA — sem autenticação — para ecrã de TV
 # ═══════════════════════════════════════════════════════════════
 
+@cached(key='dashboard:tv', ttl=60, stale_ttl=8, tags=['fila'])
+def _dados_tv():
+    """Conteúdo do ecrã TV — partilhado por todos os ecrãs (ver dados_tv)."""
+    hoje = date.today()
+
+    # Senhas actualmente em atendimento
+    atendendo = db.session.execute(
+        select(Senha.numero, Senha.numero_balcao, Senha.tipo, Servico.nome)
+        .outerjoin(Servico, Servico.id == Senha.servico_id)
+        .where(
+            Senha.status == 'atendendo',
+            no_dia(Senha.emitida_em, hoje)
+        )
+        .order_by(Senha.atendimento_iniciado_em.asc())
+    ).all()
+
+    em_atendimento = [{
+        "numero":  numero,
+        "balcao":  balcao or '–',
+        "servico": servico_nome or 'Geral',
+        "tipo":    tipo
+    } for numero, balcao, tipo, servico_nome in atendendo]
+
+    # Senhas aguardando (máx. 10 para o ecrã)
+    fila = FilaService.obter_fila()  # sem filtro de serviço = fila geral
+
+    # Estimativa por serviço (EWMA + balcões abertos), sem ler a BD
+    estimador   = get_estimador_espera()
+    tempo_medio = round(estimador.tempo_medio())
+
+    aguardando_list, por_servico = [], {}
+    for idx, s in enumerate(fila[:10], start=1):
+        # A fila geral mantém a ordem de cada serviço: a posição
+        # no serviço é o nº de senhas dele vistas até aqui
+        por_servico[s.servico_id] = por_servico.get(s.servico_id, 0) + 1
+        aguardando_list.append({
+            "numero":               s.numero,
+            "tipo":                 s.tipo,
+            "posicao":              idx,
+            "servico":              s.servico.nome if s.servico else 'Geral',
+            "tempo_espera_estimado": estimador.estimar(
+                s.servico_id, por_servico[s.servico_id])
+        })
+
+    return {
+        "em_atendimento":    em_atendimento,
+        "aguardando":        aguardando_list,
+        "total_aguardando":  len(fila),
+        "tempo_medio_global": tempo_medio
+    }
+
+
 @dashboard_bp.route('/public/tv', methods=['GET'])
 def dados_tv():
     """
@@ -408,49 +411,7 @@ def dados_tv():
         }
     """
     try:
-        hoje = date.today()
-
-        # Senhas actualmente em atendimento
-        atendendo = Senha.query.filter(
-            Senha.status == 'atendendo',
-            func.date(Senha.emitida_em) == hoje
-        ).order_by(Senha.atendimento_iniciado_em.asc()).all()
-
-        em_atendimento = [{
-            "numero":  s.numero,
-            "balcao":  s.numero_balcao or '–',
-            "servico": s.servico.nome if s.servico else 'Geral',
-            "tipo":    s.tipo
-        } for s in atendendo]
-
-        # Senhas aguardando (máx. 10 para o ecrã)
-        fila = FilaService.obter_fila()  # sem filtro de serviço = fila geral
-
-        # Tempo médio global hoje (senhas concluídas)
-        senhas_c = Senha.query.filter(
-            Senha.status == 'concluida',
-            func.date(Senha.atendimento_concluido_em) == hoje,
-            Senha.tempo_atendimento_minutos.isnot(None)
-        ).all()
-        tempos = [s.tempo_atendimento_minutos for s in senhas_c]
-        tempo_medio = round(sum(tempos) / len(tempos)) if tempos else 10
-
-        aguardando_list = []
-        for idx, s in enumerate(fila[:10], start=1):
-            aguardando_list.append({
-                "numero":               s.numero,
-                "tipo":                 s.tipo,
-                "posicao":              idx,
-                "servico":              s.servico.nome if s.servico else 'Geral',
-                "tempo_espera_estimado": idx * tempo_medio
-            })
-
-        return jsonify({
-            "em_atendimento":    em_atendimento,
-            "aguardando":        aguardando_list,
-            "total_aguardando":  len(fila),
-            "tempo_medio_global": tempo_medio
-        }), 200
+        return jsonify(_dados_tv()), 200
 
     except Exception as e:
         print(f"❌ Erro /dashboard/public/tv: {e}")
@@ -479,7 +440,7 @@ def acompanhar_senha(numero):
         hoje  = date.today()
         senha = Senha.query.filter(
             Senha.numero == numero.upper(),
-            func.date(Senha.emitida_em) == hoje
+            no_dia(Senha.emitida_em, hoje)
         ).first()
 
         if not senha:
@@ -490,17 +451,10 @@ def acompanhar_senha(numero):
         tempo_estimado = 0
 
         if senha.status == 'aguardando':
-            posicao = FilaService.obter_posicao_fila(senha.id)
-
-            # Tempo médio hoje
-            senhas_c = Senha.query.filter(
-                Senha.status == 'concluida',
-                func.date(Senha.atendimento_concluido_em) == hoje,
-                Senha.tempo_atendimento_minutos.isnot(None)
-            ).all()
-            tempos = [s.tempo_atendimento_minutos for s in senhas_c]
-            tempo_medio = round(sum(tempos) / len(tempos)) if tempos else 10
-            tempo_estimado = (posicao or 1) * tempo_medio
+            posicao = FilaService.obter_posicao_fila(senha.id, senha=senha)
+
+            tempo_estimado = get_estimador_espera().estimar(
+                senha.servico_id, posicao or 1)
 
         return jsonify({
             "numero":               senha.numero,
@@ -525,15 +479,16 @@ def exportar_csv():
     """
     GET /api/dashboard/admin/exportar?data_inicio=2026-03-01&data_fim=2026-03-15
 
-    Exporta histórico de atendimentos em CSV.
+    Exporta histórico de atendimentos em CSV, em streaming (memória
+    constante qualquer que seja o intervalo — ver ExportacaoService).
 
     Query params (opcionais):
         data_inicio – YYYY-MM-DD (default: hoje)
         data_fim    – YYYY-MM-DD (default: hoje)
+        gzip        – 0 desliga a compressão (por omissão comprime
+                      quando o cliente envia Accept-Encoding: gzip)
     """
-    import csv
-    import io
-    from flask import make_response
+    from flask import Response, stream_with_context
 
     try:
         hoje = date.today()
@@ -546,44 +501,32 @@ def exportar_csv():
         except ValueError:
             return jsonify({"erro": "Formato de data inválido. Use YYYY-MM-DD"}), 400
 
-        senhas = Senha.query.filter(
-            Senha.status == 'concluida',
-            func.date(Senha.atendimento_concluido_em) >= data_inicio,
-            func.date(Senha.atendimento_concluido_em) <= data_fim
-        ).order_by(Senha.atendimento_concluido_em.asc()).all()
-
-        # Gerar CSV em memória
-        output  = io.StringIO()
-        escritor = csv.writer(output)
-
-        # Cabeçalho
-        escritor.writerow([
-            'Número', 'Tipo', 'Serviço', 'Atendente',
-            'Balcão', 'Emitida em', 'Concluída em',
-            'Tempo Espera (min)', 'Tempo Atendimento (min)'
-        ])
-
-        # Linhas
-        for s in senhas:
-            escritor.writerow([
-                s.numero,
-                s.tipo,
-                s.servico.nome if s.servico else '',
-                s.atendente.nome if s.atendente else '',
-                s.numero_balcao or '',
-                s.emitida_em.strftime('%d/%m/%Y %H:%M') if s.emitida_em else '',
-                s.atendimento_concluido_em.strftime('%d/%m/%Y %H:%M')
-                    if s.atendimento_concluido_em else '',
-                s.tempo_espera_minutos    or 0,
-                s.tempo_atendimento_minutos or 0
-            ])
-
-        csv_str  = output.getvalue()
-        response = make_response(csv_str)
-        response.headers['Content-Type']        = 'text/csv; charset=utf-8'
+        def gerar():
+            try:
+                yield from blocos
+            except Exception as e:
+                # Já não é possível devolver 500: o ficheiro fica truncado
+                print(f"❌ Erro /dashboard/admin/exportar (stream): {e}")
+                raise
+
+        blocos = ExportacaoService.csv_em_blocos(
+            ExportacaoService.linhas(data_inicio, data_fim)
+        )
+        comprimir = (
+            request.args.get('gzip') != '0'
+            and 'gzip' in request.headers.get('Accept-Encoding', '')
+        )
+        if comprimir:
+            blocos = ExportacaoService.gzip_em_blocos(blocos)
+
+        response = Response(stream_with_context(gerar()),
+                            content_type='text/csv; charset=utf-8')
         response.headers['Content-Disposition'] = (
             f'attachment; filename=relatorio_{data_inicio}_{data_fim}.csv'
         )
+        response.headers['Vary'] = 'Accept-Encoding'
+        if comprimir:
+            response.headers['Content-Encoding'] = 'gzip'
         return response
 
     except Exception as e:
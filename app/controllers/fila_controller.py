@@ -12,6 +12,7 @@ CORRECÇÕES:
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.fila_service import FilaService, AtendimentoAtivoError
+from app.services.eventos_service import EventosService
 from app.schemas.senha_schema import SenhaSchema
 from app.models.senha import Senha
 from app.extensions import db
@@ -174,6 +175,7 @@ def concluir_atendimento(senha_id):
         )
 
         db.session.commit()
+        EventosService.publicar('concluida', senha)
         print(f"[OK] Senha {senha.numero} concluída (atendente {atendente_id})")
 
         return jsonify({
@@ -221,7 +223,8 @@ def redirecionar_senha(senha_id):
         if not servico_destino.ativo:
             return jsonify({'erro': f'Serviço "{servico_destino.nome}" está inactivo'}), 400
 
-        servico_anterior = senha.servico.nome if senha.servico else '–'
+        servico_anterior    = senha.servico.nome if senha.servico else '–'
+        servico_anterior_id = senha.servico_id
 
         # Preservar formulário + adicionar nota
         obs_orig = senha.observacoes or ''
@@ -252,6 +255,8 @@ def redirecionar_senha(senha_id):
         )
 
         db.session.commit()
+        EventosService.publicar('redirecionada', senha,
+                                servico_origem_id=servico_anterior_id)
         print(f"[OK] Senha {senha.numero}: {servico_anterior} → {servico_destino.nome}")
 
         return jsonify({
@@ -278,15 +283,13 @@ def redirecionar_senha(senha_id):
 @fila_bp.route('/status', methods=['GET'])
 def obter_status_todas_filas():
     try:
-        from app.models import Servico, Senha
-        servicos = Servico.query.filter_by(ativo=True).order_by(Servico.ordem_exibicao).all()
+        from app.models import Servico
+        servicos  = Servico.query.filter_by(ativo=True).order_by(Servico.ordem_exibicao).all()
+        contagens = FilaService.contagens_por_servico()   # 1 query para todos
         filas, total_a, total_e = [], 0, 0
         for s in servicos:
-            ag = Senha.query.filter_by(servico_id=s.id, status='aguardando').count()
-            at = Senha.query.filter(
-                Senha.servico_id == s.id,
-                Senha.status.in_(['chamando', 'atendendo'])
-            ).count()
+            c = contagens.get(s.id, {})
+            ag, at = c.get('aguardando', 0), c.get('atendendo', 0)
             total_a += ag; total_e += at
             filas.append({'servico_id': s.id, 'nome': s.nome,
                           'icone': s.icone or '📋', 'aguardando': ag, 'atendendo': at})
@@ -364,6 +367,7 @@ def cancelar_senha(senha_id):
         )
 
         db.session.commit()
+        EventosService.publicar('cancelada', senha)
 
         print(f"[OK] Senha {senha.numero} cancelada")
 
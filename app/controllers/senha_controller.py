@@ -13,6 +13,9 @@ ALTERAÇÕES:
 from flask import Blueprint, request, jsonify, send_from_directory, current_app
 import mimetypes
 from app.services.senha_service import SenhaService
+from app.services.numeracao_service import NumeracaoService, NumerosEmConflitoError
+from app.services.notificacao_dispatcher import get_notificacao_dispatcher
+from app.services.eventos_service import EventosService
 from app.schemas.senha_schema import (
     EmitirSenhaSchema,
     CancelarSenhaSchema,
@@ -36,7 +39,7 @@ senha_bp = Blueprint('senha', __name__)
 
 @senha_bp.route('/emitir', methods=['POST'])
 @senha_bp.route('', methods=['POST'])
-@rate_limit(limit=10, window=60)
+@rate_limit(limit=10, window=60, key_prefix='emissao')
 def emitir_senha():
     """
     POST /api/senhas | POST /api/senhas/emitir
@@ -68,6 +71,101 @@ def emitir_senha():
         return jsonify({'erro': 'Erro interno ao emitir senha'}), 500
 
 
+# ═══════════════════════════════════════════════════════════════
+# Blocos de numeração (quiosques / staff autenticados — JWT)
+#   POST /api/senhas/blocos                 – arrendar bloco
+#   POST /api/senhas/blocos/:id/lote        – registar senhas do bloco
+#   POST /api/senhas/blocos/:id/devolver    – devolver números livres
+# ═══════════════════════════════════════════════════════════════
+
+@senha_bp.route('/blocos', methods=['POST'])
+@jwt_required()
+@rate_limit(limit=30, window=60, key_prefix='blocos', por='user')
+def arrendar_bloco():
+    """
+    Body: { "titular": "quiosque-1", "tipo": "normal", "tamanho": 50 }
+    Resposta 201: { "bloco": { "id", "prefixo", "inicio", "fim", "expira_em", ... } }
+    """
+    dados = request.get_json() or {}
+    try:
+        bloco = NumeracaoService.arrendar_bloco(
+            titular = str(dados.get('titular') or '').strip(),
+            prefixo = dados.get('prefixo') or
+                      ('P' if dados.get('tipo') == 'prioritaria' else 'N'),
+            tamanho = dados.get('tamanho')
+        )
+        return jsonify({'bloco': bloco.to_dict()}), 201
+    except (ValueError, TypeError) as e:
+        return jsonify({'erro': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] Arrendar bloco: {e}")
+        return jsonify({'erro': 'Erro interno ao arrendar bloco'}), 500
+
+
+@senha_bp.route('/blocos/<int:bloco_id>/lote', methods=['POST'])
+@jwt_required()
+@rate_limit(limit=60, window=60, key_prefix='lote', por='user')
+def registar_lote(bloco_id):
+    """
+    Body: { "titular": "quiosque-1",
+            "senhas": [ { "numero": "N101", "servico_id": 1,
+                          "emitida_em": "2026-03-15T08:01:02" }, ... ] }
+    Resposta 200: { "criadas": [...], "duplicadas": [...], "rejeitadas": [...], "bloco": {...} }
+    Resposta 409: { "erro", "numeros": [...] } — gravados em simultâneo por
+                  outro pedido; o lote não foi gravado (reenviar)
+    """
+    dados = request.get_json() or {}
+    senhas = dados.get('senhas')
+    if not isinstance(senhas, list):
+        return jsonify({'erro': "Campo 'senhas' deve ser uma lista"}), 400
+
+    try:
+        resultado = NumeracaoService.registar_lote(
+            bloco_id, str(dados.get('titular') or '').strip(), senhas
+        )
+        return jsonify(resultado), 200
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 404
+    except NumerosEmConflitoError as e:
+        return jsonify({'erro': str(e), 'numeros': e.numeros}), 409
+    except Exception as e:
+        print(f"[ERROR] Registar lote: {e}")
+        return jsonify({'erro': 'Erro interno ao registar lote'}), 500
+
+
+@senha_bp.route('/blocos/<int:bloco_id>/devolver', methods=['POST'])
+@jwt_required()
+@rate_limit(limit=60, window=60, key_prefix='lote', por='user')
+def devolver_bloco(bloco_id):
+    dados = request.get_json() or {}
+    try:
+        bloco = NumeracaoService.devolver_bloco(
+            bloco_id, str(dados.get('titular') or '').strip()
+        )
+        return jsonify({'bloco': bloco.to_dict()}), 200
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 404
+    except Exception as e:
+        print(f"[ERROR] Devolver bloco: {e}")
+        return jsonify({'erro': 'Erro interno ao devolver bloco'}), 500
+
+
+# ═══════════════════════════════════════════════════════════════
+# GET /api/senhas/notificacoes/:id  — estado do SMS de emissão
+# ═══════════════════════════════════════════════════════════════
+
+@senha_bp.route('/notificacoes/<string:notificacao_id>', methods=['GET'])
+def estado_notificacao(notificacao_id):
+    """
+    Resposta 200: { "id", "estado": "pendente|enviada|falhada|descartada",
+                    "tentativas", "erro", "provider" }
+    """
+    estado = get_notificacao_dispatcher().estado(notificacao_id)
+    if not estado:
+        return jsonify({'erro': 'Notificação não encontrada'}), 404
+    return jsonify(estado), 200
+
+
 # ═══════════════════════════════════════════════════════════════
 # GET /api/senhas
 # ═══════════════════════════════════════════════════════════════
@@ -220,6 +318,7 @@ def iniciar_atendimento(senha_id):
             atendente_id=atendente_id,
             numero_balcao=data['numero_balcao']
         )
+        EventosService.publicar('iniciada', senha)
         return jsonify({
             "mensagem": "Atendimento iniciado",
             "senha": SenhaSchema().dump(senha)
@@ -249,6 +348,7 @@ def finalizar_atendimento(senha_id):
             return jsonify({"erro": "Senha não encontrada"}), 404
 
         senha.finalizar_atendimento(observacoes=data.get('observacoes'))
+        EventosService.publicar('concluida', senha)
         return jsonify({
             "mensagem": "Atendimento finalizado",
             "senha": SenhaSchema().dump(senha)
@@ -0,0 +1,124 @@
+"""
+app/controllers/socket_controller.py
+═══════════════════════════════════════════════════════════════
+Handlers Socket.IO — entrada/saída das salas de eventos
+
+Os eventos senha_* (EventosService) só chegam às salas interessadas;
+cada cliente diz o que quer acompanhar logo após ligar (e de novo
+após cada reconexão):
+
+  socket.emit('entrar', { senha: 'N042' })                 → senha:<id>
+  socket.emit('entrar', { servico_id: 3 })                 → servico:3
+  socket.emit('entrar', { tv: true })                      → tv
+  socket.emit('entrar', { balcao: 2, token: '<JWT>' })     → balcao:2
+  socket.emit('entrar', { admin: true, token: '<JWT>' })   → admin
+  socket.emit('sair',   { salas: ['servico:3'] })
+
+A resposta (ack) é { ok, salas, erros } ou { ok: false, erro }.
+balcao e admin exigem access token de funcionário / administrador.
+═══════════════════════════════════════════════════════════════
+"""
+
+from flask_jwt_extended import decode_token
+from flask_socketio import join_room, leave_room
+
+from app.extensions import socketio
+from app.services.eventos_service import EventosService
+
+
+PREFIXOS_SALA = ('servico:', 'senha:', 'balcao:')
+
+
+def _claims(dados):
+    """Claims do access token enviado no payload (None se inválido)."""
+    token = (dados or {}).get('token')
+    if not token:
+        return None
+    try:
+        claims = decode_token(token)
+    except Exception:
+        return None
+    return claims if claims.get('type') == 'access' else None
+
+
+def _senha_id(dados):
+    """Id da senha a acompanhar: por número de hoje (ex: N042) ou id."""
+    from app.services.senha_service import SenhaService
+
+    numero = dados.get('senha') or dados.get('numero')
+    if numero:
+        senha = SenhaService.obter_por_numero(str(numero).upper())
+        return senha.id if senha else None
+
+    senha_id = dados.get('senha_id')
+    return int(senha_id) if str(senha_id or '').isdigit() else None
+
+
+@socketio.on('entrar')
+def entrar(dados=None):
+    """
+    Junta o socket às salas pedidas. Pedidos inválidos não impedem os
+    restantes: a resposta traz as salas efectivas e os erros.
+    """
+    dados = dados if isinstance(dados, dict) else {}
+    salas = []
+    erros = []
+
+    try:
+        if dados.get('senha') or dados.get('numero') or dados.get('senha_id'):
+            senha_id = _senha_id(dados)
+            if senha_id:
+                salas.append(EventosService.sala_senha(senha_id))
+            else:
+                erros.append('Senha não encontrada')
+
+        if str(dados.get('servico_id') or '').isdigit():
+            salas.append(EventosService.sala_servico(int(dados['servico_id'])))
+
+        if dados.get('tv'):
+            salas.append(EventosService.SALA_TV)
+
+        if dados.get('balcao') or dados.get('admin'):
+            claims = _claims(dados)
+
+            if not claims:
+                erros.append('Token inválido ou em falta')
+            else:
+                if dados.get('balcao'):
+                    if str(dados['balcao']).isdigit():
+                        salas.append(EventosService.sala_balcao(int(dados['balcao'])))
+                    else:
+                        erros.append('Balcão inválido')
+
+                if dados.get('admin'):
+                    if claims.get('tipo') == 'admin':
+                        salas.append(EventosService.SALA_ADMIN)
+                    else:
+                        erros.append('Acesso negado. Apenas administradores.')
+
+    except Exception as e:
+        print(f"❌ Erro socket 'entrar': {e}")
+        return {'ok': False, 'salas': [], 'erro': 'Erro interno do servidor'}
+
+    for sala in salas:
+        join_room(sala)
+
+    if not salas:
+        return {'ok': False, 'salas': [], 'erro': '; '.join(erros) or 'Nenhuma sala pedida'}
+    return {'ok': True, 'salas': salas, 'erros': erros}
+
+
+@socketio.on('sair')
+def sair(dados=None):
+    """Sai das salas indicadas (só salas de eventos conhecidas)."""
+    dados = dados if isinstance(dados, dict) else {}
+    salas = [
+        s for s in dados.get('salas') or []
+        if isinstance(s, str) and (
+            s.startswith(PREFIXOS_SALA)
+            or s in (EventosService.SALA_TV, EventosService.SALA_ADMIN)
+        )
+    ]
+    for sala in salas:
+        leave_room(sala)
+    return {'ok': True, 'salas': salas}
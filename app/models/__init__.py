@@ -6,18 +6,26 @@ from app.models.base import BaseModel
 from app.models.servico import Servico
 from app.models.utente import Utente
 from app.models.senha import Senha
+from app.models.senha_sequencia import SenhaSequencia
+from app.models.senha_bloco import SenhaBloco
 from app.models.atendente import Atendente
 from app.models.log_actividade import LogActividade
 from app.models.configuracao import Configuracao
 from app.models.avaliacao import Avaliacao
+from app.models.metrica_diaria import MetricaDiaria
+from app.models.senha_rollup_hora import SenhaRollupHora
 
 __all__ = [
     'BaseModel',
     'Servico',
     'Utente',
     'Senha',
+    'SenhaSequencia',
+    'SenhaBloco',
     'Atendente',
     'LogActividade',
     'Configuracao',
-    'Avaliacao'
+    'Avaliacao',
+    'MetricaDiaria',
+    'SenhaRollupHora'
 ]
@@ -21,6 +21,11 @@ class LogActividade(BaseModel):
     """
     
     __tablename__ = 'log_actividades'
+
+    __table_args__ = (
+        # Última chamada / eventos do dia (snapshot): acao + created_at
+        db.Index('ix_log_actividades_acao_criado', 'acao', 'created_at'),
+    )
     
     # Colunas
     senha_id = db.Column(
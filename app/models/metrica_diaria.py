@@ -0,0 +1,64 @@
+"""
+app/models/metrica_diaria.py
+═══════════════════════════════════════════════════════════════
+Métricas agregadas por dia, atendente e serviço (dias fechados)
+
+Uma linha por (data, atendente_id, servico_id) com SOMAS — não
+médias — para que qualquer intervalo se obtenha somando linhas:
+  tempo médio     = tempo_soma / tempo_n
+  avaliação média = avaliacoes_soma / avaliacoes_total
+
+Convenções (sem FKs, é uma tabela de cache):
+  atendente_id = 0 → senhas sem atendente
+  servico_id   = 0 → linha de fecho: o dia já foi calculado
+                     (existe mesmo em dias sem senhas)
+
+Escrita só pelo MetricasDiariasService; apagar as linhas de um dia
+força o seu recálculo no próximo pedido.
+═══════════════════════════════════════════════════════════════
+"""
+
+from app.extensions import db
+from app.models.base import BaseModel
+
+
+class MetricaDiaria(BaseModel):
+    """Totais de um dia fechado para um par atendente × serviço."""
+
+    __tablename__ = 'metricas_diarias'
+
+    __table_args__ = (
+        db.UniqueConstraint('data', 'atendente_id', 'servico_id',
+                            name='uq_metricas_diarias_chave'),
+        {'comment': 'Cache de métricas por dia fechado'}
+    )
+
+    # Somas guardadas por linha (ordem usada pelo MetricasDiariasService)
+    CAMPOS = (
+        'total',
+        'concluidas',
+        'tempo_soma',
+        'tempo_n',
+        'redirecionamentos',
+        'avaliacoes_soma',
+        'avaliacoes_total',
+    )
+
+    data = db.Column(db.Date, nullable=False, comment='Dia (senhas.data_emissao)')
+    atendente_id = db.Column(db.Integer, nullable=False, default=0,
+                             comment='0 = sem atendente')
+    servico_id = db.Column(db.Integer, nullable=False, default=0,
+                           comment='0 = linha de fecho do dia')
+
+    total = db.Column(db.Integer, nullable=False, default=0, comment='Senhas emitidas')
+    concluidas = db.Column(db.Integer, nullable=False, default=0)
+    tempo_soma = db.Column(db.Integer, nullable=False, default=0,
+                           comment='Soma de tempo_atendimento_minutos (concluídas)')
+    tempo_n = db.Column(db.Integer, nullable=False, default=0,
+                        comment='Concluídas com tempo de atendimento')
+    redirecionamentos = db.Column(db.Integer, nullable=False, default=0)
+    avaliacoes_soma = db.Column(db.Integer, nullable=False, default=0)
+    avaliacoes_total = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MetricaDiaria {self.data} at={self.atendente_id} sv={self.servico_id}>'
@@ -22,6 +22,16 @@ class Senha(BaseModel):
     __table_args__ = (
         # Constraint única por número + data → reinicia diariamente
         db.UniqueConstraint('numero', 'data_emissao', name='uq_numero_data'),
+        # Posição na fila (COUNT das senhas à frente) — FilaService._contar_a_frente
+        db.Index('ix_senhas_fila_posicao', 'status', 'servico_id', 'tipo', 'emitida_em'),
+        # Fila/estatísticas do dia (snapshot, painéis): status + data_emissao
+        db.Index('ix_senhas_status_dia', 'status', 'data_emissao',
+                 'servico_id', 'tipo', 'emitida_em'),
+        # Concluídas por intervalo (dashboard, exportação)
+        db.Index('ix_senhas_status_concluida', 'status', 'atendimento_concluido_em'),
+        # Concluídas por atendente (métricas, atendimento activo)
+        db.Index('ix_senhas_atendente_status', 'atendente_id', 'status',
+                 'atendimento_concluido_em'),
         {'comment': 'Senhas de atendimento com numeração diária'}
     )
 
@@ -143,6 +153,34 @@ class Senha(BaseModel):
 
         return data
 
+    # ═══════════════════════════════════════════════════════════
+    # Estratégia de carga para serialização
+    # ═══════════════════════════════════════════════════════════
+
+    @classmethod
+    def opcoes_serializacao(cls):
+        """
+        Opções de carga partilhadas pelos caminhos de leitura que
+        serializam senhas (to_dict, SenhaSchema, _senha_para_ticket).
+
+        servico / atendente / utente são many-to-one lazy: sem isto,
+        listar 500 senhas dispara até 3×500 SELECTs extra. Com
+        joinedload vêm no mesmo SELECT (LEFT JOIN), só com as colunas
+        que os serializadores usam.
+
+        Uso: Senha.query.options(*Senha.opcoes_serializacao())
+        """
+        from sqlalchemy.orm import joinedload
+        from app.models.atendente import Atendente
+        from app.models.servico import Servico
+        from app.models.utente import Utente
+
+        return (
+            joinedload(cls.servico).load_only(Servico.id, Servico.nome, Servico.icone),
+            joinedload(cls.atendente).load_only(Atendente.id, Atendente.nome),
+            joinedload(cls.utente).load_only(Utente.id, Utente.nome, Utente.telefone),
+        )
+
     @classmethod
     def obter_por_numero_e_data(cls, numero, data_emissao=None):
         if data_emissao is None:
@@ -154,7 +192,8 @@ class Senha(BaseModel):
         if data_emissao is None:
             data_emissao = datetime.utcnow().date()
 
-        query = cls.query.filter_by(data_emissao=data_emissao, status='aguardando')
+        query = cls.query.options(*cls.opcoes_serializacao()).filter_by(
+            data_emissao=data_emissao, status='aguardando')
         if servico_id:
             query = query.filter_by(servico_id=servico_id)
 
@@ -165,7 +204,8 @@ class Senha(BaseModel):
 
     @classmethod
     def obter_por_utente(cls, utente_id, limite=10):
-        return cls.query.filter_by(utente_id=utente_id).order_by(cls.emitida_em.desc()).limit(limite).all()
+        return cls.query.options(*cls.opcoes_serializacao()).filter_by(
+            utente_id=utente_id).order_by(cls.emitida_em.desc()).limit(limite).all()
 
     def chamar(self, numero_balcao=None):
         if self.status != 'aguardando':
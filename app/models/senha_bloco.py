@@ -0,0 +1,79 @@
+"""
+app/models/senha_bloco.py
+═══════════════════════════════════════════════════════════════
+Blocos de numeração arrendados a quiosques / processos emissores
+
+Um bloco é um intervalo [inicio, fim] de números de um prefixo num
+dia (ex: N101–N150), reservado em `senha_sequencias`. O titular
+atribui os números localmente e envia as senhas em lotes; `usado_ate`
+guarda o maior número já registado. Quando o arrendamento expira, o
+resto do intervalo (usado_ate+1 .. fim) volta a ser arrendado.
+═══════════════════════════════════════════════════════════════
+"""
+
+from datetime import datetime
+
+from app.extensions import db
+from app.models.base import BaseModel
+
+
+class SenhaBloco(BaseModel):
+    """Intervalo de números arrendado a um titular."""
+
+    __tablename__ = 'senha_blocos'
+
+    __table_args__ = (
+        # Procura de blocos expirados para reaproveitar
+        db.Index('ix_senha_blocos_reaproveitar', 'estado', 'data', 'prefixo', 'expira_em'),
+        {'comment': 'Blocos de numeração arrendados a quiosques'}
+    )
+
+    ESTADOS = ['activo', 'fechado']
+
+    data = db.Column(db.Date, nullable=False, comment='Dia da numeração')
+    prefixo = db.Column(db.String(5), nullable=False, comment='N, P, ...')
+    inicio = db.Column(db.Integer, nullable=False, comment='Primeiro número do bloco')
+    fim = db.Column(db.Integer, nullable=False, comment='Último número do bloco')
+    usado_ate = db.Column(
+        db.Integer,
+        nullable=False,
+        comment='Maior número já registado (inicio-1 = nenhum)'
+    )
+    titular = db.Column(db.String(100), nullable=False, comment='Quiosque / processo')
+    expira_em = db.Column(db.DateTime, nullable=False, comment='Fim do arrendamento')
+    estado = db.Column(
+        db.String(20),
+        nullable=False,
+        default='activo',
+        comment='activo | fechado (resto devolvido ou esgotado)'
+    )
+
+    def __repr__(self):
+        return (f'<SenhaBloco {self.prefixo}{self.inicio:03d}-'
+                f'{self.prefixo}{self.fim:03d} {self.titular} {self.estado}>')
+
+    @property
+    def expirado(self):
+        return self.expira_em <= datetime.utcnow()
+
+    @property
+    def livres(self):
+        """Números ainda não registados neste bloco."""
+        return max(self.fim - self.usado_ate, 0)
+
+    def contem(self, n):
+        return self.inicio <= n <= self.fim
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'data': self.data.isoformat() if self.data else None,
+            'prefixo': self.prefixo,
+            'inicio': self.inicio,
+            'fim': self.fim,
+            'usado_ate': self.usado_ate,
+            'livres': self.livres,
+            'titular': self.titular,
+            'estado': self.estado,
+            'expira_em': self.expira_em.isoformat() if self.expira_em else None,
+        }
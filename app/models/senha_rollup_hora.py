@@ -0,0 +1,65 @@
+"""
+app/models/senha_rollup_hora.py
+═══════════════════════════════════════════════════════════════
+Factos horários das senhas (rollup incremental)
+
+Uma linha por (hora, servico_id, atendente_id) com contadores e
+somas, actualizada na mesma transacção da emissão / conclusão /
+cancelamento (RollupService). Os gráficos do dashboard lêem só esta
+tabela — o custo não cresce com o histórico de `senhas`.
+
+Em que hora conta cada facto (UTC, como os timestamps de senhas):
+  emitidas                      → hora de emitida_em
+  concluidas, espera, atendimento → hora de atendimento_concluido_em
+  canceladas                    → hora do cancelamento
+
+Convenções: atendente_id = 0 → sem atendente (ex: emissões).
+`flask rebuild-rollups` reconstrói a tabela a partir de `senhas`.
+═══════════════════════════════════════════════════════════════
+"""
+
+from app.extensions import db
+from app.models.base import BaseModel
+
+
+class SenhaRollupHora(BaseModel):
+    """Contadores de uma hora para um par serviço × atendente."""
+
+    __tablename__ = 'senhas_rollup_hora'
+
+    __table_args__ = (
+        db.UniqueConstraint('hora', 'servico_id', 'atendente_id',
+                            name='uq_senhas_rollup_hora_chave'),
+        {'comment': 'Factos horários das senhas (dashboard)'}
+    )
+
+    # Contadores somados em cada actualização (ordem usada pelo RollupService)
+    SOMAS = (
+        'emitidas',
+        'concluidas',
+        'canceladas',
+        'soma_espera',
+        'n_espera',
+        'soma_atendimento',
+        'n_atendimento',
+    )
+
+    hora = db.Column(db.DateTime, nullable=False, comment='Início da hora (UTC)')
+    servico_id = db.Column(db.Integer, nullable=False)
+    atendente_id = db.Column(db.Integer, nullable=False, default=0,
+                             comment='0 = sem atendente')
+
+    emitidas = db.Column(db.Integer, nullable=False, default=0)
+    concluidas = db.Column(db.Integer, nullable=False, default=0)
+    canceladas = db.Column(db.Integer, nullable=False, default=0)
+    soma_espera = db.Column(db.Integer, nullable=False, default=0,
+                            comment='Soma de tempo_espera_minutos (concluídas)')
+    n_espera = db.Column(db.Integer, nullable=False, default=0)
+    soma_atendimento = db.Column(db.Integer, nullable=False, default=0,
+                                 comment='Soma de tempo_atendimento_minutos (concluídas)')
+    n_atendimento = db.Column(db.Integer, nullable=False, default=0)
+    max_atendimento = db.Column(db.Integer, nullable=True)
+    min_atendimento = db.Column(db.Integer, nullable=True)
+
+    def __repr__(self):
+        return f'<SenhaRollupHora {self.hora} sv={self.servico_id} at={self.atendente_id}>'
@@ -0,0 +1,125 @@
+"""
+app/models/senha_sequencia.py
+═══════════════════════════════════════════════════════════════
+Contador diário de numeração de senhas (uma linha por dia + prefixo)
+
+MOTIVAÇÃO:
+  O número era calculado com COUNT(*) ... WHERE numero LIKE 'N%' + 1:
+  um scan por emissão e, com vários quiosques em simultâneo, dois
+  pedidos liam a mesma contagem e colidiam em `uq_numero_data`.
+
+COMO FUNCIONA:
+  UPDATE senha_sequencias SET ultimo = ultimo + 1
+   WHERE data = ? AND prefixo = ?
+  O UPDATE bloqueia a linha até ao commit da emissão, por isso dois
+  quiosques nunca recebem o mesmo número e um rollback devolve-o.
+  A primeira emissão do dia cria a linha (INSERT ... ON DUPLICATE KEY /
+  ON CONFLICT DO NOTHING), semeada com o maior número já existente.
+═══════════════════════════════════════════════════════════════
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from app.extensions import db
+from app.models.base import BaseModel
+
+
+class SenhaSequencia(BaseModel):
+    """Último número emitido por (data, prefixo)."""
+
+    __tablename__ = 'senha_sequencias'
+
+    __table_args__ = (
+        db.UniqueConstraint('data', 'prefixo', name='uq_sequencia_data_prefixo'),
+        {'comment': 'Contador diário de numeração de senhas'}
+    )
+
+    data = db.Column(db.Date, nullable=False, comment='Dia da numeração')
+    prefixo = db.Column(db.String(5), nullable=False, comment='N, P, ...')
+    ultimo = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        comment='Último número atribuído'
+    )
+
+    def __repr__(self):
+        return f'<SenhaSequencia {self.prefixo} {self.data} = {self.ultimo}>'
+
+    # ═══════════════════════════════════════════════════════════
+    # Incremento atómico
+    # ═══════════════════════════════════════════════════════════
+
+    @classmethod
+    def reservar(cls, data, prefixo, quantidade=1):
+        """
+        Reserva `quantidade` números consecutivos e devolve o último.
+        Corre na transacção da sessão actual — o commit da emissão
+        confirma o número; um rollback devolve-o.
+        """
+        if cls._incrementar(data, prefixo, quantidade) == 0:
+            cls._criar(data, prefixo)
+            cls._incrementar(data, prefixo, quantidade)
+
+        return db.session.execute(
+            select(cls.ultimo).where(cls.data == data, cls.prefixo == prefixo)
+        ).scalar_one()
+
+    @classmethod
+    def _incrementar(cls, data, prefixo, quantidade):
+        resultado = db.session.execute(
+            update(cls)
+            .where(cls.data == data, cls.prefixo == prefixo)
+            .values(ultimo=cls.ultimo + quantidade)
+            .execution_options(synchronize_session=False)
+        )
+        return resultado.rowcount
+
+    @classmethod
+    def _criar(cls, data, prefixo):
+        """Cria a linha do dia; ignora se outro processo a criou primeiro."""
+        agora   = datetime.utcnow()
+        valores = dict(
+            data=data, prefixo=prefixo,
+            ultimo=cls._maior_emitido(data, prefixo),
+            created_at=agora, updated_at=agora
+        )
+        dialecto = db.session.get_bind().dialect.name
+
+        if dialecto in ('mysql', 'mariadb'):
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(cls).values(**valores).on_duplicate_key_update(
+                ultimo=cls.ultimo
+            )
+        elif dialecto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(cls).values(**valores).on_conflict_do_nothing()
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(cls).values(**valores).on_conflict_do_nothing()
+
+        db.session.execute(stmt)
+
+    @staticmethod
+    def _maior_emitido(data, prefixo):
+        """
+        Maior número já emitido no dia (senhas anteriores à tabela de
+        sequências). Só corre uma vez por dia e prefixo.
+        """
+        from app.models.senha import Senha
+
+        numeros = db.session.execute(
+            select(Senha.numero).where(
+                Senha.data_emissao == data,
+                Senha.numero.like(f'{prefixo}%')
+            )
+        ).scalars()
+
+        maior = 0
+        for numero in numeros:
+            sufixo = numero[len(prefixo):]
+            if sufixo.isdigit():
+                maior = max(maior, int(sufixo))
+        return maior
@@ -52,20 +52,24 @@ class Servico(BaseModel):
         self.ativo = kwargs.get('ativo', True)
 
     def calcular_tempo_espera_estimado(self):
+        from app.services.estimador_espera import get_estimador_espera
 
         senhas_pendentes = self.senhas.filter(
             db.text("status IN ('aguardando','chamada','atendendo')")
         ).count()
 
-        return senhas_pendentes * self.tempo_medio_minutos
+        # EWMA do serviço (semeada com tempo_medio_minutos) ÷ balcões abertos
+        return get_estimador_espera().estimar(self.id, senhas_pendentes)
 
     def obter_estatisticas_hoje(self):
+        from app.models.senha import Senha
+        from app.utils.periodos import no_dia
 
         hoje = date.today()
 
         return {
             'total_senhas_hoje': self.senhas.filter(
-                db.func.date(db.text("emitida_em")) == hoje
+                no_dia(Senha.emitida_em, hoje)
             ).count(),
             'aguardando': self.senhas.filter_by(status='aguardando').count(),
             'atendendo': self.senhas.filter_by(status='atendendo').count(),
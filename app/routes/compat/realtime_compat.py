@@ -15,7 +15,8 @@ realtime_compat_bp = Blueprint("realtime_compat", __name__)
 def snapshot():
     servico_id = request.args.get("servico_id", type=int)
     data_str = request.args.get("data", type=str)
-    resposta, codigo = obter_snapshot(servico_id=servico_id, data_str=data_str)
+    since = request.args.get("since", type=int)
+    resposta, codigo = obter_snapshot(servico_id=servico_id, data_str=data_str, since=since)
     return jsonify(resposta), codigo
 
 
@@ -6,6 +6,7 @@ from app.services.senha_service import SenhaService
 from app.services.fila_service import FilaService
 from app.services.auth_service import AuthService
 from app.services.notificacao_service import NotificacaoService
+from app.services.numeracao_service import NumeracaoService
 from app.services.metrics_service import (
     get_atendente_metrics,
     get_todos_atendentes_metrics,
@@ -17,5 +18,6 @@ __all__ = [
     'SenhaService',
     'FilaService',
     'AuthService',
-    'NotificacaoService'
+    'NotificacaoService',
+    'NumeracaoService'
 ]
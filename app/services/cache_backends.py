@@ -0,0 +1,537 @@
+"""
+app/services/cache_backends.py
+═══════════════════════════════════════════════════════════════
+Backends de armazenamento do CacheService
+
+MOTIVAÇÃO:
+  Com o gunicorn em vários workers cada processo tinha o seu cache
+  (e o seu RateLimiter): a taxa de acertos caía com o nº de workers
+  e os limites multiplicavam-se. O CacheService passa a guardar os
+  valores num backend escolhido em config.py (CACHE_BACKEND).
+
+BACKENDS:
+  memoria — LRU segmentado por lock, no processo (o de sempre).
+            Guarda os objectos tal como estão (sem serializar).
+  sqlite  — ficheiro SQLite em WAL partilhado pelos workers do
+            mesmo servidor (CACHE_SQLITE_CAMINHO).
+  redis   — servidor Redis partilhado por vários servidores
+            (CACHE_REDIS_URL; exige o pacote `redis`).
+
+INTERFACE (chaves str; ttl em segundos, None = sem expiração):
+  get_many(chaves)               → {chave: valor} só das presentes
+  set_many({chave: valor}, ttl)  — uma ida ao backend para o lote
+  delete_many(chaves)
+  incr(chave, delta, ttl, inicial) → novo valor (atómico; ttl e
+                                     inicial só contam ao criar)
+  get_contadores(chaves)         → {chave: int}
+  clear(), limpar_expiradas(), stats(), fechar()
+
+  Os backends partilhados serializam com pickle num só passo por
+  lote (get_many / set_many), nunca chave a chave.
+═══════════════════════════════════════════════════════════════
+"""
+
+import heapq
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+
+def _tamanho(valor, _vistos=None) -> int:
+    """Bytes aproximados de um valor (percorre dicts / listas / tuplos / sets)."""
+    _vistos = _vistos if _vistos is not None else set()
+    if id(valor) in _vistos:
+        return 0
+    _vistos.add(id(valor))
+
+    total = sys.getsizeof(valor)
+    if isinstance(valor, dict):
+        total += sum(_tamanho(k, _vistos) + _tamanho(v, _vistos) for k, v in valor.items())
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        total += sum(_tamanho(v, _vistos) for v in valor)
+    return total
+
+
+class CacheBackend(ABC):
+    """Interface comum dos backends (um backend incompleto falha ao ser criado)."""
+
+    nome        = None
+    partilhado  = False     # visível por outros processos
+
+    @abstractmethod
+    def get_many(self, chaves: Iterable[str]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def set_many(self, itens: Dict[str, Any], ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    def delete_many(self, chaves: Iterable[str]):
+        ...
+
+    @abstractmethod
+    def incr(self, chave: str, delta: int = 1, ttl: Optional[float] = None,
+             inicial: int = 0) -> int:
+        ...
+
+    @abstractmethod
+    def get_contadores(self, chaves: Iterable[str]) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def limpar_expiradas(self) -> int:
+        return 0
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    def configurar(self, **_):
+        pass
+
+    def fechar(self):
+        pass
+
+    # Atalhos de uma chave
+    def get(self, chave, default=None):
+        return self.get_many([chave]).get(chave, default)
+
+    def set(self, chave, valor, ttl=None):
+        self.set_many({chave: valor}, ttl)
+
+    def delete(self, chave):
+        self.delete_many([chave])
+
+
+# ═══════════════════════════════════════════════════════════════
+# memoria
+# ═══════════════════════════════════════════════════════════════
+
+class _Segmento:
+    """Parte do cache protegida por um lock próprio."""
+
+    __slots__ = ('lock', 'dados', 'expiracoes', 'bytes', 'evictions', 'expirations')
+
+    def __init__(self):
+        self.lock        = threading.Lock()
+        self.dados       = OrderedDict()   # chave → (valor, expira_em, tamanho)
+        self.expiracoes  = []              # heap (expira_em, chave)
+        self.bytes       = 0
+        self.evictions   = 0
+        self.expirations = 0
+
+    def retirar(self, chave):
+        _, _, tamanho = self.dados.pop(chave)
+        self.bytes -= tamanho
+
+
+class BackendMemoria(CacheBackend):
+    """
+    LRU limitado no processo, segmentado por lock (lock striping):
+    a chave escolhe o segmento por hash, cada um com o seu lock,
+    OrderedDict (ordem LRU) e heap de expirações. Os limites
+    max_entradas / max_bytes são repartidos pelos segmentos.
+    """
+
+    nome = 'memoria'
+    N_SEGMENTOS = 16
+
+    def __init__(self, max_entradas=10000, max_bytes=None, **_):
+        self.max_entradas = max_entradas
+        self.max_bytes    = max_bytes
+        self._segmentos   = [_Segmento() for _ in range(self.N_SEGMENTOS)]
+
+    def configurar(self, max_entradas=None, max_bytes=None, **_):
+        if max_entradas is not None:
+            self.max_entradas = max_entradas
+        if max_bytes is not None:
+            self.max_bytes = max_bytes or None
+
+    def _segmento(self, chave) -> _Segmento:
+        return self._segmentos[hash(chave) % self.N_SEGMENTOS]
+
+    def _ler(self, seg, chave, now):
+        """Valor válido da chave ou None (com o lock; remove se expirada)."""
+        item = seg.dados.get(chave)
+        if item is None:
+            return None
+        if item[1] <= now:
+            seg.retirar(chave)
+            seg.expirations += 1
+            return None
+        seg.dados.move_to_end(chave)
+        return item
+
+    def _gravar(self, seg, chave, valor, expira_em):
+        tamanho = _tamanho(valor) if self.max_bytes else 0
+        if chave in seg.dados:
+            seg.retirar(chave)
+        seg.dados[chave] = (valor, expira_em, tamanho)
+        seg.bytes += tamanho
+        if expira_em != float('inf'):
+            heapq.heappush(seg.expiracoes, (expira_em, chave))
+        self._limitar(seg)
+
+    def get_many(self, chaves):
+        now = time.monotonic()
+        encontrados = {}
+        for chave in chaves:
+            seg = self._segmento(chave)
+            with seg.lock:
+                item = self._ler(seg, chave, now)
+            if item is not None:
+                encontrados[chave] = item[0]
+        return encontrados
+
+    def set_many(self, itens, ttl=None):
+        expira_em = float('inf') if ttl is None else time.monotonic() + ttl
+        for chave, valor in itens.items():
+            seg = self._segmento(chave)
+            with seg.lock:
+                self._gravar(seg, chave, valor, expira_em)
+
+    def delete_many(self, chaves):
+        for chave in chaves:
+            seg = self._segmento(chave)
+            with seg.lock:
+                if chave in seg.dados:
+                    seg.retirar(chave)
+
+    def incr(self, chave, delta=1, ttl=None, inicial=0):
+        now = time.monotonic()
+        seg = self._segmento(chave)
+        with seg.lock:
+            item = self._ler(seg, chave, now)
+            if item is None:
+                novo = inicial + delta
+                expira_em = float('inf') if ttl is None else now + ttl
+            else:
+                novo = item[0] + delta
+                expira_em = item[1]
+            self._gravar(seg, chave, novo, expira_em)
+            return novo
+
+    def get_contadores(self, chaves):
+        return {k: int(v) for k, v in self.get_many(chaves).items()}
+
+    def clear(self):
+        for seg in self._segmentos:
+            with seg.lock:
+                seg.dados.clear()
+                seg.expiracoes.clear()
+                seg.bytes = 0
+
+    def stats(self):
+        now = time.monotonic()
+        stats = dict.fromkeys(
+            ('total_entries', 'valid_entries', 'bytes', 'evictions', 'expirations'), 0
+        )
+        for seg in self._segmentos:
+            with seg.lock:
+                stats['total_entries'] += len(seg.dados)
+                stats['valid_entries'] += sum(1 for item in seg.dados.values() if item[1] > now)
+                stats['bytes']         += seg.bytes
+                stats['evictions']     += seg.evictions
+                stats['expirations']   += seg.expirations
+        stats['max_entries'] = self.max_entradas
+        stats['max_bytes']   = self.max_bytes
+        return stats
+
+    def _limitar(self, seg: _Segmento):
+        """Evicção LRU até o segmento respeitar a sua quota (com o lock)."""
+        max_entradas = -(-self.max_entradas // self.N_SEGMENTOS) if self.max_entradas else None
+        max_bytes    = -(-self.max_bytes // self.N_SEGMENTOS) if self.max_bytes else None
+
+        while seg.dados and (
+            (max_entradas and len(seg.dados) > max_entradas)
+            or (max_bytes and seg.bytes > max_bytes)
+        ):
+            chave = next(iter(seg.dados))
+            seg.retirar(chave)
+            seg.evictions += 1
+
+    def limpar_expiradas(self) -> int:
+        """Remove as entradas expiradas de todos os segmentos, pela heap."""
+        now = time.monotonic()
+        removidas = 0
+        for seg in self._segmentos:
+            with seg.lock:
+                heap = seg.expiracoes
+                while heap and heap[0][0] <= now:
+                    expira_em, chave = heapq.heappop(heap)
+                    item = seg.dados.get(chave)
+                    # A heap guarda expirações antigas de chaves regravadas
+                    if item is not None and item[1] == expira_em:
+                        seg.retirar(chave)
+                        seg.expirations += 1
+                        removidas += 1
+
+                if len(heap) > 2 * len(seg.dados) + 64:
+                    seg.expiracoes = [(item[1], k) for k, item in seg.dados.items()
+                                      if item[1] != float('inf')]
+                    heapq.heapify(seg.expiracoes)
+        return removidas
+
+
+# ═══════════════════════════════════════════════════════════════
+# sqlite
+# ═══════════════════════════════════════════════════════════════
+
+class BackendSQLite(CacheBackend):
+    """
+    Ficheiro SQLite (WAL) partilhado pelos processos do servidor.
+    Uma ligação por thread; expira_em em tempo de relógio (time.time),
+    comum a todos os processos. Contadores guardados como INTEGER.
+    """
+
+    nome       = 'sqlite'
+    partilhado = True
+
+    LOTE_SQL = 500   # chaves por IN (...) — abaixo do limite de parâmetros
+
+    def __init__(self, caminho=None, max_entradas=None, **_):
+        self.caminho      = caminho or os.path.join(os.getcwd(), 'cache.sqlite3')
+        self.max_entradas = max_entradas
+        self._local       = threading.local()
+        self._ligacoes    = []
+        self._lock        = threading.Lock()
+
+    def configurar(self, max_entradas=None, **_):
+        if max_entradas is not None:
+            self.max_entradas = max_entradas
+
+    def _ligacao(self) -> sqlite3.Connection:
+        ligacao = getattr(self._local, 'ligacao', None)
+        if ligacao is None:
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            ligacao = sqlite3.connect(self.caminho, timeout=10,
+                                      isolation_level=None, check_same_thread=False)
+            ligacao.execute('PRAGMA journal_mode=WAL')
+            ligacao.execute('PRAGMA synchronous=NORMAL')
+            ligacao.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' chave TEXT PRIMARY KEY, valor BLOB, expira_em REAL)'
+            )
+            ligacao.execute('CREATE INDEX IF NOT EXISTS ix_cache_expira ON cache (expira_em)')
+            self._local.ligacao = ligacao
+            with self._lock:
+                self._ligacoes.append(ligacao)
+        return ligacao
+
+    @staticmethod
+    def _lotes(chaves):
+        chaves = list(chaves)
+        for i in range(0, len(chaves), BackendSQLite.LOTE_SQL):
+            yield chaves[i:i + BackendSQLite.LOTE_SQL]
+
+    def _ler(self, chaves):
+        now = time.time()
+        linhas = []
+        for lote in self._lotes(chaves):
+            linhas += self._ligacao().execute(
+                f"SELECT chave, valor FROM cache WHERE chave IN ({','.join('?' * len(lote))})"
+                " AND (expira_em IS NULL OR expira_em > ?)",
+                (*lote, now)
+            ).fetchall()
+        return linhas
+
+    def get_many(self, chaves):
+        return {chave: pickle.loads(valor) for chave, valor in self._ler(chaves)}
+
+    def get_contadores(self, chaves):
+        return {chave: int(valor) for chave, valor in self._ler(chaves)}
+
+    def set_many(self, itens, ttl=None):
+        expira_em = None if ttl is None else time.time() + ttl
+        linhas = [
+            (chave, pickle.dumps(valor, pickle.HIGHEST_PROTOCOL), expira_em)
+            for chave, valor in itens.items()
+        ]
+        ligacao = self._ligacao()
+        with ligacao:
+            ligacao.execute('BEGIN')
+            ligacao.executemany(
+                'INSERT OR REPLACE INTO cache (chave, valor, expira_em) VALUES (?, ?, ?)',
+                linhas
+            )
+
+    def delete_many(self, chaves):
+        ligacao = self._ligacao()
+        for lote in self._lotes(chaves):
+            ligacao.execute(
+                f"DELETE FROM cache WHERE chave IN ({','.join('?' * len(lote))})", lote
+            )
+
+    def incr(self, chave, delta=1, ttl=None, inicial=0):
+        now = time.time()
+        ligacao = self._ligacao()
+        with ligacao:
+            # IMMEDIATE: reserva a escrita já, dois processos não lêem o mesmo valor
+            ligacao.execute('BEGIN IMMEDIATE')
+            linha = ligacao.execute(
+                'SELECT valor, expira_em FROM cache WHERE chave = ?', (chave,)
+            ).fetchone()
+            if linha is None or (linha[1] is not None and linha[1] <= now):
+                novo, expira_em = inicial + delta, (None if ttl is None else now + ttl)
+            else:
+                novo, expira_em = int(linha[0]) + delta, linha[1]
+            ligacao.execute(
+                'INSERT OR REPLACE INTO cache (chave, valor, expira_em) VALUES (?, ?, ?)',
+                (chave, novo, expira_em)
+            )
+        return novo
+
+    def clear(self):
+        self._ligacao().execute('DELETE FROM cache')
+
+    def limpar_expiradas(self) -> int:
+        ligacao = self._ligacao()
+        removidas = ligacao.execute(
+            'DELETE FROM cache WHERE expira_em IS NOT NULL AND expira_em <= ?', (time.time(),)
+        ).rowcount
+        if self.max_entradas:
+            # Sem LRU partilhado: saem primeiro as que expiram mais cedo
+            ligacao.execute(
+                'DELETE FROM cache WHERE chave IN ('
+                ' SELECT chave FROM cache WHERE expira_em IS NOT NULL'
+                ' ORDER BY expira_em LIMIT max(0, (SELECT count(*) FROM cache) - ?))',
+                (self.max_entradas,)
+            )
+        return removidas
+
+    def stats(self):
+        total, validas, tamanho = self._ligacao().execute(
+            'SELECT count(*), sum(expira_em IS NULL OR expira_em > ?), sum(length(valor))'
+            ' FROM cache', (time.time(),)
+        ).fetchone()
+        return {
+            'total_entries': total or 0,
+            'valid_entries': validas or 0,
+            'bytes':         tamanho or 0,
+            'max_entries':   self.max_entradas,
+            'caminho':       self.caminho,
+        }
+
+    def fechar(self):
+        with self._lock:
+            for ligacao in self._ligacoes:
+                try:
+                    ligacao.close()
+                except sqlite3.Error:
+                    pass
+            self._ligacoes.clear()
+        self._local = threading.local()
+
+
+# ═══════════════════════════════════════════════════════════════
+# redis
+# ═══════════════════════════════════════════════════════════════
+
+class BackendRedis(CacheBackend):
+    """
+    Servidor Redis (MGET / pipeline / INCRBY). Todas as chaves levam
+    `prefixo` para clear() não apagar dados de outras aplicações.
+    """
+
+    nome       = 'redis'
+    partilhado = True
+
+    def __init__(self, url=None, prefixo='filas:', cliente=None, **_):
+        if cliente is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError(
+                    "CACHE_BACKEND='redis' exige o pacote 'redis' (pip install redis)"
+                ) from e
+            cliente = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.cliente = cliente
+        self.prefixo = prefixo
+
+    def _k(self, chave):
+        return f'{self.prefixo}{chave}'
+
+    def get_many(self, chaves):
+        chaves = list(chaves)
+        if not chaves:
+            return {}
+        valores = self.cliente.mget([self._k(c) for c in chaves])
+        return {c: pickle.loads(v) for c, v in zip(chaves, valores) if v is not None}
+
+    def get_contadores(self, chaves):
+        chaves = list(chaves)
+        if not chaves:
+            return {}
+        valores = self.cliente.mget([self._k(c) for c in chaves])
+        return {c: int(v) for c, v in zip(chaves, valores) if v is not None}
+
+    def set_many(self, itens, ttl=None):
+        pipe = self.cliente.pipeline(transaction=False)
+        for chave, valor in itens.items():
+            pipe.set(self._k(chave), pickle.dumps(valor, pickle.HIGHEST_PROTOCOL),
+                     px=None if ttl is None else max(int(ttl * 1000), 1))
+        pipe.execute()
+
+    def delete_many(self, chaves):
+        chaves = [self._k(c) for c in chaves]
+        if chaves:
+            self.cliente.delete(*chaves)
+
+    def incr(self, chave, delta=1, ttl=None, inicial=0):
+        pipe = self.cliente.pipeline(transaction=True)
+        pipe.set(self._k(chave), inicial, nx=True,
+                 px=None if ttl is None else max(int(ttl * 1000), 1))
+        pipe.incrby(self._k(chave), delta)
+        return int(pipe.execute()[1])
+
+    def clear(self):
+        lote = []
+        for chave in self.cliente.scan_iter(match=f'{self.prefixo}*', count=1000):
+            lote.append(chave)
+            if len(lote) >= 1000:
+                self.cliente.delete(*lote)
+                lote = []
+        if lote:
+            self.cliente.delete(*lote)
+
+    def stats(self):
+        return {'prefixo': self.prefixo}
+
+    def fechar(self):
+        try:
+            self.cliente.close()
+        except Exception:
+            pass
+
+
+BACKENDS = {
+    'memoria': BackendMemoria,
+    'sqlite':  BackendSQLite,
+    'redis':   BackendRedis,
+}
+
+
+def criar_backend(config) -> CacheBackend:
+    """Backend a partir de app.config (CACHE_BACKEND e opções)."""
+    nome = config.get('CACHE_BACKEND', 'memoria')
+    if nome not in BACKENDS:
+        raise ValueError(f"CACHE_BACKEND inválido: {nome}. Use: {', '.join(BACKENDS)}")
+    return BACKENDS[nome](
+        max_entradas = config.get('CACHE_MAX_ENTRADAS'),
+        max_bytes    = config.get('CACHE_MAX_BYTES'),
+        caminho      = config.get('CACHE_SQLITE_CAMINHO'),
+        url          = config.get('CACHE_REDIS_URL'),
+        prefixo      = config.get('CACHE_REDIS_PREFIXO', 'filas:'),
+    )
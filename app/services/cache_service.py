@@ -1,58 +1,285 @@
+"""
+app/services/cache_service.py
+═══════════════════════════════════════════════════════════════
+Cache com TTL por chave, tags e backend configurável
+
+MOTIVAÇÃO:
+  A versão anterior era um dict sem limite nem lock (o Socket.IO
+  corre em modo threading) e só apagava entradas expiradas quando
+  alguém as lia — com chaves sempre novas a memória crescia sem fim.
+  Com vários workers gunicorn cada processo tinha ainda o seu cache.
+
+ESTRUTURA:
+  - O armazenamento é um CacheBackend (app/services/cache_backends.py)
+    escolhido por CACHE_BACKEND: memoria (LRU segmentado por lock,
+    limites max_entradas / max_bytes), sqlite (ficheiro partilhado
+    pelos workers do servidor) ou redis.
+  - TTL por chave (set(..., ttl=)); uma thread de limpeza remove as
+    expiradas a cada CACHE_LIMPEZA_SEGUNDOS.
+  - get_many / set_many: um lote por ida ao backend; incr() é um
+    contador atómico (partilhado se o backend o for).
+  - get_stats(): entradas, bytes, hits, misses, evicções, expirações.
+  - Tags (set(..., tags=[...])): cada tag tem uma versão (contador no
+    backend); a entrada guarda as versões das suas tags e deixa de
+    valer quando alguma muda. invalidate_tags('servico:3') invalida
+    em O(1) todas as entradas dessa tag, sem as procurar.
+
+TAGS (invalidadas pelo ouvinte do EventosService, depois do commit):
+  fila            qualquer transição (fila de espera / em atendimento)
+  servico:<id>    transições de senhas do serviço (e do de origem)
+  dia:<data>      transições de senhas emitidas nesse dia
+  atendente:<id>  transições de senhas do atendente
+  Alterações fora das transições (notas, avaliações) chamam
+  invalidar_senha(senha).
+
+USO:
+  cache = get_cache()
+  valor = cache.get('chave')          # None se ausente/expirada
+  cache.set('chave', valor, ttl=30)
+
+  @cached(key='tv', ttl=60, stale_ttl=8, tags=['fila'])
+  def dados_tv(): ...
+    - misses simultâneos da mesma chave esperam por UM só cálculo
+      (single-flight);
+    - durante stale_ttl depois de expirar devolve o valor antigo e
+      recalcula uma vez em background (stale-while-revalidate).
+    Os valores são partilhados entre pedidos: não os alterar.
+    Com tags o TTL pode ser longo: a transição invalida logo a entrada.
+
+NOTA: com o backend memoria o cache é por processo (como o
+FilaIndex); hits/misses são sempre contados por processo.
+═══════════════════════════════════════════════════════════════
+"""
+
+import threading
 import time
-from typing import Any, Optional
+from contextlib import nullcontext
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+from flask import current_app, has_app_context
+
+from app.services.cache_backends import BackendMemoria, CacheBackend, criar_backend
 
 
 class CacheService:
-    """
-    Cache simples em memória com TTL.
-    Estrutura interna:
-    {
-        "chave": {
-            "value": dados,
-            "expires_at": timestamp
-        }
-    }
-    """
+    """Cache com TTL, tags e limpeza periódica sobre um CacheBackend."""
 
-    def __init__(self):
-        self._cache = {}
+    PREFIXO_TAG = 'tag:'
 
-    def get(self, key: str) -> Optional[Any]:
-        item = self._cache.get(key)
+    def __init__(self, max_entradas=10000, max_bytes=None, ttl_padrao=60,
+                 intervalo_limpeza=30, backend: CacheBackend = None):
+        self.backend           = backend or BackendMemoria(max_entradas, max_bytes)
+        self.ttl_padrao        = ttl_padrao
+        self.intervalo_limpeza = intervalo_limpeza
 
-        if not item:
-            return None
+        self._limpeza = None
+        self._parar   = threading.Event()
 
-        if item["expires_at"] < time.time():
-            del self._cache[key]
-            return None
+        self._stats_lock    = threading.Lock()
+        self._hits          = 0
+        self._misses        = 0
+        self._invalidations = 0
 
-        return item["value"]
+    def init_app(self, app):
+        """Configura a partir de app.config (CACHE_*) e arranca a limpeza."""
+        nome = app.config.get('CACHE_BACKEND', 'memoria')
+        if nome != self.backend.nome or self.backend.partilhado:
+            self.usar_backend(criar_backend(app.config))
+        self.configurar(
+            max_entradas      = app.config.get('CACHE_MAX_ENTRADAS'),
+            max_bytes         = app.config.get('CACHE_MAX_BYTES'),
+            ttl_padrao        = app.config.get('CACHE_TTL_PADRAO', self.ttl_padrao),
+            intervalo_limpeza = app.config.get('CACHE_LIMPEZA_SEGUNDOS', self.intervalo_limpeza),
+        )
+        self.arrancar_limpeza()
 
-    def set(self, key: str, value: Any, ttl: int = 60):
-        self._cache[key] = {
-            "value": value,
-            "expires_at": time.time() + ttl
-        }
+    def configurar(self, max_entradas=None, max_bytes=None, ttl_padrao=None,
+                   intervalo_limpeza=None):
+        self.backend.configurar(max_entradas=max_entradas, max_bytes=max_bytes)
+        if ttl_padrao is not None:
+            self.ttl_padrao = ttl_padrao
+        if intervalo_limpeza is not None:
+            self.intervalo_limpeza = intervalo_limpeza
+
+    def usar_backend(self, backend: CacheBackend):
+        """Troca o backend (o anterior é fechado; as entradas não migram)."""
+        antigo, self.backend = self.backend, backend
+        if antigo is not backend:
+            antigo.fechar()
+
+    # ───────────────────────────────────────────────────────────
+    # API
+    # ───────────────────────────────────────────────────────────
+
+    def _contar(self, hits=0, misses=0, invalidations=0):
+        with self._stats_lock:
+            self._hits          += hits
+            self._misses        += misses
+            self._invalidations += invalidations
+
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        {chave: valor} das chaves presentes e válidas — uma leitura ao
+        backend para as entradas e outra para as versões das suas tags.
+        """
+        keys = list(keys)
+        entradas = self.backend.get_many(keys)
+
+        tags = {tag for _, versoes in entradas.values() if versoes for tag in versoes}
+        actuais = self._versoes_actuais(tags) if tags else {}
+
+        valores, invalidas = {}, []
+        for chave, (valor, versoes) in entradas.items():
+            if versoes and any(actuais.get(t) != v for t, v in versoes.items()):
+                invalidas.append(chave)
+            else:
+                valores[chave] = valor
+        if invalidas:
+            self.backend.delete_many(invalidas)
+
+        self._contar(hits=len(valores), misses=len(keys) - len(valores),
+                     invalidations=len(invalidas))
+        return valores
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None,
+            tags: Union[Iterable[str], dict, None] = None):
+        """
+        Args:
+            tags — nomes de tags (versões lidas agora) ou o dict devolvido
+                   por versoes_tags() ANTES de calcular o valor (assim uma
+                   invalidação durante o cálculo não fica perdida)
+        """
+        self.set_many({key: value}, ttl=ttl, tags=tags)
+
+    def set_many(self, itens: Dict[str, Any], ttl: Optional[float] = None,
+                 tags: Union[Iterable[str], dict, None] = None):
+        """Grava várias chaves (mesmo ttl e tags) num só lote do backend."""
+        ttl = self.ttl_padrao if ttl is None else ttl
+        if tags is not None and not isinstance(tags, dict):
+            tags = self.versoes_tags(tags)
+        versoes = dict(tags) if tags else None
+        self.backend.set_many({k: (v, versoes) for k, v in itens.items()}, ttl)
+
+    def incr(self, key: str, delta: int = 1, ttl: Optional[float] = None,
+             inicial: int = 0) -> int:
+        """
+        Contador atómico (no backend: partilhado entre workers se o backend o for).
+        `inicial` é o valor de partida se o contador ainda não existir.
+        """
+        return self.backend.incr(key, delta, ttl, inicial=inicial)
 
     def delete(self, key: str):
-        self._cache.pop(key, None)
+        self.backend.delete(key)
 
     def clear(self):
-        self._cache.clear()
+        self.backend.clear()
+
+    @property
+    def partilhado(self) -> bool:
+        return self.backend.partilhado
+
+    # ───────────────────────────────────────────────────────────
+    # Tags
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _versao_inicial() -> int:
+        # Contador criado (ou recriado após evicção / clear) nunca repete
+        # uma versão antiga: entradas anteriores deixam de ser válidas
+        return time.time_ns() // 1000
+
+    def _versoes_actuais(self, tags) -> dict:
+        chaves = {self.PREFIXO_TAG + tag: tag for tag in tags}
+        return {chaves[k]: v for k, v in self.backend.get_contadores(chaves).items()}
+
+    def versoes_tags(self, tags: Iterable[str]) -> dict:
+        """{tag: versão actual} (cria os contadores que ainda não existam)."""
+        tags = list(tags)
+        versoes = self._versoes_actuais(tags)
+        for tag in tags:
+            if tag not in versoes:
+                versoes[tag] = self.backend.incr(self.PREFIXO_TAG + tag, 0,
+                                                 inicial=self._versao_inicial())
+        return versoes
+
+    def invalidate_tags(self, *tags: str):
+        """Invalida todas as entradas com alguma destas tags — O(nº de tags)."""
+        for tag in tags:
+            self.backend.incr(self.PREFIXO_TAG + tag, 1, inicial=self._versao_inicial())
+
+    def invalidar_senha(self, senha, servico_origem_id=None):
+        """Invalida as tags afectadas por uma alteração da senha (depois do commit)."""
+        self.invalidate_tags(*tags_da_senha(senha, servico_origem_id))
+
+    def ouvinte(self, evento, senha, dados):
+        """Ouvinte do EventosService."""
+        self.invalidar_senha(senha, dados.get('servico_origem_id'))
 
     def get_stats(self):
-        now = time.time()
-        valid = sum(
-            1 for item in self._cache.values()
-            if item["expires_at"] > now
+        stats = {
+            'total_entries': 0, 'valid_entries': 0, 'bytes': 0,
+            'evictions': 0, 'expirations': 0,
+        }
+        stats.update(self.backend.stats())
+        with self._stats_lock:
+            stats['hits']          = self._hits
+            stats['misses']        = self._misses
+            stats['invalidations'] = self._invalidations
+
+        stats['expired_entries'] = stats['total_entries'] - stats['valid_entries']
+        pedidos = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / pedidos, 4) if pedidos else 0.0
+        stats['backend']   = self.backend.nome
+        stats['partilhado'] = self.backend.partilhado
+        return stats
+
+    # ───────────────────────────────────────────────────────────
+    # Expiração
+    # ───────────────────────────────────────────────────────────
+
+    def limpar_expiradas(self) -> int:
+        """Remove as entradas expiradas do backend; devolve quantas."""
+        return self.backend.limpar_expiradas()
+
+    def arrancar_limpeza(self):
+        """Thread de limpeza periódica (idempotente)."""
+        if self._limpeza is not None and self._limpeza.is_alive():
+            return
+        self._parar.clear()
+        self._limpeza = threading.Thread(
+            target=self._ciclo_limpeza, name='cache-limpeza', daemon=True
         )
+        self._limpeza.start()
 
-        return {
-            "total_entries": len(self._cache),
-            "valid_entries": valid,
-            "expired_entries": len(self._cache) - valid
-        }
+    def parar_limpeza(self):
+        self._parar.set()
+        if self._limpeza is not None:
+            self._limpeza.join(timeout=5)
+            self._limpeza = None
+
+    def _ciclo_limpeza(self):
+        while not self._parar.wait(self.intervalo_limpeza):
+            try:
+                self.limpar_expiradas()
+            except Exception as e:
+                print(f"[CacheService] Limpeza falhou: {e}")
+
+
+def tags_da_senha(senha, servico_origem_id=None) -> list:
+    """Tags das leituras que uma alteração desta senha pode mudar."""
+    tags = ['fila']
+    for servico_id in (senha.servico_id, servico_origem_id):
+        if servico_id:
+            tags.append(f'servico:{servico_id}')
+    if senha.data_emissao:
+        tags.append(f'dia:{senha.data_emissao.isoformat()}')
+    if senha.atendente_id:
+        tags.append(f'atendente:{senha.atendente_id}')
+    return tags
 
 
 # 🔥 INSTÂNCIA GLOBAL ÚNICA
@@ -60,4 +287,129 @@ _cache_instance = CacheService()
 
 
 def get_cache() -> CacheService:
-    return _cache_instance
\ No newline at end of file
+    return _cache_instance
+
+
+# ═══════════════════════════════════════════════════════════════
+# @cached — single-flight + stale-while-revalidate
+# ═══════════════════════════════════════════════════════════════
+
+class _Voo:
+    """Cálculo em curso de uma chave (partilhado pelos que esperam)."""
+
+    __slots__ = ('evento', 'valor', 'erro')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor  = None
+        self.erro   = None
+
+
+_voos      = {}                 # chave → _Voo
+_voos_lock = threading.Lock()
+
+
+def _chave_padrao(prefixo, args, kwargs) -> str:
+    partes = [repr(a) for a in args] + [f'{k}={v!r}' for k, v in sorted(kwargs.items())]
+    return f"{prefixo}:{','.join(partes)}"
+
+
+def _calcular(cache, chave, fn, args, kwargs, ttl, stale_ttl, guardar_se, voo, tags):
+    """Corre fn e guarda (valor, fresco_ate); acorda quem espera no voo."""
+    try:
+        # Versões lidas antes do cálculo: uma transição a meio invalida o resultado
+        versoes = cache.versoes_tags(tags) if tags else None
+        valor = fn(*args, **kwargs)
+        if guardar_se is None or guardar_se(valor):
+            cache.set(chave, (valor, time.time() + ttl), ttl=ttl + stale_ttl,
+                      tags=versoes)
+        voo.valor = valor
+        return valor
+    except BaseException as e:
+        voo.erro = e
+        raise
+    finally:
+        with _voos_lock:
+            _voos.pop(chave, None)
+        voo.evento.set()
+
+
+def _iniciar_voo(chave):
+    """(voo, lider): lider=True se coube a quem chama fazer o cálculo."""
+    with _voos_lock:
+        voo = _voos.get(chave)
+        if voo is not None:
+            return voo, False
+        voo = _voos[chave] = _Voo()
+        return voo, True
+
+
+def _refrescar(cache, chave, fn, args, kwargs, ttl, stale_ttl, guardar_se, tags):
+    """Recalcula em background (se ninguém o estiver já a fazer)."""
+    voo, lider = _iniciar_voo(chave)
+    if not lider:
+        return
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def tarefa():
+        # O teardown do app context liberta a sessão da BD desta thread
+        with app.app_context() if app is not None else nullcontext():
+            try:
+                _calcular(cache, chave, fn, args, kwargs, ttl, stale_ttl, guardar_se, voo, tags)
+            except Exception as e:
+                print(f"[cached] Refresh de '{chave}' falhou: {e}")
+
+    threading.Thread(target=tarefa, name='cache-refresh', daemon=True).start()
+
+
+def cached(key: Union[str, Callable[..., str]], ttl: float = None,
+           stale_ttl: float = 0, guardar_se: Callable[[Any], bool] = None,
+           cache: CacheService = None,
+           tags: Union[Iterable[str], Callable[..., Iterable[str]]] = None):
+    """
+    Memoiza o resultado de uma função no cache.
+
+    Args:
+        key        — prefixo (a chave inclui os argumentos) ou
+                     callable(*args, **kwargs) → chave
+        ttl        — segundos em que o valor é servido como fresco
+                     (None = CACHE_TTL_PADRAO)
+        stale_ttl  — segundos seguintes em que o valor antigo ainda é
+                     servido enquanto um refresh corre em background
+        guardar_se — predicado sobre o resultado (ex: só respostas 200)
+        cache      — instância (por omissão, get_cache() em cada chamada)
+        tags       — tags da entrada ou callable(*args, **kwargs) → tags
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            alvo  = cache or get_cache()
+            chave = key(*args, **kwargs) if callable(key) else _chave_padrao(key, args, kwargs)
+            fresco = alvo.ttl_padrao if ttl is None else ttl
+            etiquetas = list(tags(*args, **kwargs) if callable(tags) else tags or ())
+
+            item = alvo.get(chave)
+            if item is not None:
+                valor, fresco_ate = item
+                if time.time() >= fresco_ate:
+                    _refrescar(alvo, chave, fn, args, kwargs, fresco, stale_ttl,
+                               guardar_se, etiquetas)
+                return valor
+
+            voo, lider = _iniciar_voo(chave)
+            if lider:
+                return _calcular(alvo, chave, fn, args, kwargs, fresco, stale_ttl,
+                                 guardar_se, voo, etiquetas)
+
+            voo.evento.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.valor
+
+        def chave(*a, **kw):
+            """Chave usada para estes argumentos (para invalidar)."""
+            return key(*a, **kw) if callable(key) else _chave_padrao(key, a, kw)
+
+        wrapper.chave = chave
+        return wrapper
+    return decorator
@@ -0,0 +1,189 @@
+"""
+app/services/estatisticas_service.py
+═══════════════════════════════════════════════════════════════
+Estatísticas de um dia num único SELECT (memoizado por pedido)
+
+MOTIVAÇÃO:
+  obter_estatisticas_hoje fazia 5 COUNTs + carregava as senhas
+  atendidas para calcular a espera média; obter_estatisticas_fila
+  fazia mais 4 COUNTs sobre o mesmo dia; /dashboard/estatisticas
+  chamava os dois (e /senhas/estatisticas é público e consultado
+  em polling).
+
+COMO FUNCIONA:
+  - dia(data, servico_id, atendente_id) → contagens por status e
+    tipo + média/máx/mín de espera e de atendimento, tudo com
+    SUM(CASE ...) / AVG / MAX / MIN numa só query.
+  - A query lê as senhas emitidas OU concluídas no dia; cada agregado
+    filtra o seu período dentro do CASE (emissão para contagens,
+    espera e atendimento; conclusão para atendimento_*_no_dia, o
+    tempo médio do dashboard, antes lido do rollup horário).
+  - Dentro de um pedido o resultado fica em flask.g: todos os
+    chamadores com os mesmos filtros partilham a mesma leitura.
+  - Fora de um pedido (CLI, jobs) é sempre calculado.
+  - por_atendente(data) → atendimentos concluídos no dia agrupados
+    por atendente_id (lista de atendentes sem N+1).
+
+CONVENÇÕES:
+  espera      — senhas atendendo/concluídas já iniciadas, com
+                tempo_espera_minutos > 0 (como antes)
+  atendimento — senhas emitidas no dia e concluídas, com
+                tempo_atendimento_minutos > 0 (como antes, por atendente)
+  atendimento_*_no_dia — senhas concluídas no dia, com
+                tempo_atendimento_minutos registado (como o rollup)
+═══════════════════════════════════════════════════════════════
+"""
+
+from datetime import date, datetime
+from typing import Optional
+
+from flask import g, has_request_context, request
+from sqlalchemy import case, func
+
+from app.extensions import db
+from app.models.senha import Senha
+from app.utils.periodos import no_dia
+
+STATUS = ('aguardando', 'chamando', 'atendendo', 'concluida', 'cancelada')
+
+
+def _contar(condicao):
+    return func.sum(case((condicao, 1), else_=0))
+
+
+def _so(condicao, coluna):
+    """Coluna quando a condição se verifica, senão NULL (ignorado por AVG/MAX/MIN)."""
+    return case((condicao, coluna), else_=None)
+
+
+class EstatisticasService:
+    """Primitiva partilhada de estatísticas do dia."""
+
+    @staticmethod
+    def dia(data: Optional[date] = None, servico_id: Optional[int] = None,
+            atendente_id: Optional[int] = None) -> dict:
+        """
+        Estatísticas das senhas emitidas em `data` (por omissão, hoje UTC)
+        e dos atendimentos concluídos nesse dia.
+
+        Returns:
+            {total, <status>..., aguardando_normal, aguardando_prioritaria,
+             espera_media, espera_max, espera_min,
+             atendimento_media, atendimento_max, atendimento_min, atendimento_n,
+             atendimento_media_no_dia, atendimento_n_no_dia}
+            (médias arredondadas a 1 casa; máx/mín None sem dados)
+        """
+        if data is None:
+            data = datetime.utcnow().date()
+        chave = (data, servico_id, atendente_id)
+
+        memo = EstatisticasService._memo()
+        if memo is not None and chave in memo:
+            return dict(memo[chave])
+
+        resultado = EstatisticasService._calcular(data, servico_id, atendente_id)
+        if memo is not None:
+            memo[chave] = resultado
+        return dict(resultado)
+
+    @staticmethod
+    def _memo():
+        """Dicionário do pedido actual em flask.g (None fora de um pedido)."""
+        if not has_request_context():
+            return None
+        # O contexto de app pode sobreviver a vários pedidos (ex: testes
+        # com um app_context aberto) — o memo só vale para este pedido.
+        pedido = request._get_current_object()
+        guardado = g.get('_estatisticas_dia')
+        if guardado is None or guardado[0] is not pedido:
+            guardado = (pedido, {})
+            g._estatisticas_dia = guardado
+        return guardado[1]
+
+    @staticmethod
+    def _calcular(data: date, servico_id, atendente_id) -> dict:
+        emitida          = no_dia(Senha.data_emissao, data)
+        concluida        = (Senha.status == 'concluida') & Senha.tempo_atendimento_minutos.isnot(None)
+        concluida_no_dia = concluida & no_dia(Senha.atendimento_concluido_em, data)
+
+        aguardando = emitida & (Senha.status == 'aguardando')
+        espera = (
+            emitida
+            & Senha.status.in_(('atendendo', 'concluida'))
+            & Senha.atendimento_iniciado_em.isnot(None)
+            & (Senha.tempo_espera_minutos > 0)
+        )
+        atendimento = emitida & concluida & (Senha.tempo_atendimento_minutos > 0)
+
+        query = db.session.query(
+            _contar(emitida),
+            *[_contar(emitida & (Senha.status == s)) for s in STATUS],
+            _contar(aguardando & (Senha.tipo == 'normal')),
+            _contar(aguardando & (Senha.tipo == 'prioritaria')),
+            func.avg(_so(espera, Senha.tempo_espera_minutos)),
+            func.max(_so(espera, Senha.tempo_espera_minutos)),
+            func.min(_so(espera, Senha.tempo_espera_minutos)),
+            func.avg(_so(atendimento, Senha.tempo_atendimento_minutos)),
+            func.max(_so(atendimento, Senha.tempo_atendimento_minutos)),
+            func.min(_so(atendimento, Senha.tempo_atendimento_minutos)),
+            _contar(atendimento),
+            func.avg(_so(concluida_no_dia, Senha.tempo_atendimento_minutos)),
+            _contar(concluida_no_dia),
+        ).filter(emitida | no_dia(Senha.atendimento_concluido_em, data))
+
+        if servico_id:
+            query = query.filter(Senha.servico_id == servico_id)
+        if atendente_id:
+            query = query.filter(Senha.atendente_id == atendente_id)
+
+        linha = query.one()
+        total, contagens = linha[0], linha[1:1 + len(STATUS)]
+        (normal, prioritaria,
+         espera_media, espera_max, espera_min,
+         atend_media, atend_max, atend_min, atend_n,
+         no_dia_media, no_dia_n) = linha[1 + len(STATUS):]
+
+        resultado = {'total': int(total or 0)}
+        resultado.update({s: int(n or 0) for s, n in zip(STATUS, contagens)})
+        resultado.update({
+            'aguardando_normal':      int(normal or 0),
+            'aguardando_prioritaria': int(prioritaria or 0),
+            'espera_media':           round(float(espera_media), 1) if espera_media is not None else 0,
+            'espera_max':             espera_max,
+            'espera_min':             espera_min,
+            'atendimento_media':      round(float(atend_media), 1) if atend_media is not None else 0,
+            'atendimento_max':        atend_max,
+            'atendimento_min':        atend_min,
+            'atendimento_n':          int(atend_n or 0),
+            'atendimento_media_no_dia': round(float(no_dia_media), 1) if no_dia_media is not None else 0,
+            'atendimento_n_no_dia':   int(no_dia_n or 0),
+        })
+        return resultado
+
+    @staticmethod
+    def por_atendente(data: Optional[date] = None) -> dict:
+        """
+        Atendimentos concluídos em `data` (por omissão, hoje), por atendente.
+
+        Returns:
+            {atendente_id: {'atendidos': n, 'tempo_medio': média ou None}}
+            (tempo_medio só sobre atendimentos com tempo registado)
+        """
+        data = data or date.today()
+        linhas = db.session.query(
+            Senha.atendente_id,
+            func.count(Senha.id),
+            func.avg(Senha.tempo_atendimento_minutos),
+        ).filter(
+            Senha.status == 'concluida',
+            Senha.atendente_id.isnot(None),
+            no_dia(Senha.atendimento_concluido_em, data),
+        ).group_by(Senha.atendente_id).all()
+
+        return {
+            atendente_id: {
+                'atendidos':   int(n),
+                'tempo_medio': float(media) if media is not None else None,
+            }
+            for atendente_id, n, media in linhas
+        }
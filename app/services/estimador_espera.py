@@ -0,0 +1,286 @@
+"""
+app/services/estimador_espera.py
+═══════════════════════════════════════════════════════════════
+Estimativa do tempo de espera: média móvel exponencial (EWMA)
+do tempo de atendimento + nº de balcões abertos, por serviço
+
+MOTIVAÇÃO:
+  obter_estatisticas_fila usava `aguardando * 10`, o Servico um
+  tempo_medio_minutos estático, e o ecrã TV / acompanhamento da
+  senha recarregavam todas as concluídas do dia em cada pedido só
+  para tirar uma média global — que ignora o serviço e quantos
+  balcões o estão a atender.
+
+COMO FUNCIONA:
+  - Cada conclusão (ouvinte do EventosService) actualiza em O(1) a
+    EWMA do serviço e a global: m ← m + ALFA·(t − m).
+  - Chamadas / inícios / conclusões marcam o atendente como balcão
+    aberto do serviço; sem actividade há JANELA_BALCAO_SEGUNDOS
+    deixa de contar.
+  - estimar(servico_id, posicao) = posicao × m / balcões  (O(1)).
+  - Sincronização com a BD (3 queries): a EWMA é refeita a partir das
+    últimas N_SEMENTE conclusões de cada serviço (dos últimos
+    DIAS_SEMENTE dias; sem conclusões, Servico.tempo_medio_minutos) e
+    os balcões a partir da actividade recente.
+
+VÁRIOS WORKERS:
+  - Backend de cache partilhado (sqlite/redis): médias e balcões vivem
+    no backend, actualizados pelas conclusões de todos os workers; um
+    só worker (eleito por incr) volta a sincronizar com a BD a cada
+    RESYNC_PARTILHADO_SEGUNDOS, corrigindo actualizações concorrentes
+    perdidas (leitura + escrita sem CAS).
+  - Backend 'memoria': estado no processo, re-sincronizado com a BD a
+    cada RESYNC_SEGUNDOS (como o FilaIndex) — todos os workers chegam
+    à mesma EWMA, porque a BD vê as conclusões de todos.
+═══════════════════════════════════════════════════════════════
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+
+from app.services.cache_service import CacheService, get_cache
+
+
+class EstimadorEspera:
+    """EWMA do tempo de atendimento e balcões activos por serviço."""
+
+    ALFA                    = 0.2     # peso da observação mais recente
+    PADRAO_MINUTOS          = 10.0    # sem histórico nem tempo_medio_minutos
+    JANELA_BALCAO_SEGUNDOS  = 30 * 60
+    DIAS_SEMENTE            = 7
+    N_SEMENTE               = 30      # conclusões por serviço (0,8^30 ≈ 0,1 %)
+
+    RESYNC_SEGUNDOS             = 60        # backend por processo
+    RESYNC_PARTILHADO_SEGUNDOS  = 10 * 60   # backend partilhado
+    MEDIA_TTL                   = 24 * 3600 # médias no backend partilhado
+
+    STATUS_NO_BALCAO = ('chamada', 'chamando', 'atendendo')
+
+    PREFIXO = 'estimador:'
+    GLOBAL  = None                     # chave da média/balcões de todos os serviços
+
+    def __init__(self, cache: CacheService = None):
+        self._lock    = threading.Lock()
+        self._cache   = cache  # None = cache global (get_cache())
+        self._medias  = {}     # servico_id | GLOBAL → minutos (EWMA), sem backend partilhado
+        self._balcoes = {}     # servico_id | GLOBAL → {atendente_id: time.time()}
+        self._sincronizado_em = None       # time.monotonic() (backend por processo)
+
+    @property
+    def cache(self) -> CacheService:
+        return self._cache or get_cache()
+
+    # ───────────────────────────────────────────────────────────
+    # Armazenamento (backend partilhado ou dicts locais)
+    # ───────────────────────────────────────────────────────────
+
+    def _chave(self, tipo, servico_id):
+        return f"{self.PREFIXO}{tipo}:{'global' if servico_id is None else servico_id}"
+
+    def _ler_media(self, servico_id):
+        if self.cache.partilhado:
+            return self.cache.get(self._chave('media', servico_id))
+        return self._medias.get(servico_id)
+
+    def _gravar_medias(self, medias):
+        if self.cache.partilhado:
+            self.cache.set_many({self._chave('media', k): v for k, v in medias.items()},
+                                ttl=self.MEDIA_TTL)
+        else:
+            self._medias.update(medias)
+
+    def _ler_balcoes(self, servico_id):
+        if self.cache.partilhado:
+            return dict(self.cache.get(self._chave('balcoes', servico_id)) or {})
+        return self._balcoes.setdefault(servico_id, {})
+
+    def _gravar_balcoes(self, servico_id, activos):
+        if self.cache.partilhado:
+            self.cache.set(self._chave('balcoes', servico_id), activos,
+                           ttl=self.JANELA_BALCAO_SEGUNDOS)
+        else:
+            self._balcoes[servico_id] = activos
+
+    # ───────────────────────────────────────────────────────────
+    # Actualização
+    # ───────────────────────────────────────────────────────────
+
+    def registar(self, servico_id, minutos, atendente_id=None):
+        """Nova duração de atendimento (minutos) num serviço."""
+        with self._lock:
+            medias = {}
+            for chave in (servico_id, self.GLOBAL):
+                actual = self._ler_media(chave)
+                medias[chave] = (
+                    float(minutos) if actual is None
+                    else actual + self.ALFA * (minutos - actual)
+                )
+            self._gravar_medias(medias)
+            self._marcar(servico_id, atendente_id)
+
+    def balcao_activo(self, servico_id, atendente_id):
+        """Atendente a trabalhar neste serviço (chamou / iniciou / concluiu)."""
+        with self._lock:
+            self._marcar(servico_id, atendente_id)
+
+    def _marcar(self, servico_id, atendente_id, em=None):
+        if atendente_id is None:
+            return
+        em = time.time() if em is None else em
+        limite = time.time() - self.JANELA_BALCAO_SEGUNDOS
+        for chave in (servico_id, self.GLOBAL):
+            activos = {a: e for a, e in self._ler_balcoes(chave).items() if e >= limite}
+            activos[atendente_id] = max(em, activos.get(atendente_id, em))
+            self._gravar_balcoes(chave, activos)
+
+    def ouvinte(self, evento, senha, dados):
+        """Ouvinte do EventosService."""
+        if evento == 'concluida' and senha.tempo_atendimento_minutos is not None:
+            self.registar(senha.servico_id, senha.tempo_atendimento_minutos,
+                          senha.atendente_id)
+        elif evento in ('chamada', 'iniciada', 'concluida'):
+            self.balcao_activo(senha.servico_id, senha.atendente_id)
+
+    # ───────────────────────────────────────────────────────────
+    # Leitura
+    # ───────────────────────────────────────────────────────────
+
+    def tempo_medio(self, servico_id=GLOBAL) -> float:
+        """EWMA do tempo de atendimento (minutos) do serviço, ou global."""
+        self._garantir_sincronizado()
+        with self._lock:
+            media = self._ler_media(servico_id)
+            if media is None:
+                media = self._ler_media(self.GLOBAL)
+            return self.PADRAO_MINUTOS if media is None else media
+
+    def balcoes(self, servico_id=GLOBAL) -> int:
+        """Balcões com actividade recente no serviço (mínimo 1)."""
+        self._garantir_sincronizado()
+        limite = time.time() - self.JANELA_BALCAO_SEGUNDOS
+        with self._lock:
+            activos = self._ler_balcoes(servico_id)
+            for atendente_id in [a for a, em in activos.items() if em < limite]:
+                del activos[atendente_id]
+            return max(len(activos), 1)
+
+    def estimar(self, servico_id=GLOBAL, posicao=1) -> int:
+        """Minutos estimados até ser atendido na `posicao` (1-based) da fila."""
+        if not posicao or posicao <= 0:
+            return 0
+        minutos = posicao * self.tempo_medio(servico_id) / self.balcoes(servico_id)
+        return max(int(round(minutos)), 1)
+
+    # ───────────────────────────────────────────────────────────
+    # Sincronização com a BD
+    # ───────────────────────────────────────────────────────────
+
+    def reiniciar(self):
+        """Esquece o estado local (volta a sincronizar no próximo uso)."""
+        with self._lock:
+            self._medias.clear()
+            self._balcoes.clear()
+            self._sincronizado_em = None
+        self.cache.delete(self.PREFIXO + 'sincronizado')
+
+    def _sincronizacao_devida(self):
+        if self.cache.partilhado:
+            # Um só worker por intervalo: o primeiro a criar o contador
+            return self.cache.incr(self.PREFIXO + 'sincronizado', 1,
+                                   ttl=self.RESYNC_PARTILHADO_SEGUNDOS) == 1
+        sincronizado_em = self._sincronizado_em
+        return (sincronizado_em is None
+                or time.monotonic() - sincronizado_em > self.RESYNC_SEGUNDOS)
+
+    def _garantir_sincronizado(self):
+        if not has_app_context() or not self._sincronizacao_devida():
+            return
+        self._sincronizado_em = time.monotonic()
+        try:
+            medias, balcoes = self._ler_da_bd()
+        except Exception as e:
+            print(f"[EstimadorEspera] Sincronização falhou, a manter o estado actual: {e}")
+            return
+
+        # Sobrepõe as médias da BD (que já inclui as conclusões de todos os
+        # workers); serviços sem conclusões na BD mantêm a EWMA actual.
+        with self._lock:
+            self._gravar_medias(medias)
+            for (servico_id, atendente_id), em in balcoes.items():
+                self._marcar(servico_id, atendente_id, em)
+
+    @classmethod
+    def _ewma(cls, tempos, inicial=None):
+        media = inicial
+        for tempo in tempos:
+            media = float(tempo) if media is None else media + cls.ALFA * (tempo - media)
+        return media
+
+    def _ler_da_bd(self):
+        """({servico_id | GLOBAL: minutos}, {(servico_id, atendente_id): time.time()})"""
+        from sqlalchemy import func, select
+        from app.extensions import db
+        from app.models.senha import Senha
+        from app.models.servico import Servico
+
+        agora = datetime.utcnow()
+        medias = {
+            servico_id: float(tempo)
+            for servico_id, tempo in db.session.query(
+                Servico.id, Servico.tempo_medio_minutos
+            ).all() if tempo
+        }
+
+        # Últimas N_SEMENTE conclusões de cada serviço, por ordem de conclusão
+        ordem = func.row_number().over(
+            partition_by=Senha.servico_id,
+            order_by=(Senha.atendimento_concluido_em.desc(), Senha.id.desc()),
+        ).label('ordem')
+        recentes = select(
+            Senha.servico_id, Senha.tempo_atendimento_minutos.label('tempo'),
+            Senha.atendimento_concluido_em.label('em'), Senha.id, ordem,
+        ).where(
+            Senha.status == 'concluida',
+            Senha.tempo_atendimento_minutos.isnot(None),
+            Senha.atendimento_concluido_em >= agora - timedelta(days=self.DIAS_SEMENTE),
+        ).subquery()
+        linhas = db.session.execute(
+            select(recentes.c.servico_id, recentes.c.tempo)
+            .where(recentes.c.ordem <= self.N_SEMENTE)
+            .order_by(recentes.c.em.asc(), recentes.c.id.asc())
+        ).all()
+
+        por_servico = {}
+        for servico_id, tempo in linhas:
+            por_servico.setdefault(servico_id, []).append(tempo)
+        for servico_id, tempos in por_servico.items():
+            medias[servico_id] = self._ewma(tempos)
+        if linhas:
+            medias[self.GLOBAL] = self._ewma(t for _, t in linhas[-self.N_SEMENTE:])
+
+        recente = agora - timedelta(seconds=self.JANELA_BALCAO_SEGUNDOS)
+        balcoes, relogio = {}, time.time()
+        for servico_id, atendente_id, status, concluida_em in db.session.query(
+            Senha.servico_id, Senha.atendente_id, Senha.status, Senha.atendimento_concluido_em
+        ).filter(
+            Senha.atendente_id.isnot(None),
+            Senha.status.in_(self.STATUS_NO_BALCAO)
+            | (Senha.atendimento_concluido_em >= recente)
+        ).all():
+            activo_em = agora if status in self.STATUS_NO_BALCAO else concluida_em
+            em = relogio - (agora - activo_em).total_seconds()
+            chave = (servico_id, atendente_id)
+            balcoes[chave] = max(em, balcoes.get(chave, em))
+
+        return medias, balcoes
+
+
+# 🔥 INSTÂNCIA GLOBAL ÚNICA (por processo; com backend partilhado o estado vive lá)
+_estimador = EstimadorEspera()
+
+
+def get_estimador_espera() -> EstimadorEspera:
+    return _estimador
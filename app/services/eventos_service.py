@@ -0,0 +1,200 @@
+"""
+app/services/eventos_service.py
+═══════════════════════════════════════════════════════════════
+Hub de transições de senha → índice da fila + eventos Socket.IO
+
+MOTIVAÇÃO:
+  `socketio` estava inicializado mas nunca emitia nada; cada ecrã
+  (dashusuario.js, realtime-store.js, dash.js, dashadm.js) fazia
+  polling ao snapshot de 3–5 s. Agora cada transição publica um
+  evento com o delta mínimo e os ecrãs só reagem quando algo muda.
+
+USO (sempre DEPOIS do commit):
+  EventosService.publicar('emitida', senha)
+  EventosService.publicar('redirecionada', senha, servico_origem_id=3)
+
+EVENTOS Socket.IO:
+  senha_emitida | senha_chamada | senha_iniciada | senha_concluida |
+  senha_cancelada | senha_redirecionada
+
+  payload: { evento, id, numero, tipo, status, servico_id,
+             numero_balcao, atendente_id, em, ...extra }
+
+SALAS (fan-out dirigido — ver app/controllers/socket_controller.py):
+  servico:<id>  ecrãs/filas de um serviço  → todas as transições do serviço
+  senha:<id>    utente a acompanhar a senha → transições + senha_posicao
+  balcao:<n>    posto de atendimento        → transições nesse balcão
+  tv            painéis TV                  → só senha_chamada
+  admin         dashboard administrativo    → tudo
+
+OUVINTES:
+  registar_ouvinte(fn) → fn(evento, senha, dados) em cada transição
+  (caches, agregados, ...). Erros num ouvinte não afectam os outros.
+  O CacheService invalida aqui as tags afectadas (ver tags_da_senha).
+═══════════════════════════════════════════════════════════════
+"""
+
+from datetime import datetime
+
+from app.extensions import socketio
+from app.services.fila_index import get_fila_index
+
+
+class EventosService:
+    """Publicação centralizada das transições de estado das senhas."""
+
+    EVENTOS = {
+        'emitida':       'senha_emitida',
+        'chamada':       'senha_chamada',
+        'iniciada':      'senha_iniciada',
+        'concluida':     'senha_concluida',
+        'cancelada':     'senha_cancelada',
+        'redirecionada': 'senha_redirecionada',
+    }
+
+    # Eventos que mudam a ordem da fila de espera (→ senha_posicao)
+    ALTERAM_FILA = ('emitida', 'chamada', 'cancelada', 'redirecionada')
+
+    SALA_ADMIN = 'admin'
+    SALA_TV    = 'tv'
+
+    _ouvintes = []
+
+    # ───────────────────────────────────────────────────────────
+    # Salas
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def sala_servico(servico_id):
+        return f'servico:{servico_id}'
+
+    @staticmethod
+    def sala_senha(senha_id):
+        return f'senha:{senha_id}'
+
+    @staticmethod
+    def sala_balcao(numero_balcao):
+        return f'balcao:{numero_balcao}'
+
+    @staticmethod
+    def salas(evento, senha, dados) -> list:
+        """Salas interessadas numa transição."""
+        salas = [
+            EventosService.SALA_ADMIN,
+            EventosService.sala_senha(senha.id),
+        ]
+        if senha.servico_id:
+            salas.append(EventosService.sala_servico(senha.servico_id))
+        if dados.get('servico_origem_id'):
+            salas.append(EventosService.sala_servico(dados['servico_origem_id']))
+        if senha.numero_balcao:
+            salas.append(EventosService.sala_balcao(senha.numero_balcao))
+        if evento == 'chamada':
+            salas.append(EventosService.SALA_TV)
+        return salas
+
+    # ───────────────────────────────────────────────────────────
+    # Ouvintes
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def registar_ouvinte(fn):
+        """Regista fn(evento, senha, dados); pode ser usado como decorador."""
+        if fn not in EventosService._ouvintes:
+            EventosService._ouvintes.append(fn)
+        return fn
+
+    @staticmethod
+    def remover_ouvinte(fn):
+        if fn in EventosService._ouvintes:
+            EventosService._ouvintes.remove(fn)
+
+    @staticmethod
+    def publicar(evento: str, senha, **extra) -> dict:
+        """
+        Reflecte a transição no FilaIndex, notifica os ouvintes e
+        emite o evento Socket.IO. Nunca lança — a transição já está
+        gravada quando isto corre.
+
+        Returns:
+            dict com o payload emitido
+        """
+        if evento not in EventosService.EVENTOS:
+            raise ValueError(f"Evento desconhecido: {evento}")
+
+        get_fila_index().actualizar(senha)
+
+        dados = EventosService.delta(evento, senha, **extra)
+
+        for ouvinte in list(EventosService._ouvintes):
+            try:
+                ouvinte(evento, senha, dados)
+            except Exception as e:
+                print(f"[EventosService] Ouvinte {getattr(ouvinte, '__name__', ouvinte)} "
+                      f"falhou em '{evento}': {e}")
+
+        EventosService._emitir(EventosService.EVENTOS[evento], dados,
+                               EventosService.salas(evento, senha, dados))
+
+        if evento in EventosService.ALTERAM_FILA:
+            servicos = {senha.servico_id, dados.get('servico_origem_id')}
+            EventosService._publicar_posicoes(s for s in servicos if s)
+        return dados
+
+    @staticmethod
+    def delta(evento, senha, **extra) -> dict:
+        """Campos mínimos para o cliente actualizar o seu estado local."""
+        dados = {
+            'evento':        evento,
+            'id':            senha.id,
+            'numero':        senha.numero,
+            'tipo':          senha.tipo,
+            'status':        senha.status,
+            'servico_id':    senha.servico_id,
+            'numero_balcao': senha.numero_balcao,
+            'atendente_id':  senha.atendente_id,
+            'em':            datetime.utcnow().isoformat() + 'Z',
+        }
+        dados.update(extra)
+        return dados
+
+    @staticmethod
+    def _publicar_posicoes(servico_ids):
+        """
+        senha_posicao {id, numero, posicao} para cada senha em espera
+        dos serviços afectados — só para as salas senha:<id> com alguém
+        a acompanhar (um utente recebe apenas a sua posição).
+        """
+        ocupadas = EventosService._salas_ocupadas()
+        if ocupadas is not None and not any(s.startswith('senha:') for s in ocupadas):
+            return
+
+        indice = get_fila_index()
+        for servico_id in servico_ids:
+            for posicao, senha_id in enumerate(indice.listar(servico_id), start=1):
+                sala = EventosService.sala_senha(senha_id)
+                if ocupadas is not None and sala not in ocupadas:
+                    continue
+                EventosService._emitir('senha_posicao', {
+                    'id':         senha_id,
+                    'servico_id': servico_id,
+                    'posicao':    posicao,
+                }, sala)
+
+    @staticmethod
+    def _salas_ocupadas():
+        """Salas com sockets no namespace '/' (set() sem servidor, None = desconhecido)."""
+        if getattr(socketio, 'server', None) is None:
+            return set()
+        try:
+            salas = socketio.server.manager.rooms.get('/', {})
+            return {s for s in salas if isinstance(s, str)}   # None = todos
+        except Exception:
+            return None
+
+    @staticmethod
+    def _emitir(nome, dados, salas):
+        try:
+            socketio.emit(nome, dados, to=salas)
+        except Exception as e:
+            print(f"[EventosService] Falha ao emitir '{nome}': {e}")
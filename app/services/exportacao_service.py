@@ -0,0 +1,169 @@
+"""
+app/services/exportacao_service.py
+═══════════════════════════════════════════════════════════════
+Exportação de atendimentos em streaming (memória constante)
+
+MOTIVAÇÃO:
+  /api/dashboard/admin/exportar carregava o intervalo inteiro com
+  .all() e montava o ficheiro num StringIO antes de responder — um
+  ano de histórico rebentava a memória do worker.
+
+COMO FUNCIONA:
+  - registos()     → gerador de tuplos Core (nomes de serviço e
+                      atendente por JOIN), lidos com yield_per +
+                      stream_results (cursor do lado do servidor).
+  - linhas()        → os mesmos registos formatados para CSV.
+  - csv_em_blocos() / ndjson_em_blocos() → texto em blocos de N linhas.
+  - gzip_em_blocos() → os mesmos blocos comprimidos incrementalmente.
+  Só um bloco está em memória de cada vez, seja qual for o intervalo.
+
+USO:
+  blocos = ExportacaoService.csv_em_blocos(ExportacaoService.linhas(ini, fim))
+  Response(stream_with_context(blocos), mimetype='text/csv')
+═══════════════════════════════════════════════════════════════
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import date
+from typing import Iterable, Iterator
+
+from sqlalchemy import func, select
+
+from app.extensions import db
+from app.models.atendente import Atendente
+from app.models.senha import Senha
+from app.models.servico import Servico
+from app.utils.periodos import entre_dias
+
+
+class ExportacaoService:
+    """Geradores para exportar atendimentos concluídos."""
+
+    LINHAS_POR_LEITURA = 1000   # yield_per do cursor
+    LINHAS_POR_BLOCO   = 500    # linhas CSV por bloco enviado
+
+    CABECALHO = [
+        'Número', 'Tipo', 'Serviço', 'Atendente',
+        'Balcão', 'Emitida em', 'Concluída em',
+        'Tempo Espera (min)', 'Tempo Atendimento (min)'
+    ]
+
+    # Chaves dos registos NDJSON (mesma ordem do CABECALHO)
+    CAMPOS = [
+        'numero', 'tipo', 'servico', 'atendente',
+        'balcao', 'emitida_em', 'concluida_em',
+        'tempo_espera_min', 'tempo_atendimento_min'
+    ]
+
+    @staticmethod
+    def _filtros(data_inicio: date, data_fim: date) -> list:
+        return [
+            Senha.status == 'concluida',
+            entre_dias(Senha.atendimento_concluido_em, data_inicio, data_fim)
+        ]
+
+    @staticmethod
+    def contar(data_inicio: date, data_fim: date) -> int:
+        """Nº de atendimentos do intervalo (para progresso)."""
+        return db.session.execute(
+            select(func.count(Senha.id)).where(
+                *ExportacaoService._filtros(data_inicio, data_fim)
+            )
+        ).scalar() or 0
+
+    @staticmethod
+    def registos(data_inicio: date, data_fim: date) -> Iterator[tuple]:
+        """Atendimentos concluídos no intervalo, tuplos Core por ordem de conclusão."""
+        resultado = db.session.execute(
+            select(
+                Senha.numero, Senha.tipo, Servico.nome, Atendente.nome,
+                Senha.numero_balcao, Senha.emitida_em, Senha.atendimento_concluido_em,
+                Senha.tempo_espera_minutos, Senha.tempo_atendimento_minutos,
+            )
+            .outerjoin(Servico, Servico.id == Senha.servico_id)
+            .outerjoin(Atendente, Atendente.id == Senha.atendente_id)
+            .where(*ExportacaoService._filtros(data_inicio, data_fim))
+            .order_by(Senha.atendimento_concluido_em.asc())
+            .execution_options(
+                stream_results=True,
+                yield_per=ExportacaoService.LINHAS_POR_LEITURA,
+            )
+        )
+
+        try:
+            yield from resultado
+        finally:
+            # Cliente desligou a meio: libertar o cursor do servidor
+            resultado.close()
+
+    @staticmethod
+    def linhas(data_inicio: date, data_fim: date, registos: Iterable[tuple] = None) -> Iterator[list]:
+        """Atendimentos concluídos no intervalo, já formatados para CSV."""
+        if registos is None:
+            registos = ExportacaoService.registos(data_inicio, data_fim)
+
+        for (numero, tipo, servico_nome, atendente_nome, balcao,
+             emitida_em, concluida_em, tempo_espera, tempo_atendimento) in registos:
+            yield [
+                numero,
+                tipo,
+                servico_nome or '',
+                atendente_nome or '',
+                balcao or '',
+                emitida_em.strftime('%d/%m/%Y %H:%M') if emitida_em else '',
+                concluida_em.strftime('%d/%m/%Y %H:%M') if concluida_em else '',
+                tempo_espera      or 0,
+                tempo_atendimento or 0
+            ]
+
+    @staticmethod
+    def csv_em_blocos(linhas: Iterable[list], cabecalho: list = None,
+                      linhas_por_bloco: int = None) -> Iterator[str]:
+        """Texto CSV em blocos (o primeiro inclui o cabeçalho)."""
+        linhas_por_bloco = linhas_por_bloco or ExportacaoService.LINHAS_POR_BLOCO
+        buffer   = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(cabecalho or ExportacaoService.CABECALHO)
+
+        pendentes = 0
+        for linha in linhas:
+            escritor.writerow(linha)
+            pendentes += 1
+            if pendentes >= linhas_por_bloco:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pendentes = 0
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    @staticmethod
+    def ndjson_em_blocos(registos: Iterable[tuple],
+                         linhas_por_bloco: int = None) -> Iterator[str]:
+        """Um objecto JSON por linha (datas em ISO 8601), em blocos."""
+        linhas_por_bloco = linhas_por_bloco or ExportacaoService.LINHAS_POR_BLOCO
+        bloco = []
+        for registo in registos:
+            bloco.append(json.dumps(
+                dict(zip(ExportacaoService.CAMPOS, registo)),
+                ensure_ascii=False, default=lambda v: v.isoformat()
+            ))
+            if len(bloco) >= linhas_por_bloco:
+                yield '\n'.join(bloco) + '\n'
+                bloco = []
+        if bloco:
+            yield '\n'.join(bloco) + '\n'
+
+    @staticmethod
+    def gzip_em_blocos(blocos: Iterable[str]) -> Iterator[bytes]:
+        """Comprime os blocos num único stream gzip (Content-Encoding: gzip)."""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)   # 31 = cabeçalho gzip
+        for bloco in blocos:
+            dados = compressor.compress(bloco.encode('utf-8'))
+            if dados:
+                yield dados
+        yield compressor.flush()
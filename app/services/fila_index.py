@@ -0,0 +1,381 @@
+"""
+app/services/fila_index.py
+═══════════════════════════════════════════════════════════════
+Índice em memória da fila de espera (por serviço + vista global)
+
+MOTIVAÇÃO:
+  Cada chamada a `_buscar_proxima_senha` / `obter_fila` fazia um
+  ORDER BY CASE(tipo) , emitida_em sobre `senhas` com filtro
+  não-sargable em func.date(emitida_em). O índice mantém as senhas
+  'aguardando' ordenadas em memória e a BD só confirma o "claim".
+
+ESTRUTURA:
+  - Uma lista ordenada por servico_id com chaves
+    (prioridade, emitida_em, id) — prioritárias primeiro, FIFO.
+  - Vista global = merge das listas por serviço (heapq.merge).
+  - Inserção/remoção por bisect: a procura é O(log n), mas o
+    insert/del na lista desloca os elementos seguintes — O(n) no pior
+    caso (memmove de ponteiros; para filas de centenas/milhares de
+    senhas é mais barato do que uma árvore ou heap em Python puro).
+  - Próxima senha = cabeça da lista.
+  - Posição na fila e tamanho = rank por bisect na lista do serviço
+    (O(log n)), sem materializar a fila.
+
+CONSISTÊNCIA:
+  - Construído a partir da BD no arranque (ou no primeiro uso).
+  - Actualizado em emitir, chamar, cancelar, redireccionar, concluir.
+  - Re-sincronizado com a BD a cada RESYNC_SEGUNDOS para apanhar
+    alterações feitas por outros workers.
+  - Com backend de cache partilhado (sqlite/redis) cada transição
+    incrementa o contador CONTADOR_PARTILHADO; um worker que veja o
+    contador avançar sem ter sido ele recarrega logo no acesso seguinte.
+  - Sem backend partilhado, um índice vazio não é conclusivo: proximos()
+    confirma na BD antes de responder "não há senhas".
+  - A recarga é single-flight: pedidos concorrentes esperam pela mesma
+    leitura em vez de lerem a BD cada um.
+═══════════════════════════════════════════════════════════════
+"""
+
+import bisect
+import heapq
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+
+# Cópia leve dos campos usados pelo índice (evita guardar objectos ORM)
+_Registo = namedtuple('_Registo', 'id servico_id tipo numero emitida_em')
+
+
+class FilaIndex:
+    """Índice ordenado das senhas 'aguardando' de hoje/ontem."""
+
+    RESYNC_SEGUNDOS = 30
+
+    # Contador no backend de cache (só usado se for partilhado)
+    CONTADOR_PARTILHADO = 'fila_index:versao'
+
+    def __init__(self):
+        self._lock        = threading.RLock()
+        self._lock_carga  = threading.Lock()   # uma recarga de cada vez
+        self._por_servico = {}    # servico_id → [chave, ...] ordenada
+        self._entradas    = {}    # senha_id   → (servico_id, chave, numero, tipo)
+        self._carregado_em = None
+        self._pendentes    = None  # operações durante recarga (replay)
+        self._versao_vista = None  # CONTADOR_PARTILHADO já reflectido
+        self._da_bd        = False # última carga veio da BD (não de uma lista)
+
+    # ═══════════════════════════════════════════════════════════
+    # Chaves e janela temporal
+    # ═══════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _chave(senha):
+        """(prioridade, emitida_em, id) — mesma ordem do ORDER BY antigo."""
+        prioridade = 0 if senha.tipo == 'prioritaria' else 1
+        return (prioridade, senha.emitida_em or datetime.min, senha.id)
+
+    @staticmethod
+    def inicio_janela():
+        """Aceita senhas emitidas hoje ou ontem (margem turno nocturno)."""
+        ontem = date.today() - timedelta(days=1)
+        return datetime.combine(ontem, datetime.min.time())
+
+    # ═══════════════════════════════════════════════════════════
+    # Carga a partir da BD
+    # ═══════════════════════════════════════════════════════════
+
+    def carregar(self, senhas=None):
+        """
+        (Re)constrói o índice.
+
+        Args:
+            senhas: iterável de objectos com id, servico_id, tipo,
+                    numero, emitida_em. None = ler da BD.
+        """
+        senhas_da_bd = senhas is None
+        versao = self._versao_partilhada() if senhas_da_bd else None
+
+        with self._lock:
+            self._pendentes = []
+
+        try:
+            if senhas is None:
+                senhas = self._ler_da_bd()
+
+            por_servico, entradas = {}, {}
+            for s in senhas:
+                chave = self._chave(s)
+                por_servico.setdefault(s.servico_id, []).append(chave)
+                entradas[s.id] = (s.servico_id, chave, s.numero, s.tipo)
+
+            for lista in por_servico.values():
+                lista.sort()
+        except Exception:
+            with self._lock:
+                self._pendentes = None
+            raise
+
+        with self._lock:
+            pendentes = self._pendentes or []
+            self._por_servico  = por_servico
+            self._entradas     = entradas
+            self._pendentes    = None
+            self._carregado_em = time.monotonic()
+            self._versao_vista = versao
+            self._da_bd        = senhas_da_bd
+
+            # Reaplicar alterações que chegaram durante a leitura
+            for operacao, argumento in pendentes:
+                if operacao == 'actualizar':
+                    self._inserir(argumento)
+                else:
+                    self._remover(argumento)
+
+    def _ler_da_bd(self):
+        from app.models.senha import Senha
+        from app.extensions import db
+
+        return db.session.query(
+            Senha.id, Senha.servico_id, Senha.tipo,
+            Senha.numero, Senha.emitida_em
+        ).filter(
+            Senha.status == 'aguardando',
+            Senha.emitida_em >= self.inicio_janela()
+        ).all()
+
+    def _desactualizado(self):
+        carregado_em = self._carregado_em
+        if carregado_em is None or time.monotonic() - carregado_em > self.RESYNC_SEGUNDOS:
+            return True
+        versao = self._versao_partilhada()
+        return versao is not None and versao != self._versao_vista
+
+    def _garantir_carregado(self):
+        if self._desactualizado():
+            self._recarregar(self._carregado_em)
+
+    def _recarregar(self, carregado_em):
+        """
+        Single-flight: só recarrega se ninguém o fez desde `carregado_em`
+        (quem esperou pelo lock aproveita a leitura de quem o tinha).
+        """
+        with self._lock_carga:
+            if self._carregado_em is carregado_em or self._desactualizado():
+                self.carregar()
+
+    def invalidar(self):
+        """Força recarga no próximo acesso."""
+        with self._lock:
+            self._carregado_em = None
+
+    # ───────────────────────────────────────────────────────────
+    # Contador partilhado entre workers
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _cache_partilhada():
+        from app.services.cache_service import get_cache
+
+        cache = get_cache()
+        return cache if cache.partilhado else None
+
+    def _versao_partilhada(self):
+        """Valor actual do contador partilhado (None sem backend partilhado)."""
+        cache = self._cache_partilhada()
+        if cache is None:
+            return None
+        try:
+            return cache.incr(self.CONTADOR_PARTILHADO, 0)
+        except Exception as e:
+            print(f"[FilaIndex] Contador partilhado indisponível: {e}")
+            return None
+
+    def _anunciar(self):
+        """
+        Avisa os outros workers de uma transição. Se o contador só
+        avançou por nós, o índice local continua em dia; se outro worker
+        mexeu entretanto, fica por reflectir e o próximo acesso recarrega.
+        """
+        cache = self._cache_partilhada()
+        if cache is None:
+            return
+        try:
+            versao = cache.incr(self.CONTADOR_PARTILHADO, 1)
+        except Exception as e:
+            print(f"[FilaIndex] Contador partilhado indisponível: {e}")
+            return
+        with self._lock:
+            if self._versao_vista is not None and versao == self._versao_vista + 1:
+                self._versao_vista = versao
+
+    # ═══════════════════════════════════════════════════════════
+    # Actualizações (transições de estado)
+    # ═══════════════════════════════════════════════════════════
+
+    def actualizar(self, senha):
+        """
+        Reflecte o estado actual de uma senha no índice:
+        'aguardando' → (re)insere; qualquer outro estado → remove.
+        """
+        if senha is None or senha.id is None:
+            return
+
+        with self._lock:
+            if senha.status == 'aguardando':
+                registo = _Registo(senha.id, senha.servico_id, senha.tipo,
+                                   senha.numero, senha.emitida_em)
+                self._inserir(registo)
+                if self._pendentes is not None:
+                    self._pendentes.append(('actualizar', registo))
+            else:
+                self._remover(senha.id)
+                if self._pendentes is not None:
+                    self._pendentes.append(('remover', senha.id))
+
+        self._anunciar()
+
+    def remover(self, senha_id):
+        with self._lock:
+            self._remover(senha_id)
+            if self._pendentes is not None:
+                self._pendentes.append(('remover', senha_id))
+
+    def _inserir(self, senha):
+        """Procura O(log n); o insort desloca a cauda da lista (O(n))."""
+        self._remover(senha.id)
+        chave = self._chave(senha)
+        bisect.insort(self._por_servico.setdefault(senha.servico_id, []), chave)
+        self._entradas[senha.id] = (senha.servico_id, chave, senha.numero, senha.tipo)
+
+    def _remover(self, senha_id):
+        entrada = self._entradas.pop(senha_id, None)
+        if entrada is None:
+            return
+        servico_id, chave = entrada[0], entrada[1]
+        lista = self._por_servico.get(servico_id)
+        if not lista:
+            return
+        i = bisect.bisect_left(lista, chave)
+        if i < len(lista) and lista[i] == chave:
+            del lista[i]
+        if not lista:
+            del self._por_servico[servico_id]
+
+    # ═══════════════════════════════════════════════════════════
+    # Consultas
+    # ═══════════════════════════════════════════════════════════
+
+    def _iterar(self, servico_id=None):
+        """Chaves válidas por ordem de atendimento (já sob lock)."""
+        if servico_id:
+            fonte = iter(self._por_servico.get(servico_id, ()))
+        else:
+            fonte = heapq.merge(*self._por_servico.values())
+
+        limite = self.inicio_janela()
+        for chave in fonte:
+            if chave[1] < limite:
+                continue   # senha antiga — descartada na próxima recarga
+            yield chave
+
+    def proximos(self, servico_id=None, limite=1):
+        """
+        IDs das próximas `limite` senhas (servico_id None = fila geral).
+
+        Sem contador partilhado o índice pode não ter as senhas emitidas
+        noutro worker: se não houver candidatos, confirma na BD (query
+        barata — a fila está vazia ou quase) antes de devolver [].
+        """
+        self._garantir_carregado()
+        ids = self._proximos(servico_id, limite)
+        if not ids and self._da_bd and self._versao_vista is None:
+            self._recarregar(self._carregado_em)
+            ids = self._proximos(servico_id, limite)
+        return ids
+
+    def _proximos(self, servico_id, limite):
+        with self._lock:
+            ids = []
+            for chave in self._iterar(servico_id):
+                ids.append(chave[2])
+                if len(ids) >= limite:
+                    break
+            return ids
+
+    def listar(self, servico_id=None, tipo=None):
+        """IDs de toda a fila, ordenados por prioridade e emissão."""
+        self._garantir_carregado()
+        with self._lock:
+            ids = []
+            for chave in self._iterar(servico_id):
+                if tipo and self._entradas[chave[2]][3] != tipo:
+                    continue
+                ids.append(chave[2])
+            return ids
+
+    def tamanho(self, servico_id=None):
+        """Senhas na fila (dentro da janela, como _iterar / posicao)."""
+        self._garantir_carregado()
+        limite = self.inicio_janela()
+        with self._lock:
+            if servico_id:
+                listas = [self._por_servico.get(servico_id, [])]
+            else:
+                listas = self._por_servico.values()
+            return sum(len(lista) - self._antigas(lista, limite) for lista in listas)
+
+    @staticmethod
+    def _antigas(lista, limite, ate_prioridade=1):
+        """
+        Chaves emitidas antes de `limite` nos grupos de prioridade
+        0..ate_prioridade — ficam no início de cada grupo (O(log n)).
+        """
+        antigas = 0
+        for prioridade in range(ate_prioridade + 1):
+            inicio = bisect.bisect_left(lista, (prioridade, datetime.min))
+            fim    = bisect.bisect_left(lista, (prioridade, limite))
+            antigas += fim - inicio
+        return antigas
+
+    def posicao(self, senha_id):
+        """
+        Posição 1-based da senha na fila do seu serviço, ou None se
+        não estiver no índice. O(log n): conta as chaves à frente por
+        bisect e desconta as senhas antigas (fora da janela).
+        """
+        self._garantir_carregado()
+        with self._lock:
+            entrada = self._entradas.get(senha_id)
+            if entrada is None:
+                return None
+
+            servico_id, chave = entrada[0], entrada[1]
+            lista  = self._por_servico.get(servico_id, ())
+            limite = self.inicio_janela()
+            if chave[1] < limite:
+                return None
+
+            a_frente = bisect.bisect_left(lista, chave)
+            return a_frente - self._antigas(lista, limite, chave[0]) + 1
+
+    def emissao(self, senha_id):
+        """emitida_em guardado no índice (None se a senha não estiver lá)."""
+        with self._lock:
+            entrada = self._entradas.get(senha_id)
+            if entrada is None or entrada[1][1] == datetime.min:
+                return None
+            return entrada[1][1]
+
+    def contem(self, senha_id):
+        with self._lock:
+            return senha_id in self._entradas
+
+
+# 🔥 INSTÂNCIA GLOBAL ÚNICA (por processo)
+_fila_index = FilaIndex()
+
+
+def get_fila_index() -> FilaIndex:
+    return _fila_index
@@ -9,13 +9,29 @@ CORRECÇÕES NESTA VERSÃO:
   ✅ FIX 3: um único db.session.commit() no fim — evita
      double-commit que causava estados inconsistentes.
   ✅ FIX 4: finalizar_anterior aceita 'chamando' E 'atendendo'.
+
+RESERVA ATÓMICA:
+  ✅ chamar_proxima reserva a senha numa única operação na BD:
+     FOR UPDATE SKIP LOCKED (MySQL) ou UPDATE condicional com
+     verificação de rowcount (SQLite) — dois balcões nunca ficam
+     com a mesma senha nem precisam de repetir a chamada.
+
+ÍNDICE EM MEMÓRIA:
+  ✅ obter_fila / _buscar_proxima_senha lêem a ordem da fila do
+     FilaIndex (app/services/fila_index.py) — a BD só carrega as
+     linhas escolhidas por PK e confirma que ainda estão 'aguardando'.
 ═══════════════════════════════════════════════════════════════
 """
 
 from app.models.senha import Senha
 from app.extensions import db
-from datetime import date, datetime, timedelta
-from sqlalchemy import func, case, or_
+from app.services.fila_index import get_fila_index
+from app.services.eventos_service import EventosService
+from app.services.estatisticas_service import EstatisticasService
+from app.services.estimador_espera import get_estimador_espera
+from app.services.cache_service import cached
+from datetime import datetime
+from sqlalchemy import func, case, update, and_, or_
 
 
 class AtendimentoAtivoError(Exception):
@@ -30,84 +46,84 @@ class FilaService:
     # ═══════════════════════════════════════════════════════════
 
     @staticmethod
-    def obter_fila(servico_id=None, tipo=None):
+    def _carregar_por_ids(ids):
         """
-        Senhas aguardando de HOJE, ordenadas por prioridade e emissão.
+        Carrega senhas por PK mantendo a ordem do índice.
 
-        FIX: filtro de data adicionado — antes buscava senhas de
-        qualquer data, causando que senhas antigas reaparecessem.
+        Senhas que já não estão 'aguardando' (alteradas por outro
+        worker) são descartadas e removidas do índice.
         """
-        hoje  = date.today()
-        ontem = hoje - timedelta(days=1)
+        if not ids:
+            return []
+
+        linhas = {s.id: s for s in Senha.query.options(*Senha.opcoes_serializacao())
+                  .filter(Senha.id.in_(ids)).all()}
+        indice = get_fila_index()
+
+        resultado = []
+        for senha_id in ids:
+            senha = linhas.get(senha_id)
+            if senha is None or senha.status != 'aguardando':
+                indice.remover(senha_id)
+                continue
+            resultado.append(senha)
+        return resultado
 
-        # Aceita senhas emitidas hoje ou ontem (margem para turno nocturno)
-        query = Senha.query.filter(
-            Senha.status == 'aguardando',
-            or_(
-                func.date(Senha.emitida_em) == hoje,
-                func.date(Senha.emitida_em) == ontem
-            )
-        )
-
-        if servico_id:
-            query = query.filter(Senha.servico_id == servico_id)
-
-        if tipo:
-            query = query.filter(Senha.tipo == tipo)
+    @staticmethod
+    def obter_fila(servico_id=None, tipo=None):
+        """
+        Senhas aguardando de HOJE (ou ontem), ordenadas por prioridade
+        e emissão.
 
-        # Prioritárias primeiro; dentro do mesmo tipo, FIFO por emissão
-        return query.order_by(
-            case((Senha.tipo == 'prioritaria', 0), else_=1),
-            Senha.emitida_em.asc()
-        ).all()
+        A ordem vem do FilaIndex; a BD só carrega as linhas por PK.
+        """
+        ids = get_fila_index().listar(servico_id=servico_id, tipo=tipo)
+        return FilaService._carregar_por_ids(ids)
 
     # ═══════════════════════════════════════════════════════════
     # Buscar próxima (uso interno)
     # ═══════════════════════════════════════════════════════════
 
+    # Candidatos lidos do índice por tentativa (cobre entradas obsoletas)
+    _CANDIDATOS = 5
+
     @staticmethod
     def _buscar_proxima_senha(servico_id=None):
         """
         Próxima senha aguardando de hoje.
         Prioritárias primeiro; FIFO dentro do mesmo tipo.
         """
-        hoje  = date.today()
-        ontem = hoje - timedelta(days=1)
-
-        query = Senha.query.filter(
-            Senha.status == 'aguardando',
-            or_(
-                func.date(Senha.emitida_em) == hoje,
-                func.date(Senha.emitida_em) == ontem
-            )
-        )
-
-        if servico_id:
-            query = query.filter(Senha.servico_id == servico_id)
+        indice = get_fila_index()
+        while True:
+            ids = indice.proximos(servico_id=servico_id, limite=FilaService._CANDIDATOS)
+            if not ids:
+                return None
 
-        return query.order_by(
-            case((Senha.tipo == 'prioritaria', 0), else_=1),
-            Senha.emitida_em.asc()
-        ).first()
+            validas = FilaService._carregar_por_ids(ids)
+            if validas:
+                return validas[0]
 
     # ═══════════════════════════════════════════════════════════
     # Chamar próxima — método principal (CORRIGIDO)
     # ═══════════════════════════════════════════════════════════
 
     @staticmethod
-    def chamar_proxima(servico_id, atendente_id, numero_balcao):
+    def chamar_proxima(servico_id, atendente_id, numero_balcao, publicar=True):
         """
         Chama a próxima senha da fila.
 
+        Args:
+            publicar: False se o chamador ainda grava algo sobre a
+                      chamada (ex: LogActividade) — publica ele o evento
+                      'chamada' depois do seu commit
+
         Fluxo:
-          1. Finalizar senha anterior do atendente (se existir)
-          2. Buscar próxima do serviço; fallback para fila geral
-          3. Marcar como 'atendendo'
-          4. Um único commit no final
+          1. Recusar se o atendente já tiver senha activa
+          2. Reservar atomicamente a próxima do serviço (já marcada
+             como 'atendendo'); fallback para fila geral
 
-        FIX CRÍTICO: o finalizar anterior está dentro de try/except
-        — se a senha anterior estiver num estado inesperado (ex:
-        'chamando'), não quebra o fluxo principal.
+        Balcões concorrentes recebem sempre senhas distintas — ver
+        _reivindicar_proxima.
 
         Returns:
             Senha | None
@@ -123,74 +139,197 @@ class FilaService:
                 f"Atendente já possui senha activa ({senha_anterior.numero})"
             )
 
-        # ── 2. Buscar próxima senha ───────────────────────────────
-        proxima = FilaService._buscar_proxima_senha(servico_id=servico_id)
+        # ── 2. Reservar atomicamente a próxima senha ─────────────
+        proxima = FilaService._reivindicar_proxima(
+            servico_id, atendente_id, numero_balcao)
 
         # Fallback: se não houver no serviço específico, fila geral
-        if not proxima:
-            proxima = FilaService._buscar_proxima_senha(servico_id=None)
+        if not proxima and servico_id:
+            proxima = FilaService._reivindicar_proxima(
+                None, atendente_id, numero_balcao)
 
         if not proxima:
-            # Não há senhas — commit das alterações anteriores e sai
-            try:
-                db.session.commit()
-            except Exception:
-                db.session.rollback()
             return None
 
-        # ── 3. Marcar próxima como 'atendendo' ────────────────────
-        proxima.status                  = 'atendendo'
-        proxima.atendente_id            = atendente_id
-        proxima.numero_balcao           = numero_balcao
-        proxima.chamada_em              = datetime.utcnow()
-        proxima.atendimento_iniciado_em = datetime.utcnow()
+        if publicar:
+            EventosService.publicar('chamada', proxima)
 
-        # Calcular tempo de espera
-        if proxima.emitida_em:
-            delta = proxima.atendimento_iniciado_em - proxima.emitida_em
-            proxima.tempo_espera_minutos = max(0, int(delta.total_seconds() / 60))
+        print(f"[FilaService] Senha {proxima.numero} → atendendo "
+              f"| Balcão {numero_balcao} | Atendente {atendente_id}")
+        return proxima
+
+    # ═══════════════════════════════════════════════════════════
+    # Reserva atómica ("claim") — sem corridas entre balcões
+    # ═══════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _suporta_skip_locked():
+        """MySQL 8+/MariaDB 10.6+/PostgreSQL suportam FOR UPDATE SKIP LOCKED."""
+        return db.session.get_bind().dialect.name in ('mysql', 'mariadb', 'postgresql')
+
+    @staticmethod
+    def _valores_atendimento(atendente_id, numero_balcao, emitida_em):
+        agora   = datetime.utcnow()
+        valores = {
+            'status':                  'atendendo',
+            'atendente_id':            atendente_id,
+            'numero_balcao':           numero_balcao,
+            'chamada_em':              agora,
+            'atendimento_iniciado_em': agora,
+        }
+        if emitida_em:
+            delta = agora - emitida_em
+            valores['tempo_espera_minutos'] = max(0, int(delta.total_seconds() / 60))
+        return valores
+
+    @staticmethod
+    def _reivindicar_proxima(servico_id, atendente_id, numero_balcao):
+        """
+        Reserva a próxima senha de `servico_id` (None = fila geral).
+
+        Os candidatos vêm do FilaIndex; a BD só confirma a posse:
+          - MySQL/PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED sobre
+            os candidatos — balcões concorrentes saltam as linhas já
+            bloqueadas e ficam cada um com uma senha diferente.
+          - SQLite/outros: UPDATE ... WHERE status='aguardando' por
+            candidato; rowcount == 1 confirma que a senha é nossa.
+
+        Returns:
+            Senha | None
+        """
+        indice = get_fila_index()
+        limite = FilaService._CANDIDATOS
 
-        # ── 4. Um único commit para todas as alterações ───────────
         try:
-            db.session.commit()
-            print(f"[FilaService] Senha {proxima.numero} → atendendo "
-                  f"| Balcão {numero_balcao} | Atendente {atendente_id}")
+            while True:
+                ids = indice.proximos(servico_id=servico_id, limite=limite)
+                if not ids:
+                    db.session.commit()
+                    return None
+
+                if FilaService._suporta_skip_locked():
+                    senha = FilaService._reivindicar_skip_locked(
+                        ids, atendente_id, numero_balcao)
+                else:
+                    senha = FilaService._reivindicar_condicional(
+                        ids, atendente_id, numero_balcao)
+
+                if senha:
+                    indice.actualizar(senha)
+                    return senha
+
+                # Todos os candidatos estavam bloqueados por outros balcões:
+                # alargar a janela; se já cobre a fila inteira, não há senha livre.
+                if len(ids) < limite:
+                    return None
+                limite *= 2
         except Exception as e:
             db.session.rollback()
-            print(f"[FilaService] ERRO ao commit chamar_proxima: {e}")
+            print(f"[FilaService] ERRO ao reservar senha: {e}")
             raise
 
-        return proxima
+    @staticmethod
+    def _reivindicar_skip_locked(ids, atendente_id, numero_balcao):
+        senha = Senha.query.filter(
+            Senha.id.in_(ids),
+            Senha.status == 'aguardando'
+        ).order_by(
+            case((Senha.tipo == 'prioritaria', 0), else_=1),
+            Senha.emitida_em.asc(),
+            Senha.id.asc()
+        ).with_for_update(skip_locked=True).first()
+
+        if senha is None:
+            # Bloqueadas por outros balcões ou já fora de 'aguardando':
+            # as que mudaram de estado saem do índice antes de alargar a janela
+            ainda_aguardam = {sid for (sid,) in db.session.query(Senha.id).filter(
+                Senha.id.in_(ids), Senha.status == 'aguardando')}
+            db.session.commit()
+
+            indice = get_fila_index()
+            for senha_id in ids:
+                if senha_id not in ainda_aguardam:
+                    indice.remover(senha_id)
+            return None
+
+        valores = FilaService._valores_atendimento(
+            atendente_id, numero_balcao, senha.emitida_em)
+        for campo, valor in valores.items():
+            setattr(senha, campo, valor)
+
+        db.session.commit()
+        return senha
+
+    @staticmethod
+    def _reivindicar_condicional(ids, atendente_id, numero_balcao):
+        indice = get_fila_index()
+
+        for senha_id in ids:
+            valores = FilaService._valores_atendimento(
+                atendente_id, numero_balcao, indice.emissao(senha_id))
+
+            resultado = db.session.execute(
+                update(Senha)
+                .where(Senha.id == senha_id, Senha.status == 'aguardando')
+                .values(**valores)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+
+            if resultado.rowcount == 1:
+                return db.session.get(Senha, senha_id)
+
+            # Outro balcão ficou com ela (ou mudou de estado) — descartar
+            indice.remover(senha_id)
+
+        return None
 
     # ═══════════════════════════════════════════════════════════
     # Estatísticas de fila
     # ═══════════════════════════════════════════════════════════
 
     @staticmethod
+    @cached(key=lambda servico_id=None: f"estatisticas_fila:{servico_id}:{datetime.utcnow().date()}",
+            tags=lambda servico_id=None: [f"servico:{servico_id}" if servico_id else "fila"],
+            ttl=60)
     def obter_estatisticas_fila(servico_id=None):
-        """Estatísticas da fila do dia actual."""
-        hoje = date.today()
+        """
+        Estatísticas da fila do dia actual (mesma query de EstatisticasService).
+        TTL curto só pelos balcões do estimador, que expiram com o tempo.
+        """
+        stats = EstatisticasService.dia(servico_id=servico_id)
 
-        query_base = Senha.query.filter(
-            func.date(Senha.emitida_em) == hoje
-        )
+        return {
+            'aguardando_total':        stats['aguardando'],
+            'aguardando_normal':       stats['aguardando_normal'],
+            'aguardando_prioritaria':  stats['aguardando_prioritaria'],
+            'atendendo':               stats['atendendo'],
+            'tempo_espera_estimado':   get_estimador_espera().estimar(
+                                           servico_id, stats['aguardando'])
+        }
 
-        if servico_id:
-            query_base = query_base.filter(Senha.servico_id == servico_id)
+    @staticmethod
+    @cached(key='contagens_por_servico', tags=['fila'], ttl=300)
+    def contagens_por_servico():
+        """
+        Senhas aguardando / em atendimento por serviço, numa query agrupada.
 
-        aguardando_total      = query_base.filter(Senha.status == 'aguardando').count()
-        aguardando_normal     = query_base.filter(
-            Senha.status == 'aguardando', Senha.tipo == 'normal').count()
-        aguardando_prioritaria = query_base.filter(
-            Senha.status == 'aguardando', Senha.tipo == 'prioritaria').count()
-        atendendo             = query_base.filter(Senha.status == 'atendendo').count()
+        Returns:
+            {servico_id: {'aguardando': n, 'atendendo': n}}
+            ('atendendo' inclui 'chamando'; serviços sem senhas omitidos)
+        """
+        em_atendimento = Senha.status.in_(('chamando', 'atendendo'))
+        linhas = db.session.query(
+            Senha.servico_id,
+            func.sum(case((Senha.status == 'aguardando', 1), else_=0)),
+            func.sum(case((em_atendimento, 1), else_=0)),
+        ).filter(
+            Senha.status.in_(('aguardando', 'chamando', 'atendendo'))
+        ).group_by(Senha.servico_id).all()
 
         return {
-            'aguardando_total':        aguardando_total,
-            'aguardando_normal':       aguardando_normal,
-            'aguardando_prioritaria':  aguardando_prioritaria,
-            'atendendo':               atendendo,
-            'tempo_espera_estimado':   aguardando_total * 10
+            servico_id: {'aguardando': int(ag or 0), 'atendendo': int(at or 0)}
+            for servico_id, ag, at in linhas
         }
 
     # ═══════════════════════════════════════════════════════════
@@ -198,17 +337,52 @@ class FilaService:
     # ═══════════════════════════════════════════════════════════
 
     @staticmethod
-    def obter_posicao_fila(senha_id):
-        """Posição de uma senha na fila (1-based) ou None."""
-        senha = Senha.query.get(senha_id)
-        if not senha or senha.status != 'aguardando':
+    def obter_posicao_fila(senha_id, senha=None):
+        """
+        Posição de uma senha na fila do seu serviço (1-based) ou None.
+
+        Caminho quente: rank no FilaIndex (O(log n), sem ler linhas).
+        Caminho frio (senha ainda não indexada, ex. emitida noutro
+        worker): COUNT das senhas à frente, servido pelo índice
+        composto ix_senhas_fila_posicao.
+
+        Args:
+            senha: objecto Senha já carregado (evita nova leitura)
+        """
+        posicao = get_fila_index().posicao(senha_id)
+        if posicao is not None:
+            return posicao
+
+        if senha is None:
+            senha = db.session.get(Senha, senha_id)
+        if not senha or senha.status != 'aguardando' or not senha.emitida_em:
+            return None
+        if senha.emitida_em < get_fila_index().inicio_janela():
             return None
 
-        fila = FilaService.obter_fila(servico_id=senha.servico_id)
-        for idx, s in enumerate(fila, start=1):
-            if s.id == senha_id:
-                return idx
-        return None
+        return FilaService._contar_a_frente(senha) + 1
+
+    @staticmethod
+    def _contar_a_frente(senha):
+        """COUNT(*) das senhas aguardando antes de `senha` no mesmo serviço."""
+        mesma_prioridade_antes = and_(
+            Senha.tipo == senha.tipo,
+            or_(
+                Senha.emitida_em < senha.emitida_em,
+                and_(Senha.emitida_em == senha.emitida_em, Senha.id < senha.id)
+            )
+        )
+        if senha.tipo == 'prioritaria':
+            a_frente = mesma_prioridade_antes
+        else:
+            a_frente = or_(Senha.tipo == 'prioritaria', mesma_prioridade_antes)
+
+        return db.session.query(func.count(Senha.id)).filter(
+            Senha.status == 'aguardando',
+            Senha.servico_id == senha.servico_id,
+            Senha.emitida_em >= get_fila_index().inicio_janela(),
+            a_frente
+        ).scalar() or 0
 
     # ═══════════════════════════════════════════════════════════
     # Status da fila (painel público)
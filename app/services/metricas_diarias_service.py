@@ -0,0 +1,319 @@
+"""
+app/services/metricas_diarias_service.py
+═══════════════════════════════════════════════════════════════
+Métricas por dia fechado — calculadas uma vez, depois só somadas
+
+MOTIVAÇÃO:
+  ?periodo=mes (ou um intervalo longo) varria todas as senhas do
+  intervalo em cada pedido, embora os dias passados já não mudem.
+
+COMO FUNCIONA:
+  - Dias fechados (< hoje): na primeira vez que um intervalo os
+    inclui, cada dia em falta é agregado por (atendente, serviço) e
+    gravado em `metricas_diarias`, com uma linha de fecho por dia.
+    Daí em diante o intervalo custa um SUM ... GROUP BY sobre essas
+    linhas (O(dias × atendentes)), sem tocar em `senhas`.
+  - Hoje (e datas futuras): calculado ao vivo, sempre.
+  - Uma transição (EventosService) ou avaliação numa senha de um dia
+    fechado apaga as linhas desse dia → recalculado no pedido seguinte.
+
+USO:
+  MetricasDiariasService.agregados(inicio, fim)                  → por atendente
+  MetricasDiariasService.agregados(inicio, fim, por='servico')   → por serviço
+
+  Valores: lista de somas na ordem de MetricaDiaria.CAMPOS.
+═══════════════════════════════════════════════════════════════
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app.extensions import db
+from app.models.avaliacao import Avaliacao
+from app.models.metrica_diaria import MetricaDiaria
+from app.models.senha import Senha
+
+logger = logging.getLogger(__name__)
+
+N_CAMPOS = len(MetricaDiaria.CAMPOS)
+
+
+def _tabela_em_falta(exc: Exception, tabela: str) -> bool:
+    msg = str(exc).lower()
+    return tabela in msg and any(
+        kw in msg for kw in ("doesn't exist", "no such table", "does not exist")
+    )
+
+
+def _somar(destino: dict, chave, valores) -> None:
+    acumulado = destino.setdefault(chave, [0] * N_CAMPOS)
+    for i, v in enumerate(valores):
+        acumulado[i] += int(v or 0)
+
+
+class MetricasDiariasService:
+    """Cache persistente de métricas por dia fechado."""
+
+    LINHA_FECHO = 0     # servico_id da linha que marca o dia como calculado
+
+    # ───────────────────────────────────────────────────────────
+    # Leitura
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def agregados(
+        data_inicio: Optional[date] = None,
+        data_fim: Optional[date] = None,
+        atendente_ids=None,
+        por: str = 'atendente',
+    ) -> dict:
+        """
+        Somas do intervalo [data_inicio, data_fim] (None = sem limite).
+
+        Args:
+            atendente_ids — restringe aos atendentes indicados (None = todos)
+            por           — 'atendente' | 'servico'
+
+        Returns:
+            {atendente_id | servico_id: [somas de MetricaDiaria.CAMPOS]}
+            (atendente_id 0 = senhas sem atendente)
+        """
+        if por not in ('atendente', 'servico'):
+            raise ValueError(f"Agrupamento desconhecido: {por}")
+
+        hoje = date.today()
+        ontem = hoje - timedelta(days=1)
+        totais = {}
+
+        # ── Dias fechados: cache ────────────────────────────
+        fim_fechados = min(data_fim, ontem) if data_fim else ontem
+        inicio = data_inicio or MetricasDiariasService._primeiro_dia()
+
+        if inicio and inicio <= fim_fechados:
+            try:
+                MetricasDiariasService._materializar(inicio, fim_fechados)
+                linhas = MetricasDiariasService._ler(inicio, fim_fechados, atendente_ids, por)
+            except SQLAlchemyError as exc:
+                if not _tabela_em_falta(exc, 'metricas_diarias'):
+                    raise
+                # Antes de `flask db upgrade`: tudo ao vivo
+                db.session.rollback()
+                linhas = MetricasDiariasService._agrupar(
+                    MetricasDiariasService.calcular(inicio, fim_fechados),
+                    atendente_ids, por
+                )
+            for chave, valores in linhas.items():
+                _somar(totais, chave, valores)
+
+        # ── Hoje: ao vivo ───────────────────────────────────
+        if data_fim is None or data_fim >= hoje:
+            inicio_vivo = max(data_inicio, hoje) if data_inicio else hoje
+            linhas = MetricasDiariasService._agrupar(
+                MetricasDiariasService.calcular(inicio_vivo, data_fim),
+                atendente_ids, por
+            )
+            for chave, valores in linhas.items():
+                _somar(totais, chave, valores)
+
+        return totais
+
+    @staticmethod
+    def _primeiro_dia() -> Optional[date]:
+        return db.session.query(func.min(Senha.data_emissao)).scalar()
+
+    @staticmethod
+    def _ler(inicio: date, fim: date, atendente_ids, por: str) -> dict:
+        coluna = (MetricaDiaria.atendente_id if por == 'atendente'
+                  else MetricaDiaria.servico_id)
+
+        query = db.session.query(
+            coluna,
+            *[func.sum(getattr(MetricaDiaria, c)) for c in MetricaDiaria.CAMPOS]
+        ).filter(
+            MetricaDiaria.data >= inicio,
+            MetricaDiaria.data <= fim,
+            MetricaDiaria.servico_id != MetricasDiariasService.LINHA_FECHO,
+        )
+        if atendente_ids is not None:
+            query = query.filter(MetricaDiaria.atendente_id.in_(atendente_ids))
+
+        return {linha[0]: list(linha[1:]) for linha in query.group_by(coluna).all()}
+
+    @staticmethod
+    def _agrupar(linhas: dict, atendente_ids, por: str) -> dict:
+        """{(data, atendente, servico): somas} → {atendente|servico: somas}"""
+        ids = set(atendente_ids) if atendente_ids is not None else None
+        resultado = {}
+        for (_, atendente_id, servico_id), valores in linhas.items():
+            if ids is not None and atendente_id not in ids:
+                continue
+            _somar(resultado, atendente_id if por == 'atendente' else servico_id, valores)
+        return resultado
+
+    # ───────────────────────────────────────────────────────────
+    # Cálculo a partir de senhas / avaliacoes
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def calcular(inicio: Optional[date], fim: Optional[date]) -> dict:
+        """
+        Agrega senhas e avaliações do intervalo (2 queries).
+
+        Returns:
+            {(data, atendente_id, servico_id): [somas de MetricaDiaria.CAMPOS]}
+        """
+        filtros = []
+        if inicio:
+            filtros.append(Senha.data_emissao >= inicio)
+        if fim:
+            filtros.append(Senha.data_emissao <= fim)
+
+        concluida = Senha.status == "concluida"
+        com_tempo = concluida & Senha.tempo_atendimento_minutos.isnot(None)
+
+        linhas = {}
+        for l in db.session.query(
+            Senha.data_emissao,
+            Senha.atendente_id,
+            Senha.servico_id,
+            func.count(Senha.id),
+            func.sum(case((concluida, 1), else_=0)),
+            func.sum(case((com_tempo, Senha.tempo_atendimento_minutos), else_=0)),
+            func.sum(case((com_tempo, 1), else_=0)),
+            func.sum(case(
+                (Senha.observacoes.isnot(None) & Senha.observacoes.like("%REDIR:%"), 1),
+                else_=0
+            )),
+        ).filter(*filtros).group_by(
+            Senha.data_emissao, Senha.atendente_id, Senha.servico_id
+        ).all():
+            _somar(linhas, (l[0], l[1] or 0, l[2]), list(l[3:]) + [0, 0])
+
+        for dia, atendente_id, servico_id, soma, n in MetricasDiariasService._avaliacoes(filtros):
+            _somar(linhas, (dia, atendente_id or 0, servico_id),
+                   [0] * (N_CAMPOS - 2) + [soma, n])
+
+        return linhas
+
+    @staticmethod
+    def _avaliacoes(filtros: list) -> list:
+        """(data, atendente_id, servico_id, soma, total) por grupo."""
+        try:
+            return db.session.query(
+                Senha.data_emissao,
+                Avaliacao.atendente_id,
+                Senha.servico_id,
+                func.sum(Avaliacao.score),
+                func.count(Avaliacao.id),
+            ).join(Senha, Avaliacao.senha_id == Senha.id).filter(*filtros).group_by(
+                Senha.data_emissao, Avaliacao.atendente_id, Senha.servico_id
+            ).all()
+
+        except Exception as _aval_exc:
+            _msg = str(_aval_exc).lower()
+            if not ("avaliacoes" in _msg or "doesn't exist" in _msg or "no such table" in _msg):
+                logger.warning("Avaliacao query error: %s", _aval_exc)
+                return []
+
+            # Tabela avaliacoes ausente → fallback para Senha.avaliacao_nota
+            if not hasattr(Senha, "avaliacao_nota"):
+                logger.warning(
+                    "Fallback avaliacao_nota indisponível: coluna não mapeada no model Senha."
+                )
+                return []
+
+            return db.session.query(
+                Senha.data_emissao,
+                Senha.atendente_id,
+                Senha.servico_id,
+                func.sum(Senha.avaliacao_nota),
+                func.count(Senha.id),
+            ).filter(
+                Senha.avaliacao_nota.isnot(None),
+                Senha.avaliacao_nota > 0,
+                *filtros,
+            ).group_by(
+                Senha.data_emissao, Senha.atendente_id, Senha.servico_id
+            ).all()
+
+    # ───────────────────────────────────────────────────────────
+    # Escrita
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _materializar(inicio: date, fim: date) -> None:
+        """Calcula e grava os dias de [inicio, fim] ainda sem linha de fecho."""
+        feitos = {
+            dia for (dia,) in db.session.query(MetricaDiaria.data).filter(
+                MetricaDiaria.data >= inicio,
+                MetricaDiaria.data <= fim,
+                MetricaDiaria.servico_id == MetricasDiariasService.LINHA_FECHO,
+            )
+        }
+
+        em_falta = []
+        dia = inicio
+        while dia <= fim:
+            if dia not in feitos:
+                em_falta.append(dia)
+            dia += timedelta(days=1)
+        if not em_falta:
+            return
+
+        # Uma agregação por bloco de dias consecutivos em falta
+        blocos = [[em_falta[0], em_falta[0]]]
+        for dia in em_falta[1:]:
+            if dia == blocos[-1][1] + timedelta(days=1):
+                blocos[-1][1] = dia
+            else:
+                blocos.append([dia, dia])
+
+        for bloco_inicio, bloco_fim in blocos:
+            for (dia, atendente_id, servico_id), valores in \
+                    MetricasDiariasService.calcular(bloco_inicio, bloco_fim).items():
+                db.session.add(MetricaDiaria(
+                    data=dia, atendente_id=atendente_id, servico_id=servico_id,
+                    **dict(zip(MetricaDiaria.CAMPOS, valores))
+                ))
+
+        for dia in em_falta:
+            db.session.add(MetricaDiaria(
+                data=dia, atendente_id=0, servico_id=MetricasDiariasService.LINHA_FECHO,
+                **dict.fromkeys(MetricaDiaria.CAMPOS, 0)
+            ))
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Outro processo gravou os mesmos dias entretanto — são iguais
+            db.session.rollback()
+
+    @staticmethod
+    def invalidar(dia: date) -> None:
+        """Apaga as linhas de um dia (recalculado no próximo pedido)."""
+        try:
+            MetricaDiaria.query.filter(MetricaDiaria.data == dia).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            if not _tabela_em_falta(exc, 'metricas_diarias'):
+                # Não falhar a operação que já foi gravada
+                logger.error("Erro ao invalidar métricas de %s: %s", dia, exc)
+
+    @staticmethod
+    def invalidar_se_fechado(dia: Optional[date]) -> None:
+        if dia and dia < date.today():
+            MetricasDiariasService.invalidar(dia)
+
+    @staticmethod
+    def ouvinte(evento, senha, dados):
+        """Ouvinte do EventosService: transição numa senha de um dia fechado."""
+        MetricasDiariasService.invalidar_se_fechado(senha.data_emissao)
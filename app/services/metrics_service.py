@@ -43,12 +43,11 @@ import logging
 from datetime import date, datetime
 from typing import Optional
 
-from sqlalchemy import case, func, or_
+from sqlalchemy.orm import joinedload
 
-from app.extensions import db
 from app.models.atendente import Atendente
-from app.models.avaliacao import Avaliacao
-from app.models.senha import Senha
+from app.models.metrica_diaria import MetricaDiaria
+from app.services.metricas_diarias_service import MetricasDiariasService
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +76,52 @@ _PESOS = {
 _MIN_ATENDIMENTOS_PARA_SCORE = 1
 
 
+# ─────────────────────────────────────────────────────────────
+# AGREGADOS — somas por atendente (dias fechados vêm da cache)
+# ─────────────────────────────────────────────────────────────
+
+def _agregar(data_inicio, data_fim, atendente_ids=None) -> dict:
+    """
+    Somas por atendente no período, via MetricasDiariasService: dias
+    fechados lidos de `metricas_diarias`, hoje calculado ao vivo.
+
+    Returns:
+        {atendente_id: {campo: soma}}  (atendente_id 0 = sem atendente;
+        presente só quando atendente_ids é None)
+    """
+    somas = MetricasDiariasService.agregados(data_inicio, data_fim, atendente_ids)
+    return {
+        atendente_id: dict(zip(MetricaDiaria.CAMPOS, valores))
+        for atendente_id, valores in somas.items()
+    }
+
+
+def _montar_metricas(somas: dict = None) -> dict:
+    """Dict de métricas a partir das somas agregadas (None = sem senhas)."""
+    somas = somas or dict.fromkeys(MetricaDiaria.CAMPOS, 0)
+
+    total      = somas["total"]
+    concluidas = somas["concluidas"]
+    taxa = round((concluidas / total * 100), 2) if total > 0 else 0.0
+    tempo_medio = somas["tempo_soma"] / somas["tempo_n"] if somas["tempo_n"] else 0.0
+
+    # FIX-M4: 0.0 quando sem avaliações — NÃO usar valor neutro fictício
+    aval_total = somas["avaliacoes_total"]
+    aval_media = round(somas["avaliacoes_soma"] / aval_total, 2) if aval_total else 0.0
+
+    return {
+        "avaliacao_media":         aval_media,
+        "avaliacoes_total":        aval_total,
+        "total_atendimentos":      total,
+        "atendimentos_concluidos": concluidas,
+        "taxa_conclusao":          taxa,
+        "tempo_medio":             round(tempo_medio, 1),
+        "redirecionamentos":       somas["redirecionamentos"],
+        # FIX-M2: flag de dados insuficientes — critério objectivo
+        "dados_insuficientes":     total < _MIN_ATENDIMENTOS_PARA_SCORE,
+    }
+
+
 # ─────────────────────────────────────────────────────────────
 # FUNÇÃO PRINCIPAL — métricas de UM atendente
 # ─────────────────────────────────────────────────────────────
@@ -109,120 +154,24 @@ def get_atendente_metrics(
     FIX-M2: 'dados_insuficientes' é True quando total_atendimentos == 0.
     Quando True, o frontend deve exibir "—" em vez de qualquer score.
     """
-    # ── Filtros de data ──────────────────────────────────────
-    filtros_base = [Senha.atendente_id == atendente_id]
-    if data_inicio:
-        filtros_base.append(Senha.data_emissao >= data_inicio)
-    if data_fim:
-        filtros_base.append(Senha.data_emissao <= data_fim)
-
-    # ── Consulta agregada principal ──────────────────────────
-    resultado = db.session.query(
-        func.count(Senha.id).label("total"),
-        func.sum(
-            case((Senha.status == "concluida", 1), else_=0)
-        ).label("concluidas"),
-        func.avg(
-            case(
-                (
-                    (Senha.status == "concluida") &
-                    (Senha.tempo_atendimento_minutos.isnot(None)),
-                    Senha.tempo_atendimento_minutos
-                ),
-                else_=None
-            )
-        ).label("tempo_medio"),
-        func.sum(
-            case(
-                (
-                    (Senha.observacoes.isnot(None)) &
-                    (Senha.observacoes.like("%REDIR:%")),
-                    1
-                ),
-                else_=0
-            )
-        ).label("redirecionamentos"),
-    ).filter(*filtros_base).one()
-
-    total         = resultado.total         or 0
-    concluidas    = int(resultado.concluidas or 0)
-    tempo_medio   = float(resultado.tempo_medio or 0.0)
-    redirs        = int(resultado.redirecionamentos or 0)
-    taxa          = round((concluidas / total * 100), 2) if total > 0 else 0.0
-
-    # FIX-M4: avaliação — 0.0 real quando sem avaliações (não valor neutro)
-    filtros_aval_join = list(filtros_base[1:])  # filtros de data sem o atendente_id
-
-    try:
-        aval_query = db.session.query(
-            func.avg(Avaliacao.score).label("media"),
-            func.count(Avaliacao.id).label("total"),
-        ).join(Senha, Avaliacao.senha_id == Senha.id)
-
-        aval_query = aval_query.filter(Avaliacao.atendente_id == atendente_id)
-        for f in filtros_aval_join:
-            aval_query = aval_query.filter(f)
-
-        aval = aval_query.one()
-        # FIX-M4: 0.0 quando sem avaliações — NÃO usar valor neutro fictício
-        aval_media = round(float(aval.media or 0.0), 2)
-        aval_total = int(aval.total or 0)
-    except Exception as _aval_exc:
-        _msg = str(_aval_exc).lower()
-        if "avaliacoes" in _msg or "doesn't exist" in _msg or "no such table" in _msg:
-            # Tabela avaliacoes ausente → fallback para Senha.avaliacao_nota
-            if hasattr(Senha, "avaliacao_nota"):
-                _fb = db.session.query(
-                    func.avg(Senha.avaliacao_nota).label("media"),
-                    func.count(Senha.id).label("total"),
-                ).filter(
-                    Senha.atendente_id == atendente_id,
-                    Senha.avaliacao_nota.isnot(None),
-                    Senha.avaliacao_nota > 0,
-                    *filtros_aval_join,
-                ).one()
-                aval_media = round(float(_fb.media or 0.0), 2)
-                aval_total = int(_fb.total or 0)
-            else:
-                logger.warning(
-                    "Fallback avaliacao_nota indisponível: coluna não mapeada no model Senha."
-                )
-                aval_media = 0.0
-                aval_total = 0
-        else:
-            logger.warning("Avaliacao query error atendente %s: %s", atendente_id, _aval_exc)
-            aval_media = 0.0
-            aval_total = 0
-
-    # FIX-M2: flag de dados insuficientes — critério objectivo
-    dados_insuficientes = total < _MIN_ATENDIMENTOS_PARA_SCORE
-
-    return {
-        "avaliacao_media":         aval_media,
-        "avaliacoes_total":        aval_total,
-        "total_atendimentos":      total,
-        "atendimentos_concluidos": concluidas,
-        "taxa_conclusao":          taxa,
-        "tempo_medio":             round(tempo_medio, 1),
-        "redirecionamentos":       redirs,
-        "dados_insuficientes":     dados_insuficientes,  # ← FIX-M2
-    }
+    somas = _agregar(data_inicio, data_fim, [atendente_id])
+    return _montar_metricas(somas.get(atendente_id))
 
 
 # ─────────────────────────────────────────────────────────────
 # FUNÇÃO — score composto ponderado (0–100 ou None)
 # ─────────────────────────────────────────────────────────────
 
-def calcular_score(
-    metrics: dict,
+def calcular_scores(
+    metricas: list[dict],
     max_atendimentos: int = None
-) -> Optional[float]:
+) -> list[Optional[float]]:
     """
-    Calcula o score composto de um atendente a partir das suas métricas.
+    Score composto de vários atendentes de uma vez (por colunas).
 
-    FIX-M1: Devolve None quando não existem dados de produção reais.
-    O frontend deve tratar None como "Sem dados suficientes" e NÃO
-    atribuir qualquer badge, ranking ou posição no pódio.
+    FIX-M1: None para quem não tem dados de produção reais. O frontend
+    deve tratar None como "Sem dados suficientes" e NÃO atribuir
+    qualquer badge, ranking ou posição no pódio.
 
     Fórmula (score de 0 a 100):
       35% — avaliação média normalizada (0–5 → 0–100)
@@ -232,57 +181,61 @@ def calcular_score(
        8% — redirecionamentos invertidos (quanto menos, melhor → 0–100)
 
     Args:
-        metrics          — dict devolvido por get_atendente_metrics()
+        metricas         — dicts devolvidos por get_atendente_metrics()
         max_atendimentos — valor de referência para normalizar total;
                            se None usa _REF_MAX_ATENDIMENTOS global
 
     Returns:
-        score arredondado a 1 decimal (0.0–100.0) ou None se sem dados.
+        scores alinhados com `metricas` (1 decimal ou None).
     """
-    # FIX-M1: sem dados reais → None, nunca um valor sintético
-    if metrics.get("dados_insuficientes"):
-        return None
+    ref = max_atendimentos or _REF_MAX_ATENDIMENTOS
+    intervalo = _TEMPO_MAXIMO_MIN - _TEMPO_IDEAL_MIN
 
-    if metrics.get("total_atendimentos", 0) < _MIN_ATENDIMENTOS_PARA_SCORE:
-        return None
+    def coluna(campo):
+        return [float(m.get(campo, 0) or 0) for m in metricas]
 
-    ref = max_atendimentos or _REF_MAX_ATENDIMENTOS
+    totais = coluna("total_atendimentos")
 
-    # ── Componente: avaliação (0–5 → 0–100) ─────────────────
     # FIX-M4: se aval_media == 0 (sem avaliações), contribuição = 0
-    # NÃO usar valor neutro de 70 como antes
-    p_aval = (metrics.get("avaliacao_media", 0) / 5.0) * 100
-
-    # ── Componente: taxa de conclusão (já em %) ──────────────
-    p_taxa = float(metrics.get("taxa_conclusao", 0))
-
-    # ── Componente: atendimentos (normalizado) ───────────────
-    total   = metrics.get("total_atendimentos", 0)
-    p_atend = min(total / ref * 100, 100.0) if ref > 0 else 0.0
-
-    # ── Componente: tempo médio invertido ────────────────────
-    tempo = metrics.get("tempo_medio", 0) or 0
-    if tempo <= _TEMPO_IDEAL_MIN:
-        p_tempo = 100.0
-    elif tempo >= _TEMPO_MAXIMO_MIN:
-        p_tempo = 0.0
-    else:
-        intervalo = _TEMPO_MAXIMO_MIN - _TEMPO_IDEAL_MIN
-        p_tempo = max(0.0, (1 - (tempo - _TEMPO_IDEAL_MIN) / intervalo) * 100)
-
-    # ── Componente: redirecionamentos invertidos ─────────────
-    redir   = metrics.get("redirecionamentos", 0) or 0
-    p_redir = max(0.0, 100.0 - redir * 10)
-
-    score = (
-        p_aval  * _PESOS["avaliacao"]    +
-        p_taxa  * _PESOS["taxa"]         +
-        p_atend * _PESOS["atendimentos"] +
-        p_tempo * _PESOS["tempo"]        +
-        p_redir * _PESOS["redir"]
-    )
+    p_aval  = [a / 5.0 * 100 for a in coluna("avaliacao_media")]
+    p_taxa  = coluna("taxa_conclusao")
+    p_atend = [min(t / ref * 100, 100.0) if ref > 0 else 0.0 for t in totais]
+    p_tempo = [
+        100.0 if t <= _TEMPO_IDEAL_MIN else
+        0.0   if t >= _TEMPO_MAXIMO_MIN else
+        max(0.0, (1 - (t - _TEMPO_IDEAL_MIN) / intervalo) * 100)
+        for t in coluna("tempo_medio")
+    ]
+    p_redir = [max(0.0, 100.0 - r * 10) for r in coluna("redirecionamentos")]
+
+    scores = []
+    for i, m in enumerate(metricas):
+        # FIX-M1: sem dados reais → None, nunca um valor sintético
+        if m.get("dados_insuficientes") or totais[i] < _MIN_ATENDIMENTOS_PARA_SCORE:
+            scores.append(None)
+            continue
+        scores.append(round(
+            p_aval[i]  * _PESOS["avaliacao"]    +
+            p_taxa[i]  * _PESOS["taxa"]         +
+            p_atend[i] * _PESOS["atendimentos"] +
+            p_tempo[i] * _PESOS["tempo"]        +
+            p_redir[i] * _PESOS["redir"],
+            1
+        ))
+    return scores
 
-    return round(score, 1)
+
+def calcular_score(
+    metrics: dict,
+    max_atendimentos: int = None
+) -> Optional[float]:
+    """
+    Score composto de UM atendente (ver calcular_scores).
+
+    Returns:
+        score arredondado a 1 decimal (0.0–100.0) ou None se sem dados.
+    """
+    return calcular_scores([metrics], max_atendimentos)[0]
 
 
 # ─────────────────────────────────────────────────────────────
@@ -298,6 +251,11 @@ def get_todos_atendentes_metrics(
     """
     Devolve lista de atendentes com métricas + score, ordenada por score DESC.
 
+    Número fixo de queries, seja qual for o nº de atendentes:
+      1. atendentes (+ serviço por JOIN)
+      2. somas por atendente (também dão o máximo) — dias fechados
+         de `metricas_diarias`, hoje ao vivo (MetricasDiariasService)
+
     FIX-M3: Atendentes com dados_insuficientes=True terão score=None
     e aparecem NO FIM da lista (após os que têm dados reais).
 
@@ -315,7 +273,7 @@ def get_todos_atendentes_metrics(
           + dados_insuficientes: bool
     """
     # ── Carregar atendentes ──────────────────────────────────
-    query = Atendente.query
+    query = Atendente.query.options(joinedload(Atendente.servico))
     if apenas_ativos:
         query = query.filter(Atendente.ativo == True)
     if apenas_atendentes:
@@ -325,60 +283,38 @@ def get_todos_atendentes_metrics(
     if not atendentes:
         return []
 
-    # ── Calcular máximo real de atendimentos ─────────────────
-    filtros_max = [Senha.status == "concluida"]
-    if data_inicio:
-        filtros_max.append(Senha.data_emissao >= data_inicio)
-    if data_fim:
-        filtros_max.append(Senha.data_emissao <= data_fim)
-
-    # MySQL não aceita MAX(COUNT(...)) no mesmo SELECT com GROUP BY.
-    # Fazemos em 2 passos: subquery com COUNT por atendente e depois MAX no exterior.
-    counts_subq = db.session.query(
-        Senha.atendente_id.label("atendente_id"),
-        func.count(Senha.id).label("total_concluidas")
-    ).filter(
-        *filtros_max
-    ).group_by(
-        Senha.atendente_id
-    ).subquery()
-
-    max_total = db.session.query(
-        func.max(counts_subq.c.total_concluidas)
-    ).scalar()
+    # ── Agregados de todos os atendentes ─────────────────────
+    # Sem filtro de ids: o máximo de concluídas considera todos os
+    # grupos (como antes), não só os atendentes listados.
+    somas = _agregar(data_inicio, data_fim)
 
+    max_total = max((linha["concluidas"] for linha in somas.values()), default=0)
     max_atend = int(max_total) if max_total else _REF_MAX_ATENDIMENTOS
 
-    # ── Calcular métricas por atendente ─────────────────────
-    resultado = []
-    for atendente in atendentes:
-        try:
-            metricas = get_atendente_metrics(
-                atendente.id, data_inicio, data_fim
-            )
-            # FIX-M1 + FIX-M3: score é None quando sem dados reais
-            score = calcular_score(metricas, max_atend)
-
-            resultado.append({
-                "id":          atendente.id,
-                "nome":        atendente.nome,
-                "email":       atendente.email,
-                "balcao":      atendente.balcao,
-                "tipo":        atendente.tipo,
-                "ativo":       atendente.ativo,
-                "departamento": (
-                    atendente.servico.nome if atendente.servico else "Geral"
-                ),
-                **metricas,
-                "score":               score,               # Optional[float]
-                "dados_insuficientes": metricas["dados_insuficientes"],
-            })
-        except Exception as exc:
-            logger.error(
-                "Erro ao calcular métricas do atendente %s: %s",
-                atendente.id, exc
-            )
-            continue
+    metricas = [
+        _montar_metricas(somas.get(a.id))
+        for a in atendentes
+    ]
+    # FIX-M1 + FIX-M3: score é None quando sem dados reais
+    scores = calcular_scores(metricas, max_atend)
+
+    resultado = [
+        {
+            "id":          atendente.id,
+            "nome":        atendente.nome,
+            "email":       atendente.email,
+            "balcao":      atendente.balcao,
+            "tipo":        atendente.tipo,
+            "ativo":       atendente.ativo,
+            "departamento": (
+                atendente.servico.nome if atendente.servico else "Geral"
+            ),
+            **m,
+            "score":               score,               # Optional[float]
+            "dados_insuficientes": m["dados_insuficientes"],
+        }
+        for atendente, m, score in zip(atendentes, metricas, scores)
+    ]
 
     # FIX-M3: ordenar — scores reais primeiro (desc), sem dados no fim
     resultado.sort(
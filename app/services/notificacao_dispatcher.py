@@ -0,0 +1,322 @@
+"""
+app/services/notificacao_dispatcher.py
+═══════════════════════════════════════════════════════════════
+Envio de notificações (SMS) fora do pedido HTTP
+
+MOTIVAÇÃO:
+  `emitir_senha` chamava o provider de SMS dentro do pedido: com um
+  provider real, cada emissão no quiosque esperaria por uma chamada
+  HTTP externa. Agora o pedido só mete a mensagem numa fila e
+  devolve logo o id da notificação.
+
+ESTRUTURA:
+  - Fila limitada (NOTIFICACOES_FILA_MAX); cheia → notificação
+    'descartada' (a emissão nunca falha por causa do SMS).
+  - NOTIFICACOES_WORKERS threads; cada uma junta até `tamanho_lote`
+    mensagens do mesmo provider e envia-as numa só chamada.
+  - Falhas voltam à fila com backoff exponencial (+ jitter) até
+    NOTIFICACOES_TENTATIVAS; depois ficam 'falhada'.
+  - estado(id) → pendente | enviada | falhada | descartada.
+
+PROVIDERS:
+  simulado — imprime a mensagem (comportamento anterior)
+  stub     — latência e falhas configuráveis, para testes
+═══════════════════════════════════════════════════════════════
+"""
+
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+# ═══════════════════════════════════════════════════════════════
+# Providers
+# ═══════════════════════════════════════════════════════════════
+
+class ProviderSimulado:
+    """SMS simulado — imprime no terminal."""
+
+    nome = 'simulado'
+    tamanho_lote = 20
+
+    def enviar_lote(self, mensagens):
+        """
+        Args:
+            mensagens: lista de dicts {id, destino, texto, tipo}
+        Returns:
+            lista de erros alinhada com `mensagens` (None = enviada)
+        """
+        for m in mensagens:
+            print("\n" + "=" * 60)
+            print(f"[SMS SIMULADO - {m['tipo'].upper()}] → {m['destino'] or 'Utente'}")
+            print(m['texto'])
+            print("=" * 60 + "\n")
+        return [None] * len(mensagens)
+
+
+class ProviderStub:
+    """
+    Provider de teste: simula latência por chamada e falhas.
+
+    Attributes:
+        latencia:   segundos por chamada (lote)
+        taxa_falha: probabilidade de falha por mensagem (0..1)
+    """
+
+    nome = 'stub'
+
+    def __init__(self, latencia=0.0, taxa_falha=0.0, tamanho_lote=20):
+        self.latencia     = latencia
+        self.taxa_falha   = taxa_falha
+        self.tamanho_lote = tamanho_lote
+        self.enviadas     = []
+        self.chamadas     = 0
+        self._falhas_forcadas = 0
+        self._lock = threading.Lock()
+
+    def falhar_proximas(self, n):
+        """As próximas `n` mensagens falham (independente da taxa)."""
+        with self._lock:
+            self._falhas_forcadas = n
+
+    def enviar_lote(self, mensagens):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+        erros = []
+        with self._lock:
+            self.chamadas += 1
+            for m in mensagens:
+                if self._falhas_forcadas > 0:
+                    self._falhas_forcadas -= 1
+                    erros.append('falha forçada')
+                elif self.taxa_falha and random.random() < self.taxa_falha:
+                    erros.append('falha simulada')
+                else:
+                    self.enviadas.append(m)
+                    erros.append(None)
+        return erros
+
+
+PROVIDERS = {
+    'simulado': ProviderSimulado,
+    'stub':     ProviderStub,
+}
+
+
+# ═══════════════════════════════════════════════════════════════
+# Dispatcher
+# ═══════════════════════════════════════════════════════════════
+
+class NotificacaoDispatcher:
+    """Fila limitada + workers com retry e envio em lote."""
+
+    MAX_ESTADOS = 10_000   # ids recentes guardados para consulta
+
+    def __init__(self, provider=None, workers=2, fila_max=1000,
+                 tentativas=4, backoff=2.0):
+        self.provider   = provider or ProviderSimulado()
+        self.workers    = workers
+        self.tentativas = tentativas
+        self.backoff    = backoff
+
+        self._fila      = queue.Queue(maxsize=fila_max)
+        self._adiadas   = []                 # heap (quando, seq, pedido)
+        self._seq       = itertools.count()
+        self._estados   = OrderedDict()      # id → dict
+        self._lock      = threading.Lock()
+        self._em_curso  = 0
+        self._threads   = []
+        self._parar     = threading.Event()
+
+    def init_app(self, app):
+        """Configura a partir de app.config (NOTIFICACOES_*)."""
+        provider = PROVIDERS.get(app.config.get('NOTIFICACOES_PROVIDER', 'simulado'),
+                                 ProviderSimulado)
+        self.configurar(
+            provider   = provider(),
+            workers    = app.config.get('NOTIFICACOES_WORKERS', self.workers),
+            fila_max   = app.config.get('NOTIFICACOES_FILA_MAX', self._fila.maxsize),
+            tentativas = app.config.get('NOTIFICACOES_TENTATIVAS', self.tentativas),
+            backoff    = app.config.get('NOTIFICACOES_BACKOFF_SEGUNDOS', self.backoff),
+        )
+
+    def configurar(self, provider=None, workers=None, fila_max=None,
+                   tentativas=None, backoff=None):
+        """Substitui provider/parâmetros; só antes do primeiro envio ou após parar()."""
+        if provider is not None:
+            self.provider = provider
+        if workers is not None:
+            self.workers = workers
+        if tentativas is not None:
+            self.tentativas = tentativas
+        if backoff is not None:
+            self.backoff = backoff
+        if fila_max is not None and fila_max != self._fila.maxsize and not self._threads:
+            self._fila = queue.Queue(maxsize=fila_max)
+
+    # ───────────────────────────────────────────────────────────
+    # API
+    # ───────────────────────────────────────────────────────────
+
+    def submeter(self, destino, texto, tipo='geral'):
+        """
+        Põe a mensagem na fila e devolve o id da notificação
+        (sem esperar pelo envio).
+        """
+        self._arrancar()
+
+        pedido = {
+            'id': uuid.uuid4().hex,
+            'destino': destino,
+            'texto': texto,
+            'tipo': tipo,
+            'tentativa': 0,
+        }
+        self._registar(pedido['id'], 'pendente')
+
+        try:
+            self._fila.put_nowait(pedido)
+        except queue.Full:
+            self._registar(pedido['id'], 'descartada', erro='fila cheia')
+            print(f"[Notificacoes] Fila cheia — notificação {pedido['id']} descartada")
+
+        return pedido['id']
+
+    def estado(self, notificacao_id):
+        with self._lock:
+            estado = self._estados.get(notificacao_id)
+            return dict(estado) if estado else None
+
+    def pendentes(self):
+        with self._lock:
+            return self._fila.qsize() + len(self._adiadas) + self._em_curso
+
+    def aguardar(self, timeout=10.0):
+        """Espera até não haver notificações pendentes (testes / shutdown)."""
+        limite = time.monotonic() + timeout
+        vazias = 0
+        while vazias < 2 and time.monotonic() < limite:
+            vazias = vazias + 1 if self.pendentes() == 0 else 0
+            time.sleep(0.01)
+        return vazias >= 2
+
+    def parar(self, timeout=5.0):
+        self._parar.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self._parar.clear()
+
+    # ───────────────────────────────────────────────────────────
+    # Workers
+    # ───────────────────────────────────────────────────────────
+
+    def _arrancar(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._ciclo, name=f'notificacoes-{n}', daemon=True)
+                for n in range(max(self.workers, 1))
+            ]
+            for t in self._threads:
+                t.start()
+
+    def _ciclo(self):
+        while not self._parar.is_set():
+            lote = self._recolher()
+            if not lote:
+                continue
+            try:
+                self._enviar(lote)
+            finally:
+                with self._lock:
+                    self._em_curso -= len(lote)
+
+    def _recolher(self):
+        """Junta até `tamanho_lote` pedidos: primeiro retries vencidos, depois a fila."""
+        tamanho = getattr(self.provider, 'tamanho_lote', 1) or 1
+        lote = []
+
+        with self._lock:
+            agora = time.monotonic()
+            while self._adiadas and self._adiadas[0][0] <= agora and len(lote) < tamanho:
+                lote.append(heapq.heappop(self._adiadas)[2])
+            espera = self._adiadas[0][0] - agora if self._adiadas else 0.2
+            self._em_curso += len(lote)
+
+        if not lote:
+            try:
+                pedido = self._fila.get(timeout=min(max(espera, 0.01), 0.2))
+            except queue.Empty:
+                return []
+            with self._lock:
+                self._em_curso += 1
+            lote.append(pedido)
+
+        while len(lote) < tamanho:
+            try:
+                pedido = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._em_curso += 1
+            lote.append(pedido)
+
+        return lote
+
+    def _enviar(self, lote):
+        try:
+            erros = self.provider.enviar_lote(lote)
+        except Exception as e:
+            erros = [str(e)] * len(lote)
+
+        for pedido, erro in zip(lote, erros):
+            pedido['tentativa'] += 1
+            if erro is None:
+                self._registar(pedido['id'], 'enviada', tentativas=pedido['tentativa'])
+            elif pedido['tentativa'] >= self.tentativas:
+                self._registar(pedido['id'], 'falhada', erro=erro,
+                               tentativas=pedido['tentativa'])
+                print(f"[Notificacoes] {pedido['id']} falhou "
+                      f"{pedido['tentativa']}x: {erro}")
+            else:
+                self._registar(pedido['id'], 'pendente', erro=erro,
+                               tentativas=pedido['tentativa'])
+                self._adiar(pedido)
+
+    def _adiar(self, pedido):
+        atraso = self.backoff * (2 ** (pedido['tentativa'] - 1))
+        atraso *= random.uniform(0.5, 1.0)
+        with self._lock:
+            heapq.heappush(self._adiadas,
+                           (time.monotonic() + atraso, next(self._seq), pedido))
+
+    def _registar(self, notificacao_id, estado, erro=None, tentativas=0):
+        with self._lock:
+            self._estados[notificacao_id] = {
+                'id': notificacao_id,
+                'estado': estado,
+                'tentativas': tentativas,
+                'erro': erro,
+                'provider': self.provider.nome,
+            }
+            self._estados.move_to_end(notificacao_id)
+            while len(self._estados) > self.MAX_ESTADOS:
+                self._estados.popitem(last=False)
+
+
+# 🔥 INSTÂNCIA GLOBAL ÚNICA (por processo)
+_dispatcher = NotificacaoDispatcher()
+
+
+def get_notificacao_dispatcher() -> NotificacaoDispatcher:
+    return _dispatcher
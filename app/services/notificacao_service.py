@@ -3,6 +3,7 @@ NotificacaoService - Envio de notificações
 Responsável por: SMS, emails (futuro)
 """
 from app.models import Senha, Configuracao
+from app.services.notificacao_dispatcher import get_notificacao_dispatcher
 
 
 class NotificacaoService:
@@ -14,37 +15,50 @@ class NotificacaoService:
         notificar_proximo_atendimento(): Avisa próximos da fila
     
     Note:
-        Implementação de SMS será feita posteriormente
-        usando API de SMS (exemplo: Twilio, Africa's Talking)
+        O envio é feito em background por NotificacaoDispatcher;
+        o provider real (Twilio, Africa's Talking, ...) liga-se em
+        notificacao_dispatcher.PROVIDERS + NOTIFICACOES_PROVIDER.
     """
     @staticmethod
     def notificar_senha_emitida(senha):
         """
-        Simulação de SMS para emissão de senha.
+        SMS de emissão de senha — enviado em background.
 
-        Futuramente poderá usar Twilio, Africa's Talking,
-        Infobip ou outro provider sem alterar o frontend.
+        A mensagem é montada aqui (precisa da sessão da BD) e entregue
+        ao dispatcher; o pedido não espera pelo provider.
+
+        Returns:
+            dict com notificacao_id, estado inicial e a mensagem
+            (o frontend mostra a pré-visualização), ou None se a
+            senha não tiver contacto.
         """
 
+        # Sem contacto não há destinatário — não ocupar a fila do dispatcher
+        if not senha.usuario_contato:
+            return None
+
         mensagem = (
-            f"📱 SMS enviado para {senha.usuario_contato or 'Utente'}\n\n"
             f"Senha: {senha.numero}\n"
             f"Serviço: {senha.servico.nome if senha.servico else 'Atendimento'}\n"
             f"Estado: Emitida com sucesso\n\n"
             f"Acompanhe a sua posição no painel IMTSB."
         )
 
-        print("\n" + "=" * 60)
-        print("[SMS SIMULADO - SENHA EMITIDA]")
-        print(mensagem)
-        print("=" * 60 + "\n")
+        dispatcher     = get_notificacao_dispatcher()
+        notificacao_id = dispatcher.submeter(
+            senha.usuario_contato, mensagem, tipo='senha_emitida'
+        )
 
         return {
-            "enviado": True,
-            "provider": "simulated",
+            "notificacao_id": notificacao_id,
+            "estado": "pendente",
+            "enviado": False,
+            "provider": dispatcher.provider.nome,
             "tipo": "senha_emitida",
+            "destinatario": senha.usuario_contato,
             "mensagem": mensagem
         }
+
     @staticmethod
     def notificar_senha_chamada(senha_id):
         """
@@ -65,16 +79,12 @@ class NotificacaoService:
         if not senha or not senha.usuario_contato:
             return False
         
-        # TODO: Implementar envio de SMS
-        # Exemplo com Twilio:
-        # client.messages.create(
-        #     to=senha.usuario_contato,
-        #     from_='+244...',
-        #     body=f'Sua senha {senha.numero} foi chamada no balcão {senha.numero_balcao}!'
-        # )
-        
-        print(f"[SMS simulado] Senha {senha.numero} chamada -> {senha.usuario_contato}")
-        
+        get_notificacao_dispatcher().submeter(
+            senha.usuario_contato,
+            f'Sua senha {senha.numero} foi chamada no balcão {senha.numero_balcao}!',
+            tipo='senha_chamada'
+        )
+
         return True
     
     @staticmethod
@@ -95,12 +105,15 @@ class NotificacaoService:
             return False
         
         # Verificar posição na fila
-        posicao = FilaService.obter_posicao_na_fila(senha_id)
+        posicao = FilaService.obter_posicao_fila(senha_id, senha=senha)
         
         # Notificar apenas se está entre os próximos 3
         if posicao and posicao <= 3:
-            # TODO: Implementar SMS
-            print(f"[SMS simulado] Voce esta em {posicao}o lugar -> {senha.usuario_contato}")
+            get_notificacao_dispatcher().submeter(
+                senha.usuario_contato,
+                f'Voce esta em {posicao}o lugar (senha {senha.numero})',
+                tipo='proximo_atendimento'
+            )
             return True
         
         return False
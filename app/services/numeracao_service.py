@@ -0,0 +1,399 @@
+"""
+app/services/numeracao_service.py
+═══════════════════════════════════════════════════════════════
+Blocos de numeração para quiosques / processos emissores
+
+MOTIVAÇÃO:
+  Nas manhãs de matrículas cada emissão no quiosque custa uma ida
+  e volta à BD. Com um bloco arrendado (ex: N101–N150) o quiosque
+  atribui números localmente e envia as senhas em lotes; uma falha
+  curta da BD não impede a emissão.
+
+FLUXO:
+  1. arrendar_bloco(titular, prefixo)  → reserva N números em
+     `senha_sequencias` (ou reaproveita o resto de um bloco expirado)
+  2. o titular numera localmente: inicio, inicio+1, ..., fim
+  3. registar_lote(bloco_id, titular, senhas) → grava o lote num só
+     commit e renova o arrendamento
+  4. devolver_bloco(...) ou expiração → os números não usados voltam
+     a ser arrendados ao próximo pedido
+
+  EmissorBloco faz o papel do quiosque dentro de um processo Python.
+═══════════════════════════════════════════════════════════════
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, case
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models.senha import Senha
+from app.models.senha_bloco import SenhaBloco
+from app.models.senha_sequencia import SenhaSequencia
+from app.models.servico import Servico
+from app.services.eventos_service import EventosService
+
+
+class NumerosEmConflitoError(Exception):
+    """Erro de domínio: números do lote gravados em simultâneo por outro pedido."""
+
+    def __init__(self, numeros):
+        self.numeros = sorted(numeros)
+        super().__init__(f"Números já registados por outro pedido: {', '.join(self.numeros)}")
+
+
+class NumeracaoService:
+    """Arrendamento de blocos de números e registo de lotes."""
+
+    PREFIXOS         = ('N', 'P')
+    TAMANHO_BLOCO    = 50
+    TAMANHO_MAXIMO   = 500
+    VALIDADE_MINUTOS = 30
+
+    # ═══════════════════════════════════════════════════════════
+    # Arrendamento
+    # ═══════════════════════════════════════════════════════════
+
+    @staticmethod
+    def arrendar_bloco(titular: str, prefixo: str = 'N',
+                       tamanho: int = None, data=None) -> SenhaBloco:
+        """
+        Arrenda um bloco de números do dia ao titular.
+        Primeiro tenta reaproveitar o resto de um bloco expirado;
+        senão reserva `tamanho` números novos na sequência do dia.
+
+        Raises:
+            ValueError: titular em falta ou prefixo inválido
+        """
+        if not titular:
+            raise ValueError("titular é obrigatório")
+        prefixo = (prefixo or 'N').upper()
+        if prefixo not in NumeracaoService.PREFIXOS:
+            raise ValueError(f"Prefixo inválido: {prefixo}")
+
+        tamanho = min(max(int(tamanho or NumeracaoService.TAMANHO_BLOCO), 1),
+                      NumeracaoService.TAMANHO_MAXIMO)
+        data    = data or datetime.utcnow().date()
+        agora   = datetime.utcnow()
+        expira  = agora + timedelta(minutes=NumeracaoService.VALIDADE_MINUTOS)
+
+        try:
+            bloco = NumeracaoService._reaproveitar(data, prefixo, titular, agora, expira)
+            if bloco is None:
+                fim   = SenhaSequencia.reservar(data, prefixo, tamanho)
+                bloco = SenhaBloco(
+                    data=data, prefixo=prefixo,
+                    inicio=fim - tamanho + 1, fim=fim, usado_ate=fim - tamanho,
+                    titular=titular, expira_em=expira, estado='activo'
+                )
+                db.session.add(bloco)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return bloco
+
+    @staticmethod
+    def _reaproveitar(data, prefixo, titular, agora, expira):
+        """
+        Fecha um bloco expirado com números livres e arrenda o resto
+        (usado_ate+1 .. fim) ao novo titular. O fecho é um UPDATE
+        condicional — dois pedidos nunca ficam com o mesmo resto.
+        """
+        candidatos = db.session.execute(
+            select(SenhaBloco.id).where(
+                SenhaBloco.estado == 'activo',
+                SenhaBloco.data == data,
+                SenhaBloco.prefixo == prefixo,
+                SenhaBloco.expira_em <= agora,
+                SenhaBloco.usado_ate < SenhaBloco.fim
+            ).order_by(SenhaBloco.inicio).limit(5)
+        ).scalars().all()
+
+        for bloco_id in candidatos:
+            resultado = db.session.execute(
+                update(SenhaBloco)
+                .where(SenhaBloco.id == bloco_id,
+                       SenhaBloco.estado == 'activo',
+                       SenhaBloco.expira_em <= agora)
+                .values(estado='fechado', updated_at=agora)
+                .execution_options(synchronize_session=False)
+            )
+            if resultado.rowcount != 1:
+                continue   # renovado ou apanhado por outro pedido
+
+            usado_ate, fim = db.session.execute(
+                select(SenhaBloco.usado_ate, SenhaBloco.fim)
+                .where(SenhaBloco.id == bloco_id)
+            ).one()
+
+            bloco = SenhaBloco(
+                data=data, prefixo=prefixo,
+                inicio=usado_ate + 1, fim=fim, usado_ate=usado_ate,
+                titular=titular, expira_em=expira, estado='activo'
+            )
+            db.session.add(bloco)
+            return bloco
+
+        return None
+
+    @staticmethod
+    def devolver_bloco(bloco_id: int, titular: str) -> SenhaBloco:
+        """
+        Termina o arrendamento: os números livres ficam disponíveis
+        para o próximo arrendar_bloco().
+        """
+        bloco = NumeracaoService._obter_bloco(bloco_id, titular)
+        agora = datetime.utcnow()
+
+        bloco.expira_em = agora
+        if bloco.livres == 0:
+            bloco.estado = 'fechado'
+        db.session.commit()
+        return bloco
+
+    @staticmethod
+    def _obter_bloco(bloco_id, titular):
+        bloco = db.session.get(SenhaBloco, bloco_id)
+        if not bloco or bloco.titular != titular:
+            raise ValueError("Bloco não encontrado")
+        return bloco
+
+    # ═══════════════════════════════════════════════════════════
+    # Registo de lotes
+    # ═══════════════════════════════════════════════════════════
+
+    @staticmethod
+    def registar_lote(bloco_id: int, titular: str, itens: list) -> dict:
+        """
+        Grava num só commit as senhas numeradas localmente.
+
+        Cada item: {numero, servico_id, usuario_contato?, observacoes?,
+        emitida_em? (ISO, hora do quiosque)}.
+
+        Números já registados (lote reenviado) vêm em `duplicadas`;
+        números fora do bloco, de serviços inválidos ou de um bloco
+        já reaproveitado por outro titular vêm em `rejeitadas`.
+
+        Raises:
+            ValueError: bloco inexistente ou de outro titular
+            NumerosEmConflitoError: outro pedido gravou os mesmos números
+                entre a verificação e o commit (ex: lote reenviado em
+                paralelo) — nada é gravado; reenviar devolve-os em
+                `duplicadas`
+        """
+        bloco = NumeracaoService._obter_bloco(bloco_id, titular)
+
+        validos, rejeitadas = [], []
+        servicos = NumeracaoService._servicos_activos(itens)
+        for item in itens or []:
+            numero = str(item.get('numero', '')).strip().upper()
+            n      = NumeracaoService._numero_no_bloco(bloco, numero)
+            if n is None:
+                rejeitadas.append({'numero': numero, 'motivo': 'Número fora do bloco'})
+            elif item.get('servico_id') not in servicos:
+                rejeitadas.append({'numero': numero, 'motivo': 'Serviço inválido'})
+            else:
+                validos.append((n, numero, item))
+
+        existentes = NumeracaoService._ja_registados(
+            bloco, [numero for _, numero, _ in validos])
+
+        novos = [v for v in validos if v[1] not in existentes]
+        agora = datetime.utcnow()
+
+        try:
+            if novos:
+                maior = max(n for n, _, _ in novos)
+                renovado = db.session.execute(
+                    update(SenhaBloco)
+                    .where(SenhaBloco.id == bloco.id, SenhaBloco.estado == 'activo')
+                    .values(
+                        usado_ate=case((SenhaBloco.usado_ate < maior, maior),
+                                       else_=SenhaBloco.usado_ate),
+                        expira_em=agora + timedelta(minutes=NumeracaoService.VALIDADE_MINUTOS),
+                        updated_at=agora
+                    )
+                    .execution_options(synchronize_session=False)
+                ).rowcount == 1
+
+                if not renovado:
+                    # Bloco fechado: o resto já pertence a outro titular
+                    db.session.refresh(bloco)
+                    for v in [v for v in novos if v[0] > bloco.usado_ate]:
+                        novos.remove(v)
+                        rejeitadas.append({'numero': v[1], 'motivo': 'Bloco expirado'})
+
+            senhas = [
+                NumeracaoService._nova_senha(bloco, numero, item, agora)
+                for _, numero, item in novos
+            ]
+            db.session.add_all(senhas)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            conflitos = NumeracaoService._ja_registados(
+                bloco, [numero for _, numero, _ in novos])
+            if not conflitos:
+                raise
+            raise NumerosEmConflitoError(conflitos)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        db.session.refresh(bloco)
+        for senha in senhas:
+            EventosService.publicar('emitida', senha)
+
+        return {
+            'bloco':      bloco.to_dict(),
+            'criadas':    [s.to_dict() for s in senhas],
+            'duplicadas': sorted(existentes),
+            'rejeitadas': rejeitadas,
+        }
+
+    @staticmethod
+    def _ja_registados(bloco, numeros):
+        """Números do dia do bloco que já existem em `senhas`."""
+        if not numeros:
+            return set()
+        return set(db.session.execute(
+            select(Senha.numero).where(
+                Senha.data_emissao == bloco.data,
+                Senha.numero.in_(numeros)
+            )
+        ).scalars())
+
+    @staticmethod
+    def _numero_no_bloco(bloco, numero):
+        sufixo = numero[len(bloco.prefixo):]
+        if not numero.startswith(bloco.prefixo) or not sufixo.isdigit():
+            return None
+        n = int(sufixo)
+        return n if bloco.contem(n) else None
+
+    @staticmethod
+    def _servicos_activos(itens):
+        ids = {item.get('servico_id') for item in itens or []}
+        ids.discard(None)
+        if not ids:
+            return set()
+        return set(db.session.execute(
+            select(Servico.id).where(Servico.id.in_(ids), Servico.ativo.is_(True))
+        ).scalars())
+
+    @staticmethod
+    def _nova_senha(bloco, numero, item, agora):
+        senha = Senha(
+            numero=numero,
+            servico_id=item['servico_id'],
+            tipo='prioritaria' if bloco.prefixo == 'P' else 'normal',
+            usuario_contato=item.get('usuario_contato'),
+            data_emissao=bloco.data,
+        )
+        if item.get('observacoes'):
+            senha.observacoes = item['observacoes']
+
+        # Hora do quiosque mantém a ordem FIFO de quem chegou primeiro,
+        # mas nunca antes do arrendamento do bloco (sem furar a fila)
+        senha.emitida_em = agora
+        emitida = NumeracaoService._hora_utc(item.get('emitida_em'))
+        if emitida is not None and emitida.date() == bloco.data and emitida <= agora:
+            senha.emitida_em = max(emitida, bloco.created_at or agora)
+        return senha
+
+    @staticmethod
+    def _hora_utc(valor):
+        """ISO 8601 → datetime UTC naive (com fuso é convertido), ou None."""
+        try:
+            hora = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if hora.tzinfo is not None:
+            hora = hora.astimezone(timezone.utc).replace(tzinfo=None)
+        return hora
+
+
+class EmissorBloco:
+    """
+    Numeração local para processos emissores: atribui números do bloco
+    arrendado sem ir à BD e envia as senhas em lotes de `lote`.
+    Se o envio falhar, as senhas ficam pendentes para o próximo envio.
+    Requer app context em emitir() quando é preciso arrendar ou enviar.
+    """
+
+    def __init__(self, titular, prefixo='N', tamanho=None, lote=20):
+        self.titular   = titular
+        self.prefixo   = prefixo
+        self.tamanho   = tamanho
+        self.lote      = lote
+        self._lock      = threading.Lock()
+        self._bloco_id  = None
+        self._proximo   = 0
+        self._fim       = -1
+        self._expira_em = None
+        self._pendentes = []    # (bloco_id, item)
+
+    def emitir(self, servico_id, **dados):
+        """Devolve o número atribuído (ex: N107)."""
+        with self._lock:
+            if self._proximo > self._fim or self._a_expirar():
+                self._arrendar()
+
+            numero = f"{self.prefixo}{str(self._proximo).zfill(3)}"
+            self._proximo += 1
+            self._pendentes.append((self._bloco_id, dict(
+                dados, numero=numero, servico_id=servico_id,
+                emitida_em=datetime.utcnow().isoformat()
+            )))
+            cheio = len(self._pendentes) >= self.lote
+
+        if cheio:
+            self.descarregar()
+        return numero
+
+    def _a_expirar(self):
+        """Não numerar perto do fim do arrendamento (o resto pode ser reaproveitado)."""
+        return datetime.utcnow() >= self._expira_em - timedelta(minutes=1)
+
+    def _arrendar(self):
+        bloco = NumeracaoService.arrendar_bloco(self.titular, self.prefixo, self.tamanho)
+        self._bloco_id  = bloco.id
+        self._proximo   = bloco.usado_ate + 1
+        self._fim       = bloco.fim
+        self._expira_em = bloco.expira_em
+
+    def descarregar(self):
+        """Envia as senhas pendentes; devolve quantas foram criadas."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+
+        por_bloco = {}
+        for bloco_id, item in pendentes:
+            por_bloco.setdefault(bloco_id, []).append(item)
+
+        criadas = 0
+        for bloco_id, itens in por_bloco.items():
+            try:
+                resultado = NumeracaoService.registar_lote(bloco_id, self.titular, itens)
+                criadas += len(resultado['criadas'])
+                with self._lock:
+                    if bloco_id == self._bloco_id:
+                        self._expira_em = datetime.fromisoformat(resultado['bloco']['expira_em'])
+            except Exception as e:
+                print(f"[EmissorBloco] Falha ao enviar lote do bloco {bloco_id}: {e}")
+                with self._lock:
+                    self._pendentes[:0] = [(bloco_id, item) for item in itens]
+        return criadas
+
+    def devolver(self):
+        """Envia o que falta e devolve os números não usados."""
+        self.descarregar()
+        with self._lock:
+            if self._bloco_id is not None:
+                NumeracaoService.devolver_bloco(self._bloco_id, self.titular)
+            self._bloco_id, self._proximo, self._fim = None, 0, -1
+            self._expira_em = None
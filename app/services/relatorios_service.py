@@ -0,0 +1,335 @@
+"""
+app/services/relatorios_service.py
+═══════════════════════════════════════════════════════════════
+Relatórios em background (CSV, NDJSON, resumo) com progresso
+
+MOTIVAÇÃO:
+  Mesmo em streaming, exportar vários meses ou calcular o resumo por
+  atendente prendia uma thread de pedido durante muito tempo. Agora
+  o pedido só cria o job e devolve o id; um pool de threads gera o
+  ficheiro em disco e o cliente consulta o progresso.
+
+ESTRUTURA:
+  - submeter(tipo, inicio, fim) → (job, novo). Um pedido igual a um
+    job ainda pendente / a gerar devolve esse job (novo=False).
+  - RELATORIOS_WORKERS threads geram os ficheiros em RELATORIOS_PASTA
+    (escritos em .parcial e renomeados no fim).
+  - estado(id) → pendente | a_gerar | concluido | erro, com
+    progresso 0–100 e nº de linhas escritas.
+  - O registo dos jobs vive no backend do CacheService (uma chave por
+    job, TTL = RELATORIOS_VALIDADE_SEGUNDOS): com sqlite/redis e a
+    RELATORIOS_PASTA partilhada, qualquer worker responde ao estado e
+    ao download, e os jobs sobrevivem a um reinício.
+  - Ficheiros mais antigos que a validade são apagados da pasta.
+  - Job activo sem sinal de vida há ABANDONO_SEGUNDOS (worker que
+    reiniciou a meio) passa a 'erro'.
+
+TIPOS:
+  csv    — o mesmo conteúdo de /api/dashboard/admin/exportar
+  ndjson — um atendimento por linha (datas ISO 8601)
+  resumo — JSON com o ranking de atendentes (metrics_service) e os
+           totais por serviço (rollup horário)
+
+NOTA: com o backend 'memoria' o registo é por processo; a geração
+corre sempre no pool do worker que recebeu o pedido.
+═══════════════════════════════════════════════════════════════
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from flask import current_app, has_app_context
+
+from app.services.cache_service import CacheService, get_cache
+
+
+class GestorRelatorios:
+    """Fila de jobs de relatório + pool de threads geradoras."""
+
+    TIPOS = {
+        'csv':    ('csv',    'text/csv; charset=utf-8'),
+        'ndjson': ('ndjson', 'application/x-ndjson'),
+        'resumo': ('json',   'application/json'),
+    }
+    ACTIVOS  = ('pendente', 'a_gerar')
+    PREFIXO  = 'relatorios:'
+    ABANDONO_SEGUNDOS = 3600    # activo sem actualizações → interrompido
+
+    def __init__(self, workers=2, pasta=None, validade=86400, cache: CacheService = None):
+        self.workers  = workers
+        self.pasta    = pasta
+        self.validade = validade
+
+        self._app      = None
+        self._cache    = cache             # None = cache global (get_cache())
+        self._executor = None
+        self._lock     = threading.Lock()
+
+    def init_app(self, app):
+        """Configura a partir de app.config (RELATORIOS_*)."""
+        self._app = app
+        self.configurar(
+            workers  = app.config.get('RELATORIOS_WORKERS', self.workers),
+            pasta    = app.config.get('RELATORIOS_PASTA',
+                                      os.path.join(app.instance_path, 'relatorios')),
+            validade = app.config.get('RELATORIOS_VALIDADE_SEGUNDOS', self.validade),
+        )
+
+    def configurar(self, workers=None, pasta=None, validade=None):
+        """Substitui parâmetros; workers só antes do primeiro job ou após parar()."""
+        if workers is not None and self._executor is None:
+            self.workers = workers
+        if pasta is not None:
+            self.pasta = pasta
+        if validade is not None:
+            self.validade = validade
+
+    # ───────────────────────────────────────────────────────────
+    # API
+    # ───────────────────────────────────────────────────────────
+
+    def submeter(self, tipo, data_inicio: date, data_fim: date, pedido_por=None):
+        """
+        Cria (ou reaproveita) um job.
+
+        Returns:
+            (job: dict, novo: bool)
+
+        Raises:
+            ValueError — tipo desconhecido ou intervalo inválido
+        """
+        if tipo not in self.TIPOS:
+            raise ValueError(f"Tipo de relatório inválido. Use: {', '.join(self.TIPOS)}")
+        if data_inicio > data_fim:
+            raise ValueError("data_inicio posterior a data_fim")
+
+        chave = f"{tipo}:{data_inicio.isoformat()}:{data_fim.isoformat()}"
+
+        with self._lock:
+            self._limpar()
+            existente = self._ler(self.cache.get(self.PREFIXO + 'activo:' + chave))
+            if existente and existente['estado'] in self.ACTIVOS:
+                return self._publico(existente), False
+
+            job = {
+                'id':           uuid.uuid4().hex,
+                'chave':        chave,
+                'tipo':         tipo,
+                'data_inicio':  data_inicio.isoformat(),
+                'data_fim':     data_fim.isoformat(),
+                'pedido_por':   pedido_por,
+                'estado':       'pendente',
+                'progresso':    0,
+                'linhas':       0,
+                'erro':         None,
+                'ficheiro':     None,
+                'criado_em':    datetime.utcnow().isoformat(),
+                'concluido_em': None,
+                '_vivo_em':     time.time(),
+            }
+            self._gravar(job)
+            self.cache.set(self.PREFIXO + 'activo:' + chave, job['id'], ttl=self.validade)
+
+        # App do pedido (pode haver várias no processo, ex: testes)
+        app = current_app._get_current_object() if has_app_context() else self._app
+        self._arrancar().submit(self._executar, job['id'], app)
+        return self._publico(job), True
+
+    def estado(self, job_id):
+        job = self._ler(job_id)
+        return self._publico(job) if job else None
+
+    def ficheiro(self, job_id):
+        """(caminho, nome para download, mimetype) de um job concluído, ou None."""
+        job = self._ler(job_id)
+        if not job or job['estado'] != 'concluido' or not os.path.exists(job['ficheiro']):
+            return None
+        extensao, mimetype = self.TIPOS[job['tipo']]
+        nome = f"relatorio_{job['tipo']}_{job['data_inicio']}_{job['data_fim']}.{extensao}"
+        return job['ficheiro'], nome, mimetype
+
+    def aguardar(self, job_id, timeout=10.0):
+        """Espera pelo fim de um job (testes / CLI)."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            estado = self.estado(job_id)
+            if not estado or estado['estado'] not in self.ACTIVOS:
+                return estado
+            time.sleep(0.01)
+        return self.estado(job_id)
+
+    def parar(self):
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # ───────────────────────────────────────────────────────────
+    # Geração
+    # ───────────────────────────────────────────────────────────
+
+    def _arrancar(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(self.workers, 1), thread_name_prefix='relatorios'
+                )
+            return self._executor
+
+    def _executar(self, job_id, app):
+        from app.extensions import db
+
+        job = self._ler(job_id)
+        if job is None or job['estado'] != 'pendente':
+            return      # expirou / foi evictado, ou já dado como interrompido
+        self._actualizar(job_id, estado='a_gerar')
+        extensao = self.TIPOS[job['tipo']][0]
+        destino = os.path.join(self.pasta, f'{job_id}.{extensao}')
+        parcial = destino + '.parcial'
+
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            with app.app_context():
+                try:
+                    inicio = date.fromisoformat(job['data_inicio'])
+                    fim    = date.fromisoformat(job['data_fim'])
+                    with open(parcial, 'w', encoding='utf-8', newline='') as f:
+                        if job['tipo'] == 'resumo':
+                            self._gerar_resumo(job_id, f, inicio, fim)
+                        else:
+                            self._gerar_linhas(job_id, f, job['tipo'], inicio, fim)
+                finally:
+                    db.session.remove()
+
+            os.replace(parcial, destino)
+            self._actualizar(job_id, estado='concluido', progresso=100, ficheiro=destino,
+                             concluido_em=datetime.utcnow().isoformat())
+
+        except Exception as e:
+            print(f"[Relatorios] Job {job_id} ({job['tipo']}) falhou: {e}")
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            self._actualizar(job_id, estado='erro', erro=str(e))
+
+    def _gerar_linhas(self, job_id, f, tipo, inicio, fim):
+        from app.services.exportacao_service import ExportacaoService
+
+        total = ExportacaoService.contar(inicio, fim)
+        contador = {'linhas': 0}
+
+        def contar(registos):
+            for registo in registos:
+                contador['linhas'] += 1
+                yield registo
+
+        registos = contar(ExportacaoService.registos(inicio, fim))
+        if tipo == 'csv':
+            blocos = ExportacaoService.csv_em_blocos(
+                ExportacaoService.linhas(inicio, fim, registos)
+            )
+        else:
+            blocos = ExportacaoService.ndjson_em_blocos(registos)
+
+        for bloco in blocos:
+            f.write(bloco)
+            linhas = contador['linhas']
+            # 99 no máximo: só fica a 100 depois de renomeado
+            progresso = min(int(linhas * 100 / total), 99) if total else 99
+            self._actualizar(job_id, linhas=linhas, progresso=progresso)
+
+    def _gerar_resumo(self, job_id, f, inicio, fim):
+        from app.models.servico import Servico
+        from app.services.metrics_service import get_todos_atendentes_metrics
+        from app.services.rollup_service import RollupService
+
+        atendentes = get_todos_atendentes_metrics(data_inicio=inicio, data_fim=fim)
+        self._actualizar(job_id, progresso=50, linhas=len(atendentes))
+
+        nomes   = dict(Servico.query.with_entities(Servico.id, Servico.nome).all())
+        rollup  = RollupService.por_servico(inicio, fim)
+        servicos = [
+            {'id': servico_id, 'nome': nomes.get(servico_id), **somas}
+            for servico_id, somas in sorted(rollup.items())
+        ]
+
+        json.dump({
+            'data_inicio': inicio.isoformat(),
+            'data_fim':    fim.isoformat(),
+            'gerado_em':   datetime.utcnow().isoformat(),
+            'atendentes':  atendentes,
+            'servicos':    servicos,
+        }, f, ensure_ascii=False)
+        self._actualizar(job_id, progresso=99, linhas=len(atendentes) + len(servicos))
+
+    # ───────────────────────────────────────────────────────────
+    # Registo
+    # ───────────────────────────────────────────────────────────
+
+    @property
+    def cache(self) -> CacheService:
+        return self._cache or get_cache()
+
+    def _gravar(self, job):
+        self.cache.set(self.PREFIXO + 'job:' + job['id'], job, ttl=self.validade)
+
+    def _ler(self, job_id):
+        """Job guardado (cópia), marcando como interrompido o que ficou sem dono."""
+        if not job_id:
+            return None
+        job = self.cache.get(self.PREFIXO + 'job:' + job_id)
+        if job is None:
+            return None
+        job = dict(job)
+        if (job['estado'] in self.ACTIVOS
+                and time.time() - job['_vivo_em'] > self.ABANDONO_SEGUNDOS):
+            job.update(estado='erro', erro='Interrompido (reinício do servidor?)')
+            self._gravar(job)
+        return job
+
+    def _actualizar(self, job_id, **campos):
+        """Só o worker que gera o job escreve nele depois de criado."""
+        with self._lock:
+            job = self._ler(job_id)
+            if job:
+                job.update(campos, _vivo_em=time.time())
+                self._gravar(job)
+
+    def _limpar(self):
+        """Apaga da pasta os ficheiros com mais de `validade` segundos."""
+        if not self.pasta or not os.path.isdir(self.pasta):
+            return
+        limite = time.time() - self.validade
+        for entrada in os.scandir(self.pasta):
+            try:
+                if entrada.is_file() and entrada.stat().st_mtime < limite:
+                    self._apagar_ficheiro({'ficheiro': entrada.path})
+            except OSError:
+                pass    # apagado entretanto por outro worker
+
+    @staticmethod
+    def _apagar_ficheiro(job):
+        if job.get('ficheiro') and os.path.exists(job['ficheiro']):
+            try:
+                os.remove(job['ficheiro'])
+            except OSError as e:
+                print(f"[Relatorios] Não foi possível apagar {job['ficheiro']}: {e}")
+
+    @staticmethod
+    def _publico(job):
+        """Cópia do job sem campos internos."""
+        return {
+            k: v for k, v in job.items()
+            if not k.startswith('_') and k not in ('chave', 'ficheiro')
+        }
+
+
+# 🔥 INSTÂNCIA GLOBAL ÚNICA (por processo; registo no backend do cache)
+_gestor = GestorRelatorios()
+
+
+def get_gestor_relatorios() -> GestorRelatorios:
+    return _gestor
@@ -0,0 +1,269 @@
+"""
+app/services/rollup_service.py
+═══════════════════════════════════════════════════════════════
+Rollup horário das senhas — mantido a cada flush, lido pelo dashboard
+
+MOTIVAÇÃO:
+  fluxo / trend / tempo-por-servico / estatísticas agregavam as
+  senhas em bruto a cada pedido, com func.hour/day (só MySQL).
+
+COMO FUNCIONA:
+  - Um ouvinte `after_flush` da sessão vê as senhas novas (emitidas)
+    e as que mudaram de status para concluida/cancelada, e soma os
+    deltas em `senhas_rollup_hora` com um upsert na MESMA ligação —
+    o rollback da transacção também desfaz o rollup.
+  - Redireccionamento (servico_id alterado) move a emissão para o
+    novo serviço, como ficaria numa reconstrução.
+  - reconstruir() recalcula um intervalo a partir de `senhas`
+    (backfill / correcções): `flask rebuild-rollups [--desde AAAA-MM-DD]`.
+  - Leitura: por_hora() e por_servico(), agrupando só pela coluna
+    `hora` ou `servico_id` — sem funções de data específicas do SGBD.
+═══════════════════════════════════════════════════════════════
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app.extensions import db
+from app.models.senha import Senha
+from app.models.senha_rollup_hora import SenhaRollupHora
+from app.utils.periodos import entre_dias
+
+SOMAS = SenhaRollupHora.SOMAS
+
+
+def _hora(momento: Optional[datetime]) -> datetime:
+    momento = momento or datetime.utcnow()
+    return momento.replace(minute=0, second=0, microsecond=0)
+
+
+def _linha(deltas: dict, hora, servico_id, atendente_id) -> dict:
+    chave = (_hora(hora), servico_id, atendente_id or 0)
+    if chave not in deltas:
+        deltas[chave] = dict.fromkeys(SOMAS, 0)
+        deltas[chave].update(max_atendimento=None, min_atendimento=None)
+    return deltas[chave]
+
+
+def _registar_conclusao(deltas: dict, senha) -> None:
+    linha = _linha(deltas, senha.atendimento_concluido_em, senha.servico_id, senha.atendente_id)
+    linha['concluidas'] += 1
+
+    if senha.tempo_espera_minutos is not None:
+        linha['soma_espera'] += senha.tempo_espera_minutos
+        linha['n_espera'] += 1
+
+    tempo = senha.tempo_atendimento_minutos
+    if tempo is not None:
+        linha['soma_atendimento'] += tempo
+        linha['n_atendimento'] += 1
+        if linha['max_atendimento'] is None or tempo > linha['max_atendimento']:
+            linha['max_atendimento'] = tempo
+        if linha['min_atendimento'] is None or tempo < linha['min_atendimento']:
+            linha['min_atendimento'] = tempo
+
+
+class RollupService:
+    """Manutenção e leitura de `senhas_rollup_hora`."""
+
+    # ───────────────────────────────────────────────────────────
+    # Manutenção incremental
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def ligar(session=None) -> None:
+        """Regista o ouvinte after_flush (idempotente)."""
+        session = session or db.session
+        if not event.contains(session, 'after_flush', RollupService._apos_flush):
+            event.listen(session, 'after_flush', RollupService._apos_flush)
+
+    @staticmethod
+    def _apos_flush(session, contexto) -> None:
+        deltas = RollupService.deltas(session)
+        if deltas:
+            RollupService._aplicar(session.connection(), deltas)
+
+    @staticmethod
+    def deltas(session) -> dict:
+        """
+        Deltas do flush actual (estado pré-flush ainda visível).
+
+        Returns:
+            {(hora, servico_id, atendente_id): {campo: delta, max/min_atendimento}}
+        """
+        deltas = {}
+
+        for senha in session.new:
+            if not isinstance(senha, Senha):
+                continue
+            _linha(deltas, senha.emitida_em, senha.servico_id, 0)['emitidas'] += 1
+            if senha.status == 'concluida':
+                _registar_conclusao(deltas, senha)
+            elif senha.status == 'cancelada':
+                _linha(deltas, None, senha.servico_id, senha.atendente_id)['canceladas'] += 1
+
+        for senha in session.dirty:
+            if not isinstance(senha, Senha):
+                continue
+            estado = inspect(senha)
+
+            servico = estado.attrs.servico_id.history
+            if servico.added and servico.deleted and servico.added[0] != servico.deleted[0]:
+                _linha(deltas, senha.emitida_em, servico.deleted[0], 0)['emitidas'] -= 1
+                _linha(deltas, senha.emitida_em, servico.added[0], 0)['emitidas'] += 1
+
+            status = estado.attrs.status.history
+            if not status.added or status.added[0] in status.deleted:
+                continue
+            if status.added[0] == 'concluida':
+                _registar_conclusao(deltas, senha)
+            elif status.added[0] == 'cancelada':
+                _linha(deltas, None, senha.servico_id, senha.atendente_id)['canceladas'] += 1
+
+        return deltas
+
+    @staticmethod
+    def _aplicar(conn, deltas: dict) -> None:
+        """Upsert dos deltas: contadores somados, max/min combinados."""
+        agora = datetime.utcnow()
+        linhas = [
+            {'hora': hora, 'servico_id': servico_id, 'atendente_id': atendente_id,
+             'created_at': agora, 'updated_at': agora, **valores}
+            for (hora, servico_id, atendente_id), valores in deltas.items()
+        ]
+        tabela = SenhaRollupHora.__table__
+        dialecto = conn.dialect.name
+
+        if dialecto == 'mysql':
+            stmt = mysql.insert(tabela).values(linhas)
+            novo = stmt.inserted
+            maior, menor = func.greatest, func.least
+        elif dialecto in ('sqlite', 'postgresql'):
+            stmt = (sqlite if dialecto == 'sqlite' else postgresql).insert(tabela).values(linhas)
+            novo = stmt.excluded
+            # SQLite: max()/min() com 2 argumentos são escalares
+            maior, menor = (func.max, func.min) if dialecto == 'sqlite' else (func.greatest, func.least)
+        else:
+            raise NotImplementedError(f"Rollup sem suporte para o SGBD '{dialecto}'")
+
+        def combinar(f, coluna):
+            actual, inserido = tabela.c[coluna], novo[coluna]
+            return f(func.coalesce(actual, inserido), func.coalesce(inserido, actual))
+
+        valores = {c: tabela.c[c] + novo[c] for c in SOMAS}
+        valores['max_atendimento'] = combinar(maior, 'max_atendimento')
+        valores['min_atendimento'] = combinar(menor, 'min_atendimento')
+        valores['updated_at'] = novo.updated_at
+
+        if dialecto == 'mysql':
+            stmt = stmt.on_duplicate_key_update(**valores)
+        else:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['hora', 'servico_id', 'atendente_id'], set_=valores
+            )
+        conn.execute(stmt)
+
+    # ───────────────────────────────────────────────────────────
+    # Reconstrução (backfill)
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def reconstruir(desde: Optional[date] = None) -> int:
+        """
+        Apaga e recalcula as horas desde `desde` (None = tudo) a partir
+        de `senhas`. Cancelamentos contam na hora de updated_at.
+
+        Returns:
+            nº de linhas de rollup gravadas
+        """
+        deltas = {}
+        colunas = (
+            Senha.servico_id, Senha.atendente_id, Senha.status,
+            Senha.emitida_em, Senha.atendimento_concluido_em, Senha.updated_at,
+            Senha.tempo_espera_minutos, Senha.tempo_atendimento_minutos,
+        )
+        query = db.session.query(*colunas).execution_options(yield_per=1000)
+        if desde:
+            query = query.filter(
+                entre_dias(Senha.emitida_em, desde)
+                | entre_dias(Senha.atendimento_concluido_em, desde)
+                | entre_dias(Senha.updated_at, desde)
+            )
+
+        inicio = datetime.combine(desde, datetime.min.time()) if desde else None
+        for senha in query:
+            if inicio is None or senha.emitida_em >= inicio:
+                _linha(deltas, senha.emitida_em, senha.servico_id, 0)['emitidas'] += 1
+            if senha.status == 'concluida' and (
+                inicio is None or (senha.atendimento_concluido_em or datetime.min) >= inicio
+            ):
+                _registar_conclusao(deltas, senha)
+            elif senha.status == 'cancelada' and (
+                inicio is None or senha.updated_at >= inicio
+            ):
+                _linha(deltas, senha.updated_at, senha.servico_id,
+                       senha.atendente_id)['canceladas'] += 1
+
+        apagar = SenhaRollupHora.query
+        if inicio:
+            apagar = apagar.filter(SenhaRollupHora.hora >= inicio)
+        apagar.delete(synchronize_session=False)
+
+        if deltas:
+            RollupService._aplicar(db.session.connection(), deltas)
+        db.session.commit()
+        return len(deltas)
+
+    # ───────────────────────────────────────────────────────────
+    # Leitura
+    # ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def por_hora(inicio: date, fim: date) -> dict:
+        """{hora: {campo: soma}} para os dias [inicio, fim]."""
+        linhas = db.session.query(
+            SenhaRollupHora.hora,
+            *[func.sum(getattr(SenhaRollupHora, c)) for c in SOMAS]
+        ).filter(
+            entre_dias(SenhaRollupHora.hora, inicio, fim)
+        ).group_by(SenhaRollupHora.hora).all()
+
+        return {
+            linha[0]: {c: int(v or 0) for c, v in zip(SOMAS, linha[1:])}
+            for linha in linhas
+        }
+
+    @staticmethod
+    def por_dia(inicio: date, fim: date) -> dict:
+        """{date: {campo: soma}} para os dias [inicio, fim] (dias sem dados omitidos)."""
+        dias = {}
+        for hora, somas in RollupService.por_hora(inicio, fim).items():
+            dia = dias.setdefault(hora.date(), dict.fromkeys(SOMAS, 0))
+            for campo, valor in somas.items():
+                dia[campo] += valor
+        return dias
+
+    @staticmethod
+    def por_servico(inicio: date, fim: date) -> dict:
+        """{servico_id: {campo: soma, max_atendimento, min_atendimento}}"""
+        linhas = db.session.query(
+            SenhaRollupHora.servico_id,
+            *[func.sum(getattr(SenhaRollupHora, c)) for c in SOMAS],
+            func.max(SenhaRollupHora.max_atendimento),
+            func.min(SenhaRollupHora.min_atendimento),
+        ).filter(
+            entre_dias(SenhaRollupHora.hora, inicio, fim)
+        ).group_by(SenhaRollupHora.servico_id).all()
+
+        resultado = {}
+        for linha in linhas:
+            somas = {c: int(v or 0) for c, v in zip(SOMAS, linha[1:-2])}
+            somas['max_atendimento'] = linha[-2]
+            somas['min_atendimento'] = linha[-1]
+            resultado[linha[0]] = somas
+        return resultado
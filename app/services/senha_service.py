@@ -8,10 +8,14 @@ ALTERAÇÕES:
 """
 
 from datetime import datetime, date
-from sqlalchemy import func, or_
 from app.extensions import db
 from app.models.senha import Senha
+from app.models.senha_sequencia import SenhaSequencia
 from app.models.log_actividade import LogActividade
+from app.services.eventos_service import EventosService
+from app.services.cache_service import cached
+from app.services.estatisticas_service import EstatisticasService
+from app.utils.periodos import no_dia, entre_dias
 
 
 class SenhaService:
@@ -38,13 +42,7 @@ class SenhaService:
         """
         hoje    = datetime.utcnow().date()
         prefixo = 'P' if tipo == 'prioritaria' else 'N'
-
-        contagem = Senha.query.filter(
-            Senha.data_emissao == hoje,
-            Senha.numero.like(f'{prefixo}%')
-        ).count()
-
-        numero = f"{prefixo}{str(contagem + 1).zfill(3)}"
+        numero  = SenhaService.gerar_numero(prefixo, hoje)
 
         senha = Senha(
             numero=numero,
@@ -62,6 +60,7 @@ class SenhaService:
         db.session.add(senha)
         db.session.commit()
         db.session.refresh(senha)
+        EventosService.publicar('emitida', senha)
 
         from app.services.notificacao_service import NotificacaoService
 
@@ -74,6 +73,16 @@ class SenhaService:
               f"Obs: {'✅' if observacoes else '—'}")
         return senha
 
+    @staticmethod
+    def gerar_numero(prefixo: str, data: date) -> str:
+        """
+        Próximo número do dia para o prefixo (ex: N042).
+        Incremento atómico em `senha_sequencias` — a linha fica
+        bloqueada até ao commit da emissão, sem colisões entre quiosques.
+        """
+        ultimo = SenhaSequencia.reservar(data, prefixo)
+        return f"{prefixo}{str(ultimo).zfill(3)}"
+
     # ─────────────────────────────────────────────────────────
     # Listagem — sem paginação
     # ─────────────────────────────────────────────────────────
@@ -88,36 +97,22 @@ class SenhaService:
         data_de / data_ate: strings 'YYYY-MM-DD' para filtrar por intervalo de datas.
         apenas_hoje: atalho para filtrar só hoje (sobrepõe data_de/data_ate).
         """
-        from datetime import datetime
-        from sqlalchemy import func as sqlfunc
-
-        query = Senha.query
+        query = Senha.query.options(*Senha.opcoes_serializacao())
 
         if apenas_hoje:
             hoje  = datetime.utcnow().date()
-            query = query.filter(
-                db.or_(
-                    Senha.data_emissao == hoje,
-                    sqlfunc.date(Senha.emitida_em) == hoje
-                )
-            )
+            query = query.filter(no_dia(Senha.data_emissao, hoje))
         elif data_de or data_ate:
             if data_de:
                 try:
                     d = datetime.strptime(data_de, '%Y-%m-%d').date()
-                    query = query.filter(
-                        db.or_(Senha.data_emissao >= d,
-                               sqlfunc.date(Senha.emitida_em) >= d)
-                    )
+                    query = query.filter(entre_dias(Senha.data_emissao, d, None))
                 except ValueError:
                     pass
             if data_ate:
                 try:
                     d = datetime.strptime(data_ate, '%Y-%m-%d').date()
-                    query = query.filter(
-                        db.or_(Senha.data_emissao <= d,
-                               sqlfunc.date(Senha.emitida_em) <= d)
-                    )
+                    query = query.filter(entre_dias(Senha.data_emissao, None, d))
                 except ValueError:
                     pass
 
@@ -143,36 +138,22 @@ class SenhaService:
         Lista senhas com paginação server-side.
         data_de / data_ate: 'YYYY-MM-DD' para histórico de dias/semanas/meses.
         """
-        from datetime import datetime
-        from sqlalchemy import func as sqlfunc
-
-        query = Senha.query
+        query = Senha.query.options(*Senha.opcoes_serializacao())
 
         if apenas_hoje:
             hoje  = datetime.utcnow().date()
-            query = query.filter(
-                db.or_(
-                    Senha.data_emissao == hoje,
-                    sqlfunc.date(Senha.emitida_em) == hoje
-                )
-            )
+            query = query.filter(no_dia(Senha.data_emissao, hoje))
         elif data_de or data_ate:
             if data_de:
                 try:
                     d = datetime.strptime(data_de, '%Y-%m-%d').date()
-                    query = query.filter(
-                        db.or_(Senha.data_emissao >= d,
-                               sqlfunc.date(Senha.emitida_em) >= d)
-                    )
+                    query = query.filter(entre_dias(Senha.data_emissao, d, None))
                 except ValueError:
                     pass
             if data_ate:
                 try:
                     d = datetime.strptime(data_ate, '%Y-%m-%d').date()
-                    query = query.filter(
-                        db.or_(Senha.data_emissao <= d,
-                               sqlfunc.date(Senha.emitida_em) <= d)
-                    )
+                    query = query.filter(entre_dias(Senha.data_emissao, None, d))
                 except ValueError:
                     pass
 
@@ -201,7 +182,7 @@ class SenhaService:
         hoje = date.today()
         return Senha.query.filter(
             Senha.numero == numero,
-            func.date(Senha.emitida_em) == hoje
+            no_dia(Senha.emitida_em, hoje)
         ).first()
 
     # ─────────────────────────────────────────────────────────
@@ -237,6 +218,7 @@ class SenhaService:
 
         db.session.commit()
         db.session.refresh(senha)
+        EventosService.publicar('cancelada', senha)
         return senha
 
     # ─────────────────────────────────────────────────────────
@@ -244,43 +226,28 @@ class SenhaService:
     # ─────────────────────────────────────────────────────────
 
     @staticmethod
+    @cached(key=lambda data=None: f"estatisticas_hoje:{data or datetime.utcnow().date()}",
+            tags=lambda data=None: [f"dia:{data or datetime.utcnow().date()}"],
+            ttl=300, stale_ttl=10)
     def obter_estatisticas_hoje(data: date = None) -> dict:
         """
         Estatísticas do dia (ou de uma data específica).
+        Uma única query (EstatisticasService), partilhada no pedido e
+        em cache até uma transição de uma senha do dia (tag dia:<data>).
         """
         if data is None:
             data = datetime.utcnow().date()
 
-        query_base = Senha.query.filter(
-            or_(
-                Senha.data_emissao == data,
-                func.date(Senha.emitida_em) == data
-            )
-        )
-
-        total_emitidas = query_base.count()
-        aguardando     = query_base.filter(Senha.status == 'aguardando').count()
-        atendendo      = query_base.filter(Senha.status == 'atendendo').count()
-        concluidas     = query_base.filter(Senha.status == 'concluida').count()
-        canceladas     = query_base.filter(Senha.status == 'cancelada').count()
-
-        senhas_atendidas = query_base.filter(
-            Senha.status.in_(['atendendo', 'concluida']),
-            Senha.atendimento_iniciado_em.isnot(None)
-        ).all()
-
-        tempos = [s.tempo_espera_minutos for s in senhas_atendidas
-                  if s.tempo_espera_minutos]
-        tempo_medio_espera = round(sum(tempos) / len(tempos), 1) if tempos else 0
+        stats = EstatisticasService.dia(data)
 
         return {
             'data': data.isoformat(),
-            'total_emitidas': total_emitidas,
-            'aguardando': aguardando,
-            'atendendo': atendendo,
-            'concluidas': concluidas,
-            'canceladas': canceladas,
-            'tempo_medio_espera': tempo_medio_espera
+            'total_emitidas': stats['total'],
+            'aguardando': stats['aguardando'],
+            'atendendo': stats['atendendo'],
+            'concluidas': stats['concluida'],
+            'canceladas': stats['cancelada'],
+            'tempo_medio_espera': stats['espera_media']
         }
 
     # ─────────────────────────────────────────────────────────
@@ -288,24 +255,14 @@ class SenhaService:
     # ─────────────────────────────────────────────────────────
 
     @staticmethod
+    @cached(key=lambda atendente_id: f"estatisticas_trabalhador:{atendente_id}:{datetime.utcnow().date()}",
+            tags=lambda atendente_id: [f"atendente:{atendente_id}"],
+            ttl=300)
     def obter_estatisticas_trabalhador(atendente_id: int) -> dict:
-        """Estatísticas do dia para um atendente específico."""
-        hoje = datetime.utcnow().date()
-
-        senhas_hoje = Senha.query.filter(
-            Senha.atendente_id == atendente_id,
-            or_(
-                Senha.data_emissao == hoje,
-                func.date(Senha.emitida_em) == hoje
-            )
-        ).all()
-
-        atendidos = [s for s in senhas_hoje if s.status == 'concluida']
-        tempos    = [s.tempo_atendimento_minutos for s in atendidos
-                     if s.tempo_atendimento_minutos]
-        tempo_medio = round(sum(tempos) / len(tempos), 1) if tempos else 0
+        """Estatísticas do dia para um atendente (em cache até uma transição sua)."""
+        stats = EstatisticasService.dia(atendente_id=atendente_id)
 
         return {
-            'atendidos_hoje': len(atendidos),
-            'tempo_medio_atendimento': tempo_medio
-        }
\ No newline at end of file
+            'atendidos_hoje': stats['concluida'],
+            'tempo_medio_atendimento': stats['atendimento_media']
+        }
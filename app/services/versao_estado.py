@@ -0,0 +1,113 @@
+"""
+app/services/versao_estado.py
+═══════════════════════════════════════════════════════════════
+Versão monotónica do estado das filas + diário de alterações
+
+MOTIVAÇÃO:
+  /api/realtime/snapshot reconstruía fila, histórico, utilizadores,
+  eventos e estatísticas em cada poll, mesmo sem nada ter mudado.
+  Com uma versão, o cliente envia ?since=<versao> e recebe apenas
+  o que mudou — ou "unchanged" sem tocar na BD.
+
+COMO FUNCIONA:
+  - Cada transição publicada pelo EventosService (ou tocar(senha_id)
+    para alterações fora das transições, ex: avaliações) incrementa a
+    versão e regista (senha_id, em) no diário, uma chave por versão.
+  - Versão, diário e estatísticas por versão vivem no backend do
+    CacheService: com sqlite/redis são comuns a todos os workers, e
+    um ?since= emitido por um worker é servido correctamente por outro.
+  - alteracoes_desde(v) → ids das senhas alteradas depois de v, ou
+    None se falta alguma entrada do diário (expirou, foi evictada,
+    ainda está a ser escrita, ou v é de outro contador) → snapshot
+    completo.
+  - O contador começa num valor derivado do relógio (como as tags do
+    cache): se for recriado, nunca repete versões já entregues.
+
+NOTA: com o backend 'memoria' (por processo) cada worker teria a sua
+versão — delta_disponivel é False e o snapshot é sempre completo.
+═══════════════════════════════════════════════════════════════
+"""
+
+from datetime import datetime
+
+from app.services.cache_service import CacheService, get_cache
+
+
+class VersaoEstado:
+    """Contador de versão + diário das senhas alteradas (no backend do cache)."""
+
+    PREFIXO     = 'versao_estado:'
+    MAX_DIARIO  = 5000     # alterações servidas por delta (mais → completo)
+    DIARIO_TTL  = 3600     # segundos que cada entrada do diário fica disponível
+    STATS_TTL   = 600      # estatísticas guardadas por versão (diff de stats)
+
+    def __init__(self, cache: CacheService = None):
+        self._cache = cache     # None = cache global (get_cache())
+
+    @property
+    def cache(self) -> CacheService:
+        return self._cache or get_cache()
+
+    @property
+    def delta_disponivel(self) -> bool:
+        """Deltas só com backend partilhado: versões iguais em todos os workers."""
+        return self.cache.partilhado
+
+    def _chave_diario(self, versao):
+        return f"{self.PREFIXO}diario:{versao}"
+
+    def _incr(self, delta):
+        return self.cache.incr(self.PREFIXO + 'versao', delta,
+                               inicial=CacheService._versao_inicial())
+
+    @property
+    def versao(self) -> int:
+        return self._incr(0)
+
+    def tocar(self, senha_id=None) -> int:
+        """Regista uma alteração e devolve a nova versão."""
+        versao = self._incr(1)
+        self.cache.set(self._chave_diario(versao), (senha_id, datetime.utcnow()),
+                       ttl=self.DIARIO_TTL)
+        return versao
+
+    def ouvinte(self, evento, senha, dados):
+        """Ouvinte do EventosService."""
+        self.tocar(senha.id)
+
+    def alteracoes_desde(self, versao):
+        """
+        Returns:
+            None se `versao` não puder ser servida por delta; senão
+            dict {senha_ids: set, desde_em: datetime|None}
+        """
+        actual = self.versao
+        if versao > actual or actual - versao > self.MAX_DIARIO:
+            return None
+
+        chaves   = [self._chave_diario(v) for v in range(versao, actual + 1)]
+        entradas = self.cache.get_many(chaves)
+        if any(chave not in entradas for chave in chaves[1:]):
+            return None     # alterações intermédias já não estão no diário
+
+        anterior = entradas.get(chaves[0])
+        ids = {entradas[chave][0] for chave in chaves[1:]} - {None}
+        return {'senha_ids': ids, 'desde_em': anterior[1] if anterior else None}
+
+    # ───────────────────────────────────────────────────────────
+    # Estatísticas por versão (para enviar só os campos alterados)
+    # ───────────────────────────────────────────────────────────
+
+    def guardar_stats(self, chave, versao, stats):
+        self.cache.set(f"{self.PREFIXO}stats:{chave}:{versao}", stats, ttl=self.STATS_TTL)
+
+    def stats_em(self, chave, versao):
+        return self.cache.get(f"{self.PREFIXO}stats:{chave}:{versao}")
+
+
+# 🔥 INSTÂNCIA GLOBAL ÚNICA (por processo; o estado vive no backend do cache)
+_versao_estado = VersaoEstado()
+
+
+def get_versao_estado() -> VersaoEstado:
+    return _versao_estado
@@ -0,0 +1,64 @@
+"""
+app/utils/periodos.py
+═══════════════════════════════════════════════════════════════
+Predicados de data "sargable" (intervalos semiabertos)
+
+MOTIVAÇÃO:
+  `func.date(coluna) == hoje` aplica uma função à coluna e impede o
+  MySQL de usar qualquer índice sobre ela (full scan a cada pedido).
+  Aqui o dia é convertido num intervalo [dia, dia+1) comparado
+  directamente com a coluna, o que permite range scans nos índices
+  compostos de `senhas` e `log_actividades`.
+
+USO:
+  Senha.query.filter(no_dia(Senha.emitida_em, date.today()))
+  Senha.query.filter(entre_dias(Senha.data_emissao, inicio, fim))
+═══════════════════════════════════════════════════════════════
+"""
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, true
+from sqlalchemy.types import DateTime
+
+
+def _como_data(valor):
+    return valor.date() if isinstance(valor, datetime) else valor
+
+
+def _limite(coluna, dia):
+    """
+    Converte o dia no literal adequado ao tipo da coluna.
+    Colunas Date comparam com date; DateTime com datetime à meia-noite
+    (no SQLite as datas são texto e '2024-01-01' < '2024-01-01 00:00').
+    """
+    if isinstance(coluna.type, DateTime):
+        return datetime.combine(dia, datetime.min.time())
+    return dia
+
+
+def entre_dias(coluna, inicio=None, fim=None):
+    """
+    Condição `inicio <= coluna < fim + 1 dia` (ambos os dias inclusivos).
+
+    Args:
+        coluna: coluna Date ou DateTime
+        inicio: date/datetime (None = sem limite inferior)
+        fim:    date/datetime (None = sem limite superior)
+    """
+    condicoes = []
+    if inicio is not None:
+        condicoes.append(coluna >= _limite(coluna, _como_data(inicio)))
+    if fim is not None:
+        seguinte = _como_data(fim) + timedelta(days=1)
+        condicoes.append(coluna < _limite(coluna, seguinte))
+
+    if not condicoes:
+        return true()
+    return and_(*condicoes)
+
+
+def no_dia(coluna, dia=None):
+    """Condição `coluna` dentro do dia indicado (por omissão, hoje)."""
+    dia = dia or date.today()
+    return entre_dias(coluna, dia, dia)
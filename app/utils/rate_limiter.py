@@ -1,32 +1,60 @@
 # ===== FASE 4.2: RATE LIMITING =====
 
 """
-app/utils/rate_limiter.py - NOVO ARQUIVO
+app/utils/rate_limiter.py
+
+Rate limiting por chave (prefixo:ip ou prefixo:user) com custo O(1)
 
-Sistema de rate limiting para prevenir spam e ataques DDoS
+MOTIVAÇÃO:
+  is_allowed chamava _clean_old_entries, que percorria todos os IPs
+  em cada pedido (O(nº de clientes)), e o key_prefix do decorador era
+  ignorado — login, emissão e polling público partilhavam um só
+  contador por IP.
 
-CRIAR EM: app/utils/rate_limiter.py
+ALGORITMOS:
+  janela       — janela deslizante aproximada (dois contadores fixos
+                 ponderados): estimativa = anterior × (1 − fracção
+                 decorrida) + actual. Sem rajadas na fronteira da janela.
+  token_bucket — capacidade `limit`, reposição limit/window tokens por
+                 segundo: permite rajadas curtas até `limit`.
+
+CUSTO:
+  - Cada pedido toca só a sua chave: O(1) sob um lock.
+  - Expiração preguiçosa: _requests é um OrderedDict por ordem de
+    último uso; cada pedido retira do início no máximo LIMPEZA_POR_PEDIDO
+    chaves já inactivas (O(1) amortizado, memória limitada).
+  - Backend do cache partilhado (CACHE_BACKEND sqlite/redis): a janela
+    deslizante usa contadores incr() comuns a todos os workers.
+    O token_bucket precisa de ler-e-escrever o estado: com backend
+    partilhado é contado pela janela deslizante.
 """
 
-from datetime import datetime, timedelta
+import math
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 from flask import request, jsonify
-import time
 
 
 class RateLimiter:
     """
-    Rate limiter em memória
+    Rate limiter em memória (ou no cache partilhado)
     
-    Limita número de requisições por IP em uma janela de tempo
+    Limita número de requisições por chave numa janela de tempo
     """
     
-    # Armazena: { 'IP': {'count': X, 'reset_time': datetime} }
-    _requests = {}
+    # chave → [algoritmo, expira_em, estado...]  (ordem = último uso)
+    _requests = OrderedDict()
+    _lock = threading.Lock()
     
     # Configurações padrão
     DEFAULT_LIMIT = 100  # requests
     DEFAULT_WINDOW = 60  # segundos
+    DEFAULT_ALGORITMO = 'janela'
+    ALGORITMOS = ('janela', 'token_bucket')
+    
+    LIMPEZA_POR_PEDIDO = 4  # chaves inactivas retiradas por pedido
     
     
     @classmethod
@@ -41,33 +69,61 @@ class RateLimiter:
     
     
     @classmethod
-    def _clean_old_entries(cls):
-        """Remove entradas expiradas (garbage collection)"""
-        now = time.time()
-        expired_ips = [
-            ip for ip, data in cls._requests.items()
-            if now > data['reset_time']
-        ]
-        
-        for ip in expired_ips:
-            del cls._requests[ip]
+    def _get_client_user(cls):
+        """Identidade JWT do pedido, ou None (anónimo / token inválido)"""
+        from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity()
+        except Exception:
+            return None
+    
+    
+    @classmethod
+    def chave(cls, key_prefix='general', por='ip'):
+        """'<prefixo>:ip:<ip>' ou '<prefixo>:user:<id>' (anónimos contam por IP)"""
+        if por == 'user':
+            utilizador = cls._get_client_user()
+            if utilizador is not None:
+                return f'{key_prefix}:user:{utilizador}'
+        return f'{key_prefix}:ip:{cls._get_client_ip()}'
+    
+    
+    @classmethod
+    def _clean_old_entries(cls, now=None, maximo=None):
+        """
+        Retira do início (menos usadas) as chaves já inactivas — pára na
+        primeira ainda activa. Com o lock.
+        """
+        now = time.time() if now is None else now
+        removidas = 0
+        while cls._requests and (maximo is None or removidas < maximo):
+            chave, estado = next(iter(cls._requests.items()))
+            if estado[1] > now:
+                break
+            del cls._requests[chave]
+            removidas += 1
+        return removidas
     
     
     @classmethod
-    def is_allowed(cls, ip: str = None, limit: int = None, window: int = None) -> tuple:
+    def is_allowed(cls, ip: str = None, limit: int = None, window: int = None,
+                   key: str = None, algoritmo: str = None) -> tuple:
         """
-        Verifica se requisição é permitida
+        Verifica se requisição é permitida (e conta-a)
         
         Args:
             ip: IP do cliente (None = auto-detectar)
             limit: Número máximo de requisições
             window: Janela de tempo em segundos
+            key: Chave completa (ex: 'login:ip:1.2.3.4'); sobrepõe ip
+            algoritmo: 'janela' | 'token_bucket'
             
         Returns:
             (permitido: bool, info: dict)
         """
-        if ip is None:
-            ip = cls._get_client_ip()
+        if key is None:
+            key = ip if ip is not None else cls._get_client_ip()
         
         if limit is None:
             limit = cls.DEFAULT_LIMIT
@@ -75,94 +131,193 @@ class RateLimiter:
         if window is None:
             window = cls.DEFAULT_WINDOW
         
-        # Limpar entradas antigas
-        cls._clean_old_entries()
+        algoritmo = algoritmo or cls.DEFAULT_ALGORITMO
+        if algoritmo not in cls.ALGORITMOS:
+            raise ValueError(f"Algoritmo inválido: {algoritmo}. Use: {', '.join(cls.ALGORITMOS)}")
         
-        now = time.time()
+        # Vários workers: contadores partilhados no backend do cache
+        cache = cls._cache_partilhado()
+        if cache is not None:
+            return cls._janela_partilhada(cache, key, limit, window)
         
-        # Se IP não está no tracking, adicionar
-        if ip not in cls._requests:
-            cls._requests[ip] = {
-                'count': 1,
-                'reset_time': now + window,
-                'first_request': now
-            }
+        now = time.time()
+        with cls._lock:
+            cls._clean_old_entries(now, cls.LIMPEZA_POR_PEDIDO)
             
-            return True, {
-                'limit': limit,
-                'remaining': limit - 1,
-                'reset': int(now + window)
-            }
-        
-        # Se passou do tempo de reset, resetar contador
-        if now > cls._requests[ip]['reset_time']:
-            cls._requests[ip] = {
-                'count': 1,
-                'reset_time': now + window,
-                'first_request': now
-            }
+            estado = cls._requests.get(key)
+            if estado is None or estado[0] != algoritmo:
+                estado = cls._novo_estado(algoritmo, now, limit)
+                cls._requests[key] = estado
+            else:
+                cls._requests.move_to_end(key)
             
-            return True, {
-                'limit': limit,
-                'remaining': limit - 1,
-                'reset': int(now + window)
-            }
+            if algoritmo == 'token_bucket':
+                return cls._token_bucket(estado, now, limit, window)
+            return cls._janela(estado, now, limit, window)
+    
+    
+    # ===== ALGORITMOS (estado em memória, com o lock) =====
+    
+    @staticmethod
+    def _novo_estado(algoritmo, now, limit):
+        if algoritmo == 'token_bucket':
+            return ['token_bucket', now, float(limit), now]     # tokens, último reabastecimento
+        return ['janela', now, None, 0, 0]                      # índice, actual, anterior
+    
+    
+    @staticmethod
+    def _estimar(anterior, actual, fracao):
+        """Pedidos na janela deslizante (a anterior pesa o que falta decorrer)."""
+        return anterior * (1 - fracao) + actual
+    
+    
+    @classmethod
+    def _janela(cls, estado, now, limit, window):
+        indice = int(now // window)
+        if estado[2] != indice:
+            # Janela seguinte: a actual passa a anterior; mais tarde: zera
+            estado[4] = estado[3] if estado[2] == indice - 1 else 0
+            estado[3] = 0
+            estado[2] = indice
         
-        # Incrementar contador
-        cls._requests[ip]['count'] += 1
+        inicio = indice * window
+        fracao = (now - inicio) / window
+        permitido = cls._estimar(estado[4], estado[3] + 1, fracao) <= limit
+        if permitido:
+            estado[3] += 1
         
-        # Verificar se excedeu limite
-        if cls._requests[ip]['count'] > limit:
-            return False, {
-                'limit': limit,
-                'remaining': 0,
-                'reset': int(cls._requests[ip]['reset_time']),
-                'retry_after': int(cls._requests[ip]['reset_time'] - now)
-            }
+        # Inactiva quando as duas janelas tiverem passado
+        estado[1] = inicio + 2 * window
+        return cls._info_janela(permitido, estado[4], estado[3], now, inicio, limit, window)
+    
+    
+    @classmethod
+    def _info_janela(cls, permitido, anterior, actual, now, inicio, limit, window):
+        fracao = (now - inicio) / window
+        usados = cls._estimar(anterior, actual, fracao)
+        info = {
+            'limit': limit,
+            'remaining': max(int(limit - math.ceil(usados)), 0),
+            'reset': int(inicio + window)
+        }
+        if not permitido:
+            # Momento em que a estimativa com mais um pedido cabe no limite
+            livre = limit - actual - 1
+            if livre < 0 or not anterior:
+                espera = inicio + window - now
+            else:
+                espera = inicio + window * (1 - livre / anterior) - now
+            info['retry_after'] = max(int(math.ceil(espera)), 1)
+        return permitido, info
+    
+    
+    @classmethod
+    def _token_bucket(cls, estado, now, limit, window):
+        taxa = limit / window                                   # tokens por segundo
+        tokens = min(float(limit), estado[2] + (now - estado[3]) * taxa)
+        permitido = tokens >= 1
+        if permitido:
+            tokens -= 1
+        estado[2], estado[3] = tokens, now
         
-        # Ainda dentro do limite
-        return True, {
+        # Inactiva quando o balde estiver cheio outra vez
+        cheio_em = now + (limit - tokens) / taxa
+        estado[1] = cheio_em
+        
+        info = {
             'limit': limit,
-            'remaining': limit - cls._requests[ip]['count'],
-            'reset': int(cls._requests[ip]['reset_time'])
+            'remaining': int(tokens),
+            'reset': int(math.ceil(cheio_em))
         }
+        if not permitido:
+            info['retry_after'] = max(int(math.ceil((1 - tokens) / taxa)), 1)
+        return permitido, info
+    
+    
+    # ===== BACKEND PARTILHADO =====
+    
+    @classmethod
+    def _cache_partilhado(cls):
+        """CacheService com backend partilhado (sqlite/redis), ou None."""
+        from app.services.cache_service import get_cache
+        cache = get_cache()
+        return cache if cache.partilhado else None
     
     
     @classmethod
-    def reset(cls, ip: str = None):
-        """Reseta contador para um IP"""
-        if ip is None:
-            ip = cls._get_client_ip()
+    def _janela_partilhada(cls, cache, key, limit, window) -> tuple:
+        """
+        Janela deslizante com um contador por (chave, janela) no backend:
+        uma leitura da janela anterior + um INCR atómico por pedido.
+        Um pedido recusado devolve o incremento (não gasta quota).
+        """
+        now = time.time()
+        indice = int(now // window)
+        inicio = indice * window
+        fracao = (now - inicio) / window
+        
+        anterior_chave = f'ratelimit:{key}:{indice - 1}'
+        anterior = cache.backend.get_contadores([anterior_chave]).get(anterior_chave, 0)
+        actual = cache.incr(f'ratelimit:{key}:{indice}', 1, ttl=2 * window)
         
-        if ip in cls._requests:
-            del cls._requests[ip]
+        permitido = cls._estimar(anterior, actual, fracao) <= limit
+        if not permitido:
+            actual = cache.incr(f'ratelimit:{key}:{indice}', -1, ttl=2 * window)
+        return cls._info_janela(permitido, anterior, actual, now, inicio, limit, window)
     
     
+    # ===== GESTÃO =====
+    
     @classmethod
-    def get_stats(cls) -> dict:
-        """Retorna estatísticas do rate limiter"""
-        cls._clean_old_entries()
+    def reset(cls, ip: str = None, window: int = None, key: str = None):
+        """Reseta contador de uma chave (por omissão, o IP do pedido)"""
+        if key is None:
+            key = ip if ip is not None else cls._get_client_ip()
         
-        return {
-            'total_ips': len(cls._requests),
-            'active_requests': sum(data['count'] for data in cls._requests.values())
-        }
+        cache = cls._cache_partilhado()
+        if cache is not None:
+            indice = int(time.time() // (window or cls.DEFAULT_WINDOW))
+            cache.backend.delete_many([f'ratelimit:{key}:{indice - 1}',
+                                       f'ratelimit:{key}:{indice}'])
+        
+        with cls._lock:
+            cls._requests.pop(key, None)
+    
+    
+    @classmethod
+    def get_stats(cls) -> dict:
+        """Retorna estatísticas do rate limiter (chaves em memória neste processo)"""
+        with cls._lock:
+            cls._clean_old_entries()
+            por_algoritmo = {}
+            for estado in cls._requests.values():
+                por_algoritmo[estado[0]] = por_algoritmo.get(estado[0], 0) + 1
+            
+            return {
+                'total_ips': len(cls._requests),
+                'por_algoritmo': por_algoritmo,
+                'active_requests': sum(
+                    estado[3] for estado in cls._requests.values() if estado[0] == 'janela'
+                )
+            }
 
 
 # ===== DECORATOR PARA USAR EM ROTAS =====
 
-def rate_limit(limit=100, window=60, key_prefix='general'):
+def rate_limit(limit=100, window=60, key_prefix='general', por='ip', algoritmo=None):
     """
     Decorator para aplicar rate limiting em rotas
     
     Args:
         limit: Número máximo de requisições
         window: Janela de tempo em segundos
-        key_prefix: Prefixo para diferenciar limitadores
+        key_prefix: Prefixo para diferenciar limitadores (contador próprio)
+        por: 'ip' | 'user' (identidade JWT; anónimos contam por IP)
+        algoritmo: 'janela' (padrão) | 'token_bucket'
         
     Example:
         @app.route('/api/senhas', methods=['POST'])
-        @rate_limit(limit=10, window=60)  # 10 req/min
+        @rate_limit(limit=10, window=60, key_prefix='emissao')  # 10 req/min
         def emitir_senha():
             ...
     """
@@ -170,7 +325,10 @@ def rate_limit(limit=100, window=60, key_prefix='general'):
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Verificar se permitido
-            allowed, info = RateLimiter.is_allowed(limit=limit, window=window)
+            allowed, info = RateLimiter.is_allowed(
+                key=RateLimiter.chave(key_prefix, por),
+                limit=limit, window=window, algoritmo=algoritmo
+            )
             
             # Adicionar headers de rate limit na resposta
             def add_headers(response):
@@ -217,21 +375,21 @@ EXEMPLO_USO = """
 from app.utils.rate_limiter import rate_limit
 
 @senha_bp.route('/senhas', methods=['POST'])
-@rate_limit(limit=10, window=60)  # 10 emissões por minuto
+@rate_limit(limit=10, window=60, key_prefix='emissao')  # 10 emissões por minuto
 def emitir_senha():
     # ... código de emissão ...
     pass
 
 
 @senha_bp.route('/filas/<int:servico_id>', methods=['GET'])
-@rate_limit(limit=30, window=60)  # 30 consultas por minuto
+@rate_limit(limit=30, window=60, key_prefix='fila')  # 30 consultas por minuto
 def buscar_fila(servico_id):
     # ... código de busca ...
     pass
 
 
 @auth_bp.route('/login', methods=['POST'])
-@rate_limit(limit=5, window=300)  # 5 tentativas de login por 5 minutos
+@rate_limit(limit=5, window=300, key_prefix='login', algoritmo='token_bucket')
 def login():
     # ... código de login ...
     pass
@@ -62,6 +62,37 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'doc', 'docx'}
     
+    # ===============================
+    # 📱 NOTIFICAÇÕES (SMS)
+    # ===============================
+    NOTIFICACOES_PROVIDER = os.getenv('NOTIFICACOES_PROVIDER', 'simulado')  # simulado | stub
+    NOTIFICACOES_WORKERS = int(os.getenv('NOTIFICACOES_WORKERS', 2))
+    NOTIFICACOES_FILA_MAX = int(os.getenv('NOTIFICACOES_FILA_MAX', 1000))
+    NOTIFICACOES_TENTATIVAS = 4
+    NOTIFICACOES_BACKOFF_SEGUNDOS = 2.0
+    
+    # ===============================
+    # 📊 RELATÓRIOS (jobs em background)
+    # ===============================
+    RELATORIOS_PASTA = os.path.join(os.getcwd(), 'relatorios')
+    RELATORIOS_WORKERS = int(os.getenv('RELATORIOS_WORKERS', 2))
+    RELATORIOS_VALIDADE_SEGUNDOS = 24 * 3600
+    
+    # ===============================
+    # ⚡ CACHE
+    # ===============================
+    # memoria — por processo | sqlite — partilhado pelos workers do
+    # servidor | redis — partilhado entre servidores (pip install redis)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memoria')
+    CACHE_SQLITE_CAMINHO = os.getenv('CACHE_SQLITE_CAMINHO',
+                                     os.path.join(os.getcwd(), 'instance', 'cache.sqlite3'))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_REDIS_PREFIXO = os.getenv('CACHE_REDIS_PREFIXO', 'filas:')
+    CACHE_MAX_ENTRADAS = int(os.getenv('CACHE_MAX_ENTRADAS', 10000))
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))  # 0 = sem limite
+    CACHE_TTL_PADRAO = 60
+    CACHE_LIMPEZA_SEGUNDOS = 30
+    
     # ===============================
     # 🔧 OUTRAS
     # ===============================
@@ -88,6 +119,9 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{Config.DB_USER}:{Config.DB_PASSWORD}@{Config.DB_HOST}:{Config.DB_PORT}/{DB_NAME}?charset=utf8mb4"
     
     WTF_CSRF_ENABLED = False
+    NOTIFICACOES_PROVIDER = 'stub'
+    NOTIFICACOES_BACKOFF_SEGUNDOS = 0.01
+    CACHE_BACKEND = 'memoria'
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,48 @@
+"""add senhas_rollup_hora table for dashboard charts
+
+Revision ID: a4d2e8c6f1b9
+Revises: f3c9a1e7b5d2
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d2e8c6f1b9'
+down_revision = 'f3c9a1e7b5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Factos horários (RollupService) — preencher com `flask rebuild-rollups`
+    op.create_table(
+        'senhas_rollup_hora',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('hora', sa.DateTime(), nullable=False, comment='Início da hora (UTC)'),
+        sa.Column('servico_id', sa.Integer(), nullable=False),
+        sa.Column('atendente_id', sa.Integer(), nullable=False, comment='0 = sem atendente'),
+        sa.Column('emitidas', sa.Integer(), nullable=False),
+        sa.Column('concluidas', sa.Integer(), nullable=False),
+        sa.Column('canceladas', sa.Integer(), nullable=False),
+        sa.Column('soma_espera', sa.Integer(), nullable=False,
+                  comment='Soma de tempo_espera_minutos (concluídas)'),
+        sa.Column('n_espera', sa.Integer(), nullable=False),
+        sa.Column('soma_atendimento', sa.Integer(), nullable=False,
+                  comment='Soma de tempo_atendimento_minutos (concluídas)'),
+        sa.Column('n_atendimento', sa.Integer(), nullable=False),
+        sa.Column('max_atendimento', sa.Integer(), nullable=True),
+        sa.Column('min_atendimento', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('hora', 'servico_id', 'atendente_id',
+                            name='uq_senhas_rollup_hora_chave'),
+        comment='Factos horários das senhas (dashboard)'
+    )
+
+
+def downgrade():
+    op.drop_table('senhas_rollup_hora')
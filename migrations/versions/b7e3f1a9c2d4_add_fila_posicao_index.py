@@ -0,0 +1,32 @@
+"""add composite index for queue position lookups
+
+Revision ID: b7e3f1a9c2d4
+Revises: a5dcfdfa6721
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f1a9c2d4'
+down_revision = 'a5dcfdfa6721'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # COUNT das senhas à frente (FilaService._contar_a_frente):
+    # WHERE status = 'aguardando' AND servico_id = ? AND tipo ... AND emitida_em ...
+    with op.batch_alter_table('senhas', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_senhas_fila_posicao',
+            ['status', 'servico_id', 'tipo', 'emitida_em'],
+            unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('senhas', schema=None) as batch_op:
+        batch_op.drop_index('ix_senhas_fila_posicao')
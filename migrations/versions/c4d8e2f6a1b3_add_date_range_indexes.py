@@ -0,0 +1,57 @@
+"""add composite indexes for date-range queries
+
+Revision ID: c4d8e2f6a1b3
+Revises: b7e3f1a9c2d4
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2f6a1b3'
+down_revision = 'b7e3f1a9c2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Predicados por intervalo [dia, dia+1) — app/utils/periodos.py
+    with op.batch_alter_table('senhas', schema=None) as batch_op:
+        # Fila e estatísticas do dia: WHERE status ... AND data_emissao = ?
+        batch_op.create_index(
+            'ix_senhas_status_dia',
+            ['status', 'data_emissao', 'servico_id', 'tipo', 'emitida_em'],
+            unique=False
+        )
+        # Concluídas num intervalo: WHERE status = 'concluida'
+        #   AND atendimento_concluido_em >= ? AND atendimento_concluido_em < ?
+        batch_op.create_index(
+            'ix_senhas_status_concluida',
+            ['status', 'atendimento_concluido_em'],
+            unique=False
+        )
+        # Idem, por atendente
+        batch_op.create_index(
+            'ix_senhas_atendente_status',
+            ['atendente_id', 'status', 'atendimento_concluido_em'],
+            unique=False
+        )
+
+    with op.batch_alter_table('log_actividades', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_log_actividades_acao_criado',
+            ['acao', 'created_at'],
+            unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('log_actividades', schema=None) as batch_op:
+        batch_op.drop_index('ix_log_actividades_acao_criado')
+
+    with op.batch_alter_table('senhas', schema=None) as batch_op:
+        batch_op.drop_index('ix_senhas_atendente_status')
+        batch_op.drop_index('ix_senhas_status_concluida')
+        batch_op.drop_index('ix_senhas_status_dia')
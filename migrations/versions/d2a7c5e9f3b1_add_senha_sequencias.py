@@ -0,0 +1,37 @@
+"""add senha_sequencias daily counter table
+
+Revision ID: d2a7c5e9f3b1
+Revises: c4d8e2f6a1b3
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e9f3b1'
+down_revision = 'c4d8e2f6a1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Numeração diária atómica (SenhaSequencia.reservar) — substitui o
+    # COUNT(*) ... LIKE 'N%' + 1 feito em cada emissão.
+    op.create_table(
+        'senha_sequencias',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('data', sa.Date(), nullable=False, comment='Dia da numeração'),
+        sa.Column('prefixo', sa.String(length=5), nullable=False, comment='N, P, ...'),
+        sa.Column('ultimo', sa.Integer(), nullable=False, comment='Último número atribuído'),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('data', 'prefixo', name='uq_sequencia_data_prefixo'),
+        comment='Contador diário de numeração de senhas'
+    )
+
+
+def downgrade():
+    op.drop_table('senha_sequencias')
@@ -0,0 +1,50 @@
+"""add senha_blocos table for kiosk number leases
+
+Revision ID: e8f1b3d5a7c9
+Revises: d2a7c5e9f3b1
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f1b3d5a7c9'
+down_revision = 'd2a7c5e9f3b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Blocos de numeração arrendados (NumeracaoService)
+    op.create_table(
+        'senha_blocos',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('data', sa.Date(), nullable=False, comment='Dia da numeração'),
+        sa.Column('prefixo', sa.String(length=5), nullable=False, comment='N, P, ...'),
+        sa.Column('inicio', sa.Integer(), nullable=False, comment='Primeiro número do bloco'),
+        sa.Column('fim', sa.Integer(), nullable=False, comment='Último número do bloco'),
+        sa.Column('usado_ate', sa.Integer(), nullable=False,
+                  comment='Maior número já registado (inicio-1 = nenhum)'),
+        sa.Column('titular', sa.String(length=100), nullable=False, comment='Quiosque / processo'),
+        sa.Column('expira_em', sa.DateTime(), nullable=False, comment='Fim do arrendamento'),
+        sa.Column('estado', sa.String(length=20), nullable=False,
+                  comment='activo | fechado (resto devolvido ou esgotado)'),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        comment='Blocos de numeração arrendados a quiosques'
+    )
+    with op.batch_alter_table('senha_blocos', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_senha_blocos_reaproveitar',
+            ['estado', 'data', 'prefixo', 'expira_em'],
+            unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('senha_blocos', schema=None) as batch_op:
+        batch_op.drop_index('ix_senha_blocos_reaproveitar')
+    op.drop_table('senha_blocos')
@@ -0,0 +1,46 @@
+"""add metricas_diarias table for closed-day metrics
+
+Revision ID: f3c9a1e7b5d2
+Revises: e8f1b3d5a7c9
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c9a1e7b5d2'
+down_revision = 'e8f1b3d5a7c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Cache de métricas por dia fechado (MetricasDiariasService)
+    op.create_table(
+        'metricas_diarias',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('data', sa.Date(), nullable=False, comment='Dia (senhas.data_emissao)'),
+        sa.Column('atendente_id', sa.Integer(), nullable=False, comment='0 = sem atendente'),
+        sa.Column('servico_id', sa.Integer(), nullable=False, comment='0 = linha de fecho do dia'),
+        sa.Column('total', sa.Integer(), nullable=False, comment='Senhas emitidas'),
+        sa.Column('concluidas', sa.Integer(), nullable=False),
+        sa.Column('tempo_soma', sa.Integer(), nullable=False,
+                  comment='Soma de tempo_atendimento_minutos (concluídas)'),
+        sa.Column('tempo_n', sa.Integer(), nullable=False,
+                  comment='Concluídas com tempo de atendimento'),
+        sa.Column('redirecionamentos', sa.Integer(), nullable=False),
+        sa.Column('avaliacoes_soma', sa.Integer(), nullable=False),
+        sa.Column('avaliacoes_total', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('data', 'atendente_id', 'servico_id',
+                            name='uq_metricas_diarias_chave'),
+        comment='Cache de métricas por dia fechado'
+    )
+
+
+def downgrade():
+    op.drop_table('metricas_diarias')
@@ -9,6 +9,7 @@ load_dotenv()
 
 import os
 import sys
+import click
 from app import create_app, db
 from app.extensions import socketio
 
@@ -55,6 +56,19 @@ def reset_db():
         print("❌ Operação cancelada")
 
 
+@app.cli.command()
+@click.option('--desde', default=None, help='AAAA-MM-DD (omisso = todo o histórico)')
+def rebuild_rollups(desde):
+    """Reconstrói senhas_rollup_hora a partir das senhas"""
+    from datetime import date
+    from app.services.rollup_service import RollupService
+
+    inicio = date.fromisoformat(desde) if desde else None
+    print(f"📊 Reconstruindo rollup horário desde {inicio or 'o início'}...")
+    linhas = RollupService.reconstruir(inicio)
+    print(f"✅ {linhas} linhas de rollup gravadas!")
+
+
 @app.shell_context_processor
 def make_shell_context():
     """Contexto para flask shell"""
@@ -76,6 +90,10 @@ if __name__ == '__main__':
         try:
             db.engine.connect()
             print("✅ Conexão com banco OK")
+
+            from app.services.fila_index import get_fila_index
+            get_fila_index().carregar()
+            print(f"✅ Índice da fila carregado ({get_fila_index().tamanho()} senhas)")
         except Exception as e:
             print(f"❌ Erro ao conectar no banco: {e}")
             print("\nVerifique:")
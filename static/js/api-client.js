@@ -205,8 +205,10 @@
       return result.ok ? (result.data || {}) : { aguardando: 0, concluidas: 0, tempo_medio_espera: 0 };
     },
 
-    async getSnapshot() {
-      const snapshot = await apiRequest("/realtime/snapshot");
+    // since: versão do último snapshot → resposta delta / unchanged
+    async getSnapshot(since) {
+      const query    = since ? `?since=${encodeURIComponent(since)}` : "";
+      const snapshot = await apiRequest(`/realtime/snapshot${query}`);
       if (snapshot.ok) return { ok: true, data: snapshot.data };
 
       const [queue, stats] = await Promise.all([this.getQueue(), this.getStats()]);
@@ -169,8 +169,13 @@ function _pauseStorageKey() {
     // PR-7: evitar múltiplos intervals
     if (pollingInterval) return;
 
+    _ligarEventos();
+
+    let ciclos = 0;
     pollingInterval = setInterval(async () => {
       if (_pollingTickBusy) return;
+      // eventos Socket.IO ligados → só 1 ciclo em cada 6 (rede de segurança)
+      if (store?.eventsConnected?.() && (++ciclos % 6) !== 0) return;
       _pollingTickBusy = true;
       try {
         await atualizarEstatisticas();
@@ -186,6 +191,31 @@ function _pauseStorageKey() {
     if (pollingInterval) { clearInterval(pollingInterval); pollingInterval = null; }
     _pollingTickBusy = false;
   }
+
+  /* ── Eventos Socket.IO ───────────────────────────────────── */
+  let _eventosLigados = false;
+  function _ligarEventos() {
+    if (_eventosLigados || !store?.connectEvents) return;
+    _eventosLigados = true;
+    const user = store.getUser?.() || {};
+    const balcao = parseInt(user.balcao || user.numero_balcao) || null;
+    store.connectEvents({
+      ...(user.servico_id ? { servico_id: user.servico_id } : {}),
+      ...(balcao ? { balcao } : {})
+    });
+    store.onEvent(async (nome) => {
+      if (nome === "senha_posicao") return;
+      if (!pollingInterval || _pollingTickBusy) return;
+      _pollingTickBusy = true;
+      try {
+        await atualizarEstatisticas();
+        await atualizarHistorico();
+        await atualizarFilaAoVivo();
+      } finally {
+        _pollingTickBusy = false;
+      }
+    });
+  }
 // PR-6: refresh imediato pós-acção crítica
 async function _refreshPosAccao(label) {
 
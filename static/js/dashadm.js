@@ -1887,6 +1887,8 @@ async function _executarPollingSeguro(trigger) {
 // PR-11: intervalo calculado por contexto
 function _getAdaptivePollingInterval() {
   if (document.hidden) return 60000;
+  // eventos Socket.IO ligados → polling só como rede de segurança
+  if (window.IMTSBStore?.eventsConnected?.()) return 60000;
   if (!navigator.onLine) return 45000;
   if (_adaptivePollingMode === 'recovery') return 15000;
   if (_pollingFailures >= 3) return Math.min(_pollingBackoffMs, 120000);
@@ -1903,8 +1905,21 @@ function _agendarProximoPolling() {
   }, _getAdaptivePollingInterval());
 }
 
+  // Eventos Socket.IO: refresh só quando uma senha muda de estado
+  let _eventosLigados = false;
+  function _ligarEventos() {
+    if (_eventosLigados || !window.IMTSBStore?.connectEvents) return;
+    _eventosLigados = true;
+    window.IMTSBStore.connectEvents({ admin: true });
+    window.IMTSBStore.onEvent((nome) => {
+      if (nome === 'senha_posicao') return;
+      _executarPollingSeguro('evento_socket').catch(() => {});
+    });
+  }
+
   // PR-11: adaptive polling
   function iniciarPolling() {
+    _ligarEventos();
 
     // limpa interval antigo
     if (pollingInterval) {
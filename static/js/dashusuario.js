@@ -666,9 +666,14 @@
     console.log("[ACOMPANHAR]", num);
     pararAcompanhamento();
     actualizarPosicao(num);
+    // Eventos da sala senha:<id>; com o socket ligado o polling só
+    // corre 1 ciclo em cada 6 (rede de segurança)
+    store?.connectEvents?.({ senha: num });
+    let ciclos = 0;
     pollingAcompanhamento = setInterval(() => {
       // FIX-08 — não continuar se a senha foi limpa entretanto
       if (!minhaSenha) { pararAcompanhamento(); return; }
+      if (store?.eventsConnected?.() && (++ciclos % 6) !== 0) return;
       actualizarPosicao(num);
     }, 5000);
   }
@@ -933,8 +938,14 @@
     // FIX-06 — parar sempre antes de criar novos
     pararPollingGeral();
 
+    ligarEventos();
+    let ciclos = 0, ciclosPesados = 0;
+
     // Canal leve: última chamada (mais frequente)
+    // Com eventos Socket.IO ligados os dois canais passam a rede de
+    // segurança (1 ciclo em cada 10 / 6).
     pollingLastCalled = setInterval(async () => {
+      if (store?.eventsConnected?.() && (++ciclos % 10) !== 0) return;
       try { await atualizarUltimaChamada(); } catch (_) {}
     }, 3000);
 
@@ -942,6 +953,7 @@
     pollingGeral = setInterval(async () => {
       // FIX-05 — sair se ciclo anterior ainda não terminou
       if (_pollingEmCurso) return;
+      if (store?.eventsConnected?.() && (++ciclosPesados % 6) !== 0) return;
       _pollingEmCurso = true;
       try {
         await atualizarEstatisticas();
@@ -951,6 +963,32 @@
     }, 8000);
   }
 
+  /* Eventos Socket.IO: senha_* → actualização imediata */
+  let _eventosLigados = false;
+  function ligarEventos() {
+    if (_eventosLigados || !store?.connectEvents) return;
+    _eventosLigados = true;
+    store.connectEvents({ tv: true });
+    store.onEvent(async (nome, dados) => {
+      // Acompanhamento: a sala senha:<id> só recebe a própria senha
+      if (minhaSenha && pollingAcompanhamento && dados?.id === minhaSenha.id) {
+        actualizarPosicao(minhaSenha.numero);
+        return;
+      }
+      if (!pollingGeral || nome === 'senha_posicao') return;
+      if (nome === 'senha_chamada') {
+        try { await atualizarUltimaChamada(); } catch (_) {}
+      }
+      if (_pollingEmCurso) return;
+      _pollingEmCurso = true;
+      try {
+        await atualizarEstatisticas();
+      } finally {
+        _pollingEmCurso = false;
+      }
+    });
+  }
+
   function pararPollingGeral() {
     // FIX-06 — limpeza explícita
     if (pollingGeral) {
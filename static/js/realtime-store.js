@@ -35,6 +35,11 @@
     _listeners:       [],
     _pollingInterval: null,
     _pollingBusy:     false,
+    _socket:          null,
+    _salas:           {},
+    _eventListeners:  [],
+    _eventRefresh:    null,
+    _pollingSkips:    0,
 
     /* ── Subscriptions ───────────────────────────────────── */
     subscribe(callback) {
@@ -63,14 +68,21 @@
       const client = getApiClient();
       if (!apiConfig.enabled || !client?.getSnapshot) return this.getSnapshot();
       try {
-        const result = await client.getSnapshot();
+        const result = await client.getSnapshot(this._state.version);
         if (!result.ok) return this.getSnapshot();
         const data = result.data || {};
-        this._state.queue     = Array.isArray(data.queue)   ? data.queue   : [];
-        this._state.history   = Array.isArray(data.history) ? data.history : [];
-        this._state.users     = Array.isArray(data.users)   ? data.users   : [];
-        this._state.lastCall  = data.lastCalled || data.lastCall || null;
-        this._state.stats     = data.stats || this._state.stats;
+        if (data.unchanged) return this.getSnapshot();   // nada mudou: sem notify
+        if (data.delta) {
+          this._aplicarDelta(data);
+        } else {
+          this._state.queue     = Array.isArray(data.queue)   ? data.queue   : [];
+          this._state.history   = Array.isArray(data.history) ? data.history : [];
+          this._state.users     = Array.isArray(data.users)   ? data.users   : [];
+          this._state.lastCall  = data.lastCalled || data.lastCall || null;
+          this._state.stats     = data.stats || this._state.stats;
+          this._state.events    = Array.isArray(data.events) ? data.events : [];
+        }
+        this._state.version   = data.version || null;
         this._state.updatedAt = data.updatedAt || null;
         this._notify();
         return this.getSnapshot();
@@ -80,6 +92,25 @@
       }
     },
 
+    // Delta de /realtime/snapshot?since=: upsert/remove por id
+    _aplicarDelta(data) {
+      const porId = (lista, novos, remover) => {
+        const fora = new Set([...(remover || []), ...novos.map(t => t.id)]);
+        return lista.filter(t => !fora.has(t.id)).concat(novos);
+      };
+      const queue   = data.queue   || {};
+      const history = data.history || {};
+
+      this._state.queue = porId(this._state.queue, queue.upsert || [], queue.remove)
+        .sort((a, b) => String(a.createdAt).localeCompare(String(b.createdAt)));
+      this._state.history = (history.upsert || [])
+        .concat(porId(this._state.history, [], (history.upsert || []).map(t => t.id)))
+        .slice(0, 50);
+      this._state.stats  = { ...this._state.stats, ...(data.stats || {}) };
+      this._state.events = (data.events || []).concat(this._state.events || []).slice(0, 20);
+      if ("lastCalled" in data) this._state.lastCall = data.lastCalled;
+    },
+
     getUser() {
       const stored = localStorage.getItem("imtsb_user");
       if (stored) {
@@ -292,11 +323,89 @@
       } catch (_) { return { ok: false, message: "Erro de conexão" }; }
     },
 
+    /* ── Eventos Socket.IO ───────────────────────────────── */
+    // Cada transição de senha chega como senha_* com o delta mínimo;
+    // o snapshot só é relido quando algo muda (debounce de 300 ms).
+    // O servidor só envia para as salas pedidas em `salas`:
+    //   { servico_id } | { senha: "N042" } | { balcao } | { tv: true } | { admin: true }
+    // (balcao/admin levam o access token automaticamente).
+    EVENTOS: [
+      "senha_emitida", "senha_chamada", "senha_iniciada",
+      "senha_concluida", "senha_cancelada", "senha_redirecionada",
+      "senha_posicao"
+    ],
+
+    connectEvents(salas) {
+      if (salas) {
+        Object.assign(this._salas, salas);
+        if (this._socket?.connected) this._entrarSalas();
+      }
+      if (this._socket || typeof window.io !== "function") return this._socket;
+      try {
+        this._socket = window.io({ transports: ["websocket", "polling"] });
+      } catch (e) {
+        console.warn("[store][eventos] Socket.IO indisponível:", e);
+        return null;
+      }
+      this.EVENTOS.forEach(nome => {
+        this._socket.on(nome, dados => this._onEvent(nome, dados));
+      });
+      // Salas perdem-se numa reconexão → voltar a entrar sempre
+      this._socket.on("connect", () => {
+        this._entrarSalas();
+        this._agendarRefresh();
+      });
+      return this._socket;
+    },
+
+    _entrarSalas() {
+      const pedido = { ...this._salas };
+      if (!Object.keys(pedido).length) return;
+      if (pedido.balcao || pedido.admin) pedido.token = this.getToken();
+      this._socket.emit("entrar", pedido, resp => {
+        if (resp && !resp.ok) console.warn("[store][eventos] entrar:", resp.erro);
+      });
+    },
+
+    eventsConnected() { return !!(this._socket && this._socket.connected); },
+
+    onEvent(callback) {
+      this._eventListeners.push(callback);
+      return () => {
+        const i = this._eventListeners.indexOf(callback);
+        if (i > -1) this._eventListeners.splice(i, 1);
+      };
+    },
+
+    _onEvent(nome, dados) {
+      this._state.lastEvent = { nome, ...(dados || {}) };
+      // lastCall ({code, service, counterName, at}) vem do snapshot pedido
+      // logo a seguir — o payload do evento não tem o nome do serviço
+      this._eventListeners.forEach(fn => { try { fn(nome, dados); } catch (_) {} });
+      if (nome !== "senha_posicao") this._agendarRefresh();
+    },
+
+    _agendarRefresh() {
+      clearTimeout(this._eventRefresh);
+      this._eventRefresh = setTimeout(async () => {
+        const client = getApiClient();
+        try {
+          if (apiConfig.enabled && client?.getSnapshot) await this.refreshSnapshot();
+          else { await this.refreshQueue(); await this.refreshStats(); }
+        } catch (_) {}
+        this._notify();
+      }, 300);
+    },
+
     /* ── Polling ─────────────────────────────────────────── */
+    // Com o socket ligado o polling passa a rede de segurança:
+    // só 1 ciclo em cada 6 corre (eventos perdidos numa reconexão).
     startPolling(intervalMs) {
       this.stopPolling();
+      this.connectEvents();
       this._pollingInterval = setInterval(async () => {
         if (this._pollingBusy) return;
+        if (this.eventsConnected() && (++this._pollingSkips % 6) !== 0) return;
         this._pollingBusy = true;
         const t0 = Date.now();
         const client = getApiClient();
@@ -752,6 +752,19 @@
     }
   }
 
+  /* Sala 'tv' do Socket.IO: só recebe senha_chamada → refresh imediato.
+     O polling continua para a lista de espera e como rede de segurança. */
+  function _ligarEventos() {
+    if (typeof window.io !== 'function') return;
+    try {
+      const socket = window.io({ transports: ['websocket', 'polling'] });
+      socket.on('connect', () => socket.emit('entrar', { tv: true }));
+      socket.on('senha_chamada', () => _actualizar());
+    } catch (e) {
+      console.warn('[TV] Socket.IO indisponível:', e);
+    }
+  }
+
   /* Polling adaptativo: rápido em foco, lento em background */
   function _iniciarPolling() {
     clearInterval(_pollingTimer);
@@ -819,6 +832,7 @@
   _setup();
   _relogio();
   _initVoice();
+  _ligarEventos();
   _iniciarPolling();
 
   /* Desbloquear áudio no primeiro gesto */
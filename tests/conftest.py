@@ -1,9 +1,15 @@
 ﻿import pytest
+from flask_jwt_extended import create_access_token
 from app import create_app, db
 from app.models.atendente import Atendente
 from app.models.servico import Servico
 from app.models.senha import Senha
-from datetime import date
+from app.models.metrica_diaria import MetricaDiaria
+from app.models.senha_rollup_hora import SenhaRollupHora
+from app.services.cache_backends import BackendSQLite
+from app.services.cache_service import get_cache
+from app.services.senha_service import SenhaService
+from datetime import date, datetime
 
 
 @pytest.fixture(scope='session')
@@ -27,10 +33,22 @@ def db_session(app):
         Atendente.query.delete()
         Servico.query.delete()
         db.session.commit()
+        get_cache().clear()
         yield db
         db.session.rollback()
 
 
+@pytest.fixture
+def cache_partilhada(tmp_path):
+    """Cache global num BackendSQLite (como com vários workers) durante o teste."""
+    cache = get_cache()
+    anterior = cache.backend
+    cache.backend = BackendSQLite(str(tmp_path / 'cache.sqlite3'))
+    yield cache
+    cache.backend.fechar()
+    cache.backend = anterior
+
+
 @pytest.fixture
 def servico(db_session):
     servico = Servico(
@@ -72,3 +90,59 @@ def senha(db_session, servico):
     db_session.session.add(senha)
     db_session.session.commit()
     return senha
+
+
+@pytest.fixture
+def atendente_headers(atendente):
+    """Authorization do atendente de teste (relido: o fixture fica detached)."""
+    at = Atendente.query.filter_by(email='atendente@test.com').one()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(at.id))}'}
+
+
+@pytest.fixture
+def admin_headers(db_session):
+    """Authorization de um administrador criado para o teste."""
+    admin = Atendente(nome='Admin Teste', email='admin@test.com', senha='senha123',
+                      tipo='admin', ativo=True)
+    db_session.session.add(admin)
+    db_session.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+
+
+@pytest.fixture
+def limpo(db_session):
+    """db_session com as tabelas derivadas (metricas_diarias, rollups) vazias."""
+    def limpar():
+        MetricaDiaria.query.delete()
+        SenhaRollupHora.query.delete()
+        db_session.session.commit()
+
+    limpar()
+    yield db_session
+    limpar()
+
+
+@pytest.fixture
+def concluidas(db_session):
+    """
+    Fábrica: concluidas(servico, n, ...) emite n senhas já concluídas.
+
+    atendimento/espera → tempo_*_minutos; dia → data_emissao.
+    Devolve a lista das senhas (commit feito).
+    """
+    def criar(servico, n=1, atendimento=None, espera=None, dia=None, atendente_id=None):
+        senhas = []
+        for _ in range(n):
+            senha = SenhaService.emitir_senha(servico.id)
+            senha.status = 'concluida'
+            senha.atendimento_concluido_em = datetime.utcnow()
+            senha.tempo_atendimento_minutos = atendimento
+            senha.tempo_espera_minutos = espera
+            senha.atendente_id = atendente_id
+            if dia is not None:
+                senha.data_emissao = dia
+            senhas.append(senha)
+        db_session.session.commit()
+        return senhas
+
+    return criar
@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy import event
+
+from app.controllers.compat.snapshot_controller import _calcular_stats
+from app.extensions import db
+from app.services.cache_backends import BackendSQLite
+from app.services.cache_service import CacheService
+from app.models.atendente import Atendente
+from app.models.senha import Senha
+from app.models.servico import Servico
+from app.services.senha_service import SenhaService
+from app.services.versao_estado import VersaoEstado
+
+
+@contextmanager
+def _contar_queries():
+    queries = []
+
+    def contar(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", contar)
+    try:
+        yield queries
+    finally:
+        event.remove(db.engine, "before_cursor_execute", contar)
+
+
+def _povoar(n_servicos, n_atendentes, prefixo="a"):
+    hoje = date.today()
+    servicos = [Servico(nome=f"Serviço {prefixo}{i}", ativo=True) for i in range(n_servicos)]
+    atendentes = [
+        Atendente(nome=f"At {prefixo}{i}", email=f"at{prefixo}{i}@test.com", senha="senha123",
+                  tipo="atendente", balcao=i + 1, ativo=True)
+        for i in range(n_atendentes)
+    ]
+    db.session.add_all(servicos + atendentes)
+    db.session.flush()
+
+    for i, (sv, at) in enumerate(zip(servicos * n_atendentes, atendentes * n_servicos)):
+        senha = Senha(numero=f"N{i + 1:03d}", tipo="normal",
+                      servico_id=sv.id, data_emissao=hoje)
+        senha.status = "concluida"
+        senha.atendente_id = at.id
+        senha.tempo_espera_minutos = 4
+        senha.tempo_atendimento_minutos = 6
+        db.session.add(senha)
+    db.session.commit()
+
+
+def test_snapshot_since_versao_actual_devolve_unchanged(client, db_session, cache_partilhada):
+    completo = client.get("/api/realtime/snapshot").get_json()
+    assert "version" in completo and "queue" in completo
+
+    resposta = client.get(f"/api/realtime/snapshot?since={completo['version']}")
+    body = resposta.get_json()
+
+    assert resposta.status_code == 200
+    assert body["unchanged"] is True
+    assert body["version"] == completo["version"]
+    assert "queue" not in body
+
+
+def test_snapshot_delta_so_com_senhas_alteradas(client, db_session, cache_partilhada, servico):
+    SenhaService.emitir_senha(servico.id)
+    versao = client.get("/api/realtime/snapshot").get_json()["version"]
+
+    nova = SenhaService.emitir_senha(servico.id)
+    body = client.get(f"/api/realtime/snapshot?since={versao}").get_json()
+
+    assert body["delta"] is True
+    assert body["version"] > versao
+    assert [t["code"] for t in body["queue"]["upsert"]] == [nova.numero]
+    assert body["queue"]["remove"] == []
+    assert body["history"]["upsert"] == []
+    assert "users" not in body
+    # Só os campos de stats que mudaram
+    assert body["stats"]["total_emitidas"] == 2
+    assert "concluidas" not in body["stats"]
+
+    SenhaService.cancelar(nova.id, "teste", None)
+    body = client.get(f"/api/realtime/snapshot?since={body['version']}").get_json()
+
+    assert body["queue"]["remove"] == [nova.id]
+    assert [t["id"] for t in body["history"]["upsert"]] == [nova.id]
+
+
+def test_snapshot_delta_inclui_nota(client, db_session, cache_partilhada, servico):
+    senha = SenhaService.emitir_senha(servico.id)
+    versao = client.get("/api/realtime/snapshot").get_json()["version"]
+
+    resposta = client.post("/api/tickets/note", json={"ticket_id": senha.id, "note": "trazer BI"})
+    assert resposta.status_code == 200
+    body = client.get(f"/api/realtime/snapshot?since={versao}").get_json()
+
+    assert body.get("unchanged") is not True
+    assert [t["notes"] for t in body["queue"]["upsert"]] == ["trazer BI"]
+
+
+def test_snapshot_since_desconhecido_devolve_completo(client, db_session, cache_partilhada):
+    body = client.get("/api/realtime/snapshot?since=1").get_json()
+
+    assert "delta" not in body
+    assert isinstance(body["queue"], list)
+    assert "users" in body
+
+
+def test_versao_fora_do_diario_exige_snapshot_completo():
+    estado = VersaoEstado(cache=CacheService())
+    estado.MAX_DIARIO = 3
+
+    inicial = estado.versao
+    for senha_id in range(5):
+        estado.tocar(senha_id)
+
+    assert estado.alteracoes_desde(inicial) is None
+    assert estado.alteracoes_desde(estado.versao - 2)["senha_ids"] == {3, 4}
+    assert estado.alteracoes_desde(estado.versao + 1) is None
+
+    # Entrada do diário perdida (evicção / TTL) → snapshot completo
+    estado.cache.delete(estado._chave_diario(estado.versao))
+    assert estado.alteracoes_desde(estado.versao - 2) is None
+
+
+def test_versao_partilhada_entre_workers(tmp_path):
+    """Um ?since= emitido por um worker é servido por delta noutro"""
+    caminho = str(tmp_path / "cache.sqlite3")
+    a = VersaoEstado(cache=CacheService(backend=BackendSQLite(caminho)))
+    b = VersaoEstado(cache=CacheService(backend=BackendSQLite(caminho)))
+
+    inicial = a.versao
+    a.tocar(7)
+    b.tocar(8)
+
+    assert a.versao == b.versao == inicial + 2
+    assert b.alteracoes_desde(inicial)["senha_ids"] == {7, 8}
+    assert a.alteracoes_desde(inicial + 1)["senha_ids"] == {8}
+
+
+def test_cache_por_processo_devolve_snapshot_completo(client, db_session):
+    versao = client.get("/api/realtime/snapshot").get_json()["version"]
+
+    body = client.get(f"/api/realtime/snapshot?since={versao}").get_json()
+
+    assert "unchanged" not in body and "delta" not in body
+    assert isinstance(body["queue"], list)
+
+
+def test_calcular_stats_numero_fixo_de_queries(db_session):
+    """2 queries, independentemente do número de serviços e atendentes"""
+    _povoar(n_servicos=1, n_atendentes=1)
+    with _contar_queries() as poucas:
+        stats = _calcular_stats(date.today())
+    assert stats["concluidas"] == 1
+
+    Senha.query.delete()
+    _povoar(n_servicos=6, n_atendentes=4, prefixo="b")
+    with _contar_queries() as muitas:
+        stats = _calcular_stats(date.today())
+
+    assert len(poucas) == len(muitas) == 2
+    assert stats["concluidas"] == 24
+    assert stats["tempo_medio_atendimento_min"] == 6.0
+    assert len(stats["por_atendente"]) == 4
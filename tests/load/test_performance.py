@@ -0,0 +1,186 @@
+"""
+Testes de carga — executar com:  pytest tests/load -m load -s
+
+Usam uma BD SQLite em ficheiro temporário (não precisam de MySQL).
+"""
+import threading
+import time
+from datetime import date
+
+import pytest
+
+import config as config_mod
+from app import create_app
+from app.extensions import db
+from app.models.senha import Senha
+from app.models.servico import Servico
+from app.services.fila_index import get_fila_index
+from app.services.fila_service import FilaService
+
+
+@pytest.fixture
+def app_sqlite(tmp_path, monkeypatch):
+    class BenchConfig(config_mod.TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'bench.db'}"
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'connect_args': {'timeout': 30, 'check_same_thread': False}
+        }
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+
+    monkeypatch.setitem(config_mod.config_by_name, 'bench', BenchConfig)
+    app = create_app('bench')
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+def _semear(app, total):
+    with app.app_context():
+        Senha.query.delete()
+        Servico.query.delete()
+        servico = Servico(nome='Secretaria Academica')
+        db.session.add(servico)
+        db.session.flush()
+        hoje = date.today()
+        db.session.add_all([
+            Senha(numero=f'N{i:04d}', servico_id=servico.id, data_emissao=hoje)
+            for i in range(1, total + 1)
+        ])
+        db.session.commit()
+        get_fila_index().carregar()
+        return servico.id
+
+
+def _corrida(app, servico_id, balcoes):
+    """Cada balcão chama até a fila esvaziar; devolve ids reservados."""
+    reservadas = []
+    lock = threading.Lock()
+
+    def balcao(n):
+        atendente = n * 1_000_000
+        with app.app_context():
+            while True:
+                atendente += 1   # atendente novo → sem atendimento activo
+                senha = FilaService.chamar_proxima(servico_id, atendente, n)
+                if senha is None:
+                    break
+                with lock:
+                    reservadas.append(senha.id)
+            db.session.remove()
+
+    threads = [threading.Thread(target=balcao, args=(n,)) for n in range(1, balcoes + 1)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return reservadas, time.perf_counter() - inicio
+
+
+@pytest.mark.load
+@pytest.mark.slow
+def test_chamar_proxima_sob_contencao(app_sqlite, capsys):
+    '''Balcões concorrentes recebem sempre senhas distintas'''
+    total = 200
+    linhas = []
+
+    for balcoes in (1, 2, 4, 8, 16):
+        servico_id = _semear(app_sqlite, total)
+        with capsys.disabled():
+            reservadas, duracao = _corrida(app_sqlite, servico_id, balcoes)
+
+        assert len(reservadas) == total
+        assert len(set(reservadas)) == total
+
+        linhas.append((balcoes, total / duracao))
+
+    with capsys.disabled():
+        print("\n  balcões | chamadas/s")
+        for balcoes, taxa in linhas:
+            print(f"  {balcoes:7d} | {taxa:10.1f}")
+
+
+@pytest.mark.load
+@pytest.mark.slow
+def test_emitir_senha_em_rajada(app_sqlite, capsys):
+    '''Quiosques concorrentes nunca recebem o mesmo número'''
+    from app.services.senha_service import SenhaService
+
+    servico_id = _semear(app_sqlite, 0)
+    quiosques, por_quiosque = 8, 25
+    numeros, erros = [], []
+    lock = threading.Lock()
+
+    def quiosque(n):
+        with app_sqlite.app_context():
+            for _ in range(por_quiosque):
+                try:
+                    senha = SenhaService.emitir_senha(servico_id)
+                    with lock:
+                        numeros.append(senha.numero)
+                except Exception as exc:   # colisão em uq_numero_data, etc.
+                    db.session.rollback()
+                    with lock:
+                        erros.append(exc)
+            db.session.remove()
+
+    threads = [threading.Thread(target=quiosque, args=(n,)) for n in range(quiosques)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    total = quiosques * por_quiosque
+    assert erros == []
+    assert sorted(numeros) == [f'N{i:03d}' for i in range(1, total + 1)]
+
+    with capsys.disabled():
+        print(f"\n  emissões/s ({quiosques} quiosques): {total / duracao:.1f}")
+
+
+@pytest.mark.load
+def test_rate_limiter_10k_clientes(capsys, monkeypatch):
+    '''Custo por pedido não cresce com o nº de clientes seguidos'''
+    from app.utils.rate_limiter import RateLimiter
+
+    # O algoritmo anterior: varrimento de todos os IPs em cada pedido
+    pedidos_antigos = {}
+
+    def antigo(ip, limit=100, window=60):
+        now = time.time()
+        for chave in [k for k, d in pedidos_antigos.items() if now > d['reset_time']]:
+            del pedidos_antigos[chave]
+        dados = pedidos_antigos.setdefault(ip, {'count': 0, 'reset_time': now + window})
+        dados['count'] += 1
+        return dados['count'] <= limit
+
+    def medir(pedir, n_clientes, pedidos=2000):
+        for i in range(n_clientes):
+            pedir(f'10.{i // 65536}.{i // 256 % 256}.{i % 256}')
+        inicio = time.perf_counter()
+        for i in range(pedidos):
+            pedir(f'10.0.0.{i % 50}')
+        return (time.perf_counter() - inicio) / pedidos * 1e6
+
+    monkeypatch.setattr(RateLimiter, '_requests', type(RateLimiter._requests)())
+    novo = lambda ip: RateLimiter.is_allowed(key=f'bench:ip:{ip}')
+
+    novo_100 = medir(novo, 100)
+    RateLimiter._requests.clear()
+    novo_10k = medir(novo, 10_000)
+    antigo_10k = medir(antigo, 10_000, pedidos=200)
+
+    # O(1): 100× mais clientes não pode custar nada que se pareça com 100×
+    assert novo_10k < novo_100 * 10
+    assert novo_10k < antigo_10k
+
+    with capsys.disabled():
+        print("\n  rate limiter (µs/pedido)")
+        print(f"  novo,     100 clientes: {novo_100:8.2f}")
+        print(f"  novo,  10 000 clientes: {novo_10k:8.2f}")
+        print(f"  antigo, 10 000 clientes: {antigo_10k:8.2f}")
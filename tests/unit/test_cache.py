@@ -0,0 +1,342 @@
+import threading
+import time
+
+import pytest
+
+from app.services.cache_backends import BackendMemoria, BackendSQLite, CacheBackend
+from app.services.cache_service import CacheService, cached, get_cache
+
+
+class TestCacheService:
+    '''LRU limitado com TTL por chave'''
+
+    def test_lru_evicta_a_menos_usada(self):
+        cache = CacheService(max_entradas=BackendMemoria.N_SEGMENTOS)   # 1 por segmento
+        cache.set('a', 1)
+        vizinha = next(f'k{i}' for i in range(1000)
+                       if cache.backend._segmento(f'k{i}') is cache.backend._segmento('a'))
+        cache.set(vizinha, 2)
+
+        assert cache.get('a') is None
+        assert cache.get(vizinha) == 2
+        assert cache.get_stats()['evictions'] == 1
+
+    def test_lru_mantem_a_usada_recentemente(self):
+        cache = CacheService(max_entradas=2 * BackendMemoria.N_SEGMENTOS)
+        mesmas = [k for k in (f'k{i}' for i in range(5000))
+                  if cache.backend._segmento(k) is cache.backend._segmento('k0')][:3]
+        cache.set(mesmas[0], 0)
+        cache.set(mesmas[1], 1)
+        cache.get(mesmas[0])
+        cache.set(mesmas[2], 2)
+
+        assert cache.get(mesmas[0]) == 0
+        assert cache.get(mesmas[1]) is None
+
+    def test_limite_de_bytes(self):
+        cache = CacheService(max_entradas=None, max_bytes=BackendMemoria.N_SEGMENTOS * 2000)
+        for i in range(200):
+            cache.set(f'k{i}', 'x' * 500)
+
+        stats = cache.get_stats()
+        assert stats['bytes'] <= BackendMemoria.N_SEGMENTOS * 2000
+        assert stats['evictions'] > 0
+
+    def test_ttl_por_chave_e_limpeza(self):
+        cache = CacheService()
+        cache.set('curta', 1, ttl=0.01)
+        cache.set('longa', 2, ttl=60)
+        for i in range(50):
+            cache.set(f'churn{i}', i, ttl=0.01)
+        time.sleep(0.02)
+
+        # Sem leituras: a limpeza remove as expiradas
+        assert cache.limpar_expiradas() == 51
+        stats = cache.get_stats()
+        assert (stats['total_entries'], stats['expirations']) == (1, 51)
+        assert cache.get('longa') == 2
+
+    def test_regravar_nao_expira_pela_ttl_antiga(self):
+        cache = CacheService()
+        cache.set('k', 1, ttl=0.01)
+        cache.set('k', 2, ttl=60)
+        time.sleep(0.02)
+        cache.limpar_expiradas()
+        assert cache.get('k') == 2
+
+    def test_thread_de_limpeza(self):
+        cache = CacheService(intervalo_limpeza=0.01)
+        cache.arrancar_limpeza()
+        try:
+            cache.set('k', 1, ttl=0.01)
+            time.sleep(0.1)
+            assert cache.get_stats()['total_entries'] == 0
+        finally:
+            cache.parar_limpeza()
+
+    def test_hits_misses_e_concorrencia(self):
+        cache = CacheService(max_entradas=500)
+
+        def trabalhar(n):
+            for i in range(2000):
+                chave = f'k{(i * n) % 800}'
+                if cache.get(chave) is None:
+                    cache.set(chave, i)
+
+        threads = [threading.Thread(target=trabalhar, args=(n,)) for n in range(1, 9)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = cache.get_stats()
+        assert stats['hits'] + stats['misses'] == 8 * 2000
+        assert stats['total_entries'] <= 500 + BackendMemoria.N_SEGMENTOS
+        assert 0 < stats['hit_ratio'] < 1
+
+
+class TestCached:
+    '''@cached: single-flight e stale-while-revalidate'''
+
+    def test_memoiza_por_argumentos(self):
+        chamadas = []
+
+        @cached(key='dobro', ttl=60, cache=CacheService())
+        def dobro(x):
+            chamadas.append(x)
+            return 2 * x
+
+        assert [dobro(1), dobro(1), dobro(2)] == [2, 2, 4]
+        assert chamadas == [1, 2]
+        assert dobro.chave(1) == 'dobro:1'
+
+    def test_misses_simultaneos_calculam_uma_vez(self):
+        chamadas = []
+        barreira = threading.Barrier(10)
+
+        @cached(key='lento', ttl=60, cache=CacheService())
+        def lento():
+            chamadas.append(1)
+            time.sleep(0.1)
+            return 'valor'
+
+        resultados = []
+        def pedir():
+            barreira.wait()
+            resultados.append(lento())
+
+        threads = [threading.Thread(target=pedir) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert resultados == ['valor'] * 10
+        assert len(chamadas) == 1
+
+    def test_erro_propaga_a_quem_espera_e_nao_fica_em_cache(self):
+        chamadas = []
+
+        @cached(key='falha', ttl=60, cache=CacheService())
+        def falha():
+            chamadas.append(1)
+            raise RuntimeError('boom')
+
+        for _ in range(2):
+            try:
+                falha()
+            except RuntimeError:
+                pass
+        assert len(chamadas) == 2
+
+    def test_stale_servido_enquanto_refresca(self):
+        versoes = iter(range(100))
+        refresh = threading.Event()
+
+        @cached(key='swr', ttl=0.05, stale_ttl=5, cache=CacheService())
+        def valor():
+            v = next(versoes)
+            if v:
+                refresh.set()
+            return v
+
+        assert valor() == 0
+        time.sleep(0.06)
+        # Expirado mas dentro de stale_ttl: devolve o antigo já
+        assert valor() == 0
+        assert refresh.wait(2)
+        time.sleep(0.05)
+        assert valor() == 1
+
+    def test_guardar_se(self):
+        chamadas = []
+
+        @cached(key='cond', ttl=60, guardar_se=lambda r: r[1] == 200, cache=CacheService())
+        def resposta(codigo):
+            chamadas.append(codigo)
+            return {}, codigo
+
+        resposta(500); resposta(500); resposta(200); resposta(200)
+        assert chamadas == [500, 500, 200]
+
+    def test_tv_partilhada(self, client, db_session, servico):
+        from app.services.senha_service import SenhaService
+
+        SenhaService.emitir_senha(servico.id)
+        primeira = client.get('/api/dashboard/public/tv').get_json()
+        segunda = client.get('/api/dashboard/public/tv').get_json()
+
+        # Sem transições todos os ecrãs recebem o mesmo conteúdo
+        assert primeira == segunda
+        stats = get_cache().get_stats()
+        assert stats['hits'] >= 1
+
+        # A emissão invalida a tag 'fila' — sem esperar pelo TTL
+        SenhaService.emitir_senha(servico.id)
+        assert client.get('/api/dashboard/public/tv').get_json()['total_aguardando'] == 2
+
+
+class TestTags:
+    '''Invalidação por tags'''
+
+    def test_invalidar_tag(self):
+        cache = CacheService()
+        cache.set('a', 1, tags=['servico:1'])
+        cache.set('b', 2, tags=['servico:2'])
+        cache.set('c', 3)
+
+        cache.invalidate_tags('servico:1')
+
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        assert cache.get('c') == 3
+        assert cache.get_stats()['invalidations'] == 1
+
+    def test_invalidacao_durante_o_calculo_nao_se_perde(self):
+        cache = CacheService()
+        versoes = iter(range(100))
+
+        @cached(key='corrida', ttl=60, tags=['fila'], cache=cache)
+        def valor():
+            v = next(versoes)
+            if v == 0:
+                cache.invalidate_tags('fila')   # transição a meio do cálculo
+            return v
+
+        assert valor() == 0
+        assert valor() == 1
+        assert valor() == 1
+
+    def test_tags_da_senha(self, db_session, servico):
+        from app.services.cache_service import tags_da_senha
+        from app.services.senha_service import SenhaService
+
+        senha = SenhaService.emitir_senha(servico.id)
+        tags = tags_da_senha(senha, servico_origem_id=99)
+
+        assert 'fila' in tags
+        assert f'servico:{servico.id}' in tags and 'servico:99' in tags
+        assert f'dia:{senha.data_emissao.isoformat()}' in tags
+
+    def test_transicao_invalida_estatisticas_com_ttl_longo(self, client, db_session, servico):
+        from app.services.senha_service import SenhaService
+
+        antes = client.get('/api/senhas/estatisticas').get_json()['total_emitidas']
+        senha = SenhaService.emitir_senha(servico.id)
+        assert client.get('/api/senhas/estatisticas').get_json()['total_emitidas'] == antes + 1
+
+        SenhaService.cancelar(senha.id, motivo='teste', atendente_id=None)
+        assert client.get('/api/senhas/estatisticas').get_json()['canceladas'] == 1
+
+    def test_outro_servico_mantem_a_entrada(self, db_session, servico):
+        from app.services.fila_service import FilaService
+        from app.services.senha_service import SenhaService
+
+        chave = FilaService.obter_estatisticas_fila.chave(servico.id + 1000)
+        FilaService.obter_estatisticas_fila(servico.id + 1000)
+        SenhaService.emitir_senha(servico.id)
+
+        assert get_cache().get(chave) is not None
+
+
+class TestBackendPartilhado:
+    '''Backend sqlite: dois CacheService (≈ dois workers) no mesmo ficheiro'''
+
+    def _workers(self, tmp_path, n=2):
+        caminho = str(tmp_path / 'cache.sqlite3')
+        return [CacheService(backend=BackendSQLite(caminho)) for _ in range(n)]
+
+    def test_valor_visivel_no_outro_worker(self, tmp_path):
+        a, b = self._workers(tmp_path)
+        a.set('k', {'x': [1, 2]}, ttl=60)
+
+        assert b.get('k') == {'x': [1, 2]}
+        assert b.get('outra') is None
+
+    def test_lotes_e_ttl(self, tmp_path):
+        a, b = self._workers(tmp_path)
+        a.set_many({f'k{i}': i for i in range(1200)}, ttl=60)
+        a.set('curta', 1, ttl=0.01)
+        time.sleep(0.02)
+
+        valores = b.get_many([f'k{i}' for i in range(1200)] + ['curta'])
+        assert len(valores) == 1200 and valores['k999'] == 999
+        assert b.limpar_expiradas() == 1
+
+    def test_tag_invalidada_noutro_worker(self, tmp_path):
+        a, b = self._workers(tmp_path)
+        a.set('stats', 1, ttl=3600, tags=['dia:2026-01-01'])
+        assert b.get('stats') == 1
+
+        b.invalidate_tags('dia:2026-01-01')
+        assert a.get('stats') is None
+
+    def test_incr_atomico_entre_threads(self, tmp_path):
+        workers = self._workers(tmp_path, n=4)
+
+        def contar(cache):
+            for _ in range(50):
+                cache.incr('contador', ttl=60)
+
+        threads = [threading.Thread(target=contar, args=(w,)) for w in workers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert workers[0].incr('contador', 0) == 200
+
+    def test_backend_incompleto_falha_ao_criar(self):
+        class SemContadores(CacheBackend):
+            nome = 'incompleto'
+
+            def get_many(self, chaves):
+                return {}
+
+        with pytest.raises(TypeError):
+            SemContadores()
+
+    def test_rate_limiter_partilhado(self, tmp_path):
+        from app.utils.rate_limiter import RateLimiter
+
+        cache = get_cache()
+        anterior = cache.backend
+        cache.backend = BackendSQLite(str(tmp_path / 'rl.sqlite3'))
+        try:
+            permitidos = [RateLimiter.is_allowed(ip='10.0.0.1', limit=3, window=60)[0]
+                          for _ in range(5)]
+            assert permitidos == [True, True, True, False, False]
+            assert RateLimiter._requests.get('10.0.0.1') is None
+        finally:
+            cache.backend.fechar()
+            cache.backend = anterior
+
+
+def test_estatisticas_no_admin(client, admin_headers):
+    get_cache().set('teste:admin', 1)
+
+    resposta = client.get('/api/admin/cache/stats', headers=admin_headers)
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['valid_entries'] >= 1
+    get_cache().delete('teste:admin')
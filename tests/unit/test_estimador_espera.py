@@ -0,0 +1,212 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.atendente import Atendente
+from app.models.senha import Senha
+from app.services.estimador_espera import EstimadorEspera, get_estimador_espera
+from app.services.eventos_service import EventosService
+from app.services.fila_index import get_fila_index
+from app.services.senha_service import SenhaService
+
+
+@pytest.fixture
+def estimador(db_session):
+    get_fila_index().invalidar()
+    estimador = get_estimador_espera()
+    estimador.reiniciar()
+    yield estimador
+    estimador.reiniciar()
+
+
+def _atendente(db, email, servico_id=None):
+    atendente = Atendente(nome=email, email=email, senha='senha123',
+                          tipo='atendente', balcao=1, servico_id=servico_id, ativo=True)
+    db.session.add(atendente)
+    db.session.commit()
+    return atendente
+
+
+def _concluir(db, servico_id, atendente_id, minutos):
+    senha = SenhaService.emitir_senha(servico_id)
+    agora = datetime.utcnow()
+    senha.atendente_id = atendente_id
+    senha.status = 'concluida'
+    senha.atendimento_iniciado_em = agora - timedelta(minutes=minutos)
+    senha.atendimento_concluido_em = agora
+    senha.tempo_atendimento_minutos = minutos
+    db.session.commit()
+    EventosService.publicar('concluida', senha)
+    return senha
+
+
+class TestEstimadorEspera:
+    '''EWMA do tempo de atendimento e balcões abertos (BD vazia: sem semente)'''
+
+    def test_ewma_converge_para_o_tempo_recente(self, db_session):
+        estimador = EstimadorEspera()
+        estimador.registar(1, 20)
+        assert estimador.tempo_medio(1) == 20
+
+        for _ in range(15):
+            estimador.registar(1, 4)
+        assert 4 <= estimador.tempo_medio(1) < 4.6
+        # Serviço sem histórico usa a média global
+        assert estimador.tempo_medio(2) == estimador.tempo_medio()
+
+    def test_balcoes_dividem_a_espera(self, db_session):
+        estimador = EstimadorEspera()
+        estimador.registar(1, 6, atendente_id=10)
+        assert estimador.estimar(1, 4) == 24
+
+        estimador.balcao_activo(1, 11)
+        assert estimador.balcoes(1) == 2
+        assert estimador.estimar(1, 4) == 12
+        assert estimador.estimar(1, 0) == 0
+
+    def test_balcao_inactivo_deixa_de_contar(self, db_session):
+        estimador = EstimadorEspera()
+        estimador.JANELA_BALCAO_SEGUNDOS = 0
+        estimador.balcao_activo(1, 10)
+        estimador.balcao_activo(1, 11)
+        assert estimador.balcoes(1) == 1
+
+
+class TestEstimadorNaAplicacao:
+    '''Estimativas alimentadas pelas conclusões publicadas'''
+
+    def test_semente_e_conclusoes(self, estimador, db_session, servico):
+        at1 = _atendente(db_session, 'est1@test.com', servico.id)
+        _concluir(db_session, servico.id, at1.id, 3)
+        estimador.reiniciar()
+
+        # Semente: média dos últimos dias + balcão com actividade recente
+        assert estimador.tempo_medio(servico.id) == 3
+        assert estimador.balcoes(servico.id) == 1
+
+        at2 = _atendente(db_session, 'est2@test.com', servico.id)
+        _concluir(db_session, servico.id, at2.id, 5)
+        assert estimador.tempo_medio(servico.id) == pytest.approx(3.4)
+        assert estimador.balcoes(servico.id) == 2
+
+    def test_mais_preciso_que_a_constante(self, estimador, db_session, servico):
+        from app.services.fila_service import FilaService
+
+        at = _atendente(db_session, 'est3@test.com', servico.id)
+        for _ in range(5):
+            _concluir(db_session, servico.id, at.id, 2)
+        for _ in range(3):
+            SenhaService.emitir_senha(servico.id)
+
+        # 3 senhas à espera, 1 balcão a ~2 min por senha → ~6 min (antes 30)
+        stats = FilaService.obter_estatisticas_fila(servico.id)
+        assert stats['tempo_espera_estimado'] == 6
+
+    def test_acompanhar_senha_sem_ler_concluidas(self, estimador, db_session, client, servico):
+        from sqlalchemy import event
+
+        at = _atendente(db_session, 'est4@test.com', servico.id)
+        _concluir(db_session, servico.id, at.id, 4)
+        SenhaService.emitir_senha(servico.id)
+        senha = SenhaService.emitir_senha(servico.id)
+
+        queries = []
+        def ouvinte(conn, cursor, sql, *args):
+            if 'concluida' in sql:
+                queries.append(sql)
+        event.listen(db_session.engine, 'before_cursor_execute', ouvinte)
+        try:
+            resposta = client.get(f'/api/dashboard/public/senha/{senha.numero}')
+            tv = client.get('/api/dashboard/public/tv')
+        finally:
+            event.remove(db_session.engine, 'before_cursor_execute', ouvinte)
+
+        assert resposta.get_json()['posicao'] == 2
+        assert resposta.get_json()['tempo_espera_estimado'] == 8
+        assert [s['tempo_espera_estimado'] for s in tv.get_json()['aguardando']] == [4, 8]
+        assert queries == []
+
+
+
+class TestEstimadorEntreWorkers:
+    '''Vários workers: backend partilhado ou re-sincronização com a BD'''
+
+    def test_backend_partilhado(self, db_session, tmp_path):
+        from app.services.cache_backends import BackendSQLite
+        from app.services.cache_service import CacheService
+
+        caminho = str(tmp_path / 'cache.sqlite3')
+        a = EstimadorEspera(cache=CacheService(backend=BackendSQLite(caminho)))
+        b = EstimadorEspera(cache=CacheService(backend=BackendSQLite(caminho)))
+
+        a.registar(1, 6, atendente_id=10)
+        b.balcao_activo(1, 11)
+        assert b.tempo_medio(1) == 6
+        assert a.balcoes(1) == 2
+        assert b.estimar(1, 4) == 12
+
+        b.registar(1, 16, atendente_id=11)
+        assert a.tempo_medio(1) == pytest.approx(8)
+
+    def test_resync_apanha_conclusoes_de_outro_worker(self, estimador, db_session, servico):
+        at = _atendente(db_session, 'est5@test.com', servico.id)
+        _concluir(db_session, servico.id, at.id, 3)
+        local = EstimadorEspera()
+        assert local.tempo_medio(servico.id) == 3
+
+        # Conclusão noutro worker: chega só à BD (o ouvinte corre lá)
+        senha = SenhaService.emitir_senha(servico.id)
+        senha.atendente_id = at.id
+        senha.status = 'concluida'
+        senha.atendimento_concluido_em = datetime.utcnow()
+        senha.tempo_atendimento_minutos = 8
+        db_session.session.commit()
+        assert local.tempo_medio(servico.id) == 3
+
+        local._sincronizado_em -= local.RESYNC_SEGUNDOS + 1
+        assert local.tempo_medio(servico.id) == pytest.approx(4)
+
+
+class TestPrecisaoDaEstimativa:
+    '''Estimativa vs espera real numa fila simulada (FIFO, 2 balcões)'''
+
+    def _simular(self, estimador, n=400, balcoes=2, semente=7):
+        import heapq
+        import random
+
+        aleatorio = random.Random(semente)
+        for atendente_id in range(balcoes):
+            estimador.balcao_activo(1, atendente_id)
+
+        livres = [(0.0, atendente_id) for atendente_id in range(balcoes)]
+        conclusoes = []          # heap (fim, duração, atendente_id)
+        inicios = []             # início de cada senha já emitida
+        erros_ewma, erros_constante = [], []
+        chegada = 0.0
+        for i in range(n):
+            # Mudança de regime a meio: atendimentos de ~12 min passam a ~4
+            media = 12.0 if i < n // 2 else 4.0
+            chegada += aleatorio.expovariate(balcoes * 0.95 / media)
+            while conclusoes and conclusoes[0][0] <= chegada:
+                _, duracao, atendente_id = heapq.heappop(conclusoes)
+                estimador.registar(1, duracao, atendente_id)
+
+            posicao = sum(1 for inicio in inicios if inicio > chegada) + 1
+            livre_em, atendente_id = heapq.heappop(livres)
+            inicio = max(chegada, livre_em)
+            duracao = aleatorio.uniform(0.5, 1.5) * media
+            heapq.heappush(livres, (inicio + duracao, atendente_id))
+            heapq.heappush(conclusoes, (inicio + duracao, duracao, atendente_id))
+            inicios.append(inicio)
+
+            if i >= 20:      # depois de aquecer
+                espera = inicio - chegada
+                erros_ewma.append(abs(estimador.estimar(1, posicao) - espera))
+                erros_constante.append(abs(posicao * 10 - espera))
+
+        return (sum(erros_ewma) / len(erros_ewma),
+                sum(erros_constante) / len(erros_constante))
+
+    def test_erro_menor_que_a_constante(self, db_session):
+        erro_ewma, erro_constante = self._simular(EstimadorEspera())
+        assert erro_ewma < erro_constante / 2
@@ -0,0 +1,147 @@
+from app.extensions import socketio
+from app.services.eventos_service import EventosService
+from app.services.fila_index import get_fila_index
+from app.services.senha_service import SenhaService
+
+
+def _capturar(monkeypatch):
+    emitidos = []
+    monkeypatch.setattr(socketio, 'emit',
+                        lambda nome, dados, **kw: emitidos.append((nome, dados, kw)))
+    return emitidos
+
+
+class TestEventosService:
+    '''Transições de senha publicadas via Socket.IO'''
+
+    def test_delta_tem_campos_minimos(self, senha):
+        dados = EventosService.delta('emitida', senha, extra=1)
+
+        assert dados['evento'] == 'emitida'
+        assert dados['id'] == senha.id
+        assert dados['numero'] == 'N001'
+        assert dados['servico_id'] == senha.servico_id
+        assert dados['extra'] == 1
+
+    def test_emitir_senha_publica_evento(self, monkeypatch, servico):
+        '''A emissão publica senha_emitida com o delta'''
+        emitidos = _capturar(monkeypatch)
+
+        senha = SenhaService.emitir_senha(servico.id)
+
+        assert [e[0] for e in emitidos] == ['senha_emitida']
+        assert emitidos[0][1]['numero'] == senha.numero
+        assert emitidos[0][1]['status'] == 'aguardando'
+
+    def test_ouvinte_com_erro_nao_bloqueia(self, monkeypatch, senha):
+        '''Um ouvinte que falha não impede os outros nem o emit'''
+        vistos = []
+
+        def falha(evento, s, dados):
+            raise RuntimeError('boom')
+
+        def regista(evento, s, dados):
+            vistos.append((evento, s.id))
+
+        EventosService.registar_ouvinte(falha)
+        EventosService.registar_ouvinte(regista)
+        emitidos = _capturar(monkeypatch)
+        try:
+            EventosService.publicar('cancelada', senha)
+        finally:
+            EventosService.remover_ouvinte(falha)
+            EventosService.remover_ouvinte(regista)
+
+        assert vistos == [('cancelada', senha.id)]
+        assert [e[0] for e in emitidos] == ['senha_cancelada']
+
+    def test_salas_dirigidas(self, senha):
+        '''Chamadas chegam à TV e ao balcão; emissões não vão para a TV'''
+        senha.numero_balcao = 2
+
+        emitida = EventosService.salas('emitida', senha, {})
+        chamada = EventosService.salas('chamada', senha, {})
+        redirecionada = EventosService.salas('redirecionada', senha,
+                                             {'servico_origem_id': 99})
+
+        assert 'tv' not in emitida
+        assert {'admin', f'senha:{senha.id}', f'servico:{senha.servico_id}',
+                'balcao:2', 'tv'} <= set(chamada)
+        assert 'servico:99' in redirecionada
+
+    def test_publicar_usa_salas(self, monkeypatch, senha):
+        emitidos = _capturar(monkeypatch)
+
+        EventosService.publicar('iniciada', senha)
+
+        nome, _, kw = emitidos[0]
+        assert nome == 'senha_iniciada'
+        assert f'senha:{senha.id}' in kw['to']
+
+    def test_chamada_compat_publica_depois_do_log(self, client, servico):
+        '''Quem reage à chamada já encontra o LogActividade gravado'''
+        from app.models.log_actividade import LogActividade
+
+        senha = SenhaService.emitir_senha(servico.id)
+        logs = []
+
+        def ouvinte(evento, s, dados):
+            if evento == 'chamada':
+                logs.append(LogActividade.query.filter_by(senha_id=s.id, acao='chamada').count())
+
+        get_fila_index().invalidar()
+        EventosService.registar_ouvinte(ouvinte)
+        try:
+            resposta = client.post('/api/tickets/call-next', json={
+                'servico_id': servico.id, 'numero_balcao': 1})
+        finally:
+            EventosService.remover_ouvinte(ouvinte)
+
+        assert resposta.status_code == 200
+        assert resposta.get_json()['ticket']['id'] == senha.id
+        assert logs == [1]
+
+
+class TestSalasSocket:
+    '''Entrada nas salas via handler "entrar"'''
+
+    def test_entrar_por_numero_da_senha(self, app, senha):
+        cliente = socketio.test_client(app)
+
+        resp = cliente.emit('entrar', {'senha': 'n001', 'tv': True}, callback=True)
+
+        assert resp['ok'] is True
+        assert set(resp['salas']) == {f'senha:{senha.id}', 'tv'}
+        salas = socketio.server.manager.rooms['/']
+        assert f'senha:{senha.id}' in salas
+        cliente.disconnect()
+
+    def test_admin_exige_token(self, app, db_session):
+        cliente = socketio.test_client(app)
+
+        resp = cliente.emit('entrar', {'admin': True}, callback=True)
+
+        assert resp['ok'] is False
+        assert 'admin' not in socketio.server.manager.rooms['/']
+        cliente.disconnect()
+
+    def test_posicao_so_para_senhas_acompanhadas(self, app, monkeypatch, servico):
+        '''Ao chamar a primeira senha, só a senha acompanhada recebe a posição'''
+        get_fila_index().invalidar()
+        primeira = SenhaService.emitir_senha(servico.id)
+        segunda  = SenhaService.emitir_senha(servico.id)
+        SenhaService.emitir_senha(servico.id)
+
+        cliente = socketio.test_client(app)
+        cliente.emit('entrar', {'senha_id': segunda.id}, callback=True)
+        emitidos = _capturar(monkeypatch)
+
+        primeira.status = 'chamando'
+        EventosService.publicar('chamada', primeira)
+
+        posicoes = [(e[1], e[2]['to']) for e in emitidos if e[0] == 'senha_posicao']
+        assert posicoes == [
+            ({'id': segunda.id, 'servico_id': servico.id, 'posicao': 1},
+             f'senha:{segunda.id}')
+        ]
+        cliente.disconnect()
@@ -0,0 +1,48 @@
+import csv
+import gzip
+import io
+from datetime import date
+
+from app.services.exportacao_service import ExportacaoService
+
+
+class TestExportacao:
+    '''CSV de atendimentos em streaming'''
+
+    def test_csv_em_blocos(self):
+        linhas = ([i, 'normal'] for i in range(5))
+
+        blocos = list(ExportacaoService.csv_em_blocos(linhas, ['n', 'tipo'], linhas_por_bloco=2))
+
+        assert len(blocos) == 3
+        assert list(csv.reader(io.StringIO(''.join(blocos))))[-1] == ['4', 'normal']
+
+    def test_exportar_em_streaming(self, client, concluidas, servico, atendente_headers):
+        concluidas(servico, 3, atendimento=3)
+        hoje = date.today().isoformat()
+
+        resposta = client.get(
+            f'/api/dashboard/admin/exportar?data_inicio={hoje}&data_fim={hoje}',
+            headers=atendente_headers
+        )
+
+        assert resposta.is_streamed
+        assert 'Content-Encoding' not in resposta.headers
+        linhas = list(csv.reader(io.StringIO(resposta.get_data(as_text=True))))
+        assert linhas[0] == ExportacaoService.CABECALHO
+        assert len(linhas) == 4
+        assert linhas[1][2] == servico.nome
+        resposta.close()
+
+    def test_exportar_gzip(self, client, concluidas, servico, atendente_headers):
+        concluidas(servico, 2, atendimento=3)
+        headers = {**atendente_headers, 'Accept-Encoding': 'gzip'}
+
+        comprimida = client.get('/api/dashboard/admin/exportar', headers=headers)
+        assert comprimida.headers['Content-Encoding'] == 'gzip'
+        dados = gzip.decompress(comprimida.get_data())
+        comprimida.close()
+
+        simples = client.get('/api/dashboard/admin/exportar?gzip=0', headers=headers)
+        assert dados == simples.get_data()
+        simples.close()
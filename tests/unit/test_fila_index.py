@@ -0,0 +1,186 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.services.cache_backends import BackendSQLite
+from app.services.cache_service import CacheService
+from app.services.fila_index import FilaIndex
+
+
+def _senha(id, servico_id=1, tipo='normal', minutos=0, status='aguardando'):
+    return SimpleNamespace(
+        id=id,
+        servico_id=servico_id,
+        tipo=tipo,
+        numero=f"{'P' if tipo == 'prioritaria' else 'N'}{id:03d}",
+        emitida_em=datetime.now().replace(microsecond=0) + timedelta(minutes=minutos),
+        status=status,
+    )
+
+
+class TestFilaIndex:
+    '''Testes do índice em memória da fila'''
+
+    def test_prioritarias_primeiro_e_fifo(self):
+        '''Prioritárias antes das normais; FIFO dentro do mesmo tipo'''
+        indice = FilaIndex()
+        indice.carregar([
+            _senha(1, minutos=0),
+            _senha(2, minutos=1),
+            _senha(3, tipo='prioritaria', minutos=2),
+        ])
+
+        assert indice.listar() == [3, 1, 2]
+        assert indice.proximos(servico_id=1) == [3]
+
+    def test_vista_global_junta_servicos(self):
+        '''Fila geral intercala serviços pela mesma ordem'''
+        indice = FilaIndex()
+        indice.carregar([
+            _senha(1, servico_id=1, minutos=0),
+            _senha(2, servico_id=2, minutos=1),
+            _senha(3, servico_id=1, minutos=2),
+        ])
+
+        assert indice.listar() == [1, 2, 3]
+        assert indice.listar(servico_id=2) == [2]
+        assert indice.proximos(limite=2) == [1, 2]
+
+    def test_actualizar_remove_quando_sai_de_aguardando(self):
+        '''Transições para outro estado retiram a senha do índice'''
+        indice = FilaIndex()
+        indice.carregar([_senha(1), _senha(2, minutos=1)])
+
+        chamada = _senha(1, status='atendendo')
+        indice.actualizar(chamada)
+
+        assert indice.listar() == [2]
+        assert not indice.contem(1)
+
+    def test_redireccionar_muda_de_servico(self):
+        '''Redireccionar move a senha para a lista do novo serviço'''
+        indice = FilaIndex()
+        indice.carregar([_senha(1, servico_id=1)])
+
+        indice.actualizar(_senha(1, servico_id=2))
+
+        assert indice.listar(servico_id=1) == []
+        assert indice.listar(servico_id=2) == [1]
+
+    def test_filtro_por_tipo(self):
+        '''listar(tipo=...) devolve apenas esse tipo'''
+        indice = FilaIndex()
+        indice.carregar([
+            _senha(1),
+            _senha(2, tipo='prioritaria', minutos=1),
+        ])
+
+        assert indice.listar(tipo='normal') == [1]
+        assert indice.listar(tipo='prioritaria') == [2]
+
+    def test_ignora_senhas_antigas(self):
+        '''Senhas de anteontem ou antes não entram na fila'''
+        indice = FilaIndex()
+        antiga = _senha(1)
+        antiga.emitida_em = datetime.now() - timedelta(days=3)
+        indice.carregar([antiga, _senha(2)])
+
+        assert indice.listar() == [2]
+
+    def test_posicao_por_rank(self):
+        '''posicao() conta as senhas à frente no mesmo serviço'''
+        indice = FilaIndex()
+        indice.carregar([
+            _senha(1, minutos=0),
+            _senha(2, minutos=1),
+            _senha(3, tipo='prioritaria', minutos=2),
+            _senha(4, servico_id=2, minutos=0),
+        ])
+
+        assert indice.posicao(3) == 1
+        assert indice.posicao(1) == 2
+        assert indice.posicao(2) == 3
+        assert indice.posicao(4) == 1
+        assert indice.posicao(99) is None
+
+    def test_posicao_desconta_senhas_antigas(self):
+        '''Senhas fora da janela não contam para a posição'''
+        indice = FilaIndex()
+        antiga = _senha(1)
+        antiga.emitida_em = datetime.now() - timedelta(days=3)
+        indice.carregar([antiga, _senha(2), _senha(3, minutos=1)])
+
+        assert indice.posicao(1) is None
+        assert indice.posicao(2) == 1
+        assert indice.posicao(3) == 2
+
+    def test_tamanho_desconta_senhas_antigas(self):
+        '''tamanho() conta o mesmo que listar()'''
+        indice = FilaIndex()
+        antigas = [_senha(1), _senha(2, tipo='prioritaria'), _senha(3, servico_id=2)]
+        for antiga in antigas:
+            antiga.emitida_em = datetime.now() - timedelta(days=3)
+        indice.carregar(antigas + [_senha(4), _senha(5, tipo='prioritaria'),
+                                   _senha(6, servico_id=2)])
+
+        assert indice.tamanho(1) == len(indice.listar(1)) == 2
+        assert indice.tamanho(2) == len(indice.listar(2)) == 1
+        assert indice.tamanho() == len(indice.listar()) == 3
+        assert indice.tamanho(3) == 0
+
+
+class TestFilaIndexEntreWorkers:
+    '''Índice por processo: senhas de outros workers e recargas concorrentes'''
+
+    @staticmethod
+    def _indice(linhas, cache=None):
+        indice = FilaIndex()
+        indice.leituras = 0
+
+        def ler():
+            indice.leituras += 1
+            time.sleep(0.01)
+            return list(linhas)
+
+        indice._ler_da_bd = ler
+        indice._cache_partilhada = lambda: cache
+        return indice
+
+    def test_indice_vazio_confirma_na_bd(self):
+        '''Sem contador partilhado, fila vazia no índice é confirmada na BD'''
+        bd = []
+        indice = self._indice(bd)
+        assert indice.proximos() == []
+
+        bd.append(_senha(1))                  # emitida noutro worker
+        assert indice.proximos() == [1]
+
+    def test_recarga_concorrente_le_a_bd_uma_vez(self):
+        '''Pedidos simultâneos aproveitam a mesma recarga'''
+        indice = self._indice([_senha(1)])
+        resultados = []
+
+        threads = [threading.Thread(target=lambda: resultados.append(indice.listar()))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert resultados == [[1]] * 8
+        assert indice.leituras == 1
+
+    def test_contador_partilhado_recarrega_o_outro_worker(self, tmp_path):
+        '''Transição num worker faz o outro recarregar no acesso seguinte'''
+        caminho = str(tmp_path / 'cache.sqlite3')
+        bd = [_senha(1)]
+        a = self._indice(bd, CacheService(backend=BackendSQLite(caminho)))
+        b = self._indice(bd, CacheService(backend=BackendSQLite(caminho)))
+        assert a.listar() == [1] and b.listar() == [1]
+
+        bd.append(_senha(2, minutos=1))
+        b.actualizar(bd[-1])
+
+        assert b.listar() == [1, 2] and b.leituras == 1   # a própria transição não recarrega
+        assert a.listar() == [1, 2] and a.leituras == 2
@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app.models.atendente import Atendente
+from app.models.metrica_diaria import MetricaDiaria
+from app.services.eventos_service import EventosService
+from app.services.metricas_diarias_service import MetricasDiariasService
+from app.services.metrics_service import get_atendente_metrics
+
+HOJE = date.today()
+ONTEM = HOJE - timedelta(days=1)
+
+
+@contextmanager
+def _contar_queries(db):
+    queries = []
+    ouvinte = lambda *args: queries.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', ouvinte)
+    try:
+        yield queries
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', ouvinte)
+
+
+class TestMetricasDiarias:
+    '''Dias fechados calculados uma vez e lidos de metricas_diarias'''
+
+    def test_dia_fechado_nao_volta_a_ler_senhas(self, limpo, concluidas, servico, atendente):
+        at = Atendente.query.filter_by(email='atendente@test.com').one()
+        concluidas(servico, atendimento=4, dia=ONTEM, atendente_id=at.id)
+        concluidas(servico, atendimento=8, dia=ONTEM - timedelta(days=2), atendente_id=at.id)
+
+        inicio = ONTEM - timedelta(days=3)
+        primeiro = MetricasDiariasService.agregados(inicio, ONTEM)
+        # 4 linhas de fecho (incluindo os dias sem senhas) + 2 de dados
+        assert MetricaDiaria.query.count() == 6
+
+        with _contar_queries(limpo) as queries:
+            segundo = MetricasDiariasService.agregados(inicio, ONTEM)
+
+        assert segundo == primeiro
+        assert not any('senhas' in q for q in queries)
+        somas = dict(zip(MetricaDiaria.CAMPOS, segundo[at.id]))
+        assert somas['total'] == somas['concluidas'] == 2
+        assert somas['tempo_soma'] == 12
+
+    def test_intervalo_junta_cache_e_hoje(self, limpo, concluidas, servico, atendente):
+        at = Atendente.query.filter_by(email='atendente@test.com').one()
+        concluidas(servico, atendimento=4, dia=ONTEM, atendente_id=at.id)
+        concluidas(servico, atendimento=10, dia=HOJE, atendente_id=at.id)
+
+        metricas = get_atendente_metrics(at.id, ONTEM, HOJE)
+
+        assert metricas['total_atendimentos'] == 2
+        assert metricas['tempo_medio'] == 7.0
+        # Só o dia fechado foi gravado
+        assert {m.data for m in MetricaDiaria.query.all()} == {ONTEM}
+
+    def test_transicao_em_dia_fechado_invalida(self, limpo, concluidas, servico, atendente):
+        at = Atendente.query.filter_by(email='atendente@test.com').one()
+        senha, = concluidas(servico, atendimento=4, dia=ONTEM, atendente_id=at.id)
+        MetricasDiariasService.agregados(ONTEM, ONTEM)
+
+        senha.status = 'cancelada'
+        limpo.session.commit()
+        EventosService.publicar('cancelada', senha)
+
+        assert MetricaDiaria.query.count() == 0
+        metricas = get_atendente_metrics(at.id, ONTEM, ONTEM)
+        assert metricas['atendimentos_concluidos'] == 0
+        assert metricas['total_atendimentos'] == 1
@@ -0,0 +1,97 @@
+import time
+
+from app.services.notificacao_dispatcher import NotificacaoDispatcher, ProviderStub
+
+
+def _dispatcher(provider, **kwargs):
+    kwargs.setdefault('workers', 1)
+    kwargs.setdefault('backoff', 0.01)
+    return NotificacaoDispatcher(provider=provider, **kwargs)
+
+
+class TestNotificacaoDispatcher:
+    '''Envio de notificações em background'''
+
+    def test_submeter_nao_espera_pelo_provider(self):
+        '''O pedido devolve o id sem esperar pela latência do provider'''
+        provider   = ProviderStub(latencia=0.3)
+        dispatcher = _dispatcher(provider)
+
+        inicio = time.perf_counter()
+        notificacao_id = dispatcher.submeter('923000000', 'Senha N001')
+        assert time.perf_counter() - inicio < 0.1
+        assert dispatcher.estado(notificacao_id)['estado'] == 'pendente'
+
+        assert dispatcher.aguardar()
+        assert dispatcher.estado(notificacao_id)['estado'] == 'enviada'
+        dispatcher.parar()
+
+    def test_retry_com_backoff(self):
+        '''Falhas temporárias são repetidas até ao envio'''
+        provider = ProviderStub()
+        provider.falhar_proximas(2)
+        dispatcher = _dispatcher(provider, tentativas=4)
+
+        notificacao_id = dispatcher.submeter('923000000', 'Senha N001')
+        assert dispatcher.aguardar()
+
+        estado = dispatcher.estado(notificacao_id)
+        assert estado['estado'] == 'enviada'
+        assert estado['tentativas'] == 3
+        dispatcher.parar()
+
+    def test_desiste_apos_tentativas(self):
+        provider = ProviderStub(taxa_falha=1.0)
+        dispatcher = _dispatcher(provider, tentativas=2)
+
+        notificacao_id = dispatcher.submeter('923000000', 'Senha N001')
+        assert dispatcher.aguardar()
+
+        estado = dispatcher.estado(notificacao_id)
+        assert estado['estado'] == 'falhada'
+        assert estado['tentativas'] == 2
+        dispatcher.parar()
+
+    def test_envia_em_lote(self):
+        '''Mensagens acumuladas seguem numa só chamada ao provider'''
+        provider = ProviderStub(latencia=0.05, tamanho_lote=10)
+        dispatcher = _dispatcher(provider)
+
+        for i in range(21):
+            dispatcher.submeter('923000000', f'Senha N{i:03d}')
+        assert dispatcher.aguardar()
+
+        assert len(provider.enviadas) == 21
+        assert provider.chamadas <= 4
+        dispatcher.parar()
+
+    def test_fila_cheia_descarta(self):
+        '''Fila limitada: excesso fica "descartada" e não bloqueia a emissão'''
+        provider = ProviderStub(latencia=0.2, tamanho_lote=1)
+        dispatcher = _dispatcher(provider, fila_max=1)
+
+        ids = [dispatcher.submeter('923000000', f'Senha N{i:03d}') for i in range(5)]
+        estados = [dispatcher.estado(i)['estado'] for i in ids]
+
+        assert 'descartada' in estados
+        dispatcher.aguardar()
+        dispatcher.parar()
+
+
+class TestNotificarSenhaEmitida:
+    '''SMS de emissão só para senhas com contacto'''
+
+    def test_sem_contacto_nao_submete(self, servico, monkeypatch):
+        from app.services.notificacao_dispatcher import get_notificacao_dispatcher
+        from app.services.senha_service import SenhaService
+
+        submetidas = []
+        monkeypatch.setattr(get_notificacao_dispatcher(), 'submeter',
+                            lambda *args, **kwargs: submetidas.append(args))
+
+        anonima  = SenhaService.emitir_senha(servico.id)
+        contacto = SenhaService.emitir_senha(servico.id, usuario_contato='923000000')
+
+        assert anonima.sms_resultado is None
+        assert contacto.sms_resultado['destinatario'] == '923000000'
+        assert [args[0] for args in submetidas] == ['923000000']
@@ -0,0 +1,97 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select, func
+
+import app.models  # noqa: F401 — regista todas as tabelas no metadata
+from app.extensions import db
+from app.models.senha import Senha
+from app.models.log_actividade import LogActividade
+from app.utils.periodos import no_dia, entre_dias
+
+
+HOJE = date(2026, 3, 15)
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def _sql(engine, stmt):
+    return str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+
+
+def _plano(engine, stmt):
+    with engine.connect() as conn:
+        linhas = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + _sql(engine, stmt))
+        return ' | '.join(linha[-1] for linha in linhas)
+
+
+class TestPeriodos:
+    '''Predicados de data por intervalo semiaberto'''
+
+    def test_no_dia_datetime_semiaberto(self, engine):
+        '''DateTime: [dia 00:00, dia+1 00:00) sem func.date()'''
+        sql = _sql(engine, select(Senha.id).where(no_dia(Senha.emitida_em, HOJE)))
+
+        assert 'date(' not in sql.lower()
+        assert "senhas.emitida_em >= '2026-03-15 00:00:00" in sql
+        assert "senhas.emitida_em < '2026-03-16 00:00:00" in sql
+
+    def test_entre_dias_coluna_date(self, engine):
+        '''Date: compara com datas simples, fim inclusivo'''
+        sql = _sql(engine, select(Senha.id).where(
+            entre_dias(Senha.data_emissao, date(2026, 3, 1), HOJE)))
+
+        assert "senhas.data_emissao >= '2026-03-01'" in sql
+        assert "senhas.data_emissao < '2026-03-16'" in sql
+
+    def test_entre_dias_sem_limites(self, engine):
+        '''Sem início nem fim não filtra nada'''
+        sql = _sql(engine, select(Senha.id).where(entre_dias(Senha.data_emissao)))
+
+        assert 'data_emissao' not in sql.split('WHERE')[-1]
+
+
+class TestIndicesSenhas:
+    '''EXPLAIN: os caminhos quentes usam os índices compostos'''
+
+    def test_concluidas_do_dia(self, engine):
+        plano = _plano(engine, select(func.count(Senha.id)).where(
+            Senha.status == 'concluida',
+            no_dia(Senha.atendimento_concluido_em, HOJE)
+        ))
+
+        assert 'ix_senhas_status_concluida' in plano
+        assert 'atendimento_concluido_em>?' in plano
+
+    def test_fila_do_dia(self, engine):
+        plano = _plano(engine, select(func.count(Senha.id)).where(
+            Senha.status == 'aguardando',
+            no_dia(Senha.data_emissao, HOJE)
+        ))
+
+        assert 'ix_senhas_status_dia' in plano
+        assert 'data_emissao>?' in plano
+
+    def test_concluidas_por_atendente(self, engine):
+        plano = _plano(engine, select(func.count(Senha.id)).where(
+            Senha.atendente_id == 1,
+            Senha.status == 'concluida',
+            no_dia(Senha.atendimento_concluido_em, HOJE)
+        ))
+
+        assert 'ix_senhas_atendente_status' in plano
+
+    def test_ultima_chamada_do_dia(self, engine):
+        plano = _plano(engine, select(LogActividade.id).where(
+            LogActividade.acao == 'chamada',
+            no_dia(LogActividade.created_at, HOJE)
+        ).order_by(LogActividade.created_at.desc()).limit(1))
+
+        assert 'ix_log_actividades_acao_criado' in plano
+        assert 'created_at>?' in plano
@@ -0,0 +1,141 @@
+import threading
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from app.utils import rate_limiter as modulo
+from app.utils.rate_limiter import RateLimiter, rate_limit, testar_rate_limiter
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    '''time.time() controlado pelo teste'''
+    agora = {'t': 1_000_000.0}
+    monkeypatch.setattr(modulo.time, 'time', lambda: agora['t'])
+    RateLimiter._requests.clear()
+    yield agora
+    RateLimiter._requests.clear()
+
+
+class TestJanelaDeslizante:
+
+    def test_limite_e_retry_after(self, relogio):
+        resultados = [RateLimiter.is_allowed(key='t:ip:1', limit=3, window=60)
+                      for _ in range(4)]
+
+        assert [r[0] for r in resultados] == [True, True, True, False]
+        assert resultados[2][1]['remaining'] == 0
+        assert resultados[3][1]['retry_after'] >= 1
+
+    def test_janela_anterior_pesa_o_que_falta(self, relogio):
+        relogio['t'] = 60 * 1000            # início de uma janela
+        for _ in range(10):
+            RateLimiter.is_allowed(key='t:ip:1', limit=10, window=60)
+
+        # A meio da janela seguinte a anterior ainda conta metade (5)
+        relogio['t'] += 90
+        permitidos = sum(RateLimiter.is_allowed(key='t:ip:1', limit=10, window=60)[0]
+                         for _ in range(10))
+        assert permitidos == 5
+
+    def test_sem_rajada_na_fronteira(self, relogio):
+        relogio['t'] = 60 * 1000 + 59       # fim de uma janela
+        for _ in range(10):
+            RateLimiter.is_allowed(key='t:ip:1', limit=10, window=60)
+
+        relogio['t'] += 2                   # 1 s depois da fronteira
+        assert not RateLimiter.is_allowed(key='t:ip:1', limit=10, window=60)[0]
+
+
+class TestTokenBucket:
+
+    def test_rajada_e_reposicao(self, relogio):
+        pedir = lambda: RateLimiter.is_allowed(key='t:ip:1', limit=5, window=10,
+                                               algoritmo='token_bucket')
+        assert all(pedir()[0] for _ in range(5))
+        permitido, info = pedir()
+        assert not permitido and info['retry_after'] == 2
+
+        relogio['t'] += 2                   # 0,5 tokens/s → 1 token
+        assert pedir()[0]
+        assert not pedir()[0]
+
+    def test_algoritmo_invalido(self, relogio):
+        with pytest.raises(ValueError):
+            RateLimiter.is_allowed(key='t:ip:1', algoritmo='balde')
+
+
+class TestChaves:
+
+    def test_prefixos_independentes(self, relogio):
+        for _ in range(3):
+            RateLimiter.is_allowed(key='login:ip:1', limit=3, window=60)
+
+        assert not RateLimiter.is_allowed(key='login:ip:1', limit=3, window=60)[0]
+        assert RateLimiter.is_allowed(key='emissao:ip:1', limit=3, window=60)[0]
+
+    def test_decorador_usa_prefixo_e_utilizador(self, relogio):
+        app = Flask(__name__)
+        app.config['JWT_SECRET_KEY'] = 'teste'
+        JWTManager(app)
+
+        @rate_limit(limit=1, window=60, key_prefix='login')
+        def login():
+            return 'ok'
+
+        @rate_limit(limit=1, window=60, key_prefix='painel', por='user')
+        def painel():
+            return 'ok'
+
+        with app.app_context():
+            token = create_access_token(identity='7')
+
+        with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.9'}):
+            assert login().status_code == 200
+            assert login().status_code == 429
+            assert painel().status_code == 200      # anónimo: painel:ip:10.0.0.9
+
+        with app.test_request_context(environ_base={'REMOTE_ADDR': '10.0.0.9'},
+                                      headers={'Authorization': f'Bearer {token}'}):
+            assert painel().status_code == 200      # painel:user:7
+            assert painel().status_code == 429
+
+        assert set(RateLimiter._requests) == {
+            'login:ip:10.0.0.9', 'painel:ip:10.0.0.9', 'painel:user:7'
+        }
+
+
+class TestExpiracaoECustos:
+
+    def test_chaves_inactivas_saem_sem_varrimento(self, relogio):
+        for i in range(100):
+            RateLimiter.is_allowed(key=f't:ip:{i}', limit=5, window=60)
+
+        relogio['t'] += 1000
+        RateLimiter.is_allowed(key='t:ip:novo', limit=5, window=60)
+
+        # Cada pedido só retira algumas do início (O(1) amortizado)
+        assert len(RateLimiter._requests) == 101 - RateLimiter.LIMPEZA_POR_PEDIDO
+        assert RateLimiter.get_stats()['total_ips'] == 1
+
+    def test_concorrencia(self, relogio):
+        permitidos = []
+        lock = threading.Lock()
+
+        def pedir():
+            n = sum(RateLimiter.is_allowed(key='t:ip:1', limit=500, window=60)[0]
+                    for _ in range(100))
+            with lock:
+                permitidos.append(n)
+
+        threads = [threading.Thread(target=pedir) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sum(permitidos) == 500
+
+    def test_autoteste_do_modulo(self, relogio, capsys):
+        testar_rate_limiter()
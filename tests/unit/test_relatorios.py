@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import threading
+from datetime import date
+
+import pytest
+
+from app.services.cache_backends import BackendSQLite
+from app.services.cache_service import CacheService
+from app.services.relatorios_service import GestorRelatorios, get_gestor_relatorios
+
+
+@pytest.fixture
+def gestor(tmp_path):
+    get_gestor_relatorios().configurar(pasta=str(tmp_path))
+    return get_gestor_relatorios()
+
+
+class TestRelatorios:
+    '''Jobs de relatório em background'''
+
+    def test_csv_com_progresso_e_download(self, client, concluidas, admin_headers, gestor, servico):
+        concluidas(servico, 3)
+
+        resposta = client.post('/api/admin/relatorios', json={'tipo': 'csv'},
+                               headers=admin_headers)
+        job = resposta.get_json()
+        assert resposta.status_code == 202
+        assert job['duplicado'] is False
+
+        gestor.aguardar(job['id'])
+        estado = client.get(job['status_url'], headers=admin_headers).get_json()
+        assert estado['estado'] == 'concluido'
+        assert (estado['progresso'], estado['linhas']) == (100, 3)
+
+        ficheiro = client.get(estado['download_url'], headers=admin_headers)
+        linhas = list(csv.reader(io.StringIO(ficheiro.get_data(as_text=True))))
+        ficheiro.close()
+        assert len(linhas) == 4
+
+    def test_resumo_usa_metricas(self, client, admin_headers, gestor, servico):
+        resposta = client.post('/api/admin/relatorios',
+                               json={'tipo': 'resumo', 'periodo': 'mes'},
+                               headers=admin_headers)
+        job = gestor.aguardar(resposta.get_json()['id'])
+        assert job['estado'] == 'concluido'
+
+        caminho, nome, _ = gestor.ficheiro(job['id'])
+        with open(caminho, encoding='utf-8') as f:
+            resumo = json.load(f)
+        assert nome.endswith('.json')
+        assert resumo['data_fim'] == date.today().isoformat()
+        assert 'atendentes' in resumo and 'servicos' in resumo
+
+    def test_pedidos_iguais_partilham_o_job(self, app, tmp_path, monkeypatch):
+        gestor = GestorRelatorios(workers=1, pasta=str(tmp_path))
+        gestor.init_app(app)
+        gestor.configurar(pasta=str(tmp_path))
+        libertar = threading.Event()
+        monkeypatch.setattr(gestor, '_gerar_linhas',
+                            lambda job_id, f, tipo, inicio, fim: libertar.wait(5))
+
+        hoje = date.today()
+        primeiro, novo = gestor.submeter('ndjson', hoje, hoje)
+        repetido, repetido_novo = gestor.submeter('ndjson', hoje, hoje)
+        outro, _ = gestor.submeter('csv', hoje, hoje)
+        libertar.set()
+
+        assert novo is True and repetido_novo is False
+        assert repetido['id'] == primeiro['id']
+        assert outro['id'] != primeiro['id']
+        assert gestor.aguardar(primeiro['id'])['estado'] == 'concluido'
+        gestor.parar()
+
+    def test_tipo_invalido(self, client, admin_headers, gestor):
+        resposta = client.post('/api/admin/relatorios', json={'tipo': 'xlsx'},
+                               headers=admin_headers)
+        assert resposta.status_code == 400
+
+    def test_estado_e_download_noutro_worker(self, app, tmp_path, concluidas, servico):
+        '''Registo no backend partilhado: o job é visível em qualquer worker'''
+        caminho = str(tmp_path / 'cache.sqlite3')
+        pasta   = str(tmp_path / 'relatorios')
+        gerador, outro = (
+            GestorRelatorios(workers=1, pasta=pasta,
+                             cache=CacheService(backend=BackendSQLite(caminho)))
+            for _ in range(2)
+        )
+        concluidas(servico, 2)
+
+        job, _ = gerador.submeter('csv', date.today(), date.today())
+        gerador.aguardar(job['id'])
+        gerador.parar()
+
+        assert outro.estado(job['id'])['estado'] == 'concluido'
+        caminho_csv, nome, _ = outro.ficheiro(job['id'])
+        assert nome.endswith('.csv')
+        with open(caminho_csv, encoding='utf-8') as f:
+            assert len(list(csv.reader(f))) == 3
+
+    def test_job_esquecido_antes_de_correr(self, app, tmp_path):
+        '''Se o registo do job desaparecer, o worker desiste sem erro'''
+        gestor = GestorRelatorios(workers=1, pasta=str(tmp_path), cache=CacheService())
+        libertar = threading.Event()
+        gerados  = []
+        gestor._arrancar().submit(libertar.wait, 5)       # ocupa o único worker
+        gestor._gerar_linhas = lambda *args: gerados.append(args)
+
+        job, _ = gestor.submeter('csv', date.today(), date.today())
+        gestor.cache.clear()
+        libertar.set()
+        gestor.parar()
+
+        assert gestor.estado(job['id']) is None
+        assert gerados == [] and list(tmp_path.iterdir()) == []
+
+    def test_job_sem_sinal_de_vida_fica_em_erro(self, app, tmp_path, monkeypatch):
+        '''Job activo que deixou de ser actualizado (worker reiniciou) passa a erro'''
+        gestor = GestorRelatorios(workers=1, pasta=str(tmp_path), cache=CacheService())
+        libertar = threading.Event()
+        gestor._arrancar().submit(libertar.wait, 5)
+
+        job, _ = gestor.submeter('csv', date.today(), date.today())
+        monkeypatch.setattr(GestorRelatorios, 'ABANDONO_SEGUNDOS', -1)
+
+        assert gestor.estado(job['id'])['estado'] == 'erro'
+        libertar.set()
+        gestor.parar()
@@ -0,0 +1,56 @@
+from datetime import date, datetime
+
+from app.models.senha_rollup_hora import SenhaRollupHora
+from app.services.rollup_service import RollupService
+from app.services.senha_service import SenhaService
+
+
+def _linhas():
+    return sorted(
+        (r.hora, r.servico_id, r.atendente_id,
+         *[getattr(r, c) for c in SenhaRollupHora.SOMAS],
+         r.max_atendimento, r.min_atendimento)
+        for r in SenhaRollupHora.query.all()
+    )
+
+
+class TestRollupHora:
+    '''senhas_rollup_hora actualizado nas transições'''
+
+    def test_emitir_concluir_cancelar(self, limpo, concluidas, servico):
+        concluidas(servico, atendimento=0, espera=3)
+        concluidas(servico, atendimento=7)
+        SenhaService.cancelar(SenhaService.emitir_senha(servico.id).id, 'teste', None)
+
+        somas = RollupService.por_servico(date.today(), date.today())[servico.id]
+
+        assert (somas['emitidas'], somas['concluidas'], somas['canceladas']) == (3, 2, 1)
+        assert somas['soma_atendimento'] == 7 and somas['n_atendimento'] == 2
+        assert (somas['max_atendimento'], somas['min_atendimento']) == (7, 0)
+        assert somas['n_espera'] == 1
+
+    def test_rollback_desfaz_rollup(self, limpo, servico):
+        senha = SenhaService.emitir_senha(servico.id)
+        senha.status = 'concluida'
+        limpo.session.flush()
+        limpo.session.rollback()
+
+        assert RollupService.por_servico(date.today(), date.today())[servico.id]['concluidas'] == 0
+
+    def test_reconstruir_igual_ao_incremental(self, limpo, concluidas, servico):
+        concluidas(servico, atendimento=4, espera=2)
+        SenhaService.emitir_senha(servico.id)
+        incremental = _linhas()
+
+        RollupService.reconstruir()
+
+        assert _linhas() == incremental
+
+    def test_fluxo_le_rollup(self, client, limpo, concluidas, servico, atendente_headers):
+        concluidas(servico, atendimento=5)
+
+        body = client.get('/api/dashboard/admin/fluxo?periodo=dia',
+                          headers=atendente_headers).get_json()
+
+        assert sum(body['dados']) == 1
+        assert body['dados'][datetime.utcnow().hour] == 1
@@ -0,0 +1,436 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.senha import Senha
+from app.models.senha_bloco import SenhaBloco
+from app.services.numeracao_service import NumeracaoService, EmissorBloco
+from app.services.senha_service import SenhaService
+
+
+@pytest.fixture
+def blocos(db_session):
+    SenhaBloco.query.delete()
+    db_session.session.commit()
+    yield
+    SenhaBloco.query.delete()
+    db_session.session.commit()
+
+
+class TestNumeracaoService:
+    '''Blocos de numeração arrendados a quiosques'''
+
+    def test_blocos_nao_se_sobrepoem(self, blocos, servico):
+        '''Blocos e emissões directas usam a mesma sequência do dia'''
+        a = NumeracaoService.arrendar_bloco('quiosque-1', 'N', tamanho=10)
+        directa = SenhaService.emitir_senha(servico.id)
+        b = NumeracaoService.arrendar_bloco('quiosque-2', 'N', tamanho=10)
+
+        numero_directo = int(directa.numero[1:])
+        assert not a.contem(numero_directo) and not b.contem(numero_directo)
+        assert a.fim < b.inicio
+
+    def test_registar_lote(self, blocos, servico):
+        '''Lote grava as senhas; reenvio devolve duplicadas'''
+        bloco = NumeracaoService.arrendar_bloco('quiosque-1', 'N', tamanho=5)
+        itens = [
+            {'numero': f'N{n:03d}', 'servico_id': servico.id}
+            for n in (bloco.inicio, bloco.inicio + 1)
+        ]
+
+        resultado = NumeracaoService.registar_lote(bloco.id, 'quiosque-1', itens)
+        assert len(resultado['criadas']) == 2
+        assert resultado['bloco']['usado_ate'] == bloco.inicio + 1
+
+        repetido = NumeracaoService.registar_lote(bloco.id, 'quiosque-1', itens)
+        assert repetido['criadas'] == []
+        assert len(repetido['duplicadas']) == 2
+
+    def test_lote_concorrente_devolve_409(self, blocos, servico, client,
+                                          atendente_headers, monkeypatch):
+        '''Números gravados por outro pedido após a verificação → 409, nada gravado'''
+        bloco = NumeracaoService.arrendar_bloco('quiosque-1', 'N', tamanho=5)
+        bloco_id, primeiro, segundo = bloco.id, f'N{bloco.inicio:03d}', f'N{bloco.inicio + 1:03d}'
+        NumeracaoService.registar_lote(bloco_id, 'quiosque-1',
+                                       [{'numero': primeiro, 'servico_id': servico.id}])
+
+        # O pedido concorrente ainda não tinha feito commit quando este verificou
+        original = NumeracaoService._ja_registados
+        chamadas = []
+        def verificacao_atrasada(bloco, numeros):
+            chamadas.append(numeros)
+            return set() if len(chamadas) == 1 else original(bloco, numeros)
+        monkeypatch.setattr(NumeracaoService, '_ja_registados',
+                            staticmethod(verificacao_atrasada))
+
+        resposta = client.post(f'/api/senhas/blocos/{bloco_id}/lote', headers=atendente_headers,
+                               json={'titular': 'quiosque-1', 'senhas': [
+                                   {'numero': primeiro, 'servico_id': servico.id},
+                                   {'numero': segundo, 'servico_id': servico.id},
+                               ]})
+
+        assert resposta.status_code == 409
+        assert resposta.get_json()['numeros'] == [primeiro]
+        assert Senha.query.filter_by(numero=segundo).count() == 0
+
+    def test_rejeita_numero_fora_do_bloco(self, blocos, servico):
+        bloco = NumeracaoService.arrendar_bloco('quiosque-1', 'N', tamanho=5)
+        fora  = f'N{bloco.fim + 1:03d}'
+
+        resultado = NumeracaoService.registar_lote(
+            bloco.id, 'quiosque-1', [{'numero': fora, 'servico_id': servico.id}])
+
+        assert resultado['criadas'] == []
+        assert resultado['rejeitadas'][0]['numero'] == fora
+        with pytest.raises(ValueError):
+            NumeracaoService.registar_lote(bloco.id, 'outro-quiosque', [])
+
+    def test_bloco_expirado_e_reaproveitado(self, blocos, servico, db_session):
+        '''Números não usados de um bloco expirado voltam a ser arrendados'''
+        bloco = NumeracaoService.arrendar_bloco('quiosque-1', 'N', tamanho=10)
+        NumeracaoService.registar_lote(bloco.id, 'quiosque-1', [
+            {'numero': f'N{bloco.inicio:03d}', 'servico_id': servico.id}])
+
+        bloco.expira_em = datetime.utcnow() - timedelta(minutes=1)
+        db_session.session.commit()
+
+        novo = NumeracaoService.arrendar_bloco('quiosque-2', 'N', tamanho=10)
+        assert (novo.inicio, novo.fim) == (bloco.inicio + 1, bloco.fim)
+
+        # O titular antigo já não pode usar o resto do bloco
+        tarde = NumeracaoService.registar_lote(bloco.id, 'quiosque-1', [
+            {'numero': f'N{bloco.inicio + 1:03d}', 'servico_id': servico.id}])
+        assert tarde['rejeitadas'][0]['motivo'] == 'Bloco expirado'
+
+    def test_emitida_em_nao_antecede_o_bloco(self, blocos, servico):
+        '''Hora do quiosque não fura a fila; com fuso não rebenta o lote'''
+        bloco = NumeracaoService.arrendar_bloco('quiosque-1', 'N', tamanho=5)
+        meia_noite = datetime.combine(bloco.data, datetime.min.time())
+        agora = datetime.utcnow()
+
+        resultado = NumeracaoService.registar_lote(bloco.id, 'quiosque-1', [
+            {'numero': f'N{bloco.inicio:03d}', 'servico_id': servico.id,
+             'emitida_em': meia_noite.isoformat()},
+            {'numero': f'N{bloco.inicio + 1:03d}', 'servico_id': servico.id,
+             'emitida_em': agora.isoformat() + '+01:00'},
+        ])
+
+        assert len(resultado['criadas']) == 2
+        senhas = Senha.query.filter(Senha.numero.in_(
+            [f'N{bloco.inicio:03d}', f'N{bloco.inicio + 1:03d}'])).all()
+        assert all(s.emitida_em >= bloco.created_at for s in senhas)
+
+    def test_rotas_de_blocos_exigem_autenticacao(self, client, blocos):
+        for rota in ('/api/senhas/blocos', '/api/senhas/blocos/1/lote',
+                     '/api/senhas/blocos/1/devolver'):
+            assert client.post(rota, json={'titular': 'quiosque-1'}).status_code == 401
+
+    def test_emissor_local_envia_em_lotes(self, blocos, servico):
+        '''EmissorBloco numera sem BD e grava ao encher o lote'''
+        emissor = EmissorBloco('processo-1', tamanho=10, lote=3)
+
+        numeros = [emissor.emitir(servico.id) for _ in range(4)]
+        assert Senha.query.filter(Senha.numero.in_(numeros)).count() == 3
+
+        emissor.devolver()
+        assert Senha.query.filter(Senha.numero.in_(numeros)).count() == 4
+        assert len(set(numeros)) == 4
+
+
+class TestReivindicarSkipLocked:
+    '''Caminho MySQL/PostgreSQL (FOR UPDATE é ignorado em SQLite)'''
+
+    def test_candidatos_ja_chamados_saem_do_indice(self, db_session, servico, monkeypatch):
+        '''Sem linha livre, as senhas que já não aguardam saem do índice'''
+        from app.services.fila_index import get_fila_index
+        from app.services.fila_service import FilaService
+
+        monkeypatch.setattr(FilaService, '_suporta_skip_locked', staticmethod(lambda: True))
+        senhas = [SenhaService.emitir_senha(servico.id) for _ in range(2)]
+        ids = [s.id for s in senhas]
+        get_fila_index().carregar()
+
+        # Chamadas noutro worker: a BD mudou, o índice local ainda não
+        Senha.query.filter(Senha.id.in_(ids)).update(
+            {'status': 'atendendo'}, synchronize_session=False)
+        db_session.session.commit()
+        assert get_fila_index().proximos(servico_id=servico.id, limite=5) == ids
+
+        assert FilaService._reivindicar_skip_locked(ids, None, 1) is None
+        assert not any(get_fila_index().contem(i) for i in ids)
+
+
+class TestCargaSerializacao:
+    '''Listagens serializadas sem SELECTs extra por senha'''
+
+    def test_listar_senhas_sem_n_mais_1(self, db_session, servico, atendente):
+        from sqlalchemy import event
+        from app.models.atendente import Atendente
+        from app.schemas.senha_schema import SenhaSchema
+
+        atendente = Atendente.query.filter_by(email='atendente@test.com').one()
+        for _ in range(6):
+            senha = SenhaService.emitir_senha(servico.id)
+            senha.atendente_id = atendente.id
+        db_session.session.commit()
+        db_session.session.expire_all()
+
+        queries = []
+        ouvinte = lambda *args: queries.append(args[2])
+        event.listen(db_session.engine, 'before_cursor_execute', ouvinte)
+        try:
+            senhas = SenhaService.listar_senhas(apenas_hoje=True)
+            dump   = SenhaSchema(many=True).dump(senhas)
+            dicts  = [s.to_dict() for s in senhas]
+        finally:
+            event.remove(db_session.engine, 'before_cursor_execute', ouvinte)
+
+        assert len(senhas) == 6
+        assert len(queries) == 1
+        assert dump[0]['servico']['nome'] == servico.nome
+        assert dicts[0]['atendente']['nome'] == 'Atendente Teste'
+
+
+class TestMetricasAtendentes:
+    '''Ranking de atendentes com número fixo de queries'''
+
+    def _povoar(self, db_session, servico, n_atendentes, prefixo):
+        from app.models.atendente import Atendente
+
+        for i in range(n_atendentes):
+            at = Atendente(nome=f'At {prefixo}{i}', email=f'{prefixo}{i}@test.com',
+                           senha='senha123', tipo='atendente', balcao=i + 2,
+                           servico_id=servico.id, ativo=True)
+            db_session.session.add(at)
+            db_session.session.flush()
+            for j in range(i + 1):
+                senha = SenhaService.emitir_senha(servico.id)
+                senha.atendente_id = at.id
+                senha.status = 'concluida'
+                senha.tempo_atendimento_minutos = 5 + j
+        db_session.session.commit()
+        db_session.session.expire_all()
+
+    def _ranking(self, db_session):
+        from sqlalchemy import event
+        from app.services.metrics_service import get_todos_atendentes_metrics
+
+        queries = []
+        ouvinte = lambda *args: queries.append(args[2])
+        event.listen(db_session.engine, 'before_cursor_execute', ouvinte)
+        try:
+            ranking = get_todos_atendentes_metrics()
+            departamentos = [r['departamento'] for r in ranking]
+        finally:
+            event.remove(db_session.engine, 'before_cursor_execute', ouvinte)
+        return ranking, departamentos, queries
+
+    def test_numero_de_queries_nao_cresce(self, db_session, servico):
+        self._povoar(db_session, servico, 1, 'a')
+        _, _, poucas = self._ranking(db_session)
+
+        self._povoar(db_session, servico, 5, 'b')
+        ranking, departamentos, muitas = self._ranking(db_session)
+
+        # atendentes + primeiro dia + senhas e avaliações de hoje
+        assert len(poucas) == len(muitas) == 4
+        assert len(ranking) == 6
+        assert set(departamentos) == {servico.nome}
+
+    def test_igual_ao_calculo_individual(self, db_session, servico):
+        from app.services.metrics_service import (
+            calcular_score, get_atendente_metrics,
+        )
+
+        self._povoar(db_session, servico, 4, 'c')
+        ranking, _, _ = self._ranking(db_session)
+
+        assert [r['total_atendimentos'] for r in ranking] == [4, 3, 2, 1]
+        for r in ranking:
+            individual = get_atendente_metrics(r['id'])
+            assert {k: r[k] for k in individual} == individual
+            assert r['score'] == calcular_score(individual, 4)
+
+
+class TestEstatisticasDia:
+    '''Estatísticas do dia numa query, partilhada dentro do pedido'''
+
+    def _povoar(self, db_session, servico):
+        estados = [
+            ('aguardando', 'normal', None, None),
+            ('aguardando', 'prioritaria', None, None),
+            ('atendendo', 'normal', 4, None),
+            ('concluida', 'normal', 6, 3),
+            ('concluida', 'prioritaria', 0, 9),
+            ('cancelada', 'normal', None, None),
+        ]
+        for status, tipo, espera, atendimento in estados:
+            senha = SenhaService.emitir_senha(servico.id, tipo=tipo)
+            senha.status = status
+            if espera is not None:
+                senha.atendimento_iniciado_em = datetime.utcnow()
+                senha.tempo_espera_minutos = espera
+            if status == 'concluida':
+                senha.atendimento_concluido_em = datetime.utcnow()
+            senha.tempo_atendimento_minutos = atendimento
+        db_session.session.commit()
+
+    def test_contagens_e_tempos(self, db_session, servico):
+        from app.services.fila_service import FilaService
+
+        self._povoar(db_session, servico)
+
+        stats = SenhaService.obter_estatisticas_hoje()
+        assert (stats['total_emitidas'], stats['aguardando'], stats['atendendo'],
+                stats['concluidas'], stats['canceladas']) == (6, 2, 1, 2, 1)
+        # Espera 0 não conta para a média (como antes)
+        assert stats['tempo_medio_espera'] == 5.0
+
+        from app.services.estimador_espera import get_estimador_espera
+
+        fila = FilaService.obter_estatisticas_fila()
+        assert fila == {
+            'aguardando_total': 2, 'aguardando_normal': 1,
+            'aguardando_prioritaria': 1, 'atendendo': 1,
+            'tempo_espera_estimado': get_estimador_espera().estimar(None, 2),
+        }
+
+    def test_filtros_de_atendimento_como_antes(self, db_session, servico, atendente):
+        from app.models.atendente import Atendente
+
+        atendente_id = Atendente.query.filter_by(email='atendente@test.com').one().id
+        ontem = datetime.utcnow().date() - timedelta(days=1)
+        for atendimento, data_emissao in ((0, None), (4, None), (8, ontem), (6, None)):
+            senha = SenhaService.emitir_senha(servico.id)
+            senha.atendente_id = atendente_id
+            senha.status = 'concluida'
+            senha.atendimento_concluido_em = datetime.utcnow()
+            senha.tempo_atendimento_minutos = atendimento
+            if data_emissao:
+                senha.data_emissao = data_emissao
+        # Emitida hoje mas concluída ontem: fora do tempo médio do dia
+        senha.atendimento_concluido_em = datetime.utcnow() - timedelta(days=1)
+        db_session.session.commit()
+
+        # Atendente: emitidas hoje, atendimentos de 0 min não contam
+        stats = SenhaService.obter_estatisticas_trabalhador(atendente_id)
+        assert stats == {'atendidos_hoje': 3, 'tempo_medio_atendimento': 5.0}
+
+        # Dashboard: concluídas hoje (também as emitidas ontem), como o rollup
+        from app.services.estatisticas_service import EstatisticasService
+        dia = EstatisticasService.dia()
+        assert (dia['atendimento_n_no_dia'], dia['atendimento_media_no_dia']) == (3, 4.0)
+        assert dia['total'] == 3
+
+    def test_uma_query_por_pedido(self, app, client, db_session, servico):
+        from flask_jwt_extended import create_access_token
+        from sqlalchemy import event
+        from app.models.atendente import Atendente
+        from app.services.cache_service import get_cache
+
+        self._povoar(db_session, servico)
+        admin = Atendente(nome='Admin', email='admin.est@test.com', senha='senha123',
+                          tipo='admin', ativo=True)
+        db_session.session.add(admin)
+        db_session.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(admin.id))}'}
+
+        queries = []
+        def ouvinte(conn, cursor, sql, *args):
+            if 'FROM senhas' in sql:
+                queries.append(sql)
+        event.listen(db_session.engine, 'before_cursor_execute', ouvinte)
+        try:
+            resposta = client.get('/api/dashboard/estatisticas', headers=headers)
+            primeiro = len(queries)
+            get_cache().clear()
+            client.get('/api/senhas/estatisticas')
+            segundo = len(queries)
+            client.get('/api/senhas/estatisticas')
+        finally:
+            event.remove(db_session.engine, 'before_cursor_execute', ouvinte)
+
+        assert resposta.status_code == 200
+        dados = resposta.get_json()
+        assert dados['senhas']['aguardando'] == dados['filas']['aguardando_total'] == 2
+        assert dados['tempo_medio_atendimento'] == 6.0
+        assert primeiro == 1
+        # Pedido seguinte não reaproveita o memo do anterior...
+        assert segundo == 2
+        # ...mas o resultado fica em cache (@cached) para os seguintes
+        assert len(queries) == 2
+
+
+class TestListagensAgrupadas:
+    '''/dashboard/atendentes e /filas/status com nº fixo de queries'''
+
+    def _contar_queries(self, db_session, pedido):
+        from sqlalchemy import event
+
+        queries = []
+        ouvinte = lambda *args: queries.append(args[2])
+        event.listen(db_session.engine, 'before_cursor_execute', ouvinte)
+        try:
+            resposta = pedido()
+        finally:
+            event.remove(db_session.engine, 'before_cursor_execute', ouvinte)
+        assert resposta.status_code == 200
+        return resposta.get_json(), len(queries)
+
+    def _povoar(self, db_session, prefixo, n):
+        from app.models.atendente import Atendente
+        from app.models.servico import Servico
+
+        for i in range(n):
+            servico = Servico(nome=f'Serviço {prefixo}{i}', ativo=True, ordem_exibicao=i)
+            db_session.session.add(servico)
+            db_session.session.flush()
+            atendente = Atendente(nome=f'At {prefixo}{i}', email=f'{prefixo}{i}@lista.com',
+                                  senha='senha123', tipo='atendente', balcao=i + 1,
+                                  servico_id=servico.id, ativo=True)
+            db_session.session.add(atendente)
+            db_session.session.flush()
+
+            SenhaService.emitir_senha(servico.id)
+            chamada = SenhaService.emitir_senha(servico.id)
+            chamada.status = 'chamando'
+            for minutos in (4, 7):
+                senha = SenhaService.emitir_senha(servico.id)
+                senha.atendente_id = atendente.id
+                senha.status = 'concluida'
+                senha.atendimento_concluido_em = datetime.now()
+                senha.tempo_atendimento_minutos = minutos
+        db_session.session.commit()
+        db_session.session.expire_all()
+
+    def test_atendentes(self, client, db_session):
+        from flask_jwt_extended import create_access_token
+        from app.models.atendente import Atendente
+
+        self._povoar(db_session, 'a', 1)
+        token = create_access_token(identity=str(Atendente.query.first().id))
+        pedido = lambda: client.get('/api/dashboard/atendentes',
+                                    headers={'Authorization': f'Bearer {token}'})
+        _, poucas = self._contar_queries(db_session, pedido)
+
+        self._povoar(db_session, 'b', 5)
+        dados, muitas = self._contar_queries(db_session, pedido)
+
+        assert poucas == muitas
+        assert len(dados) == 6
+        assert {(d['atendimentos_hoje'], d['tempo_medio']) for d in dados} == {(2, 6)}
+        assert all(d['departamento'].startswith('Serviço ') for d in dados)
+
+    def test_status_filas(self, client, db_session):
+        pedido = lambda: client.get('/api/filas/status')
+
+        self._povoar(db_session, 'c', 1)
+        _, poucas = self._contar_queries(db_session, pedido)
+
+        self._povoar(db_session, 'd', 5)
+        dados, muitas = self._contar_queries(db_session, pedido)
+
+        assert poucas == muitas == 2
+        assert len(dados['filas']) == 6
+        assert all((f['aguardando'], f['atendendo']) == (1, 1) for f in dados['filas'])
+        assert (dados['total_aguardando'], dados['total_atendendo']) == (6, 6)